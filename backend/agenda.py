@@ -0,0 +1,208 @@
+"""Operações em lote na agenda: concluir, cancelar e remarcar vários agendamentos de uma vez.
+
+    POST /admin/<loja>/appointments/bulk
+    {"conclude": [812, 813], "cancel": [820], "reschedule": [{"id": 821, "date_time": "2026-10-20T15:30"}]}
+
+Tudo numa transação, com um número fixo de comandos seja qual for o tamanho da lista:
+
+    1 SELECT ... FOR UPDATE   os agendamentos pedidos, só os da loja (os outros = not_found)
+    1 SELECT                  a agenda dos barbeiros remarcados, para achar sobreposições
+    1 UPDATE por operação     id IN (...); a remarcação usa CASE id WHEN ... para hora e fim
+    1 UPDATE products         só se houver vendas de produto canceladas (ou reativadas): as
+                              unidades voltam ao estoque (CASE id WHEN ...), como nas rotas de um só
+
+Cada ID recebe o seu resultado: ok, unchanged (já estava assim), not_found, forbidden
+(barbeiro a mexer na agenda de outro), invalid_status (só se remarca o que está agendado),
+invalid (data inválida), duplicate (o mesmo ID em duas operações) ou conflict (a nova hora
+sobrepõe-se a outro agendamento, dito em conflict_id). Os que falham não impedem os outros.
+"""
+from datetime import datetime, timedelta
+
+from sqlalchemy import case, select, update
+from sqlalchemy.orm import Session
+
+import inventory
+from availability import DEFAULT_DURATION, MAX_APPOINTMENT_MINUTES
+from models import Appointment
+
+BULK_MAX_IDS = 500
+BULK_ACTIONS = ["conclude", "cancel", "reschedule"]
+# Estado final de cada operação
+_TARGET_STATUS = {"conclude": "concluido", "cancel": "cancelado", "reschedule": "scheduled"}
+
+
+class BulkError(ValueError):
+    """Pedido mal formado (a rota devolve 400)."""
+
+
+def _parse_request(data: dict) -> list[tuple[str, int, datetime | None]]:
+    """[(operação, id, nova hora)] pela ordem do pedido."""
+    itens = []
+    for action in ["conclude", "cancel"]:
+        for appo_id in data.get(action) or []:
+            try:
+                itens.append((action, int(appo_id), None))
+            except (TypeError, ValueError):
+                raise BulkError(f"ID inválido em {action}: {appo_id!r}")
+    for item in data.get("reschedule") or []:
+        if not isinstance(item, dict) or "id" not in item:
+            raise BulkError("Cada remarcação precisa de id e date_time")
+        try:
+            appo_id = int(item["id"])
+        except (TypeError, ValueError):
+            raise BulkError(f"ID inválido em reschedule: {item['id']!r}")
+        try:
+            nova = datetime.fromisoformat(str(item.get("date_time")))
+        except ValueError:
+            nova = None
+        itens.append(("reschedule", appo_id, nova))
+    if not itens:
+        raise BulkError("Nada para fazer: envie conclude, cancel e/ou reschedule")
+    if len(itens) > BULK_MAX_IDS:
+        raise BulkError(f"No máximo {BULK_MAX_IDS} agendamentos por pedido")
+    return itens
+
+
+def _find_conflicts(db: Session, moves: list[dict], cancelled: set[int]) -> dict[int, int]:
+    """{id remarcado: id com que choca}. Uma query para a agenda de todos os barbeiros envolvidos."""
+    com_barbeiro = [m for m in moves if m["barber_id"] is not None]
+    if not com_barbeiro:
+        return {}
+    inicio = min(m["start"] for m in com_barbeiro)
+    fim = max(m["end"] for m in com_barbeiro)
+    existentes = db.execute(
+        select(Appointment.id, Appointment.barber_id, Appointment.date_time, Appointment.end_time).where(
+            Appointment.barber_id.in_({m["barber_id"] for m in com_barbeiro}),
+            Appointment.date_time >= inicio - timedelta(minutes=MAX_APPOINTMENT_MINUTES),
+            Appointment.date_time < fim,
+            Appointment.end_time > inicio,
+            Appointment.status != "cancelado",
+        )
+    ).all()
+
+    # Quem é remarcado com sucesso deixa livre a hora antiga; quem falha continua lá. Uma falha
+    # pode então criar outra (alguém contava com aquela hora livre): repete até estabilizar.
+    conflitos: dict[int, int] = {}
+    while True:
+        saem = cancelled | {m["id"] for m in com_barbeiro if m["id"] not in conflitos}
+        ocupados: dict[int, list[tuple[datetime, datetime, int]]] = {}
+        for appo_id, barber_id, comeca, acaba in existentes:
+            if appo_id not in saem:
+                ocupados.setdefault(barber_id, []).append((comeca, acaba, appo_id))
+        novos = {}
+        for move in com_barbeiro:
+            if move["id"] in conflitos:
+                continue
+            agenda = ocupados.setdefault(move["barber_id"], [])
+            choque = next((outro for comeca, acaba, outro in agenda if comeca < move["end"] and acaba > move["start"]), None)
+            if choque is not None:
+                novos[move["id"]] = choque
+            else:
+                # Aceite: passa a ocupar a nova hora para as remarcações seguintes deste pedido
+                agenda.append((move["start"], move["end"], move["id"]))
+        if not novos:
+            return conflitos
+        conflitos.update(novos)
+
+
+def bulk_update(db: Session, shop_id: int, data: dict, barber_id: int | None = None) -> dict:
+    """Aplica o lote (sem commit). `barber_id` restringe a um barbeiro (token de BARBER).
+
+    Devolve {"results": [...], "summary": {...}, "changed": [(id, barber_id, data antiga, data nova, product_id)]};
+    a rota usa `changed` para invalidar os caches depois do commit.
+    """
+    itens = _parse_request(data)
+
+    vistos: dict[int, int] = {}
+    for action, appo_id, _ in itens:
+        vistos[appo_id] = vistos.get(appo_id, 0) + 1
+
+    linhas = {
+        linha.id: linha for linha in db.execute(
+            select(Appointment.id, Appointment.barber_id, Appointment.status, Appointment.date_time,
+                   Appointment.duration, Appointment.product_id, Appointment.quantity)
+            .where(Appointment.id.in_(list(vistos)), Appointment.barbershop_id == shop_id)
+            .with_for_update()
+        )
+    }
+
+    resultados = []
+    aplicar: dict[str, list[int]] = {action: [] for action in BULK_ACTIONS}
+    moves = []
+    for action, appo_id, nova in itens:
+        linha = linhas.get(appo_id)
+        resultado = {"id": appo_id, "action": action}
+        if vistos[appo_id] > 1:
+            resultado.update(status="duplicate", detail="O mesmo agendamento em mais de uma operação")
+        elif linha is None:
+            resultado.update(status="not_found", detail="Agendamento não encontrado nesta barbearia")
+        elif barber_id is not None and linha.barber_id != barber_id:
+            resultado.update(status="forbidden", detail="Agendamento de outro barbeiro")
+        elif action == "reschedule" and linha.status != "scheduled":
+            resultado.update(status="invalid_status", detail="Só se remarca o que está agendado")
+        elif action == "reschedule" and nova is None:
+            resultado.update(status="invalid", detail="date_time inválido (use AAAA-MM-DDTHH:MM)")
+        elif action == "reschedule" and nova == linha.date_time:
+            resultado.update(status="unchanged")
+        elif action != "reschedule" and linha.status == _TARGET_STATUS[action]:
+            resultado.update(status="unchanged")
+        else:
+            resultado["status"] = "ok"
+            if action == "reschedule":
+                duracao = DEFAULT_DURATION if linha.duration is None else linha.duration
+                moves.append({"id": appo_id, "barber_id": linha.barber_id, "start": nova,
+                              "end": nova + timedelta(minutes=duracao), "duration": duracao})
+            aplicar[action].append(appo_id)
+        resultados.append(resultado)
+
+    if moves:
+        conflitos = _find_conflicts(db, moves, set(aplicar["cancel"]))
+        for resultado in resultados:
+            if resultado["action"] == "reschedule" and resultado["id"] in conflitos:
+                resultado.update(status="conflict", conflict_id=conflitos[resultado["id"]],
+                                 detail="Horário indisponível para este barbeiro")
+        moves = [m for m in moves if m["id"] not in conflitos]
+        aplicar["reschedule"] = [m["id"] for m in moves]
+
+    # Vendas de produto canceladas devolvem as unidades; reativadas, tiram-nas de novo
+    estoque: dict[int, int] = {}
+    for action in ["conclude", "cancel"]:
+        for appo_id in aplicar[action]:
+            linha = linhas[appo_id]
+            delta = inventory.sale_stock_delta(linha.product_id, linha.quantity, linha.status, _TARGET_STATUS[action])
+            if delta:
+                estoque[linha.product_id] = estoque.get(linha.product_id, 0) + delta
+    inventory.apply_stock_deltas(db, shop_id, estoque)
+
+    # Um UPDATE por operação
+    for action in ["conclude", "cancel"]:
+        if aplicar[action]:
+            db.execute(
+                update(Appointment)
+                .where(Appointment.id.in_(aplicar[action]), Appointment.barbershop_id == shop_id)
+                .values(status=_TARGET_STATUS[action])
+                .execution_options(synchronize_session=False)
+            )
+    if moves:
+        db.execute(
+            update(Appointment)
+            .where(Appointment.id.in_(aplicar["reschedule"]), Appointment.barbershop_id == shop_id)
+            .values(
+                date_time=case({m["id"]: m["start"] for m in moves}, value=Appointment.id),
+                end_time=case({m["id"]: m["end"] for m in moves}, value=Appointment.id),
+                duration=case({m["id"]: m["duration"] for m in moves}, value=Appointment.id),
+                # Nova hora = novo lembrete (ver reminders.py)
+                reminder_sent_at=None,
+            )
+            .execution_options(synchronize_session=False)
+        )
+
+    novas = {m["id"]: m["start"] for m in moves}
+    alterados = [
+        (appo_id, linhas[appo_id].barber_id, linhas[appo_id].date_time, novas.get(appo_id), linhas[appo_id].product_id)
+        for action in BULK_ACTIONS for appo_id in aplicar[action]
+    ]
+    resumo: dict[str, int] = {}
+    for resultado in resultados:
+        resumo[resultado["status"]] = resumo.get(resultado["status"], 0) + 1
+    return {"results": resultados, "summary": resumo, "changed": alterados}
@@ -0,0 +1,218 @@
+"""Séries temporais de faturamento (dia/semana/mês) agrupadas por barbeiro, serviço ou tipo de venda.
+
+A agregação é feita no banco (truncagem de data + GROUP BY) e devolvida em colunas
+(uma lista de valores por série), pronta para gráficos. Períodos já encerrados quase não
+mudam, então ficam em cache por balde; só os baldes "abertos" voltam a ser calculados.
+
+O cache é de cada worker. Cada entrada guarda a versão dos agendamentos da loja
+(sync.data_version, uma query por chamada) e vale no máximo ANALYTICS_CACHE_TTL segundos:
+uma conclusão atrasada, um cancelamento ou uma importação feita por OUTRO worker muda a
+versão e os baldes voltam a ser calculados. O TTL cobre o resto (commits fora de ordem
+entre workers com relógios diferentes).
+"""
+import os
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import case, func, select
+from sqlalchemy.orm import Session
+
+import sync
+from archive import appointments_between
+from models import Barber, Service
+
+BUCKETS = ["day", "week", "month"]
+GROUPS = ["none", "barber", "service", "kind"]
+
+ANALYTICS_CACHE_TTL = int(os.getenv("ANALYTICS_CACHE_TTL", "600"))
+_CACHE_MAX_ENTRIES = 100_000
+# (shop_id, bucket, group_by, início do balde) -> (versão, gravado em, {chave da série: (faturamento, quantidade)})
+_cache: dict[tuple, dict] = {}
+_lock = threading.Lock()
+
+
+# ==========================================
+# BALDES DE TEMPO
+# ==========================================
+
+def bucket_start(day: date, bucket: str) -> date:
+    if bucket == "week":
+        return day - timedelta(days=day.weekday())  # segunda-feira, como o date_trunc do Postgres
+    if bucket == "month":
+        return day.replace(day=1)
+    return day
+
+
+def next_bucket(start: date, bucket: str) -> date:
+    if bucket == "week":
+        return start + timedelta(days=7)
+    if bucket == "month":
+        return date(start.year + (start.month == 12), start.month % 12 + 1, 1)
+    return start + timedelta(days=1)
+
+
+def bucket_list(start: date, end: date, bucket: str) -> list[date]:
+    """Todos os baldes que tocam [start, end] (end inclusivo)."""
+    baldes = []
+    atual = bucket_start(start, bucket)
+    while atual <= end:
+        baldes.append(atual)
+        atual = next_bucket(atual, bucket)
+    return baldes
+
+
+def bucket_sql(column, bucket: str, dialect: str):
+    """Expressão SQL que trunca a data ao início do balde."""
+    if dialect == "postgresql":
+        return func.date_trunc(bucket, column)
+    # SQLite
+    if bucket == "week":
+        return func.date(column, "weekday 0", "-6 days")
+    if bucket == "month":
+        return func.strftime("%Y-%m-01", column)
+    return func.date(column)
+
+
+def _as_date(value) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+def kind_sql(table):
+    """Mesma classificação do export: serviço agendado, produto ou venda de balcão."""
+    return case(
+        (table.c.service_id.isnot(None), "servico"),
+        (table.c.client_name.like("🛍️ Produto:%"), "produto"),
+        else_="venda_balcao",
+    )
+
+
+# ==========================================
+# CÁLCULO
+# ==========================================
+
+def _query_buckets(db: Session, shop_id: int, bucket: str, group_by: str, start: date, end: date) -> dict:
+    """Um único SELECT ... GROUP BY balde, chave. Devolve {balde: {chave: (faturamento, quantidade)}}."""
+    inicio = datetime.combine(start, datetime.min.time())
+    fim = datetime.combine(end, datetime.min.time())
+    linhas = appointments_between(
+        ["date_time", "barber_id", "service_id", "client_name", "service_price"], inicio, fim,
+        lambda t: t.c.barbershop_id == shop_id,
+        lambda t: t.c.status == "concluido",
+    ).subquery()
+
+    balde = bucket_sql(linhas.c.date_time, bucket, db.get_bind().dialect.name).label("balde")
+    if group_by == "barber":
+        chave = linhas.c.barber_id
+    elif group_by == "service":
+        chave = linhas.c.service_id
+    elif group_by == "kind":
+        chave = kind_sql(linhas)
+    else:
+        chave = None
+
+    colunas = [balde, func.coalesce(func.sum(linhas.c.service_price), 0.0), func.count()]
+    agrupar = [balde]
+    if chave is not None:
+        colunas.insert(1, chave.label("chave"))
+        agrupar.append(chave)
+
+    resultado = {}
+    for row in db.execute(select(*colunas).group_by(*agrupar)):
+        if chave is not None:
+            valor_balde, valor_chave, total, qtd = row
+        else:
+            valor_balde, total, qtd = row
+            valor_chave = "total"
+        resultado.setdefault(_as_date(valor_balde), {})[valor_chave] = (float(total), int(qtd))
+    return resultado
+
+
+def revenue_series(db: Session, shop_id: int, start: date, end: date, bucket: str, group_by: str) -> dict:
+    """Série temporal em formato colunar para [start, end] (datas inclusivas)."""
+    baldes = bucket_list(start, end, bucket)
+    hoje = date.today()
+    versao = sync.data_version(db, shop_id, "appointments")
+    agora = time.monotonic()
+
+    por_balde = {}
+    faltando = []
+    with _lock:
+        for b in baldes:
+            cached = _cache.get((shop_id, bucket, group_by, b))
+            if cached is not None and cached[0] == versao and agora - cached[1] < ANALYTICS_CACHE_TTL:
+                por_balde[b] = cached[2]
+            else:
+                faltando.append(b)
+
+    if faltando:
+        # Uma só query cobre do primeiro ao último balde que faltam
+        calculado = _query_buckets(db, shop_id, bucket, group_by, faltando[0], next_bucket(faltando[-1], bucket))
+        with _lock:
+            if len(_cache) > _CACHE_MAX_ENTRIES:
+                _cache.clear()
+            for b in faltando:
+                por_balde[b] = calculado.get(b, {})
+                # Só guarda baldes que terminaram antes de ontem (margem para lançamentos tardios)
+                if next_bucket(b, bucket) < hoje:
+                    _cache[(shop_id, bucket, group_by, b)] = (versao, agora, por_balde[b])
+
+    # Baldes parciais nas pontas (ex.: semana que começa antes de `start`): recorta para o período pedido
+    fim_exclusivo = end + timedelta(days=1)
+    for b in set(baldes[:1] + baldes[-1:]):
+        if b < start or next_bucket(b, bucket) > fim_exclusivo:
+            recorte = _query_buckets(db, shop_id, bucket, group_by, max(b, start), min(next_bucket(b, bucket), fim_exclusivo))
+            por_balde[b] = recorte.get(b, {})
+
+    chaves = sorted({k for valores in por_balde.values() for k in valores}, key=lambda k: (k is None, k or 0))
+    series = []
+    for k in chaves:
+        series.append({
+            "key": k,
+            "label": None,
+            "revenue": [por_balde[b].get(k, (0.0, 0))[0] for b in baldes],
+            "count": [por_balde[b].get(k, (0.0, 0))[1] for b in baldes],
+        })
+    _attach_labels(db, series, group_by)
+
+    return {
+        "bucket": bucket,
+        "group_by": group_by,
+        "buckets": [b.isoformat() for b in baldes],
+        "series": series,
+        "totals": {
+            "revenue": sum(sum(s["revenue"]) for s in series),
+            "count": sum(sum(s["count"]) for s in series),
+        },
+    }
+
+
+def _attach_labels(db: Session, series: list[dict], group_by: str):
+    """Nomes dos barbeiros/serviços numa única query (nada de uma query por série)."""
+    if group_by == "barber":
+        ids = [s["key"] for s in series if s["key"] is not None]
+        nomes = dict(db.query(Barber.id, Barber.name).filter(Barber.id.in_(ids)).all()) if ids else {}
+        for s in series:
+            s["label"] = nomes.get(s["key"], "🛍️ Vendas de Balcão")
+    elif group_by == "service":
+        ids = [s["key"] for s in series if s["key"] is not None]
+        nomes = dict(db.query(Service.id, Service.name).filter(Service.id.in_(ids)).all()) if ids else {}
+        for s in series:
+            s["label"] = nomes.get(s["key"], "Vendas avulsas")
+    else:
+        for s in series:
+            s["label"] = s["key"]
+
+
+def invalidate(shop_id: int):
+    """Chamado depois do commit quando um atendimento de um período já encerrado muda (ex.: concluído com atraso).
+
+    A versão já deixa as entradas antigas de fora em todos os workers; isto só as tira da memória deste.
+    """
+    with _lock:
+        for key in [k for k in _cache if k[0] == shop_id]:
+            del _cache[key]
@@ -0,0 +1,188 @@
+"""Particionamento mensal e arquivo do histórico de atendimentos.
+
+A tabela `appointments` guarda só o que é "quente" (agenda atual e histórico recente).
+Atendimentos concluídos/cancelados mais antigos do que ARCHIVE_HORIZON_DAYS são movidos
+em lotes para `appointments_archive`. No Postgres a tabela quente é particionada por mês
+em `date_time`, e as consultas por período só leem as partições daquele mês.
+
+Rodar periodicamente (ex.: cron diário):
+
+    python archive.py                      # cria partições futuras e arquiva o histórico
+    python archive.py --horizon-days 180   # horizonte diferente do configurado
+"""
+import argparse
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, func, insert, select, text, union_all
+
+from database import engine
+from logs import get_logger, setup_logging
+from models import Appointment, AppointmentArchive
+
+ARCHIVE_HORIZON_DAYS = int(os.getenv("ARCHIVE_HORIZON_DAYS", "365"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "5000"))
+# Meses futuros que já deixamos com partição criada
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "12"))
+
+ARCHIVABLE_STATUSES = ["concluido", "cancelado"]
+
+
+# ==========================================
+# PARTIÇÕES (SÓ POSTGRES)
+# ==========================================
+
+def month_start(dt: datetime) -> datetime:
+    return datetime(dt.year, dt.month, 1)
+
+
+def next_month(dt: datetime) -> datetime:
+    return datetime(dt.year + (dt.month == 12), dt.month % 12 + 1, 1)
+
+
+def partition_name(dt: datetime) -> str:
+    return f"appointments_y{dt.year}m{dt.month:02d}"
+
+
+def is_partitioned(conn) -> bool:
+    if conn.dialect.name != "postgresql":
+        return False
+    relkind = conn.execute(text(
+        "SELECT c.relkind FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+        "WHERE c.relname = 'appointments' AND n.nspname = current_schema()"
+    )).scalar()
+    return relkind == "p"
+
+
+def create_month_partition(conn, month: datetime):
+    """Cria a partição do mês. Se já houver linhas desse mês na partição DEFAULT, move-as antes."""
+    nome = partition_name(month)
+    existe = conn.execute(text("SELECT to_regclass(:n)"), {"n": nome}).scalar()
+    if existe:
+        return
+    inicio, fim = month_start(month), next_month(month)
+    params = {"a": inicio, "b": fim}
+    conn.execute(text(
+        "CREATE TEMP TABLE _default_move ON COMMIT DROP AS "
+        "SELECT * FROM appointments_default WHERE date_time >= :a AND date_time < :b"
+    ), params)
+    conn.execute(text("DELETE FROM appointments_default WHERE date_time >= :a AND date_time < :b"), params)
+    conn.execute(text(
+        f"CREATE TABLE {nome} PARTITION OF appointments "
+        f"FOR VALUES FROM ('{inicio:%Y-%m-%d}') TO ('{fim:%Y-%m-%d}')"
+    ))
+    conn.execute(text("INSERT INTO appointments SELECT * FROM _default_move"))
+    conn.execute(text("DROP TABLE _default_move"))
+
+
+def ensure_partitions(conn, since: datetime | None = None, months_ahead: int = PARTITION_MONTHS_AHEAD):
+    """Garante uma partição por mês desde `since` (ou o mês atual) até `months_ahead` meses à frente."""
+    if not is_partitioned(conn):
+        return
+    mes = month_start(since or datetime.now())
+    limite = month_start(datetime.now())
+    for _ in range(months_ahead):
+        limite = next_month(limite)
+    while mes <= limite:
+        create_month_partition(conn, mes)
+        mes = next_month(mes)
+
+
+def partition_appointments(conn):
+    """Converte a tabela `appointments` comum numa tabela particionada por mês (Postgres)."""
+    if conn.dialect.name != "postgresql" or is_partitioned(conn):
+        return
+
+    conn.execute(text("ALTER TABLE appointments RENAME TO appointments_legacy"))
+    # A chave primária de uma tabela particionada tem de incluir a coluna de partição.
+    # Linhas sem data (nunca deveriam existir) vão para 1970 para não perder nada.
+    conn.execute(text("UPDATE appointments_legacy SET date_time = '1970-01-01' WHERE date_time IS NULL"))
+    conn.execute(text(
+        "CREATE TABLE appointments (LIKE appointments_legacy INCLUDING DEFAULTS) "
+        "PARTITION BY RANGE (date_time)"
+    ))
+    conn.execute(text("ALTER TABLE appointments ALTER COLUMN date_time SET NOT NULL"))
+    conn.execute(text("ALTER TABLE appointments ADD PRIMARY KEY (id, date_time)"))
+    conn.execute(text("CREATE TABLE appointments_default PARTITION OF appointments DEFAULT"))
+
+    mais_antigo = conn.execute(text(
+        "SELECT MIN(date_time) FROM appointments_legacy WHERE date_time > '1970-01-01'"
+    )).scalar()
+    ensure_partitions(conn, since=mais_antigo)
+
+    conn.execute(text("INSERT INTO appointments SELECT * FROM appointments_legacy"))
+    conn.execute(text("ALTER SEQUENCE IF EXISTS appointments_id_seq OWNED BY appointments.id"))
+    conn.execute(text("DROP TABLE appointments_legacy"))
+
+
+# ==========================================
+# ARQUIVO DO HISTÓRICO
+# ==========================================
+
+def archive_cutoff(horizon_days: int = ARCHIVE_HORIZON_DAYS) -> datetime:
+    return datetime.combine((datetime.now() - timedelta(days=horizon_days)).date(), datetime.min.time())
+
+
+def archive_old_appointments(horizon_days: int = ARCHIVE_HORIZON_DAYS, batch_size: int = ARCHIVE_BATCH_SIZE) -> int:
+    """Move, em lotes curtos (uma transação por lote), o histórico antigo para o arquivo."""
+    corte = archive_cutoff(horizon_days)
+    hot = Appointment.__table__
+    cold = AppointmentArchive.__table__
+    colunas = [c.name for c in cold.columns]
+
+    with engine.connect() as conn:
+        teto = conn.execute(select(func.max(hot.c.id))).scalar() or 0
+    # Nunca arquiva o maior ID: o SQLite (sem AUTOINCREMENT) reaproveitaria os IDs arquivados
+    pendentes = (hot.c.date_time < corte, hot.c.status.in_(ARCHIVABLE_STATUSES), hot.c.id < teto)
+
+    total = 0
+    while True:
+        with engine.begin() as conn:
+            # Lote = os próximos `batch_size` IDs arquiváveis; o maior deles delimita o lote
+            ids = conn.execute(
+                select(hot.c.id).where(*pendentes).order_by(hot.c.id).limit(batch_size)
+            ).scalars().all()
+            if not ids:
+                break
+            no_lote = (*pendentes, hot.c.id <= ids[-1])
+            conn.execute(insert(cold).from_select(
+                colunas, select(*[hot.c[nome] for nome in colunas]).where(*no_lote)
+            ))
+            # O filtro por data deixa o Postgres apagar só nas partições antigas
+            conn.execute(delete(hot).where(*no_lote))
+        total += len(ids)
+    return total
+
+
+def includes_archive(start: datetime | None) -> bool:
+    """O período pedido começa antes do horizonte? Então pode haver linhas no arquivo."""
+    return start is None or start < archive_cutoff()
+
+
+def appointments_between(columns: list[str], start: datetime, end: datetime, *filters):
+    """SELECT das colunas pedidas no período, juntando o arquivo só quando o período é antigo.
+
+    `filters` recebe uma função (tabela) -> condição, para aplicar os mesmos filtros nas duas tabelas.
+    """
+    def _select(table):
+        return select(*[table.c[nome] for nome in columns]).where(
+            table.c.date_time >= start, table.c.date_time < end, *[f(table) for f in filters]
+        )
+
+    stmt = _select(Appointment.__table__)
+    if includes_archive(start):
+        stmt = union_all(stmt, _select(AppointmentArchive.__table__))
+    return stmt
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Partições futuras + arquivo do histórico de atendimentos")
+    parser.add_argument("--horizon-days", type=int, default=ARCHIVE_HORIZON_DAYS)
+    parser.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE)
+    args = parser.parse_args()
+
+    setup_logging(default_format="text")
+    with engine.begin() as conn:
+        ensure_partitions(conn)
+    movidos = archive_old_appointments(args.horizon_days, args.batch_size)
+    get_logger("archive").info(f"{movidos} atendimentos movidos para o arquivo (antes de {archive_cutoff(args.horizon_days):%d/%m/%Y}).")
@@ -5,6 +5,9 @@ from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 
+import logs
+import sessions
+
 SECRET_KEY = os.getenv("SECRET_KEY", "chave_super_secreta_padrao")
 ALGORITHM = "HS256"
 
@@ -24,11 +27,13 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
 
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
     to_encode = data.copy()
+    agora = datetime.utcnow()
     if expires_delta:
-        expire = datetime.utcnow() + expires_delta
+        expire = agora + expires_delta
     else:
-        expire = datetime.utcnow() + timedelta(days=7) # Token dura 7 dias
-    to_encode.update({"exp": expire})
+        expire = agora + sessions.SESSION_LIFETIME # Token dura 7 dias
+    # jti: ID do token, para o logout; iat (com fração): para "terminar todas as sessões" (ver sessions.py)
+    to_encode.update({"exp": expire, "iat": sessions.issued_at(agora), "jti": sessions.new_jti()})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
@@ -46,6 +51,11 @@ def get_current_user(token: str = Depends(oauth2_scheme)):
         role: str = payload.get("role")
         if role is None:
             raise credentials_exception
+        # Revogado (logout, PIN trocado, barbeiro desativado...)? Consulta só a memória
+        if sessions.is_revoked(payload):
+            raise credentials_exception
+        # Os logs deste pedido passam a levar a loja e o utilizador
+        logs.bind(shop_id=payload.get("shop_id"), user_id=payload.get("sub"))
         return payload  # Devolve os dados (sub/id, role, etc)
     except JWTError:
         raise credentials_exception
\ No newline at end of file
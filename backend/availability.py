@@ -0,0 +1,293 @@
+"""Mapas de ocupação (bitmaps) por barbeiro e por dia.
+
+Cada dia é dividido em fatias de SLOT_MINUTES minutos; o bit `i` de um inteiro Python
+representa a fatia que começa em `i * SLOT_MINUTES` minutos depois da meia-noite.
+Um bit a 1 no mapa de um barbeiro quer dizer "ocupado".
+
+Os mapas ficam em cache (com TTL, porque cada worker tem o seu) e são atualizados na
+marcação e invalidados no cancelamento. Procurar horários livres vira um punhado de
+operações bit a bit em vez de percorrer os agendamentos minuto a minuto.
+"""
+import os
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import Integer, case, func, literal, or_, select, update
+from sqlalchemy.orm import Session
+
+from models import Appointment, Barber, Barbershop, Service
+
+SLOT_MINUTES = 5
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+DEFAULT_DURATION = 30  # agendamento sem serviço (ou serviço sem duração)
+# Nenhum agendamento dura mais do que isto: limita a busca de sobreposições a um range no índice
+MAX_APPOINTMENT_MINUTES = 24 * 60
+
+AVAILABILITY_CACHE_TTL = int(os.getenv("AVAILABILITY_CACHE_TTL", "60"))
+_CACHE_MAX_ENTRIES = 50_000
+
+# (shop_id, barber_id, dia) -> (bitmap, momento em que foi montado)
+_cache: dict[tuple[int, int, date], tuple[int, float]] = {}
+_lock = threading.Lock()
+
+
+def _slot(minutes: int) -> int:
+    return minutes // SLOT_MINUTES
+
+
+def _minutes(hhmm: str) -> int:
+    h, m = hhmm.split(":")
+    return int(h) * 60 + int(m)
+
+
+def interval_bits(start_min: int, end_min: int) -> int:
+    """Bits das fatias que tocam o intervalo [start_min, end_min)."""
+    inicio = max(_slot(start_min), 0)
+    fim = min(-(-end_min // SLOT_MINUTES), SLOTS_PER_DAY)  # arredonda para cima
+    if fim <= inicio:
+        return 0
+    return ((1 << (fim - inicio)) - 1) << inicio
+
+
+def closed_mask(shop: Barbershop) -> int:
+    """Fatias em que a loja não atende: fora do horário de funcionamento e no intervalo de almoço."""
+    aberto = interval_bits(_minutes(shop.open_time or "09:00"), _minutes(shop.close_time or "19:00"))
+    almoco = interval_bits(_minutes(shop.interval_start or "12:00"), _minutes(shop.interval_end or "13:00"))
+    dia_inteiro = (1 << SLOTS_PER_DAY) - 1
+    return (dia_inteiro & ~aberto) | almoco
+
+
+def _appointment_bits(date_time: datetime, duration: int | None) -> int:
+    inicio = date_time.hour * 60 + date_time.minute
+    return interval_bits(inicio, inicio + (DEFAULT_DURATION if duration is None else duration))
+
+
+# ==========================================
+# DURAÇÃO E FIM DOS AGENDAMENTOS
+# ==========================================
+
+def service_duration(service: Service | None) -> int:
+    return service.duration if service and service.duration else DEFAULT_DURATION
+
+
+def end_time_sql(dialect_name: str, start, minutes):
+    """Expressão SQL de `start + minutes minutos` (para backfills e UPDATEs em massa)."""
+    if dialect_name == "postgresql":
+        return start + func.make_interval(0, 0, 0, 0, 0, minutes)
+    # SQLite: mesmo formato de texto que o SQLAlchemy grava ("AAAA-MM-DD HH:MM:SS.ffffff")
+    return func.strftime("%Y-%m-%d %H:%M:%f000", start, func.printf("+%d minutes", minutes))
+
+
+COUNTER_SALE_PREFIXES = ["🛍️ Produto:%", "✂️ Corte Avulso:%"]
+END_TIME_BACKFILL_BATCH = 50_000
+
+
+def backfill_end_times(conn, table, batch_size: int = END_TIME_BACKFILL_BATCH) -> int:
+    """Preenche duration/end_time das linhas antigas (migração 007), em lotes por faixa de ID.
+
+    Agendamento com serviço: duração atual do serviço (ou a padrão). Vendas de balcão: 0,
+    não ocupam a agenda. Resto: a padrão.
+    """
+    duracao_servico = (
+        select(Service.duration).where(Service.id == table.c.service_id).scalar_subquery()
+    )
+    duracao = case(
+        (table.c.service_id.isnot(None), func.coalesce(duracao_servico, DEFAULT_DURATION)),
+        (or_(*[table.c.client_name.like(p) for p in COUNTER_SALE_PREFIXES]), 0),
+        else_=DEFAULT_DURATION,
+    )
+    menor, maior = conn.execute(select(func.min(table.c.id), func.max(table.c.id))).one()
+    if menor is None:
+        return 0
+    dialeto = conn.dialect.name
+    atualizadas = 0
+    for inicio in range(menor, maior + 1, batch_size):
+        no_lote = (table.c.id >= inicio, table.c.id < inicio + batch_size, table.c.duration.is_(None))
+        atualizadas += conn.execute(update(table).where(*no_lote).values(duration=duracao)).rowcount
+        conn.execute(
+            update(table).where(*no_lote[:2], table.c.end_time.is_(None), table.c.date_time.isnot(None))
+            .values(end_time=end_time_sql(dialeto, table.c.date_time, table.c.duration))
+        )
+    return atualizadas
+
+
+def find_overlap(db: Session, barber_id: int, start: datetime, end: datetime, exclude_id: int | None = None) -> int | None:
+    """ID de um agendamento do barbeiro que se sobrepõe a [start, end), ou None.
+
+    Um único range no índice (barber_id, date_time): só quem começa antes de `end`
+    (e no máximo MAX_APPOINTMENT_MINUTES antes de `start`) pode terminar depois de `start`.
+    """
+    consulta = select(Appointment.id).where(
+        Appointment.barber_id == barber_id,
+        Appointment.date_time >= start - timedelta(minutes=MAX_APPOINTMENT_MINUTES),
+        Appointment.date_time < end,
+        Appointment.end_time > start,
+        Appointment.status != "cancelado",
+    )
+    if exclude_id is not None:
+        consulta = consulta.where(Appointment.id != exclude_id)
+    return db.execute(consulta.limit(1)).scalar()
+
+
+def resize_service_appointments(db: Session, service_id: int, duration: int, since: datetime) -> int:
+    """Depois de mudar a duração de um serviço: os agendamentos futuros dele passam a ter a nova duração.
+
+    O histórico (o que já começou) fica com a duração com que foi atendido. Não faz commit.
+    """
+    dialeto = db.get_bind().dialect.name
+    return db.execute(
+        update(Appointment)
+        .where(Appointment.service_id == service_id, Appointment.date_time >= since, Appointment.status == "scheduled")
+        .values(duration=int(duration), end_time=end_time_sql(dialeto, Appointment.date_time, literal(int(duration), Integer)))
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+
+# ==========================================
+# CACHE
+# ==========================================
+
+def _get_cached(key):
+    entry = _cache.get(key)
+    if entry and time.monotonic() - entry[1] < AVAILABILITY_CACHE_TTL:
+        return entry[0]
+    return None
+
+
+def mark_busy(shop_id: int, barber_id: int, date_time: datetime, duration: int | None):
+    """Chamado na marcação: liga os bits do novo agendamento no mapa em cache (se existir)."""
+    key = (shop_id, barber_id, date_time.date())
+    with _lock:
+        entry = _cache.get(key)
+        if entry:
+            _cache[key] = (entry[0] | _appointment_bits(date_time, duration), entry[1])
+
+
+def invalidate(shop_id: int, barber_id: int | None = None, day: date | None = None):
+    """Chamado no cancelamento/remarcação (ou quando a duração dos serviços muda)."""
+    with _lock:
+        if barber_id is not None and day is not None:
+            _cache.pop((shop_id, barber_id, day), None)
+        else:
+            for key in [k for k in _cache if k[0] == shop_id]:
+                del _cache[key]
+
+
+def load_busy_bitmaps(db: Session, shop_id: int, barber_ids: list[int], first_day: date, days: int) -> dict:
+    """Mapas de ocupação de todos os barbeiros/dias pedidos. O que faltar no cache vem numa única query."""
+    dias = [first_day + timedelta(days=i) for i in range(days)]
+    resultado = {}
+    faltando = set()
+    with _lock:
+        for barber_id in barber_ids:
+            for dia in dias:
+                bitmap = _get_cached((shop_id, barber_id, dia))
+                if bitmap is None:
+                    faltando.add((barber_id, dia))
+                else:
+                    resultado[(barber_id, dia)] = bitmap
+
+    if faltando:
+        inicio = datetime.combine(min(d for _, d in faltando), datetime.min.time())
+        fim = datetime.combine(max(d for _, d in faltando), datetime.min.time()) + timedelta(days=1)
+        linhas = (
+            db.query(Appointment.barber_id, Appointment.date_time, Appointment.duration)
+            .filter(
+                Appointment.barbershop_id == shop_id,
+                Appointment.barber_id.in_([b for b, _ in faltando]),
+                Appointment.date_time >= inicio,
+                Appointment.date_time < fim,
+                Appointment.status != "cancelado",
+            )
+            .all()
+        )
+        novos = {key: 0 for key in faltando}
+        for barber_id, date_time, duration in linhas:
+            key = (barber_id, date_time.date())
+            if key in novos:
+                novos[key] |= _appointment_bits(date_time, duration)
+
+        agora = time.monotonic()
+        with _lock:
+            if len(_cache) > _CACHE_MAX_ENTRIES:
+                _cache.clear()
+            for (barber_id, dia), bitmap in novos.items():
+                _cache[(shop_id, barber_id, dia)] = (bitmap, agora)
+        resultado.update(novos)
+
+    return resultado
+
+
+# ==========================================
+# BUSCA DE HORÁRIOS
+# ==========================================
+
+def free_starts(busy: int, closed: int, duration: int) -> int:
+    """Bits das fatias onde um serviço de `duration` minutos pode COMEÇAR sem conflito."""
+    livres = ~(busy | closed) & ((1 << SLOTS_PER_DAY) - 1)
+    precisa = max(-(-duration // SLOT_MINUTES), 1)
+    inicios = livres
+    # Depois do passo i, o bit s fica ligado só se as fatias s..s+i estão todas livres
+    for i in range(1, precisa):
+        inicios &= livres >> i
+    return inicios
+
+
+def grid_mask(step: int) -> int:
+    """Só as fatias alinhadas de `step` em `step` minutos (ex.: 15 -> 09:00, 09:15, 09:30...)."""
+    passo = max(step // SLOT_MINUTES, 1)
+    return sum(1 << i for i in range(0, SLOTS_PER_DAY, passo))
+
+
+def iter_bits(bitmap: int):
+    while bitmap:
+        menor = bitmap & -bitmap
+        yield menor.bit_length() - 1
+        bitmap ^= menor
+
+
+def earliest_slots(db: Session, shop: Barbershop, duration: int, days: int, limit: int,
+                   step: int = SLOT_MINUTES, now: datetime | None = None) -> list[dict]:
+    """Os primeiros `limit` horários livres (com qualquer barbeiro ativo) nos próximos `days` dias.
+
+    `step` alinha os inícios a uma grade (em minutos) para a tela não ficar poluída.
+    """
+    now = now or datetime.now()
+    barbeiros = (
+        db.query(Barber.id, Barber.name)
+        .filter(Barber.barbershop_id == shop.id, Barber.is_active.isnot(False))
+        .order_by(Barber.id)
+        .all()
+    )
+    if not barbeiros:
+        return []
+
+    nomes = dict(barbeiros)
+    fechado = closed_mask(shop)
+    grade = grid_mask(step)
+    mapas = load_busy_bitmaps(db, shop.id, list(nomes), now.date(), days)
+
+    resultado = []
+    for i in range(days):
+        dia = now.date() + timedelta(days=i)
+        passado = 0
+        if dia == now.date():
+            # Hoje: nada que comece antes de agora
+            passado = (1 << -(-(now.hour * 60 + now.minute) // SLOT_MINUTES)) - 1
+
+        por_barbeiro = {b: free_starts(mapas[(b, dia)], fechado, duration) & grade & ~passado for b in nomes}
+        qualquer = 0
+        for bits in por_barbeiro.values():
+            qualquer |= bits
+
+        for slot in iter_bits(qualquer):
+            minutos = slot * SLOT_MINUTES
+            resultado.append({
+                "date": dia.isoformat(),
+                "time": f"{minutos // 60:02d}:{minutos % 60:02d}",
+                "barbers": [{"id": b, "name": nomes[b]} for b, bits in por_barbeiro.items() if bits >> slot & 1],
+            })
+            if len(resultado) >= limit:
+                return resultado
+    return resultado
@@ -0,0 +1,105 @@
+"""Benchmark da API de análises de faturamento sobre um ano de dados sintéticos.
+
+Para cada combinação de balde (dia/semana/mês) e agrupamento mede a primeira chamada
+(cache vazio, tudo calculado no banco) e as seguintes (baldes encerrados vêm do cache).
+Como referência, mede também a abordagem antiga: trazer as linhas e somar em Python.
+
+    python -m benchmarks.analytics
+    python -m benchmarks.analytics --per-day 800 --barbers 20
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import warnings
+from datetime import date, datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def cronometrar(func, runs: int) -> float:
+    tempos = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        func()
+        tempos.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(tempos)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--per-day", type=int, default=400, help="atendimentos concluídos por dia")
+    parser.add_argument("--barbers", type=int, default=12)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix="bench_analytics_")
+    os.environ["DATABASE_URL"] = f"sqlite:///{tmpdir}/bench.db"
+    os.environ["DB_KEEPALIVE_INTERVAL"] = "0"
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    sys.path.insert(0, BACKEND_DIR)
+    warnings.filterwarnings("ignore")
+
+    from sqlalchemy import insert
+    import analytics
+    import migrations
+    from database import SessionLocal, engine
+    from models import Appointment, Barber, Barbershop, Service
+
+    migrations.upgrade()
+    random.seed(42)
+    fim = date.today()
+    inicio = fim - timedelta(days=365)
+    with engine.begin() as conn:
+        shop_id = conn.execute(insert(Barbershop).values(name="Bench", slug="bench")).inserted_primary_key[0]
+        barbeiros = [conn.execute(insert(Barber).values(name=f"B{i}", pin=f"8{i:03d}", barbershop_id=shop_id)).inserted_primary_key[0]
+                     for i in range(args.barbers)]
+        servicos = [(conn.execute(insert(Service).values(name=f"S{i}", price=20 + 5 * i, duration=30, barbershop_id=shop_id)).inserted_primary_key[0], 20 + 5 * i)
+                    for i in range(8)]
+        dia = inicio
+        while dia <= fim:
+            linhas = []
+            for _ in range(args.per_day):
+                quando = datetime.combine(dia, datetime.min.time()) + timedelta(minutes=random.randint(540, 1140))
+                if random.random() < 0.15:  # venda de balcão / produto
+                    linhas.append({"client_name": "🛍️ Produto: Gel", "client_phone": "0", "date_time": quando, "barbershop_id": shop_id,
+                                   "barber_id": None, "service_id": None, "status": "concluido", "service_price": 35.0})
+                else:
+                    sid, preco = random.choice(servicos)
+                    linhas.append({"client_name": "Cliente", "client_phone": "1", "date_time": quando, "barbershop_id": shop_id,
+                                   "barber_id": random.choice(barbeiros), "service_id": sid, "status": "concluido", "service_price": float(preco)})
+            conn.execute(insert(Appointment), linhas)
+            dia += timedelta(days=1)
+    total = (fim - inicio).days * args.per_day
+    print(f"{total} atendimentos sintéticos em 1 ano, {args.barbers} barbeiros\n")
+
+    db = SessionLocal()
+
+    def em_python():
+        rows = db.query(Appointment.date_time, Appointment.barber_id, Appointment.service_price).filter(
+            Appointment.barbershop_id == shop_id, Appointment.status == "concluido",
+            Appointment.date_time >= datetime.combine(inicio, datetime.min.time()),
+        ).all()
+        somas = {}
+        for quando, barber_id, preco in rows:
+            chave = (quando.date().replace(day=1), barber_id)
+            somas[chave] = somas.get(chave, 0.0) + (preco or 0.0)
+        return somas
+
+    print(f"{'referência: linhas + soma em Python (mês x barbeiro)':<54} {cronometrar(em_python, args.runs):>9.1f} ms\n")
+    print(f"{'balde':<6} {'agrupamento':<12} {'1ª chamada':>12} {'com cache':>12}")
+    for bucket in analytics.BUCKETS:
+        for group_by in analytics.GROUPS:
+            chamar = lambda: analytics.revenue_series(db, shop_id, inicio, fim, bucket, group_by)
+            analytics._cache.clear()
+            frio = cronometrar(chamar, 1)
+            quente = cronometrar(chamar, args.runs)
+            print(f"{bucket:<6} {group_by:<12} {frio:>9.1f} ms {quente:>9.1f} ms")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
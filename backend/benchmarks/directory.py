@@ -0,0 +1,99 @@
+"""Benchmark da busca do diretório público com dezenas de milhares de lojas.
+
+Semeia lojas com nomes, bairros e serviços sintéticos num SQLite temporário, corre a
+migração (que preenche o texto pesquisável) e mede a latência (p50/p95) de buscas
+típicas pela rota pública, além do tempo de montagem do índice em memória.
+Falha se o p95 de alguma busca passar de P95_BUDGET_MS.
+
+    python -m benchmarks.directory
+    python -m benchmarks.directory --shops 50000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import warnings
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+P95_BUDGET_MS = 50
+
+NOMES = ["Barbearia", "Studio", "Salão", "Espaço", "Barber Shop", "Clube", "Ateliê", "Corte & Cia"]
+QUALIFICADORES = ["do Zé", "Vintage", "Premium", "Real", "São João", "Imperial", "Navalha", "Dom Pedro", "Central", "Moderna"]
+BAIRROS = ["Centro", "Pinheiros", "Moema", "Savassi", "Boa Viagem", "Copacabana", "Batel", "Meireles", "Asa Sul", "Tijuca"]
+SERVICOS = ["Corte", "Barba", "Degradê", "Pigmentação", "Sobrancelha", "Hidratação", "Luzes", "Relaxamento", "Pezinho", "Platinado"]
+BUSCAS = ["barb", "barbearia centro", "studio vintage", "navalha", "pigment", "copa", "sao joao", "degr moema", "corte", "xyz"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shops", type=int, default=30000)
+    parser.add_argument("--runs", type=int, default=50)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix="bench_directory_")
+    os.environ["DATABASE_URL"] = f"sqlite:///{tmpdir}/bench.db"
+    os.environ["DB_KEEPALIVE_INTERVAL"] = "0"
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    sys.path.insert(0, BACKEND_DIR)
+    os.chdir(tmpdir)
+    warnings.filterwarnings("ignore")
+
+    from sqlalchemy import insert
+    from fastapi.testclient import TestClient
+    import directory
+    import main as app_main
+    import migrations
+    from database import SessionLocal, engine
+    from models import Barbershop, Service
+
+    # Até à migração 004: as lojas entram antes, como num banco já em produção
+    for version, _, func in migrations.MIGRATIONS[:4]:
+        with engine.begin() as conn:
+            func(conn)
+            conn.exec_driver_sql("CREATE TABLE IF NOT EXISTS schema_migrations (version INTEGER PRIMARY KEY, name VARCHAR NOT NULL, applied_at VARCHAR NOT NULL)")
+            conn.exec_driver_sql(f"INSERT INTO schema_migrations VALUES ({version}, 'bench', 'now')")
+
+    random.seed(3)
+    with engine.begin() as conn:
+        conn.execute(insert(Barbershop), [{
+            "id": i, "name": f"{random.choice(NOMES)} {random.choice(QUALIFICADORES)} {i}", "slug": f"loja-{i}",
+            "address": f"Rua {random.randint(1, 999)}, {random.choice(BAIRROS)}",
+        } for i in range(1, args.shops + 1)])
+        conn.execute(insert(Service), [
+            {"name": nome, "price": 30, "duration": 30, "barbershop_id": i}
+            for i in range(1, args.shops + 1) for nome in random.sample(SERVICOS, 4)
+        ])
+
+    t0 = time.perf_counter()
+    migrations.upgrade()
+    print(f"{args.shops} lojas | migração do texto pesquisável: {(time.perf_counter() - t0) * 1000:.0f} ms")
+
+    db = SessionLocal()
+    t0 = time.perf_counter()
+    directory._memory_index(db)
+    print(f"montagem do índice em memória: {(time.perf_counter() - t0) * 1000:.0f} ms\n")
+    db.close()
+
+    client = TestClient(app_main.app)
+    estourou = False
+    print(f"{'busca':<20} {'resultados':>10} {'p50':>9} {'p95':>9}")
+    for busca in BUSCAS:
+        tempos = []
+        for i in range(args.runs):
+            t0 = time.perf_counter()
+            resposta = client.get("/api/public/barbershops", params={"q": busca, "page": 1 + i % 3})
+            tempos.append((time.perf_counter() - t0) * 1000)
+        p95 = statistics.quantiles(tempos, n=20)[-1]
+        estourou |= p95 > P95_BUDGET_MS
+        print(f"{busca:<20} {resposta.json()['total']:>10} {statistics.median(tempos):>6.1f} ms {p95:>6.1f} ms")
+
+    if estourou:
+        raise SystemExit(f"\nFALHOU: p95 acima de {P95_BUDGET_MS} ms")
+    print(f"\nTodas as buscas com p95 abaixo de {P95_BUDGET_MS} ms.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Latência do primeiro pedido depois de um período parado.
+
+Sobe a app (com lifespan) duas vezes num processo novo: uma sem aquecimento nem keepalive
+e outra com a configuração atual. Em cada uma espera `--idle` segundos e mede o primeiro
+GET a uma rota pública que toca no banco. Para ver o efeito real no Neon use um `--idle`
+maior do que o tempo de suspensão do compute (ex.: 360) e um intervalo de keepalive menor.
+
+Uso (a partir da pasta backend/, com DATABASE_URL configurada):
+
+    python -m benchmarks.first_request --idle 360 --shop-id 1
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD_CODE = """
+import json, sys, time, warnings
+warnings.filterwarnings("ignore")
+from fastapi.testclient import TestClient
+import main
+idle, shop_id = float(sys.argv[1]), int(sys.argv[2])
+with TestClient(main.app) as client:
+    time.sleep(idle)
+    t0 = time.perf_counter()
+    r = client.get(f"/barbershops/{shop_id}/services")
+    first = (time.perf_counter() - t0) * 1000
+    t0 = time.perf_counter()
+    client.get(f"/barbershops/{shop_id}/services")
+    second = (time.perf_counter() - t0) * 1000
+print(json.dumps({"status": r.status_code, "first_ms": first, "second_ms": second}))
+"""
+
+MODES = {
+    "sem keepalive": {"DB_WARM_ON_STARTUP": "false", "DB_KEEPALIVE_INTERVAL": "0"},
+    "com keepalive": {},
+}
+
+
+def run(mode_env: dict, idle: float, shop_id: int, keepalive: int) -> dict:
+    env = dict(os.environ, LOG_LEVEL="WARNING", **mode_env)
+    if not mode_env:
+        env["DB_KEEPALIVE_INTERVAL"] = str(keepalive)
+        env["DB_KEEPALIVE_HOURS"] = "00:00-24:00"
+    result = subprocess.run(
+        [sys.executable, "-c", CHILD_CODE, str(idle), str(shop_id)],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise SystemExit(result.stderr)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--idle", type=float, default=30)
+    parser.add_argument("--shop-id", type=int, default=1)
+    parser.add_argument("--keepalive", type=int, default=10, help="intervalo do keepalive no modo 'com keepalive'")
+    args = parser.parse_args()
+
+    for nome, mode_env in MODES.items():
+        r = run(mode_env, args.idle, args.shop_id, args.keepalive)
+        print(f"{nome:>14}: 1º pedido {r['first_ms']:.1f} ms | 2º pedido {r['second_ms']:.1f} ms (HTTP {r['status']})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Benchmark da importação em massa: histórico de agendamentos de uma rede migrando de outro sistema.
+
+Gera um CSV com N atendimentos (nomes de barbeiros/serviços como vêm de outro sistema,
+milhares de clientes distintos e algumas linhas inválidas), importa pela rota
+POST /admin/{id}/import/appointments e mede o tempo do dry-run e da importação real.
+
+    python -m benchmarks.imports
+    python -m benchmarks.imports --rows 300000
+"""
+import argparse
+import csv
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+import warnings
+from datetime import datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Orçamento do pedido: 100 mil atendimentos em segundos
+BUDGET_SECONDS_PER_100K = 30
+
+
+def gerar_csv(rows: int, barbeiros: list[str], servicos: list[str]) -> bytes:
+    random.seed(5)
+    inicio = datetime(2022, 1, 1, 9)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(["date_time", "kind", "status", "client_name", "client_phone", "barber_name", "service_name", "price"])
+    for i in range(rows):
+        quando = inicio + timedelta(days=i * 900 // rows, minutes=random.randrange(0, 600, 15))
+        sorte = random.random()
+        if sorte < 0.001:
+            writer.writerow(["ontem", "", "", "", "", "", "", ""])  # linha inválida
+        elif sorte < 0.1:
+            writer.writerow([quando.isoformat(), "produto", "concluido", "Pomada", "000000000", "", "", "35,00"])
+        else:
+            cliente = random.randrange(rows // 8 or 1)
+            writer.writerow([quando.isoformat(), "servico", "concluido", f"Cliente {cliente}", f"(11) 9{cliente:04d}-{cliente % 9999:04d}",
+                             random.choice(barbeiros).upper(), random.choice(servicos), ""])
+    return buffer.getvalue().encode()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix="bench_imports_")
+    os.environ["DATABASE_URL"] = f"sqlite:///{tmpdir}/bench.db"
+    os.environ["DB_KEEPALIVE_INTERVAL"] = "0"
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    sys.path.insert(0, BACKEND_DIR)
+    os.chdir(tmpdir)
+    warnings.filterwarnings("ignore")
+
+    from sqlalchemy import insert
+    from fastapi.testclient import TestClient
+    import main as app_main
+    import migrations
+    from auth import create_access_token
+    from database import SessionLocal, engine
+    from models import Appointment, Barber, Barbershop, Client, Service
+
+    migrations.upgrade()
+    barbeiros = [f"Barbeiro {i}" for i in range(8)]
+    servicos = ["Corte", "Barba", "Corte + Barba", "Degradê", "Sobrancelha"]
+    with engine.begin() as conn:
+        shop_id = conn.execute(insert(Barbershop).values(name="Rede", slug="rede")).inserted_primary_key[0]
+        conn.execute(insert(Barber), [{"name": n, "pin": f"{4000 + i}", "role": "BARBER", "barbershop_id": shop_id} for i, n in enumerate(barbeiros)])
+        conn.execute(insert(Service), [{"name": n, "price": 30 + 5 * i, "duration": 30, "barbershop_id": shop_id} for i, n in enumerate(servicos)])
+
+    conteudo = gerar_csv(args.rows, barbeiros, servicos)
+    print(f"CSV com {args.rows} linhas ({len(conteudo) / 1e6:.1f} MB)\n")
+
+    client = TestClient(app_main.app)
+    headers = {"Authorization": "Bearer " + create_access_token({"sub": "1", "role": "OWNER", "shop_id": shop_id})}
+    tempos = {}
+    for dry_run in (True, False):
+        t0 = time.perf_counter()
+        r = client.post(f"/admin/{shop_id}/import/appointments", params={"dry_run": dry_run},
+                        files={"file": ("historico.csv", conteudo, "text/csv")}, headers=headers)
+        tempos[dry_run] = time.perf_counter() - t0
+        d = r.json()
+        print(f"{'dry-run' if dry_run else 'importação':>10}: {tempos[dry_run]:.2f} s | {d['imported']} válidas, {d['errors']} com erro (HTTP {r.status_code})")
+
+    db = SessionLocal()
+    print(f"\nNo banco: {db.query(Appointment).count()} atendimentos, {db.query(Client).count()} clientes")
+    db.close()
+
+    orcamento = BUDGET_SECONDS_PER_100K * args.rows / 100_000
+    if tempos[False] > orcamento:
+        raise SystemExit(f"FALHOU: importação levou mais de {orcamento:.0f} s")
+
+
+if __name__ == "__main__":
+    main()
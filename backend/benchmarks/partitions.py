@@ -0,0 +1,115 @@
+"""Latência do caminho quente à medida que o histórico cresce.
+
+Semeia uma loja com uma agenda "atual" fixa e vai acrescentando histórico antigo
+(concluído) em degraus. Em cada degrau mede as rotas quentes (horários disponíveis,
+agenda e financeiro do mês) antes e depois de correr o job de arquivo. Com os filtros
+por intervalo + índices (e partições no Postgres) a latência deve ficar estável.
+
+Por segurança usa sempre um banco novo: SQLite temporário por omissão, ou um Postgres
+VAZIO passado em --database-url.
+
+    python -m benchmarks.partitions
+    python -m benchmarks.partitions --sizes 0 100000 1000000 --database-url postgresql://localhost/bench
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+import warnings
+from datetime import datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def medir(client, url, headers=None, runs=30) -> float:
+    tempos = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        r = client.get(url, headers=headers)
+        tempos.append((time.perf_counter() - t0) * 1000)
+        assert r.status_code == 200, r.text
+    return statistics.median(tempos)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[0, 50_000, 200_000, 500_000])
+    parser.add_argument("--database-url", default=None)
+    parser.add_argument("--runs", type=int, default=30)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix="bench_partitions_")
+    os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{tmpdir}/bench.db"
+    os.environ["DB_KEEPALIVE_INTERVAL"] = "0"
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ["DB_WARM_ON_STARTUP"] = "false"
+    sys.path.insert(0, BACKEND_DIR)
+    os.chdir(tmpdir)
+    warnings.filterwarnings("ignore")
+
+    from fastapi.testclient import TestClient
+    from sqlalchemy import insert
+    import archive
+    import migrations
+    from auth import create_access_token
+    from database import engine
+    from main import app
+    from models import Appointment, Barber, Barbershop, Service
+
+    migrations.upgrade()
+    with engine.begin() as conn:
+        shop_id = conn.execute(insert(Barbershop).values(name="Bench", slug="bench")).inserted_primary_key[0]
+        barber_ids = [
+            conn.execute(insert(Barber).values(name=f"B{i}", role="BARBER", pin=f"9{i:03d}", barbershop_id=shop_id)).inserted_primary_key[0]
+            for i in range(5)
+        ]
+        service_id = conn.execute(insert(Service).values(name="Corte", price=30, duration=30, barbershop_id=shop_id)).inserted_primary_key[0]
+
+        # Agenda atual (fixa em todos os degraus)
+        hoje = datetime.now().replace(hour=9, minute=0, second=0, microsecond=0)
+        conn.execute(insert(Appointment), [
+            {"client_name": f"Atual {d}-{h}", "client_phone": "1", "date_time": hoje + timedelta(days=d, minutes=30 * h),
+             "service_id": service_id, "barber_id": barber_ids[h % 5], "barbershop_id": shop_id,
+             "status": "scheduled" if d >= 0 else "concluido", "service_price": 30.0}
+            for d in range(-10, 10) for h in range(16)
+        ])
+
+    manager = {"Authorization": "Bearer " + create_access_token({"sub": str(barber_ids[0]), "role": "OWNER", "shop_id": shop_id})}
+    amanha = (datetime.now() + timedelta(days=1)).strftime("%Y-%m-%d")
+    rotas = {
+        "available-times": (f"/barbershops/bench/available-times?barber_id={barber_ids[1]}&service_id={service_id}&date={amanha}", None),
+        "agenda": (f"/admin/{shop_id}/appointments", manager),
+        "financeiro": (f"/admin/{shop_id}/financeiro", manager),
+    }
+
+    client = TestClient(app)
+    inicio_hist = datetime.now() - timedelta(days=archive.ARCHIVE_HORIZON_DAYS + 30)
+    historico = 0
+
+    print(f"{'histórico':>10} | {'fase':<14} | " + " | ".join(f"{nome:>16}" for nome in rotas))
+    for alvo in args.sizes:
+        lote = []
+        while historico < alvo:
+            lote.append({
+                "client_name": f"Antigo {historico}", "client_phone": "1",
+                "date_time": inicio_hist - timedelta(minutes=37 * historico),
+                "service_id": service_id, "barber_id": barber_ids[historico % 5], "barbershop_id": shop_id,
+                "status": "concluido", "service_price": 30.0,
+            })
+            historico += 1
+            if len(lote) == 10_000 or historico == alvo:
+                with engine.begin() as conn:
+                    conn.execute(insert(Appointment), lote)
+                lote = []
+
+        for fase in ["sem arquivo", "após arquivo"]:
+            if fase == "após arquivo":
+                archive.archive_old_appointments()
+            tempos = [medir(client, url, headers, args.runs) for url, headers in rotas.values()]
+            print(f"{alvo:>10} | {fase:<14} | " + " | ".join(f"{t:>13.2f} ms" for t in tempos))
+
+
+if __name__ == "__main__":
+    main()
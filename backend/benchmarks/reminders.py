@@ -0,0 +1,102 @@
+"""Benchmark do agendador de lembretes: uma hora cheia de agendamentos em várias lojas.
+
+Semeia agendamentos `scheduled` dentro da janela de lembrete (além de histórico concluído
+fora dela), corre uma volta do agendador contra um webhook simulado e mede o tempo total,
+o número de queries SQL e de POSTs ao N8N. Uma segunda volta tem de enviar zero.
+
+    python -m benchmarks.reminders
+    python -m benchmarks.reminders --upcoming 50000 --workers 4
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import warnings
+from datetime import datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--upcoming", type=int, default=30000, help="agendamentos dentro da janela")
+    parser.add_argument("--history", type=int, default=200000, help="atendimentos antigos fora da janela")
+    parser.add_argument("--shops", type=int, default=300)
+    parser.add_argument("--workers", type=int, default=3, help="voltas simultâneas (simula vários workers)")
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix="bench_reminders_")
+    os.environ["DATABASE_URL"] = f"sqlite:///{tmpdir}/bench.db"
+    os.environ["DB_KEEPALIVE_INTERVAL"] = "0"
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ["N8N_WHATSAPP_WEBHOOK"] = "http://n8n.invalid/webhook"
+    sys.path.insert(0, BACKEND_DIR)
+    warnings.filterwarnings("ignore")
+
+    import httpx
+    from sqlalchemy import event, insert
+    import migrations
+    import reminders
+    from database import engine
+    from models import Appointment, Barbershop
+
+    migrations.upgrade()
+    random.seed(7)
+    agora = datetime.now().replace(second=0, microsecond=0)
+    inicio, fim = reminders.reminder_window(agora)
+    janela = int((fim - inicio).total_seconds() // 60)
+    with engine.begin() as conn:
+        conn.execute(insert(Barbershop), [{"id": i, "name": f"Loja {i}", "slug": f"loja-{i}"} for i in range(1, args.shops + 1)])
+        linhas = [{
+            "client_name": f"Cliente {i}", "client_phone": f"1199{i:07d}", "barbershop_id": random.randint(1, args.shops),
+            "date_time": inicio + timedelta(minutes=random.randrange(janela)), "status": "scheduled",
+        } for i in range(args.upcoming)]
+        linhas += [{
+            "client_name": f"Antigo {i}", "client_phone": "1", "barbershop_id": random.randint(1, args.shops),
+            "date_time": agora - timedelta(minutes=random.randint(60, 60 * 24 * 90)), "status": "concluido",
+        } for i in range(args.history)]
+        for i in range(0, len(linhas), 20000):
+            conn.execute(insert(Appointment), linhas[i:i + 20000])
+    print(f"{args.upcoming} agendamentos na janela ({janela} min), {args.history} fora dela, {args.shops} lojas\n")
+
+    queries = [0]
+    lock = threading.Lock()
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _contar(*_):
+        with lock:
+            queries[0] += 1
+
+    recebidos = []
+    posts = [0]
+
+    def webhook(request):
+        with lock:
+            posts[0] += 1
+            recebidos.extend(r["appointment_id"] for r in json.loads(request.content)["reminders"])
+        return httpx.Response(200)
+
+    http = httpx.Client(transport=httpx.MockTransport(webhook))
+    t0 = time.perf_counter()
+    threads = [threading.Thread(target=reminders.run_reminders, args=(agora, http)) for _ in range(args.workers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    duracao = time.perf_counter() - t0
+
+    print(f"{args.workers} workers: {len(recebidos)} lembretes em {duracao * 1000:.0f} ms "
+          f"({len(recebidos) / duracao * 3600:,.0f}/hora) | {posts[0]} POSTs | {queries[0]} queries SQL")
+    duplicados = len(recebidos) - len(set(recebidos))
+    segunda = reminders.run_reminders(agora, http)
+    print(f"duplicados: {duplicados} | segunda volta enviou: {segunda}")
+    if duplicados or segunda or len(set(recebidos)) != args.upcoming:
+        raise SystemExit("FALHOU: lembretes em falta ou repetidos")
+
+
+if __name__ == "__main__":
+    main()
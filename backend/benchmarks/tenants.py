@@ -0,0 +1,67 @@
+"""Benchmark da visão geral de lojas do SuperAdmin com milhares de tenants.
+
+    python -m benchmarks.tenants
+    python -m benchmarks.tenants --shops 10000 --per-shop 100
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import warnings
+from datetime import datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shops", type=int, default=5000)
+    parser.add_argument("--per-shop", type=int, default=60, help="atendimentos por loja (últimos 90 dias)")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix="bench_tenants_")
+    os.environ["DATABASE_URL"] = f"sqlite:///{tmpdir}/bench.db"
+    os.environ["DB_KEEPALIVE_INTERVAL"] = "0"
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    sys.path.insert(0, BACKEND_DIR)
+    warnings.filterwarnings("ignore")
+
+    from sqlalchemy import insert
+    import migrations
+    from database import SessionLocal, engine
+    from models import Appointment, Barber, Barbershop
+    from tenants import OVERVIEW_SORTS, tenant_overview
+
+    migrations.upgrade()
+    random.seed(7)
+    agora = datetime.now()
+    with engine.begin() as conn:
+        conn.execute(insert(Barbershop), [{"id": i, "name": f"Loja {i:05d}", "slug": f"loja-{i}", "owner_email": f"{i}@x.com"}
+                                          for i in range(1, args.shops + 1)])
+        conn.execute(insert(Barber), [{"name": f"B{i}-{j}", "pin": f"{i}-{j}", "barbershop_id": i}
+                                      for i in range(1, args.shops + 1) for j in range(random.randint(1, 6))])
+        conn.execute(insert(Appointment), [
+            {"client_name": "C", "client_phone": "1", "barbershop_id": i, "status": random.choice(["concluido", "scheduled", "cancelado"]),
+             "date_time": agora - timedelta(minutes=random.randint(0, 90 * 24 * 60)), "service_price": 30.0}
+            for i in range(1, args.shops + 1) for _ in range(args.per_shop)
+        ])
+    print(f"{args.shops} lojas, {args.shops * args.per_shop} atendimentos\n")
+
+    db = SessionLocal()
+    for sort in OVERVIEW_SORTS:
+        for page in (1, args.shops // 50):
+            tempos = []
+            for _ in range(args.runs):
+                t0 = time.perf_counter()
+                tenant_overview(db, page=page, page_size=50, sort=sort)
+                tempos.append((time.perf_counter() - t0) * 1000)
+            print(f"sort={sort:<13} página {page:<4} mediana {statistics.median(tempos):7.1f} ms")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""Calendário (.ics) de cada barbeiro, por link secreto, para assinar no telemóvel.
+
+    GET /calendar/<token>.ics
+
+O link não pede login: o segredo é o próprio token (Barber.calendar_token, 32 caracteres
+aleatórios). Trocar o token desliga o link antigo.
+
+A janela é fixa: da semana passada (CALENDAR_PAST_DAYS) aos próximos CALENDAR_FUTURE_DAYS
+dias, só serviços agendados ou concluídos (cancelados e vendas de balcão ficam de fora).
+
+As apps de calendário consultam o link a cada poucos minutos. Cada consulta faz UMA query
+pelo índice (barber_id, date_time): o barbeiro do token e, dos agendamentos da janela (em
+qualquer estado), a última alteração (updated_at) e quantos são. Daí saem o ETag e o Last-Modified; se a app
+já tem essa versão, a resposta é 304 sem corpo. O .ics só é gerado quando algo mudou, e
+fica em cache (por barbeiro e ETag) para as outras apps que o assinam.
+"""
+import hashlib
+import secrets
+import threading
+from datetime import date, datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from models import Appointment, Barber, Barbershop, Service
+
+CALENDAR_PAST_DAYS = 7
+CALENDAR_FUTURE_DAYS = 60
+CALENDAR_STATUSES = ["scheduled", "concluido"]
+# Sugestão de intervalo de atualização para as apps que a respeitam
+CALENDAR_REFRESH = "PT15M"
+# Agendamentos antigos sem duração gravada
+CALENDAR_DEFAULT_MINUTES = 30
+
+_CACHE_MAX_ENTRIES = 5_000
+# barber_id -> (etag, corpo do .ics)
+_cache: dict[int, tuple[str, str]] = {}
+_lock = threading.Lock()
+
+
+def new_token() -> str:
+    return secrets.token_urlsafe(24)
+
+
+def feed_window(today: date) -> tuple[datetime, datetime]:
+    inicio = datetime.combine(today - timedelta(days=CALENDAR_PAST_DAYS), datetime.min.time())
+    fim = datetime.combine(today + timedelta(days=CALENDAR_FUTURE_DAYS + 1), datetime.min.time())
+    return inicio, fim
+
+
+# ==========================================
+# VERSÃO DO CALENDÁRIO (CAMINHO DE CADA CONSULTA)
+# ==========================================
+
+def check_feed(db: Session, token: str, today: date | None = None) -> dict | None:
+    """Barbeiro do token + ETag/Last-Modified da janela atual, numa query. None se o link não existe."""
+    today = today or date.today()
+    inicio, fim = feed_window(today)
+    linha = db.execute(
+        select(
+            Barber.id, Barber.name, Barbershop.name, Barbershop.address,
+            func.max(Appointment.updated_at), func.count(Appointment.id),
+        )
+        .join(Barbershop, Barbershop.id == Barber.barbershop_id)
+        # Todos os estados: um cancelamento também é uma alteração (e tira o evento do .ics)
+        .outerjoin(Appointment, (Appointment.barber_id == Barber.id)
+                   & (Appointment.date_time >= inicio) & (Appointment.date_time < fim)
+                   & Appointment.service_id.isnot(None))
+        .where(Barber.calendar_token == token, Barber.is_active.isnot(False))
+        .group_by(Barber.id, Barber.name, Barbershop.name, Barbershop.address)
+    ).first()
+    if linha is None:
+        return None
+    barber_id, barber_name, shop_name, shop_address, alterado, total = linha
+
+    # A janela anda à meia-noite: o dia entra na versão e é o Last-Modified mínimo
+    meia_noite = datetime.combine(today, datetime.min.time())
+    ultima = max(alterado or meia_noite, meia_noite)
+    versao = f"{barber_id}|{barber_name}|{shop_name}|{shop_address}|{today}|{alterado}|{total}"
+    return {
+        "barber_id": barber_id,
+        "barber_name": barber_name,
+        "shop_name": shop_name,
+        "shop_address": shop_address,
+        "start": inicio,
+        "end": fim,
+        "etag": 'W/"' + hashlib.sha1(versao.encode()).hexdigest()[:20] + '"',
+        "last_modified": ultima.astimezone(timezone.utc).replace(microsecond=0),
+    }
+
+
+def feed_headers(feed: dict) -> dict:
+    return {
+        "ETag": feed["etag"],
+        "Last-Modified": format_datetime(feed["last_modified"], usegmt=True),
+        # A app pode guardar, mas revalida sempre (a revalidação custa só a query acima)
+        "Cache-Control": "private, no-cache",
+    }
+
+
+def not_modified(feed: dict, if_none_match: str | None, if_modified_since: str | None) -> bool:
+    """A app já tem esta versão? O If-None-Match manda; sem ele, vale o If-Modified-Since."""
+    if if_none_match:
+        pedidas = {t.strip().removeprefix("W/") for t in if_none_match.split(",")}
+        return "*" in pedidas or feed["etag"].removeprefix("W/") in pedidas
+    if if_modified_since:
+        try:
+            return feed["last_modified"] <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+# ==========================================
+# GERAÇÃO DO .ICS
+# ==========================================
+
+def _escape(texto) -> str:
+    return (str(texto or "").replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+            .replace("\r\n", "\\n").replace("\n", "\\n"))
+
+
+def _fold(linha: str) -> str:
+    """Linhas de no máximo 75 bytes (RFC 5545), sem partir caracteres UTF-8 ao meio."""
+    if len(linha.encode()) <= 75:
+        return linha
+    partes, atual, tamanho = [], "", 0
+    for char in linha:
+        n = len(char.encode())
+        if tamanho + n > (75 if not partes else 74):
+            partes.append(atual)
+            atual, tamanho = "", 0
+        atual += char
+        tamanho += n
+    partes.append(atual)
+    return "\r\n ".join(partes)
+
+
+def _local(dt: datetime) -> str:
+    # Hora "flutuante" (sem fuso): a app mostra-a no fuso do telemóvel, como a loja a marcou
+    return dt.strftime("%Y%m%dT%H%M%S")
+
+
+def _utc(dt: datetime) -> str:
+    return dt.astimezone(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+def render_feed(db: Session, feed: dict) -> str:
+    """O .ics da janela do feed; gerado só quando o ETag mudou desde a última vez."""
+    with _lock:
+        cached = _cache.get(feed["barber_id"])
+    if cached is not None and cached[0] == feed["etag"]:
+        return cached[1]
+
+    agendamentos = db.execute(
+        select(
+            Appointment.id, Appointment.date_time, Appointment.end_time, Appointment.duration,
+            Appointment.client_name, Appointment.client_phone, Appointment.service_price,
+            Appointment.updated_at, Service.name,
+        )
+        .outerjoin(Service, Service.id == Appointment.service_id)
+        .where(Appointment.barber_id == feed["barber_id"],
+               Appointment.date_time >= feed["start"], Appointment.date_time < feed["end"],
+               Appointment.status.in_(CALENDAR_STATUSES), Appointment.service_id.isnot(None))
+        .order_by(Appointment.date_time)
+    ).all()
+
+    agora = _utc(datetime.now())
+    nome = f"{feed['barber_name']} · {feed['shop_name']}"
+    local = ", ".join(p for p in (feed["shop_name"], feed["shop_address"]) if p)
+    linhas = [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        "PRODID:-//SaaS Barbearia//Agenda//PT",
+        "CALSCALE:GREGORIAN",
+        "METHOD:PUBLISH",
+        f"X-WR-CALNAME:{_escape(nome)}",
+        f"REFRESH-INTERVAL;VALUE=DURATION:{CALENDAR_REFRESH}",
+        f"X-PUBLISHED-TTL:{CALENDAR_REFRESH}",
+    ]
+    for (appo_id, inicio, fim, duracao, cliente, telefone, preco, alterado, servico) in agendamentos:
+        fim = fim or inicio + timedelta(minutes=duracao or CALENDAR_DEFAULT_MINUTES)
+        titulo = f"{servico or 'Atendimento'} - {cliente}"
+        valor = f"{preco or 0:.2f}".replace(".", ",")
+        descricao = f"Cliente: {cliente}\nTelefone: {telefone}\nValor: R$ {valor}"
+        linhas += [
+            "BEGIN:VEVENT",
+            f"UID:appointment-{appo_id}@barbearia",
+            f"DTSTAMP:{_utc(alterado) if alterado else agora}",
+            f"DTSTART:{_local(inicio)}",
+            f"DTEND:{_local(fim)}",
+            f"SUMMARY:{_escape(titulo)}",
+            f"DESCRIPTION:{_escape(descricao)}",
+            f"LOCATION:{_escape(local)}" if local else None,
+            "STATUS:CONFIRMED",
+            "END:VEVENT",
+        ]
+    linhas.append("END:VCALENDAR")
+    corpo = "\r\n".join(_fold(linha) for linha in linhas if linha is not None) + "\r\n"
+
+    with _lock:
+        if len(_cache) > _CACHE_MAX_ENTRIES:
+            _cache.clear()
+        _cache[feed["barber_id"]] = (feed["etag"], corpo)
+    return corpo
@@ -0,0 +1,267 @@
+"""Diretório de clientes por loja.
+
+Cada cliente é identificado pelo telefone normalizado em E.164 (ex.: +5511999990000),
+único por loja. Os agendamentos apontam para o cliente (appointments.client_id), o que
+torna "o que este cliente já marcou" e "achar a marcação pelo telefone" buscas por índice
+em vez de varrer a tabela de agendamentos.
+
+Para refazer a ligação do histórico (a migração 004 já faz isso uma vez):
+
+    python clients.py backfill
+"""
+import os
+import re
+import sys
+import unicodedata
+from datetime import datetime
+
+from sqlalchemy import func, insert, or_, select, text, union_all
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models import Appointment, AppointmentArchive, Barber, Client, Service
+
+# Código do país assumido quando o telefone vem sem ele (lojas no Brasil)
+DEFAULT_COUNTRY_CODE = os.getenv("DEFAULT_COUNTRY_CODE", "55")
+CLIENT_SEARCH_MAX = 50
+BACKFILL_BATCH_SIZE = 5000
+
+
+# ==========================================
+# NORMALIZAÇÃO
+# ==========================================
+
+def normalize_phone(raw: str | None, country_code: str = DEFAULT_COUNTRY_CODE) -> str | None:
+    """Telefone em E.164. Devolve None para o que não parece um telefone (ex.: vendas de balcão "000000000")."""
+    if not raw:
+        return None
+    raw = raw.strip()
+    digitos = re.sub(r"\D", "", raw)
+    if not digitos or set(digitos) == {"0"}:
+        return None
+
+    if raw.startswith("+"):
+        numero = digitos
+    elif digitos.startswith("00"):
+        numero = digitos[2:]  # prefixo internacional (00 + país)
+    elif digitos.startswith(country_code) and len(digitos) >= len(country_code) + 10:
+        numero = digitos  # já veio com o país, só faltava o "+"
+    else:
+        numero = country_code + digitos.lstrip("0")  # número local (o 0 do DDD cai)
+
+    if not 8 <= len(numero) <= 15:
+        return None
+    return "+" + numero
+
+
+def phone_prefix(partial: str, country_code: str = DEFAULT_COUNTRY_CODE) -> str | None:
+    """Prefixo E.164 para buscar por um telefone incompleto ("1199" -> "+551199")."""
+    digitos = re.sub(r"\D", "", partial or "")
+    if not digitos:
+        return None
+    if partial.strip().startswith("+") or digitos.startswith("00"):
+        return "+" + digitos.removeprefix("00")
+    if digitos.startswith(country_code) and len(digitos) > len(country_code) + 2:
+        return "+" + digitos
+    return "+" + country_code + digitos.lstrip("0")
+
+
+def normalize_name(name: str | None) -> str:
+    """Minúsculas, sem acentos e com espaços simples: "  JOÃO  da Silva" -> "joao da silva"."""
+    sem_acentos = unicodedata.normalize("NFKD", name or "").encode("ascii", "ignore").decode()
+    return " ".join(sem_acentos.lower().split())
+
+
+# ==========================================
+# CADASTRO E BUSCA
+# ==========================================
+
+def upsert_client(db: Session, shop_id: int, name: str | None, raw_phone: str | None, when: datetime | None = None) -> int | None:
+    """Devolve o ID do cliente (criando-o se preciso). Não faz commit: entra na transação do agendamento."""
+    phone = normalize_phone(raw_phone)
+    if not shop_id or not phone:
+        return None
+
+    client = db.query(Client).filter(Client.barbershop_id == shop_id, Client.phone == phone).first()
+    if client is None:
+        client = Client(barbershop_id=shop_id, phone=phone, name=name, name_search=normalize_name(name), last_booking_at=when)
+        try:
+            with db.begin_nested():
+                db.add(client)
+            return client.id
+        except IntegrityError:
+            # Outro pedido criou o mesmo cliente ao mesmo tempo
+            client = db.query(Client).filter(Client.barbershop_id == shop_id, Client.phone == phone).first()
+
+    if name and name != client.name:
+        # Fica o nome mais recente que o cliente usou
+        client.name = name
+        client.name_search = normalize_name(name)
+    if when and (client.last_booking_at is None or when > client.last_booking_at):
+        client.last_booking_at = when
+    return client.id
+
+
+def client_to_dict(client: Client) -> dict:
+    return {
+        "id": client.id,
+        "name": client.name,
+        "phone": client.phone,
+        "created_at": client.created_at.isoformat() if client.created_at else None,
+        "last_booking_at": client.last_booking_at.isoformat() if client.last_booking_at else None,
+    }
+
+
+def search_clients(db: Session, shop_id: int, q: str, limit: int = 20) -> list[dict]:
+    """Busca por prefixo de telefone (se a busca tem dígitos) ou por nome (início de qualquer palavra).
+
+    O prefixo de telefone e o início do nome usam os índices (barbershop_id, phone/name_search);
+    no Postgres o índice trigram também cobre o "início de qualquer palavra".
+    """
+    limit = min(max(limit, 1), CLIENT_SEARCH_MAX)
+    query = db.query(Client).filter(Client.barbershop_id == shop_id)
+
+    if re.search(r"\d", q) and not re.search(r"[^\d\s()+\-.]", q):
+        prefixo = phone_prefix(q)
+        if not prefixo:
+            return []
+        query = query.filter(Client.phone.like(f"{prefixo}%"))
+    else:
+        termo = normalize_name(q)
+        if not termo:
+            return []
+        termo = termo.replace("\\", "").replace("%", "").replace("_", "")
+        query = query.filter(or_(Client.name_search.like(f"{termo}%"), Client.name_search.like(f"% {termo}%")))
+
+    clientes = query.order_by(Client.last_booking_at.desc().nulls_last(), Client.id).limit(limit).all()
+    return [client_to_dict(c) for c in clientes]
+
+
+def client_history(db: Session, shop_id: int, client_id: int, page: int = 1, page_size: int = 20) -> dict:
+    """Agendamentos do cliente, do mais recente para o mais antigo (inclui o histórico arquivado)."""
+    def _select(table):
+        return select(
+            table.c.id, table.c.date_time, table.c.status, table.c.service_price,
+            table.c.barber_id, table.c.service_id,
+        ).where(table.c.client_id == client_id, table.c.barbershop_id == shop_id)
+
+    linhas = union_all(_select(Appointment.__table__), _select(AppointmentArchive.__table__)).subquery()
+    total = db.execute(select(func.count()).select_from(linhas)).scalar()
+    pagina = db.execute(
+        select(linhas, Barber.name.label("barber_name"), Service.name.label("service_name"))
+        .outerjoin(Barber, Barber.id == linhas.c.barber_id)
+        .outerjoin(Service, Service.id == linhas.c.service_id)
+        .order_by(linhas.c.date_time.desc(), linhas.c.id.desc())
+        .limit(page_size)
+        .offset((page - 1) * page_size)
+    ).mappings().all()
+
+    return {
+        "items": [{
+            "id": row["id"],
+            "date_time": row["date_time"].isoformat() if row["date_time"] else None,
+            "status": row["status"],
+            "price": row["service_price"] or 0.0,
+            "barber_id": row["barber_id"],
+            "barber_name": row["barber_name"],
+            "service_id": row["service_id"],
+            "service_name": row["service_name"],
+        } for row in pagina],
+        "page": page,
+        "page_size": page_size,
+        "total": total,
+        "pages": -(-total // page_size) if total else 0,
+    }
+
+
+# ==========================================
+# PREENCHIMENTO A PARTIR DO HISTÓRICO
+# ==========================================
+
+def backfill_clients(conn, batch_size: int = BACKFILL_BATCH_SIZE) -> int:
+    """Cria os clientes a partir dos telefones já gravados e liga os agendamentos a eles.
+
+    A normalização é feita em Python (uma vez por telefone distinto); a ligação é um único
+    UPDATE por tabela, através de uma tabela temporária (loja, telefone cru) -> cliente.
+    """
+    tabelas = [Appointment.__table__, AppointmentArchive.__table__]
+    existentes = {(shop, phone): cid for cid, shop, phone in conn.execute(
+        select(Client.id, Client.barbershop_id, Client.phone)
+    )}
+
+    # Telefones crus distintos por loja, com um dos nomes usados e a data mais recente
+    por_telefone = union_all(*[
+        select(t.c.barbershop_id, t.c.client_phone, t.c.client_name, t.c.date_time)
+        .where(t.c.client_id.is_(None), t.c.client_phone.isnot(None), t.c.barbershop_id.isnot(None))
+        for t in tabelas
+    ]).subquery()
+    distintos = conn.execute(
+        select(por_telefone.c.barbershop_id, por_telefone.c.client_phone,
+               func.max(por_telefone.c.client_name), func.max(por_telefone.c.date_time))
+        .group_by(por_telefone.c.barbershop_id, por_telefone.c.client_phone)
+    ).all()
+
+    novos = {}
+    mapa = []
+    for shop_id, raw, name, ultima in distintos:
+        phone = normalize_phone(raw)
+        if not phone:
+            continue
+        chave = (shop_id, phone)
+        if chave not in existentes and chave not in novos:
+            novos[chave] = {"barbershop_id": shop_id, "phone": phone, "name": name,
+                            "name_search": normalize_name(name), "created_at": datetime.now(), "last_booking_at": ultima}
+        elif chave in novos and ultima and (novos[chave]["last_booking_at"] is None or ultima > novos[chave]["last_booking_at"]):
+            novos[chave]["last_booking_at"] = ultima
+        mapa.append((shop_id, raw, chave))
+
+    lista = list(novos.values())
+    for i in range(0, len(lista), batch_size):
+        conn.execute(insert(Client), lista[i:i + batch_size])
+    existentes = {(shop, phone): cid for cid, shop, phone in conn.execute(
+        select(Client.id, Client.barbershop_id, Client.phone)
+    )}
+
+    conn.execute(text("CREATE TEMPORARY TABLE _client_map (barbershop_id INTEGER, raw_phone VARCHAR, client_id INTEGER)"))
+    linhas = [{"s": shop_id, "r": raw, "c": existentes[chave]} for shop_id, raw, chave in mapa]
+    for i in range(0, len(linhas), batch_size):
+        conn.execute(text("INSERT INTO _client_map VALUES (:s, :r, :c)"), linhas[i:i + batch_size])
+    conn.execute(text("CREATE INDEX _client_map_idx ON _client_map (barbershop_id, raw_phone)"))
+
+    for t in tabelas:
+        conn.execute(text(
+            f"UPDATE {t.name} SET client_id = (SELECT m.client_id FROM _client_map m "
+            f"WHERE m.barbershop_id = {t.name}.barbershop_id AND m.raw_phone = {t.name}.client_phone) "
+            f"WHERE client_id IS NULL AND EXISTS (SELECT 1 FROM _client_map m "
+            f"WHERE m.barbershop_id = {t.name}.barbershop_id AND m.raw_phone = {t.name}.client_phone)"
+        ))
+    conn.execute(text("DROP TABLE _client_map"))
+    return len(lista)
+
+
+def create_trigram_index(conn) -> bool:
+    """Postgres: índice trigram para a busca por nome. Sem a extensão pg_trgm (ou sem permissão), segue sem ele."""
+    if conn.dialect.name != "postgresql":
+        return False
+    try:
+        with conn.begin_nested():
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_clients_name_trgm ON clients USING gin (name_search gin_trgm_ops)"
+            ))
+        return True
+    except Exception:
+        return False
+
+
+if __name__ == "__main__":
+    from database import engine
+    from logs import get_logger, setup_logging
+
+    setup_logging(default_format="text")
+    if len(sys.argv) > 1 and sys.argv[1] == "backfill":
+        with engine.begin() as conn:
+            criados = backfill_clients(conn)
+        get_logger("clients").info(f"{criados} clientes criados a partir do histórico.")
+    else:
+        get_logger("clients").info(__doc__)
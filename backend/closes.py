@@ -0,0 +1,323 @@
+"""Fechamento de caixa diário.
+
+Cada fechamento é uma foto imutável dos totais do dia (por barbeiro, vendas de balcão,
+produtos e serviços) guardada em `day_closes`. O agendador grava a foto de cada loja
+quando passa o `close_time` dela; o botão "fechar caixa" reaproveita a foto se nada
+mudou desde então. Se o dia mudar depois (ex.: atendimento concluído com atraso),
+grava-se uma nova versão em vez de alterar a anterior.
+
+Relatórios de dias passados passam a ser a leitura de uma única linha.
+"""
+import asyncio
+import json
+import os
+import smtplib
+from datetime import date, datetime, time as dtime, timedelta
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+from sqlalchemy import and_, func, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from analytics import kind_sql
+from archive import appointments_between
+from database import SessionLocal
+from logs import get_logger
+from models import Barber, Barbershop, DayClose
+
+# Liga/desliga o agendador (num deploy com vários workers pode ficar ligado em todos:
+# a restrição única em (loja, dia, versão) impede fotos duplicadas)
+DAY_CLOSE_SCHEDULER = os.getenv("DAY_CLOSE_SCHEDULER", "true").lower() == "true"
+DAY_CLOSE_CHECK_INTERVAL = int(os.getenv("DAY_CLOSE_CHECK_INTERVAL", "60"))
+# Envia o fechamento automático para o e-mail do dono da loja
+DAY_CLOSE_EMAIL = os.getenv("DAY_CLOSE_EMAIL", "false").lower() == "true"
+# Loja sem close_time fecha a esta hora (o default da coluna, ver models.py)
+DEFAULT_CLOSE_TIME = "19:00"
+
+close_state = {"last_run_at": None, "last_closed": 0, "last_error": None}
+logger = get_logger("closes")
+
+
+# ==========================================
+# CÁLCULO DOS TOTAIS
+# ==========================================
+
+def _day_range(day: date) -> tuple[datetime, datetime]:
+    inicio = datetime.combine(day, datetime.min.time())
+    return inicio, inicio + timedelta(days=1)
+
+
+def _concluded(shop_id: int, day: date):
+    inicio, fim = _day_range(day)
+    return appointments_between(
+        ["id", "barber_id", "service_id", "client_name", "service_price"], inicio, fim,
+        lambda t: t.c.barbershop_id == shop_id,
+        lambda t: t.c.status == "concluido",
+    ).subquery()
+
+
+def _fingerprint(count: int, max_id: int | None, total: float) -> str:
+    return f"{count}:{max_id or 0}:{total:.2f}"
+
+
+def day_fingerprint(db: Session, shop_id: int, day: date) -> str:
+    """Resumo barato (um COUNT/MAX/SUM) para saber se a foto ainda bate com o dia."""
+    linhas = _concluded(shop_id, day)
+    count, max_id, total = db.execute(
+        select(func.count(), func.max(linhas.c.id), func.coalesce(func.sum(linhas.c.service_price), 0.0))
+    ).one()
+    return _fingerprint(count, max_id, float(total))
+
+
+def compute_day_totals(db: Session, shop_id: int, day: date) -> dict:
+    """Totais do dia numa única query agrupada por barbeiro e tipo de venda."""
+    linhas = _concluded(shop_id, day)
+    tipo = kind_sql(linhas)
+    resultado = db.execute(
+        select(
+            linhas.c.barber_id, tipo, func.count(),
+            func.coalesce(func.sum(linhas.c.service_price), 0.0), func.max(linhas.c.id),
+        ).group_by(linhas.c.barber_id, tipo)
+    ).all()
+
+    totais = {
+        "services_count": 0, "services_total": 0.0,
+        "counter_sales_count": 0, "counter_sales_total": 0.0,
+        "products_count": 0, "products_total": 0.0,
+    }
+    por_barbeiro = {}
+    count, max_id, total = 0, 0, 0.0
+    for barber_id, kind, qtd, soma, maior_id in resultado:
+        soma = float(soma)
+        prefixo = {"servico": "services", "venda_balcao": "counter_sales", "produto": "products"}[kind]
+        totais[f"{prefixo}_count"] += qtd
+        totais[f"{prefixo}_total"] += soma
+        if barber_id is not None:
+            item = por_barbeiro.setdefault(barber_id, {"barber_id": barber_id, "name": None, "revenue": 0.0, "count": 0})
+            item["revenue"] += soma
+            item["count"] += qtd
+        count += qtd
+        total += soma
+        max_id = max(max_id, maior_id or 0)
+
+    if por_barbeiro:
+        nomes = dict(db.query(Barber.id, Barber.name).filter(Barber.id.in_(list(por_barbeiro))).all())
+        for barber_id, item in por_barbeiro.items():
+            item["name"] = nomes.get(barber_id)
+
+    totais["total_revenue"] = total
+    totais["per_barber"] = sorted(por_barbeiro.values(), key=lambda b: -b["revenue"])
+    totais["fingerprint"] = _fingerprint(count, max_id, total)
+    return totais
+
+
+# ==========================================
+# FOTOS (DAY_CLOSES)
+# ==========================================
+
+def latest_close(db: Session, shop_id: int, day: date) -> DayClose | None:
+    return (
+        db.query(DayClose)
+        .filter(DayClose.barbershop_id == shop_id, DayClose.day == day)
+        .order_by(DayClose.version.desc())
+        .first()
+    )
+
+
+def write_close(db: Session, shop_id: int, day: date, source: str, email_to: str | None = None) -> DayClose:
+    """Grava uma nova versão da foto do dia. Se outro worker gravar ao mesmo tempo, fica a dele."""
+    totais = compute_day_totals(db, shop_id, day)
+    anterior = latest_close(db, shop_id, day)
+    fechamento = DayClose(
+        barbershop_id=shop_id,
+        day=day,
+        version=(anterior.version + 1) if anterior else 1,
+        source=source,
+        closed_at=datetime.now(),
+        total_revenue=totais["total_revenue"],
+        services_count=totais["services_count"],
+        services_total=totais["services_total"],
+        counter_sales_count=totais["counter_sales_count"],
+        counter_sales_total=totais["counter_sales_total"],
+        products_count=totais["products_count"],
+        products_total=totais["products_total"],
+        per_barber=json.dumps(totais["per_barber"], ensure_ascii=False),
+        fingerprint=totais["fingerprint"],
+        email_to=email_to,
+    )
+    db.add(fechamento)
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        return latest_close(db, shop_id, day)
+    db.refresh(fechamento)
+    return fechamento
+
+
+def get_or_create_close(db: Session, shop_id: int, day: date, source: str = "manual") -> DayClose:
+    """Foto atual do dia: reaproveita a última se os atendimentos não mudaram, senão grava outra."""
+    atual = latest_close(db, shop_id, day)
+    if atual and atual.fingerprint == day_fingerprint(db, shop_id, day):
+        return atual
+    return write_close(db, shop_id, day, source)
+
+
+def close_to_dict(fechamento: DayClose) -> dict:
+    return {
+        "day": fechamento.day.isoformat(),
+        "version": fechamento.version,
+        "source": fechamento.source,
+        "closed_at": fechamento.closed_at.isoformat() if fechamento.closed_at else None,
+        "total_revenue": fechamento.total_revenue,
+        "services_count": fechamento.services_count,
+        "services_total": fechamento.services_total,
+        "counter_sales_count": fechamento.counter_sales_count,
+        "counter_sales_total": fechamento.counter_sales_total,
+        "products_count": fechamento.products_count,
+        "products_total": fechamento.products_total,
+        "count": fechamento.services_count + fechamento.counter_sales_count + fechamento.products_count,
+        "per_barber": json.loads(fechamento.per_barber or "[]"),
+    }
+
+
+# ==========================================
+# E-MAIL
+# ==========================================
+
+def render_close_email(tipo_relatorio: str, tipo_fechamento: str, total_faturado: float, qtd_cortes: int, observations: str) -> str:
+    return f"""
+    <html>
+        <body style="font-family: Arial, sans-serif; color: #333; line-height: 1.6;">
+            <div style="max-width: 600px; margin: 0 auto; border: 1px solid #e4e4e7; border-radius: 16px; overflow: hidden;">
+                <div style="background-color: #18181b; padding: 24px; text-align: center;">
+                    <h2 style="color: #f59e0b; margin: 0; text-transform: uppercase;">Relatório Financeiro</h2>
+                    <p style="color: #a1a1aa; margin: 5px 0 0 0;">{tipo_relatorio}</p>
+                </div>
+                <div style="padding: 32px; background-color: #fafafa;">
+                    <div style="background-color: #ffffff; padding: 20px; border-radius: 12px; border: 1px solid #e4e4e7; text-align: center; margin-bottom: 24px;">
+                        <p style="font-size: 14px; color: #71717a; text-transform: uppercase; font-weight: bold; margin: 0;">Faturamento {tipo_fechamento}</p>
+                        <h1 style="color: #10b981; font-size: 36px; margin: 8px 0;">R$ {total_faturado:.2f}</h1>
+                        <p style="margin: 0; color: #52525b; font-size: 14px;">Total de Serviços Concluídos: <strong>{qtd_cortes}</strong></p>
+                    </div>
+
+                    <h4 style="color: #3f3f46; margin-bottom: 8px;">Observações da Equipa:</h4>
+                    <div style="background-color: #f4f4f5; padding: 12px; border-radius: 8px; margin-bottom: 16px;">
+                        <p style="margin: 0; font-size: 14px;">{observations}</p>
+                    </div>
+                </div>
+            </div>
+        </body>
+    </html>
+    """
+
+
+def email_configured() -> bool:
+    return bool(os.getenv("EMAIL_SENDER") and os.getenv("EMAIL_PASSWORD"))
+
+
+def send_email(target_email: str, assunto: str, html: str):
+    """Envio pelo Gmail com as credenciais do .env. É bloqueante: chame numa thread."""
+    remetente = os.getenv("EMAIL_SENDER")
+    senha = os.getenv("EMAIL_PASSWORD")
+
+    msg = MIMEMultipart()
+    msg["From"] = remetente
+    msg["To"] = target_email
+    msg["Subject"] = assunto
+    msg.attach(MIMEText(html, "html"))
+
+    server = smtplib.SMTP("smtp.gmail.com", 587)
+    try:
+        server.starttls()
+        server.login(remetente, senha)
+        server.sendmail(remetente, target_email, msg.as_string())
+    finally:
+        server.quit()
+
+
+def send_pending_emails(db: Session) -> int:
+    """Envia os fechamentos na fila. Cada um é "reservado" com um UPDATE condicional antes do envio."""
+    if not email_configured():
+        return 0
+    enviados = 0
+    pendentes = db.query(DayClose).filter(DayClose.email_to.isnot(None), DayClose.emailed_at.is_(None)).limit(50).all()
+    for fechamento in pendentes:
+        reservado = db.query(DayClose).filter(DayClose.id == fechamento.id, DayClose.emailed_at.is_(None)).update(
+            {DayClose.emailed_at: datetime.now()}, synchronize_session=False
+        )
+        db.commit()
+        if not reservado:
+            continue  # outro worker já pegou
+        dados = close_to_dict(fechamento)
+        titulo = f"Fechamento da Loja - do Dia {fechamento.day.strftime('%d/%m/%Y')}"
+        try:
+            send_email(fechamento.email_to, titulo, render_close_email(
+                titulo, "diario", dados["total_revenue"], dados["count"], "Fechamento automático"
+            ))
+            enviados += 1
+        except Exception as e:
+            # Devolve para a fila; tenta de novo na próxima volta
+            db.query(DayClose).filter(DayClose.id == fechamento.id).update({DayClose.emailed_at: None}, synchronize_session=False)
+            db.commit()
+            close_state["last_error"] = f"E-mail do fechamento {fechamento.id}: {e}"
+            logger.warning("Falha ao enviar o e-mail do fechamento", exc_info=True,
+                           extra={"close_id": fechamento.id, "shop_id": fechamento.barbershop_id})
+    return enviados
+
+
+# ==========================================
+# AGENDADOR
+# ==========================================
+
+def close_hour(valor: str | None) -> dtime:
+    """Hora de fecho da loja: "9:00", "09:00" ou "24:00" (fim do dia); vazia ou inválida = DEFAULT_CLOSE_TIME."""
+    try:
+        horas, minutos = (int(parte) for parte in (valor or DEFAULT_CLOSE_TIME).strip().split(":"))
+        return dtime.max if (horas, minutos) == (24, 0) else dtime(horas, minutos)
+    except ValueError:
+        return close_hour(DEFAULT_CLOSE_TIME)
+
+
+def due_shops(db: Session, now: datetime) -> list:
+    """Lojas (id, owner_email) cujo close_time já passou hoje e que ainda não têm o fechamento automático do dia.
+
+    O close_time é texto livre ("9:00" e "09:00"): comparado como texto, "9:00" <= "19:30" é falso.
+    Por isso a hora é comparada em Python, depois de o banco tirar as lojas já fechadas hoje.
+    """
+    ja_fechadas = select(DayClose.id).where(
+        and_(DayClose.barbershop_id == Barbershop.id, DayClose.day == now.date(), DayClose.source == "auto")
+    ).exists()
+    abertas = db.execute(
+        select(Barbershop.id, Barbershop.owner_email, Barbershop.close_time).where(~ja_fechadas)
+    ).all()
+    return [loja for loja in abertas if close_hour(loja.close_time) <= now.time()]
+
+
+def run_due_closes(now: datetime | None = None) -> int:
+    """Uma volta do agendador: grava as fotos que venceram e despacha os e-mails pendentes."""
+    now = now or datetime.now()
+    db = SessionLocal()
+    try:
+        fechadas = 0
+        for shop in due_shops(db, now):
+            email_to = shop.owner_email if DAY_CLOSE_EMAIL else None
+            write_close(db, shop.id, now.date(), "auto", email_to=email_to)
+            fechadas += 1
+        send_pending_emails(db)
+        return fechadas
+    finally:
+        db.close()
+
+
+async def day_close_loop(interval: int = DAY_CLOSE_CHECK_INTERVAL):
+    """Tarefa de fundo: a cada `interval` segundos procura lojas que já passaram do horário de fecho."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            close_state["last_closed"] = await asyncio.to_thread(run_due_closes)
+            close_state["last_run_at"] = datetime.now().isoformat()
+        except Exception as e:
+            close_state["last_error"] = str(e)
+            logger.exception("Volta do agendador de fechamentos falhou")
@@ -1,27 +1,89 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, exc, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from fastapi import Request
+import asyncio
+import hashlib
 import os
+import time
+from datetime import datetime, time as dtime
 from dotenv import load_dotenv
 
+from logs import get_logger, install_slow_query_log
+
 load_dotenv()
+logger = get_logger("database")
 
 # Pega a URL do banco de dados do arquivo .env ou do servidor
 DATABASE_URL = os.getenv("DATABASE_URL")
 
-# Lógica inteligente: verifica qual banco estamos a usar
-if DATABASE_URL and DATABASE_URL.startswith("sqlite"):
-    # Se for SQLite (no seu computador), usamos o check_same_thread
-    engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-else:
+# Tamanho do pool e quantas conexões manter sempre abertas/aquecidas
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_MIN = min(int(os.getenv("DB_POOL_MIN", "2")), DB_POOL_SIZE)
+# Só faz o "ping" antes de usar uma conexão que ficou parada mais do que isto (segundos)
+DB_PING_IF_IDLE = int(os.getenv("DB_PING_IF_IDLE", "60"))
+# Threads para as rotas síncronas (def) de cada worker. Com mais threads do que conexões,
+# as sobrantes só ficam à espera de uma conexão livre (e podem dar timeout no pool);
+# assim esperam na fila do AnyIO, antes de ocupar uma thread.
+THREADPOOL_SIZE = int(os.getenv("THREADPOOL_SIZE", str(DB_POOL_SIZE + DB_MAX_OVERFLOW)))
+
+def _normalize_url(url):
     # Se for Postgres, corrigimos a URL caso venha como "postgres://" em vez de "postgresql://"
-    if DATABASE_URL and DATABASE_URL.startswith("postgres://"):
-        DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
-    
-    # ✅ AQUI ESTÁ A MAGIA PARA O NEON NÃO DORMIR:
-    engine = create_engine(DATABASE_URL, pool_pre_ping=True, pool_recycle=300)
+    if url and url.startswith("postgres://"):
+        url = url.replace("postgres://", "postgresql://", 1)
+    return url
+
+
+def _build_engine(url):
+    # Lógica inteligente: verifica qual banco estamos a usar
+    if url and url.startswith("sqlite"):
+        # Se for SQLite (no seu computador), usamos o check_same_thread
+        return create_engine(url, connect_args={"check_same_thread": False})
+
+    # Em vez do pool_pre_ping (um SELECT 1 em TODAS as requisições), só testamos
+    # conexões que ficaram paradas. As quentes vão direto para a query.
+    new_engine = create_engine(
+        url,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_recycle=int(os.getenv("DB_POOL_RECYCLE", "300")),
+    )
+
+    @event.listens_for(new_engine, "checkin")
+    def _mark_last_used(dbapi_connection, connection_record):
+        connection_record.info["last_used"] = time.monotonic()
+
+    @event.listens_for(new_engine, "checkout")
+    def _ping_if_idle(dbapi_connection, connection_record, connection_proxy):
+        last_used = connection_record.info.get("last_used")
+        if last_used is None or time.monotonic() - last_used < DB_PING_IF_IDLE:
+            return
+        try:
+            cursor = dbapi_connection.cursor()
+            cursor.execute("SELECT 1")
+            cursor.close()
+        except Exception:
+            # O pool descarta esta conexão e tenta outra (ou abre uma nova)
+            raise exc.DisconnectionError()
+
+    return new_engine
+
+
+DATABASE_URL = _normalize_url(DATABASE_URL)
+engine = _build_engine(DATABASE_URL)
+
+# Réplica de leitura opcional. Sem ela, as leituras vão para o banco principal.
+# Para testar localmente basta apontar para uma cópia do arquivo SQLite
+# (ex.: DATABASE_REPLICA_URL=sqlite:///./replica.db) ou para um segundo Postgres.
+DATABASE_REPLICA_URL = _normalize_url(os.getenv("DATABASE_REPLICA_URL"))
+replica_engine = _build_engine(DATABASE_REPLICA_URL) if DATABASE_REPLICA_URL else None
+
+for _engine in [e for e in (engine, replica_engine) if e is not None]:
+    install_slow_query_log(_engine)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=replica_engine or engine)
 Base = declarative_base()
 
 def get_db():
@@ -29,4 +91,141 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+# ==========================================
+# ROTEAMENTO LEITURA / ESCRITA
+# ==========================================
+
+# Depois de uma escrita, o mesmo cliente lê do principal durante esta janela (segundos),
+# para não ver dados "atrasados" enquanto a réplica ainda não recebeu a alteração.
+READ_STICKY_SECONDS = int(os.getenv("READ_STICKY_SECONDS", "5"))
+STICKY_COOKIE = "db_primary"
+
+_sticky_until: dict[str, float] = {}
+
+
+def client_key(request: Request) -> str:
+    """Identifica o cliente: pelo token (se logado) ou pelo IP."""
+    auth_header = request.headers.get("authorization")
+    if auth_header:
+        return hashlib.sha1(auth_header.encode()).hexdigest()
+    return request.client.host if request.client else "anonimo"
+
+
+def mark_recent_write(request: Request):
+    """Chamado pelo middleware depois de uma escrita bem-sucedida."""
+    agora = time.monotonic()
+    if len(_sticky_until) > 10000:
+        for chave in [k for k, v in _sticky_until.items() if v < agora]:
+            del _sticky_until[chave]
+    _sticky_until[client_key(request)] = agora + READ_STICKY_SECONDS
+
+
+def wrote_recently(request: Request) -> bool:
+    if request.cookies.get(STICKY_COOKIE):
+        return True
+    return _sticky_until.get(client_key(request), 0) > time.monotonic()
+
+
+def get_read_db(request: Request):
+    """Sessão só de leitura: usa a réplica, exceto logo depois de o cliente escrever."""
+    if replica_engine is None or wrote_recently(request):
+        db = SessionLocal()
+    else:
+        db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+# ==========================================
+# AQUECIMENTO E KEEPALIVE DO POOL (NEON / POSTGRES SERVERLESS)
+# ==========================================
+
+# Intervalo do keepalive em segundos (0 desliga). O Neon suspende após ~5 min sem uso.
+DB_KEEPALIVE_INTERVAL = int(os.getenv("DB_KEEPALIVE_INTERVAL", "0" if engine.dialect.name == "sqlite" else "240"))
+# Janela de horário comercial em que vale a pena manter o banco acordado
+DB_KEEPALIVE_HOURS = os.getenv("DB_KEEPALIVE_HOURS", "07:00-22:00")
+
+pool_state = {"warmed_at": None, "last_keepalive_at": None, "last_keepalive_ms": None, "last_error": None}
+
+
+def warm_pool(count: int = DB_POOL_MIN) -> float:
+    """Abre `count` conexões AO MESMO TEMPO (para não reaproveitar sempre a mesma) e devolve os ms gastos."""
+    inicio = time.perf_counter()
+    conexoes = []
+    try:
+        for alvo in [e for e in (engine, replica_engine) if e is not None]:
+            for _ in range(count):
+                conn = alvo.connect()
+                conexoes.append(conn)
+                conn.execute(text("SELECT 1"))
+    finally:
+        for conn in conexoes:
+            conn.close()
+    return (time.perf_counter() - inicio) * 1000
+
+
+def _keepalive_hour(valor: str) -> dtime:
+    """Hora da janela: 7:00, 07:00 ou 24:00 (fim do dia)."""
+    horas, minutos = (int(parte) for parte in valor.strip().split(":"))
+    return dtime.max if (horas, minutos) == (24, 0) else dtime(horas, minutos)
+
+
+def within_keepalive_hours(now: datetime | None = None, window: str | None = None) -> bool:
+    """Agora está na janela "HH:MM-HH:MM"? Uma janela que passa da meia-noite (ex.: 18:00-02:00) dá a volta."""
+    inicio, fim = (_keepalive_hour(v) for v in (window or DB_KEEPALIVE_HOURS).split("-"))
+    agora = (now or datetime.now()).time()
+    if inicio <= fim:
+        return inicio <= agora < fim
+    return agora >= inicio or agora < fim
+
+
+async def keepalive_loop(interval: int = DB_KEEPALIVE_INTERVAL):
+    """Tarefa de fundo: em horário comercial, toca nas conexões mínimas do pool a cada `interval` s."""
+    while True:
+        await asyncio.sleep(interval)
+        if not within_keepalive_hours():
+            continue
+        try:
+            pool_state["last_keepalive_ms"] = await asyncio.to_thread(warm_pool)
+            pool_state["last_keepalive_at"] = datetime.now().isoformat()
+            pool_state["last_error"] = None
+        except Exception as e:
+            pool_state["last_error"] = str(e)
+            logger.warning("Keepalive do pool falhou", exc_info=True)
+
+
+async def warm_up():
+    """Aquecimento inicial, corre em segundo plano para não atrasar o arranque."""
+    try:
+        await asyncio.to_thread(warm_pool)
+        pool_state["warmed_at"] = datetime.now().isoformat()
+    except Exception as e:
+        pool_state["last_error"] = str(e)
+        logger.warning("Aquecimento do pool falhou", exc_info=True)
+
+
+def _describe_pool(alvo) -> dict:
+    pool = alvo.pool
+    info = {"dialect": alvo.dialect.name, "pool_class": type(pool).__name__}
+    # Só o QueuePool tem estas métricas
+    if hasattr(pool, "checkedout"):
+        info.update({
+            "size": pool.size(),
+            "min_warm": DB_POOL_MIN,
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+        })
+    return info
+
+
+def get_pool_status() -> dict:
+    status = {**_describe_pool(engine), **pool_state}
+    status["replica"] = _describe_pool(replica_engine) if replica_engine is not None else None
+    status["threadpool_size"] = THREADPOOL_SIZE
+    status["keepalive_interval"] = DB_KEEPALIVE_INTERVAL
+    status["keepalive_hours"] = DB_KEEPALIVE_HOURS
+    return status
@@ -0,0 +1,326 @@
+"""Remoção de lojas (tenants) em segundo plano.
+
+O pedido do SuperAdmin só tranca a loja (sem senha nem PINs, fora do diretório) e grava
+um job em `tenant_deletions`; a resposta sai logo com o ID do job. O trabalho pesado
+corre depois, tabela a tabela, em lotes de DELETION_BATCH_SIZE linhas, cada lote na sua
+própria transação (locks curtos) e com o progresso gravado NA MESMA transação: se o
+processo cair a meio, o job continua de onde parou.
+
+Ordem: agendamentos, arquivo, fechamentos, folhas, regras de comissão, clientes, produtos,
+serviços, barbeiros, os arquivos da loja em uploads/ e, por fim, a própria loja.
+
+Um worker "aluga" o job por DELETION_LEASE_SECONDS (renovado a cada lote); se morrer,
+outro pega no job quando o aluguel vence. Correr à mão (ex.: job que falhou de vez):
+
+    python deletions.py            # corre os jobs pendentes
+    python deletions.py <job_id>   # força um job (zera as tentativas)
+"""
+import asyncio
+import json
+import os
+import sys
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, func, or_, select, update
+
+import analytics
+import availability
+from database import engine
+from logs import get_logger, setup_logging
+from models import (Appointment, AppointmentArchive, Barber, Barbershop, Client, CommissionRule, DayClose,
+                    PayrollPeriod, Product, Service, SyncTombstone, TenantDeletion)
+
+DELETION_SCHEDULER = os.getenv("DELETION_SCHEDULER", "true").lower() == "true"
+DELETION_CHECK_INTERVAL = int(os.getenv("DELETION_CHECK_INTERVAL", "60"))
+DELETION_BATCH_SIZE = int(os.getenv("DELETION_BATCH_SIZE", "2000"))
+DELETION_LEASE_SECONDS = int(os.getenv("DELETION_LEASE_SECONDS", "120"))
+# Depois disto um job que falha fica parado até alguém o forçar (python deletions.py <id>)
+DELETION_MAX_ATTEMPTS = int(os.getenv("DELETION_MAX_ATTEMPTS", "5"))
+UPLOADS_DIR = "uploads"
+
+# Por ordem: quem aponta para outra tabela sai antes dela (FKs do Postgres)
+DELETION_TABLES = [
+    ("appointments", Appointment.__table__),
+    ("appointments_archive", AppointmentArchive.__table__),
+    ("day_closes", DayClose.__table__),
+    ("payroll_periods", PayrollPeriod.__table__),
+    ("commission_rules", CommissionRule.__table__),
+    ("sync_tombstones", SyncTombstone.__table__),
+    ("clients", Client.__table__),
+    ("products", Product.__table__),
+    ("services", Service.__table__),
+    ("barbers", Barber.__table__),
+]
+DELETION_STEPS = [nome for nome, _ in DELETION_TABLES] + ["files", "shop"]
+ACTIVE_STATUSES = ["pending", "running", "failed"]
+
+deletion_state = {"last_run_at": None, "last_finished": 0, "last_error": None}
+logger = get_logger("deletions")
+
+jobs = TenantDeletion.__table__
+
+
+class LeaseLost(Exception):
+    """Outro worker ficou com o job (o nosso aluguel venceu a meio)."""
+
+
+# ==========================================
+# PEDIDO DE REMOÇÃO
+# ==========================================
+
+def upload_name(url: str | None) -> str | None:
+    """Nome do arquivo em uploads/ a partir do que está gravado ("/uploads/x.png" ou só "x.png")."""
+    if not url:
+        return None
+    url = url.strip()
+    if url.startswith("/uploads/"):
+        url = url[len("/uploads/"):]
+    if not url or "/" in url or "\\" in url or url.startswith("."):
+        return None  # URL externa ou caminho estranho: não é nosso
+    return url
+
+
+def shop_files(db, shop: Barbershop) -> list[str]:
+    fotos = db.execute(
+        select(Barber.profile_image_url).where(Barber.barbershop_id == shop.id, Barber.profile_image_url.isnot(None))
+    ).scalars().all()
+    urls = [shop.logo_url, *(shop.portfolio_images or "").split(","), *fotos]
+    return sorted({nome for nome in map(upload_name, urls) if nome})
+
+
+def active_deletion(db, shop_id: int) -> TenantDeletion | None:
+    return db.query(TenantDeletion).filter(
+        TenantDeletion.barbershop_id == shop_id, TenantDeletion.status.in_(ACTIVE_STATUSES)
+    ).first()
+
+
+def request_deletion(db, shop: Barbershop, requested_by: str | None = None) -> TenantDeletion:
+    """Tranca a loja e cria o job (sem commit). Se já houver um job ativo para a loja, devolve esse."""
+    existente = active_deletion(db, shop.id)
+    if existente:
+        return existente
+
+    agora = datetime.now()
+    job = TenantDeletion(
+        id=uuid.uuid4().hex, barbershop_id=shop.id, shop_name=shop.name, requested_by=requested_by,
+        status="pending", step=DELETION_STEPS[0], deleted=json.dumps({}), files=json.dumps(shop_files(db, shop)),
+        files_deleted=0, attempts=0, created_at=agora, updated_at=agora,
+    )
+    # Ninguém entra mais: sem senha do dono e sem PINs (o PIN é único; NULL não colide)
+    shop.password_hash = None
+    # Sai do diretório e da página pública já neste commit, em todos os workers e mesmo que
+    # o job nunca termine (sem slug a loja não é listada nem recebe marcações)
+    shop.slug = None
+    shop.search_text = None
+    db.execute(update(Barber).where(Barber.barbershop_id == shop.id).values(pin=None, is_active=False))
+    db.add(job)
+    return job
+
+
+def deletion_to_dict(job: TenantDeletion) -> dict:
+    totais = json.loads(job.totals) if job.totals else None
+    apagadas = json.loads(job.deleted or "{}")
+    arquivos = len(json.loads(job.files or "[]"))
+    progresso = None
+    if totais is not None:
+        total = sum(totais.values()) + arquivos + 1
+        feito = sum(min(apagadas.get(t, 0), n) for t, n in totais.items()) + (job.files_deleted or 0)
+        progresso = 100.0 if job.status == "done" else min(99.9, round(100 * feito / total, 1))
+    return {
+        "id": job.id,
+        "barbershop_id": job.barbershop_id,
+        "shop_name": job.shop_name,
+        "status": job.status,
+        "step": job.step,
+        "progress": progresso,
+        "totals": totais,
+        "deleted": apagadas,
+        "files_total": arquivos,
+        "files_deleted": job.files_deleted or 0,
+        "attempts": job.attempts,
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "updated_at": job.updated_at.isoformat() if job.updated_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+# ==========================================
+# EXECUÇÃO (EM LOTES, RETOMÁVEL)
+# ==========================================
+
+def _claimable(now: datetime):
+    return (
+        jobs.c.status.in_(ACTIVE_STATUSES),
+        jobs.c.attempts < DELETION_MAX_ATTEMPTS,
+        or_(jobs.c.locked_until.is_(None), jobs.c.locked_until < now),
+    )
+
+
+def claim(conn, job_id: str, worker: str, now: datetime) -> bool:
+    """Aluga o job para este worker. Dois workers nunca ficam com o mesmo job ao mesmo tempo."""
+    resultado = conn.execute(
+        update(jobs).where(jobs.c.id == job_id, *_claimable(now)).values(
+            status="running", worker=worker, attempts=jobs.c.attempts + 1,
+            locked_until=now + timedelta(seconds=DELETION_LEASE_SECONDS), updated_at=now,
+        )
+    )
+    return resultado.rowcount == 1
+
+
+def _save_progress(conn, job_id: str, claimed_by: str, **valores):
+    """Grava o progresso e renova o aluguel; se o job já não é nosso, desfaz o lote inteiro."""
+    agora = datetime.now()
+    resultado = conn.execute(
+        update(jobs).where(jobs.c.id == job_id, jobs.c.worker == claimed_by).values(
+            {"updated_at": agora, "locked_until": agora + timedelta(seconds=DELETION_LEASE_SECONDS), **valores}
+        )
+    )
+    if resultado.rowcount != 1:
+        raise LeaseLost(job_id)
+
+
+def _count_rows(conn, shop_id: int) -> dict:
+    return {
+        nome: conn.execute(select(func.count()).select_from(tabela).where(tabela.c.barbershop_id == shop_id)).scalar()
+        for nome, tabela in DELETION_TABLES
+    }
+
+
+def _delete_batch(conn, tabela, shop_id: int, batch_size: int) -> int:
+    lote = select(tabela.c.id).where(tabela.c.barbershop_id == shop_id).limit(batch_size)
+    return conn.execute(delete(tabela).where(tabela.c.id.in_(lote))).rowcount
+
+
+def _remove_file(uploads_dir: str, nome: str):
+    try:
+        os.remove(os.path.join(uploads_dir, nome))
+    except FileNotFoundError:
+        pass  # já apagado (ex.: numa tentativa anterior)
+
+
+def run_deletion(job_id: str, uploads_dir: str = UPLOADS_DIR, batch_size: int = DELETION_BATCH_SIZE) -> bool:
+    """Corre (ou retoma) um job até ao fim. Devolve False se outro worker já está com ele."""
+    worker = uuid.uuid4().hex
+    with engine.begin() as conn:
+        if not claim(conn, job_id, worker, datetime.now()):
+            return False
+        job = conn.execute(select(jobs).where(jobs.c.id == job_id)).one()
+    shop_id = job.barbershop_id
+
+    try:
+        if job.totals is None:
+            with engine.begin() as conn:
+                _save_progress(conn, job_id, worker, totals=json.dumps(_count_rows(conn, shop_id)))
+
+        apagadas = json.loads(job.deleted or "{}")
+        pendentes = DELETION_TABLES[DELETION_STEPS.index(job.step):] if job.step in dict(DELETION_TABLES) else []
+        for nome, tabela in pendentes:
+            while True:
+                with engine.begin() as conn:
+                    n = _delete_batch(conn, tabela, shop_id, batch_size)
+                    apagadas[nome] = apagadas.get(nome, 0) + n
+                    terminou = n < batch_size
+                    proximo = DELETION_STEPS[DELETION_STEPS.index(nome) + 1] if terminou else nome
+                    _save_progress(conn, job_id, worker, step=proximo, deleted=json.dumps(apagadas))
+                if terminou:
+                    break
+
+        with engine.connect() as conn:
+            job = conn.execute(select(jobs).where(jobs.c.id == job_id)).one()
+        if job.step == "files":
+            arquivos = json.loads(job.files or "[]")
+            feitos = job.files_deleted or 0
+            while feitos < len(arquivos):
+                lote = arquivos[feitos:feitos + batch_size]
+                for nome in lote:
+                    _remove_file(uploads_dir, nome)
+                feitos += len(lote)
+                with engine.begin() as conn:
+                    _save_progress(conn, job_id, worker, files_deleted=feitos)
+            with engine.begin() as conn:
+                _save_progress(conn, job_id, worker, step="shop")
+
+        with engine.begin() as conn:
+            # Uma marcação feita a meio da remoção (pelo link público) ainda pode ter entrado
+            for nome, tabela in DELETION_TABLES:
+                conn.execute(delete(tabela).where(tabela.c.barbershop_id == shop_id))
+            conn.execute(delete(Barbershop.__table__).where(Barbershop.__table__.c.id == shop_id))
+            _save_progress(conn, job_id, worker, status="done", step=None, error=None, worker=None,
+                           locked_until=None, finished_at=datetime.now())
+    except LeaseLost:
+        logger.warning("Job de remoção ficou com outro worker", extra={"job_id": job_id, "shop_id": shop_id})
+        return False
+    except Exception as e:
+        # Fica "failed" com o aluguel ativo: a próxima tentativa só vem depois de ele vencer
+        with engine.begin() as conn:
+            conn.execute(update(jobs).where(jobs.c.id == job_id, jobs.c.worker == worker).values(
+                status="failed", error=str(e)[:2000], updated_at=datetime.now(),
+            ))
+        logger.exception("Job de remoção falhou", extra={"job_id": job_id, "shop_id": shop_id})
+        return False
+
+    analytics.invalidate(shop_id)
+    availability.invalidate(shop_id)
+    logger.info("Loja removida", extra={"job_id": job_id, "shop_id": shop_id})
+    return True
+
+
+def pending_deletions(now: datetime | None = None) -> list[str]:
+    with engine.connect() as conn:
+        return conn.execute(
+            select(jobs.c.id).where(*_claimable(now or datetime.now())).order_by(jobs.c.created_at)
+        ).scalars().all()
+
+
+def run_pending(uploads_dir: str = UPLOADS_DIR) -> int:
+    """Corre todos os jobs que ninguém está a correr (novos, interrompidos ou a tentar de novo)."""
+    return sum(run_deletion(job_id, uploads_dir) for job_id in pending_deletions())
+
+
+# ==========================================
+# AGENDADOR
+# ==========================================
+
+# A rota acorda o agendador deste worker para o job começar já (sem esperar o intervalo)
+_wakeup = {"loop": None, "event": None}
+
+
+def wake():
+    loop, evento = _wakeup["loop"], _wakeup["event"]
+    if loop is not None:
+        loop.call_soon_threadsafe(evento.set)
+
+
+async def deletion_loop(uploads_dir: str = UPLOADS_DIR, interval: int = DELETION_CHECK_INTERVAL):
+    """Tarefa de fundo: corre os jobs pendentes quando acordada ou a cada `interval` segundos."""
+    evento = asyncio.Event()
+    _wakeup.update(loop=asyncio.get_running_loop(), event=evento)
+    try:
+        while True:
+            try:
+                await asyncio.wait_for(evento.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+            evento.clear()
+            try:
+                deletion_state["last_finished"] = await asyncio.to_thread(run_pending, uploads_dir)
+                deletion_state["last_run_at"] = datetime.now().isoformat()
+            except Exception as e:
+                deletion_state["last_error"] = str(e)
+                logger.exception("Volta do agendador de remoções falhou")
+    finally:
+        _wakeup.update(loop=None, event=None)
+
+
+if __name__ == "__main__":
+    setup_logging(default_format="text")
+    if len(sys.argv) > 1:
+        with engine.begin() as conn:
+            conn.execute(update(jobs).where(jobs.c.id == sys.argv[1], jobs.c.status != "done").values(
+                status="pending", attempts=0, worker=None, locked_until=None,
+            ))
+        logger.info("Remoção concluída." if run_deletion(sys.argv[1]) else "Remoção não concluída (ver o log).")
+    else:
+        logger.info(f"{run_pending()} remoções concluídas.")
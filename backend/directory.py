@@ -0,0 +1,236 @@
+"""Diretório público de barbearias: busca por nome, endereço ou nome de serviço.
+
+Cada loja guarda em `barbershops.search_text` o texto pesquisável (nome, slug, endereço
+e nomes dos serviços, em minúsculas e sem acentos), refeito sempre que a loja ou os
+serviços mudam (refresh_shop). A busca casa o INÍCIO das palavras ("bar cent" encontra
+"Barbearia do Centro") e todas as palavras digitadas têm de aparecer.
+
+- Postgres: full-text com prefixo (to_tsquery 'palavra:*') sobre um índice GIN.
+- SQLite: índice de prefixos em memória (palavras ordenadas + bisect), montado a partir
+  de search_text e atualizado na hora pelo worker que fez a alteração. Como cada worker
+  tem o seu, é remontado por completo a cada DIRECTORY_INDEX_TTL segundos.
+"""
+import bisect
+import heapq
+import os
+import re
+import threading
+import time
+
+from sqlalchemy import bindparam, func, select, text
+from sqlalchemy.orm import Session
+
+from clients import normalize_name
+from models import Barbershop, Service
+
+DIRECTORY_INDEX_TTL = int(os.getenv("DIRECTORY_INDEX_TTL", "300"))
+DIRECTORY_MAX_PAGE_SIZE = 50
+# Palavras de busca mais curtas do que isto são ignoradas (casariam com quase tudo)
+MIN_TOKEN_LENGTH = 2
+
+RESULT_FIELDS = ["id", "name", "slug", "address", "logo_url", "description"]
+
+
+# ==========================================
+# TEXTO PESQUISÁVEL
+# ==========================================
+
+def tokenize(value: str | None) -> list[str]:
+    """Palavras normalizadas: "Barbearia São João - Rua 7" -> ["barbearia", "sao", "joao", "rua", "7"]."""
+    return [t for t in re.split(r"[^a-z0-9]+", normalize_name(value)) if t]
+
+
+def build_search_text(shop: Barbershop, service_names: list[str]) -> str:
+    partes = [shop.name, (shop.slug or "").replace("-", " "), shop.address, *service_names]
+    palavras = []
+    for parte in partes:
+        for token in tokenize(parte):
+            if token not in palavras:
+                palavras.append(token)
+    return " ".join(palavras)
+
+
+def search_document(column):
+    """Expressão do índice GIN (tem de ser idêntica na migração e na consulta)."""
+    return func.to_tsvector("simple", func.coalesce(column, ""))
+
+
+def create_search_index(conn):
+    """Postgres: índice GIN de full-text em search_text."""
+    if conn.dialect.name == "postgresql":
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_barbershops_search "
+            "ON barbershops USING gin (to_tsvector('simple', coalesce(search_text, '')))"
+        ))
+
+
+def backfill_search_text(conn) -> int:
+    """Preenche search_text de todas as lojas (migração 005). Duas leituras e um UPDATE em lote."""
+    servicos = {}
+    for shop_id, nome in conn.execute(select(Service.barbershop_id, Service.name).order_by(Service.id)):
+        servicos.setdefault(shop_id, []).append(nome)
+    lojas = conn.execute(select(Barbershop.id, Barbershop.name, Barbershop.slug, Barbershop.address)).all()
+    linhas = [{"shop_id": loja.id, "texto": build_search_text(loja, servicos.get(loja.id, []))} for loja in lojas]
+    if linhas:
+        conn.execute(
+            Barbershop.__table__.update().where(Barbershop.id == bindparam("shop_id"))
+            .values(search_text=bindparam("texto")),
+            linhas,
+        )
+    return len(lojas)
+
+
+# ==========================================
+# ÍNDICE EM MEMÓRIA (SQLITE)
+# ==========================================
+
+class PrefixIndex:
+    """Palavras ordenadas -> IDs das lojas. Um prefixo é um intervalo contíguo na lista ordenada."""
+
+    def __init__(self):
+        self.tokens: list[str] = []
+        self.postings: dict[str, set[int]] = {}
+        self.shop_tokens: dict[int, set[str]] = {}
+        self.rows: dict[int, dict] = {}
+        self.built_at = 0.0
+
+    def put(self, row: dict, search_text: str | None):
+        self.remove(row["id"])
+        palavras = set((search_text or "").split())
+        self.rows[row["id"]] = row
+        self.shop_tokens[row["id"]] = palavras
+        for palavra in palavras:
+            ids = self.postings.get(palavra)
+            if ids is None:
+                self.postings[palavra] = ids = set()
+                bisect.insort(self.tokens, palavra)
+            ids.add(row["id"])
+
+    def remove(self, shop_id: int):
+        for palavra in self.shop_tokens.pop(shop_id, ()):
+            ids = self.postings[palavra]
+            ids.discard(shop_id)
+            if not ids:
+                del self.postings[palavra]
+                del self.tokens[bisect.bisect_left(self.tokens, palavra)]
+        self.rows.pop(shop_id, None)
+
+    def match_prefix(self, prefix: str) -> set[int]:
+        inicio = bisect.bisect_left(self.tokens, prefix)
+        fim = bisect.bisect_left(self.tokens, prefix + "\uffff")
+        if fim - inicio == 1:
+            return self.postings[self.tokens[inicio]]
+        encontrados = set()
+        for palavra in self.tokens[inicio:fim]:
+            encontrados |= self.postings[palavra]
+        return encontrados
+
+    def search(self, tokens: list[str]) -> set[int]:
+        # Começa pelas palavras mais longas (menos resultados), para a interseção encolher logo
+        resultado = None
+        for token in sorted(tokens, key=len, reverse=True):
+            ids = self.match_prefix(token)
+            resultado = set(ids) if resultado is None else resultado & ids
+            if not resultado:
+                break
+        return resultado or set()
+
+
+_index: PrefixIndex | None = None
+_lock = threading.Lock()
+
+
+def _row(shop) -> dict:
+    return {campo: getattr(shop, campo) for campo in RESULT_FIELDS}
+
+
+def _build_index(db: Session) -> PrefixIndex:
+    index = PrefixIndex()
+    for shop in db.execute(select(*[Barbershop.__table__.c[c] for c in RESULT_FIELDS], Barbershop.search_text)
+                           .where(Barbershop.slug.isnot(None))):
+        index.put(_row(shop), shop.search_text)
+    index.built_at = time.monotonic()
+    return index
+
+
+def _memory_index(db: Session) -> PrefixIndex:
+    global _index
+    with _lock:
+        if _index is None or time.monotonic() - _index.built_at > DIRECTORY_INDEX_TTL:
+            _index = _build_index(db)
+        return _index
+
+
+# ==========================================
+# ATUALIZAÇÃO E BUSCA
+# ==========================================
+
+def refresh_shop(db: Session, shop_id: int):
+    """Recalcula search_text da loja (e o índice em memória) depois de mudar a loja ou os seus serviços.
+
+    Chamar ANTES do commit da rota: o novo texto entra na mesma transação.
+    """
+    db.flush()
+    shop = db.get(Barbershop, shop_id)  # normalmente já está na sessão: sem query
+    if shop is None:
+        remove_shop(shop_id)
+        return
+    # Por ID: a mesma ordem do backfill, senão o texto "muda" só porque o plano da query mudou
+    nomes = [nome for (nome,) in db.query(Service.name).filter(Service.barbershop_id == shop_id).order_by(Service.id).all()]
+    shop.search_text = build_search_text(shop, nomes)
+    with _lock:
+        if _index is not None:
+            if shop.slug:
+                _index.put(_row(shop), shop.search_text)
+            else:
+                _index.remove(shop_id)
+
+
+def remove_shop(shop_id: int):
+    with _lock:
+        if _index is not None:
+            _index.remove(shop_id)
+
+
+def search_shops(db: Session, q: str, page: int = 1, page_size: int = 20) -> dict:
+    """Lojas cujo texto tem palavras que começam por TODAS as palavras da busca, por ordem de nome."""
+    tokens = [t for t in tokenize(q) if len(t) >= MIN_TOKEN_LENGTH]
+    vazio = {"items": [], "page": page, "page_size": page_size, "total": 0, "pages": 0}
+    if not tokens:
+        return vazio
+
+    if db.get_bind().dialect.name == "postgresql":
+        consulta = func.to_tsquery("simple", " & ".join(f"{t}:*" for t in tokens))
+        linhas = db.execute(
+            select(*[Barbershop.__table__.c[c] for c in RESULT_FIELDS], func.count().over().label("total"))
+            .where(search_document(Barbershop.search_text).op("@@")(consulta), Barbershop.slug.isnot(None))
+            .order_by(Barbershop.name, Barbershop.id)
+            .limit(page_size)
+            .offset((page - 1) * page_size)
+        ).mappings().all()
+        if linhas:
+            total = linhas[0]["total"]
+        else:
+            # Página depois do fim: o total vem de uma contagem simples
+            total = db.execute(select(func.count()).select_from(Barbershop).where(
+                search_document(Barbershop.search_text).op("@@")(consulta), Barbershop.slug.isnot(None)
+            )).scalar()
+        items = [{c: row[c] for c in RESULT_FIELDS} for row in linhas]
+    else:
+        index = _memory_index(db)
+        with _lock:
+            ids = index.search(tokens)
+            total = len(ids)
+            # Só ordena o necessário para chegar à página pedida
+            primeiros = heapq.nsmallest(page * page_size, ids, key=lambda i: ((index.rows[i]["name"] or "").lower(), i))
+            items = [dict(index.rows[i]) for i in primeiros[(page - 1) * page_size:]]
+
+    if not items and total == 0:
+        return vazio
+    return {
+        "items": items,
+        "page": page,
+        "page_size": page_size,
+        "total": total,
+        "pages": -(-total // page_size),
+    }
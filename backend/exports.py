@@ -0,0 +1,124 @@
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+
+from sqlalchemy import select, union_all
+
+from archive import includes_archive
+from database import ReadSessionLocal
+from models import Appointment, AppointmentArchive, Barber, Service
+
+# Quantas linhas o cursor traz do banco de cada vez (memória constante)
+EXPORT_BATCH_SIZE = 1000
+
+EXPORT_COLUMNS = [
+    "id", "date_time", "kind", "status", "client_name", "client_phone",
+    "barber_id", "barber_name", "service_id", "service_name", "price",
+]
+
+
+def classify_kind(client_name: str | None, service_id: int | None) -> str:
+    """Descobre se a linha é um serviço agendado, um produto ou uma venda de balcão."""
+    if service_id is not None:
+        return "servico"
+    if client_name and client_name.startswith("🛍️ Produto:"):
+        return "produto"
+    return "venda_balcao"
+
+
+def iter_export_rows(shop_id: int, start: datetime, end: datetime, after_id: int = 0):
+    """Percorre os agendamentos/vendas da loja em ordem de ID usando um cursor do lado do servidor.
+
+    Abre a própria sessão (na réplica de leitura, se houver) porque o gerador continua
+    a correr depois de a rota devolver a resposta.
+    """
+    def _select(table):
+        return (
+            select(
+                table.c.id, table.c.date_time, table.c.status,
+                table.c.client_name, table.c.client_phone,
+                table.c.barber_id, Barber.name.label("barber_name"),
+                table.c.service_id, Service.name.label("service_name"),
+                table.c.service_price,
+            )
+            .outerjoin(Barber, Barber.id == table.c.barber_id)
+            .outerjoin(Service, Service.id == table.c.service_id)
+            .where(
+                table.c.barbershop_id == shop_id,
+                table.c.date_time >= start,
+                table.c.date_time < end,
+                table.c.id > after_id,
+            )
+        )
+
+    stmt = _select(Appointment.__table__)
+    # Períodos antigos: o histórico arquivado entra na mesma exportação
+    if includes_archive(start):
+        stmt = union_all(stmt, _select(AppointmentArchive.__table__))
+    linhas = stmt.subquery()
+    stmt = select(linhas).order_by(linhas.c.id)
+
+    db = ReadSessionLocal()
+    try:
+        query = db.execute(stmt.execution_options(stream_results=True, yield_per=EXPORT_BATCH_SIZE))
+
+        for (appo_id, date_time, status, client_name, client_phone,
+             barber_id, barber_name, service_id, service_name, price) in query:
+            yield {
+                "id": appo_id,
+                "date_time": date_time.isoformat() if date_time else None,
+                "kind": classify_kind(client_name, service_id),
+                "status": status,
+                "client_name": client_name,
+                "client_phone": client_phone,
+                "barber_id": barber_id,
+                "barber_name": barber_name,
+                "service_id": service_id,
+                "service_name": service_name,
+                "price": price or 0.0,
+            }
+    finally:
+        db.close()
+
+
+def _batched(rows, size: int = EXPORT_BATCH_SIZE):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def stream_csv(rows):
+    """Transforma as linhas em CSV, um bloco de texto por lote (o cabeçalho vai no primeiro)."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS)
+    writer.writeheader()
+    yield buffer.getvalue()
+
+    for batch in _batched(rows):
+        buffer.seek(0)
+        buffer.truncate(0)
+        writer.writerows(batch)
+        yield buffer.getvalue()
+
+
+def stream_ndjson(rows):
+    """Uma linha JSON por registo (formato NDJSON)."""
+    for batch in _batched(rows):
+        yield "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in batch)
+
+
+def gzip_stream(chunks):
+    """Comprime o fluxo em gzip à medida que é gerado, sem guardar o ficheiro inteiro."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 -> cabeçalho gzip
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,503 @@
+"""Importação em massa (onboarding de redes vindas de outro sistema).
+
+Tipos: serviços, produtos, equipe e histórico de agendamentos/vendas. O arquivo é lido
+em fluxo (CSV ou NDJSON, opcionalmente gzip), cada linha é validada e as válidas entram
+em lotes de IMPORT_BATCH_SIZE com INSERTs em massa, tudo numa única transação. As linhas
+com problema não travam o resto: voltam no relatório com o número da linha e o motivo.
+Com `dry_run` nada é gravado (só a validação).
+
+O histórico usa as mesmas colunas da exportação (GET /admin/{id}/export), então um
+arquivo exportado pode ser importado noutra loja. Barbeiros e serviços podem vir por ID
+ou pelo nome; os clientes são ligados pelo telefone (ver clients.py). As vendas de
+produto ficam ligadas ao produto da loja (product_id/product_name, ou o nome da venda) com
+a sua quantidade, para entrarem no relatório de estoque (ver inventory.py).
+
+Também pela linha de comandos:
+
+    python imports.py appointments 3 historico.csv --dry-run
+    python imports.py services 3 servicos.ndjson.gz
+"""
+import argparse
+import csv
+import gzip
+import io
+import json
+import os
+import re
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import bindparam, insert, or_, select, update
+from sqlalchemy.orm import Session
+
+import analytics
+import availability
+import directory
+import inventory
+from clients import normalize_name, normalize_phone
+from models import Appointment, Barber, Client, Product, Service
+
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "2000"))
+# Erros detalhados no relatório (os restantes só entram na contagem)
+IMPORT_MAX_ERRORS = 200
+
+IMPORT_KINDS = ["services", "products", "team", "appointments"]
+IMPORT_FORMATS = ["csv", "ndjson"]
+
+TEAM_ROLES = ["OWNER", "GERENTE", "MANAGER", "BARBER"]
+APPOINTMENT_STATUSES = ["scheduled", "concluido", "cancelado"]
+PRODUCT_PREFIX = "🛍️ Produto:"
+COUNTER_SERVICE_PREFIX = "✂️ Corte Avulso:"
+
+
+class ImportRowError(ValueError):
+    """Linha inválida: a mensagem vai para o relatório."""
+
+
+# ==========================================
+# LEITURA DO ARQUIVO
+# ==========================================
+
+def _text_stream(raw):
+    """Texto UTF-8 (com ou sem BOM) do arquivo enviado; descomprime se for gzip."""
+    gzipado = raw.read(2) == b"\x1f\x8b"
+    raw.seek(0)
+    return io.TextIOWrapper(gzip.GzipFile(fileobj=raw, mode="rb") if gzipado else raw, encoding="utf-8-sig", newline="")
+
+
+def iter_rows(raw, fmt: str):
+    """(número da linha, dict) de cada registo, sem carregar o arquivo inteiro."""
+    texto = _text_stream(raw)
+    if fmt == "csv":
+        leitor = csv.DictReader(texto)
+        for row in leitor:
+            yield leitor.line_num, row
+    else:
+        for numero, linha in enumerate(texto, start=1):
+            if not linha.strip():
+                continue
+            try:
+                row = json.loads(linha)
+            except ValueError:
+                yield numero, ImportRowError("JSON inválido")
+                continue
+            yield numero, row if isinstance(row, dict) else ImportRowError("Cada linha deve ser um objeto JSON")
+
+
+def detect_format(filename: str | None) -> str:
+    nome = (filename or "").lower().removesuffix(".gz")
+    return "ndjson" if nome.endswith((".ndjson", ".jsonl", ".json")) else "csv"
+
+
+# ==========================================
+# VALIDAÇÃO DE CAMPOS
+# ==========================================
+
+def _value(row: dict, campo: str):
+    valor = row.get(campo)
+    if isinstance(valor, str):
+        valor = valor.strip()
+        return valor or None
+    return valor
+
+
+def _text(row: dict, campo: str, required: bool = False) -> str | None:
+    valor = _value(row, campo)
+    if valor is None and required:
+        raise ImportRowError(f"'{campo}' é obrigatório")
+    return None if valor is None else str(valor)
+
+
+def _number(row: dict, campo: str, cast, required: bool = False, minimum=None):
+    valor = _value(row, campo)
+    if valor is None:
+        if required:
+            raise ImportRowError(f"'{campo}' é obrigatório")
+        return None
+    try:
+        # Aceita o formato brasileiro ("1.234,50")
+        numero = cast(valor.replace(".", "").replace(",", ".") if isinstance(valor, str) and "," in valor else valor)
+    except (TypeError, ValueError):
+        raise ImportRowError(f"'{campo}' inválido: {valor!r}")
+    if minimum is not None and numero < minimum:
+        raise ImportRowError(f"'{campo}' não pode ser menor que {minimum}")
+    return numero
+
+
+def _int(row, campo, required=False, minimum=None) -> int | None:
+    numero = _number(row, campo, float, required, minimum)
+    if numero is not None and numero != int(numero):
+        raise ImportRowError(f"'{campo}' deve ser inteiro")
+    return None if numero is None else int(numero)
+
+
+def _datetime(row: dict, campo: str) -> datetime:
+    valor = _text(row, campo, required=True)
+    try:
+        return datetime.fromisoformat(valor)
+    except ValueError:
+        pass
+    for formato in ("%d/%m/%Y %H:%M", "%d/%m/%Y %H:%M:%S"):
+        try:
+            return datetime.strptime(valor, formato)
+        except ValueError:
+            continue
+    raise ImportRowError(f"'{campo}' inválido: {valor!r} (use AAAA-MM-DDTHH:MM ou DD/MM/AAAA HH:MM)")
+
+
+# ==========================================
+# TIPOS DE IMPORTAÇÃO
+# ==========================================
+
+class _Importer:
+    """Valida cada linha e grava os lotes já validados (flush). Subclasses por tipo (IMPORTERS).
+
+    Cada subclasse define `model` e `row(row) -> dict` (os valores a gravar, ou ImportRowError).
+    """
+
+    model = None
+
+    def __init__(self, db: Session, shop_id: int, dry_run: bool):
+        self.db = db
+        self.shop_id = shop_id
+        self.dry_run = dry_run
+
+    def check_batch(self, linhas: list[tuple[int, dict]]) -> list[tuple[int, str]]:
+        """Validações que precisam do banco, feitas uma vez por lote. Devolve (linha, erro)."""
+        return []
+
+    def flush(self, valores: list[dict]):
+        self.db.execute(insert(self.model), valores)
+
+    def finish(self):
+        """Últimas escritas, na mesma transação (antes do commit)."""
+
+    def invalidate(self):
+        """Limpa os caches afetados, DEPOIS do commit: antes dele uma leitura ainda guardava os dados velhos."""
+
+
+class ServiceImporter(_Importer):
+    model = Service
+
+    def row(self, row):
+        return {
+            "name": _text(row, "name", required=True),
+            "price": _number(row, "price", float, required=True, minimum=0),
+            "duration": _int(row, "duration", required=True, minimum=1),
+            "barbershop_id": self.shop_id,
+        }
+
+    def finish(self):
+        directory.refresh_shop(self.db, self.shop_id)
+
+    def invalidate(self):
+        availability.invalidate(self.shop_id)
+
+
+class ProductImporter(_Importer):
+    model = Product
+
+    def row(self, row):
+        return {
+            "name": _text(row, "name", required=True),
+            "description": _text(row, "description"),
+            "price": _number(row, "price", float, required=True, minimum=0),
+            "cost_price": _number(row, "cost_price", float, minimum=0),
+            "stock_quantity": _int(row, "stock_quantity", minimum=0) or 0,
+            "barbershop_id": self.shop_id,
+        }
+
+    def invalidate(self):
+        inventory.invalidate(self.shop_id)
+
+
+class TeamImporter(_Importer):
+    model = Barber
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.pins_no_arquivo = set()
+
+    def row(self, row):
+        pin = _text(row, "pin", required=True)
+        if not re.fullmatch(r"\d{4,6}", pin):
+            raise ImportRowError("'pin' deve ter de 4 a 6 dígitos")
+        if pin == os.getenv("CEO_PIN", "0000") or pin in self.pins_no_arquivo:
+            raise ImportRowError("PIN em uso.")
+        self.pins_no_arquivo.add(pin)
+        role = (_text(row, "role") or "BARBER").upper()
+        if role not in TEAM_ROLES:
+            raise ImportRowError(f"'role' inválido. Use: {', '.join(TEAM_ROLES)}")
+        return {
+            "name": _text(row, "name", required=True),
+            "role": role,
+            "pin": pin,
+            "email": _text(row, "email"),
+            "barbershop_id": self.shop_id,
+            "is_active": True,
+        }
+
+    def check_batch(self, linhas):
+        # O PIN é único em todo o sistema (é o login do barbeiro)
+        em_uso = set(self.db.execute(
+            select(Barber.pin).where(Barber.pin.in_([v["pin"] for _, v in linhas]))
+        ).scalars())
+        return [(numero, "PIN em uso.") for numero, v in linhas if v["pin"] in em_uso]
+
+
+class AppointmentImporter(_Importer):
+    """Histórico de agendamentos e vendas, nas colunas da exportação."""
+
+    model = Appointment
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        barbeiros = self.db.execute(select(Barber.id, Barber.name).where(Barber.barbershop_id == self.shop_id)).all()
+        self.barber_ids = {b.id for b in barbeiros}
+        self.barber_names = {normalize_name(b.name): b.id for b in barbeiros}
+        servicos = self.db.execute(
+            select(Service.id, Service.name, Service.price, Service.duration).where(Service.barbershop_id == self.shop_id)
+        ).all()
+        self.services = {s.id: s for s in servicos}
+        self.service_names = {normalize_name(s.name): s.id for s in servicos}
+        produtos = self.db.execute(
+            select(Product.id, Product.name, Product.price).where(Product.barbershop_id == self.shop_id)
+        ).all()
+        self.products = {p.id: p for p in produtos}
+        self.product_names = {normalize_name(p.name): p.id for p in produtos}
+        self.clients: dict[str, int] | None = None  # telefone E.164 -> ID, carregado no primeiro lote
+        self.last_booking: dict[int, datetime] = {}  # cliente -> marcação mais recente do arquivo
+
+    def _resolve(self, row, campo_id, campo_nome, ids, nomes, rotulo):
+        """Pelo ID, se for desta loja; senão pelo nome (um arquivo exportado de outra loja traz os dois)."""
+        ident = _int(row, campo_id)
+        if ident is not None and ident in ids:
+            return ident
+        nome = _text(row, campo_nome)
+        if nome is None:
+            if ident is not None:
+                raise ImportRowError(f"{rotulo} {ident} não pertence a esta barbearia")
+            return None
+        encontrado = nomes.get(normalize_name(nome))
+        if encontrado is None:
+            raise ImportRowError(f"{rotulo} '{nome}' não encontrado nesta barbearia")
+        return encontrado
+
+    def _product(self, row, client_name) -> tuple[int | None, int | None]:
+        """(product_id, quantidade) de uma venda de produto.
+
+        Pelas colunas product_id/product_name, como os serviços; sem elas, pelo nome gravado
+        na venda ("🛍️ Produto: Gel x2", o formato da exportação). Um nome do client_name que
+        não é produto desta loja fica sem produto (venda avulsa antiga), como no backfill.
+        """
+        quantidade = _int(row, "quantity", minimum=1)
+        product_id = self._resolve(row, "product_id", "product_name", self.products, self.product_names, "Produto")
+        if product_id is None and (client_name or "").startswith(PRODUCT_PREFIX):
+            nome = client_name.removeprefix(PRODUCT_PREFIX).strip()
+            sufixo = re.fullmatch(r"(.+) x(\d+)", nome)
+            if sufixo and normalize_name(sufixo.group(1)) in self.product_names:
+                nome = sufixo.group(1)
+                quantidade = quantidade or int(sufixo.group(2))
+            product_id = self.product_names.get(normalize_name(nome))
+        if product_id is None:
+            return None, None
+        return product_id, quantidade or 1
+
+    def row(self, row):
+        quando = _datetime(row, "date_time")
+        status = (_text(row, "status") or "concluido").lower()
+        if status not in APPOINTMENT_STATUSES:
+            raise ImportRowError(f"'status' inválido. Use: {', '.join(APPOINTMENT_STATUSES)}")
+        service_id = self._resolve(row, "service_id", "service_name", self.services, self.service_names, "Serviço")
+        barber_id = self._resolve(row, "barber_id", "barber_name", self.barber_ids, self.barber_names, "Barbeiro")
+        client_name = _text(row, "client_name")
+        price = _number(row, "price", float, minimum=0)
+
+        kind = (_text(row, "kind") or "").lower() or None
+        if kind is None:
+            kind = "servico" if service_id else ("produto" if (client_name or "").startswith(PRODUCT_PREFIX) else "venda_balcao")
+
+        product_id = quantidade = None
+        if kind == "servico":
+            if service_id is None:
+                raise ImportRowError("Atendimento sem serviço (informe service_id ou service_name)")
+            servico = self.services[service_id]
+            duracao = availability.service_duration(servico)
+            price = servico.price if price is None else price
+        elif kind in ("produto", "venda_balcao"):
+            if service_id is not None:
+                raise ImportRowError(f"Linha do tipo '{kind}' não pode ter serviço")
+            if kind == "produto":
+                product_id, quantidade = self._product(row, client_name)
+                if price is None and product_id is not None:
+                    price = (self.products[product_id].price or 0.0) * quantidade
+                if client_name is None and product_id is not None:
+                    # O mesmo nome que o balcão grava (ver inventory.sell_product)
+                    client_name = self.products[product_id].name + (f" x{quantidade}" if quantidade > 1 else "")
+                barber_id = None  # produto vai para a loja, como na venda de balcão
+            if price is None:
+                raise ImportRowError("'price' é obrigatório em vendas")
+            prefixo = PRODUCT_PREFIX if kind == "produto" else COUNTER_SERVICE_PREFIX
+            if not (client_name or "").startswith(prefixo):
+                client_name = f"{prefixo} {client_name or 'Venda'}"
+            duracao = 0
+        else:
+            raise ImportRowError("'kind' inválido. Use: servico, produto, venda_balcao")
+
+        telefone = _text(row, "client_phone")
+        return {
+            "date_time": quando,
+            "duration": duracao,
+            "end_time": quando + timedelta(minutes=duracao),
+            "status": status,
+            "client_name": client_name,
+            "client_phone": telefone,
+            "barber_id": barber_id,
+            "service_id": service_id,
+            "service_price": price or 0.0,
+            "product_id": product_id,
+            "quantity": quantidade,
+            "barbershop_id": self.shop_id,
+            "client_id": None,
+            "_phone": normalize_phone(telefone),
+        }
+
+    def flush(self, valores):
+        if self.clients is None:
+            self.clients = dict(self.db.execute(
+                select(Client.phone, Client.id).where(Client.barbershop_id == self.shop_id)
+            ).all())
+
+        # Clientes novos do lote: um INSERT em massa com RETURNING dos IDs
+        novos = {}
+        for v in valores:
+            phone = v["_phone"]
+            if phone and phone not in self.clients:
+                atual = novos.get(phone)
+                if atual is None or v["date_time"] > atual["last_booking_at"]:
+                    novos[phone] = {
+                        "barbershop_id": self.shop_id, "phone": phone, "name": v["client_name"],
+                        "name_search": normalize_name(v["client_name"]), "created_at": datetime.now(),
+                        "last_booking_at": v["date_time"],
+                    }
+        if novos:
+            criados = self.db.execute(insert(Client).returning(Client.phone, Client.id), list(novos.values())).all()
+            self.clients.update(dict(criados))
+
+        for v in valores:
+            phone = v.pop("_phone")
+            client_id = v["client_id"] = self.clients.get(phone) if phone else None
+            if client_id and v["date_time"] > self.last_booking.get(client_id, datetime.min):
+                self.last_booking[client_id] = v["date_time"]
+        self.db.execute(insert(Appointment), valores)
+
+    def finish(self):
+        # Última marcação de cada cliente: só avança (um UPDATE em lote, sem reler os agendamentos)
+        if self.last_booking:
+            tabela = Client.__table__
+            self.db.execute(
+                update(tabela)
+                .where(tabela.c.id == bindparam("cid"),
+                       or_(tabela.c.last_booking_at.is_(None), tabela.c.last_booking_at < bindparam("quando")))
+                .values(last_booking_at=bindparam("quando")),
+                [{"cid": cid, "quando": quando} for cid, quando in self.last_booking.items()],
+            )
+
+    def invalidate(self):
+        analytics.invalidate(self.shop_id)
+        availability.invalidate(self.shop_id)
+        # As vendas importadas entram na velocidade de venda e nas previsões de estoque
+        inventory.invalidate(self.shop_id)
+
+
+IMPORTERS = {
+    "services": ServiceImporter,
+    "products": ProductImporter,
+    "team": TeamImporter,
+    "appointments": AppointmentImporter,
+}
+
+
+# ==========================================
+# EXECUÇÃO
+# ==========================================
+
+def run_import(db: Session, shop_id: int, kind: str, rows, dry_run: bool = False,
+               batch_size: int = IMPORT_BATCH_SIZE) -> dict:
+    """Valida e grava as linhas (iterável de (número, dict)). Faz commit no fim, ou rollback se dry_run."""
+    inicio = time.perf_counter()
+    importer = IMPORTERS[kind](db, shop_id, dry_run)
+    erros = []
+    contagem = {"rows": 0, "imported": 0, "errors": 0}
+
+    def erro(numero, mensagem):
+        contagem["errors"] += 1
+        if len(erros) < IMPORT_MAX_ERRORS:
+            erros.append({"row": numero, "error": mensagem})
+
+    def gravar(lote):
+        invalidas = dict(importer.check_batch(lote))
+        for numero, mensagem in invalidas.items():
+            erro(numero, mensagem)
+        valores = [v for numero, v in lote if numero not in invalidas]
+        if valores and not dry_run:
+            importer.flush(valores)
+        contagem["imported"] += len(valores)
+
+    lote = []
+    try:
+        for numero, row in rows:
+            contagem["rows"] += 1
+            try:
+                if isinstance(row, Exception):
+                    raise row
+                lote.append((numero, importer.row(row)))
+            except ImportRowError as e:
+                erro(numero, str(e))
+                continue
+            if len(lote) >= batch_size:
+                gravar(lote)
+                lote = []
+        if lote:
+            gravar(lote)
+        if dry_run:
+            db.rollback()
+        else:
+            if contagem["imported"]:
+                importer.finish()
+            db.commit()
+            if contagem["imported"]:
+                importer.invalidate()
+    except Exception:
+        db.rollback()
+        raise
+
+    return {
+        "kind": kind,
+        "dry_run": dry_run,
+        **contagem,
+        "error_details": sorted(erros, key=lambda e: e["row"]),
+        "duration_ms": round((time.perf_counter() - inicio) * 1000, 1),
+    }
+
+
+if __name__ == "__main__":
+    from database import SessionLocal
+    from logs import get_logger, setup_logging
+
+    parser = argparse.ArgumentParser(description="Importação em massa para uma barbearia")
+    parser.add_argument("kind", choices=IMPORT_KINDS)
+    parser.add_argument("shop_id", type=int)
+    parser.add_argument("arquivo")
+    parser.add_argument("--format", choices=IMPORT_FORMATS)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    setup_logging(default_format="text")
+    db = SessionLocal()
+    try:
+        with open(args.arquivo, "rb") as f:
+            relatorio = run_import(db, args.shop_id, args.kind, iter_rows(f, args.format or detect_format(args.arquivo)), args.dry_run)
+    finally:
+        db.close()
+    get_logger("imports").info(json.dumps(relatorio, ensure_ascii=False, indent=2))
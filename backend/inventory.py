@@ -0,0 +1,283 @@
+"""Vendas de produtos e previsão de reposição do estoque.
+
+Cada venda de produto continua a ser uma linha em `appointments` (é o que o caixa, os
+fechamentos e os relatórios já leem), agora com `product_id` e `quantity`. O estoque
+baixa com um único UPDATE condicional, sem corrida entre dois caixas a vender a última
+unidade.
+
+O relatório de estoque calcula, para TODOS os produtos da loja de uma vez:
+
+    velocidade (unidades/dia), dias até esgotar, margem, ponto de pedido e quanto repor
+
+O histórico é agregado no banco numa única query (unidades por produto e por dia, e daí
+soma, soma dos quadrados e faturamento por produto); em Python só ficam as contas sobre
+essas somas. O resultado fica em cache por loja até à próxima venda ou reposição: cada
+entrada guarda a versão dos agendamentos e produtos da loja (sync.data_version, uma query),
+então uma venda ou reposição feita noutro worker também a invalida; INVENTORY_CACHE_TTL
+limita o resto (commits fora de ordem entre workers).
+
+Cancelar uma venda de produto devolve as unidades ao estoque; desfazer o cancelamento
+volta a tirá-las (apply_stock_deltas, na mesma transação da mudança de estado).
+"""
+import math
+import os
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import bindparam, case, func, select, update
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+
+import sync
+from analytics import bucket_sql
+from archive import appointments_between
+from models import Appointment, Product
+
+PRODUCT_SALE_PREFIX = "🛍️ Produto:"
+
+INVENTORY_WINDOW_DAYS = 28
+INVENTORY_MAX_WINDOW_DAYS = 365
+# Dias entre fazer o pedido ao fornecedor e ter o produto na prateleira
+INVENTORY_LEAD_DAYS = 7
+# Quantos dias de venda cada reposição deve cobrir
+INVENTORY_COVER_DAYS = 14
+# Estoque de segurança para ~95% dos dias (desvio padrão das vendas diárias × 1,65)
+INVENTORY_SERVICE_Z = 1.65
+
+INVENTORY_CACHE_TTL = int(os.getenv("INVENTORY_CACHE_TTL", "600"))
+_CACHE_MAX_ENTRIES = 10_000
+# (shop_id, dia, days, lead_days, cover_days) -> (versão, gravado em, relatório)
+_cache: dict[tuple, dict] = {}
+_lock = threading.Lock()
+
+
+# ==========================================
+# VENDAS
+# ==========================================
+
+def take_stock(db: Session, product: Product, quantity: int = 1) -> int | None:
+    """Tira `quantity` unidades do estoque (sem commit) e devolve o que resta, ou None se não há que chegue."""
+    restante = db.execute(
+        update(Product)
+        .where(Product.id == product.id, Product.stock_quantity >= quantity)
+        .values(stock_quantity=Product.stock_quantity - quantity)
+        .returning(Product.stock_quantity)
+    ).scalar()
+    if restante is not None:
+        # O UPDATE foi direto ao banco: o objeto na sessão recebe o estoque devolvido (sem reler)
+        set_committed_value(product, "stock_quantity", restante)
+    return restante
+
+
+def sell_product(db: Session, product: Product, quantity: int = 1, price: float | None = None,
+                 sold_by: int | None = None, now: datetime | None = None) -> Appointment | None:
+    """Baixa o estoque e regista a venda (sem commit; depois do commit, chame invalidate).
+
+    Devolve None se não há unidades suficientes.
+    `price` é o total cobrado; sem ele vale o preço do produto × quantidade. `sold_by` é o
+    barbeiro que vendeu (comissão de produto, ver payroll.py).
+    """
+    now = now or datetime.now()
+    if take_stock(db, product, quantity) is None:
+        return None
+
+    venda = Appointment(
+        barbershop_id=product.barbershop_id,
+        barber_id=None,  # venda de produto é da loja (não entra na comissão do barbeiro)
+        client_name=f"{PRODUCT_SALE_PREFIX} {product.name}" + (f" x{quantity}" if quantity > 1 else ""),
+        client_phone="000000000",
+        service_id=None,
+        service_price=float(price if price is not None else (product.price or 0.0) * quantity),
+        date_time=now,
+        duration=0,
+        end_time=now,
+        status="concluido",
+        product_id=product.id,
+        quantity=quantity,
+        seller_id=sold_by,
+    )
+    db.add(venda)
+    return venda
+
+
+def sale_stock_delta(product_id: int | None, quantity: int | None, old_status: str, new_status: str) -> int:
+    """Unidades que voltam ao estoque quando uma linha muda de estado: + ao cancelar uma venda, − ao desfazer o cancelamento."""
+    if product_id is None or old_status == new_status:
+        return 0
+    unidades = quantity or 1
+    if new_status == "cancelado":
+        return unidades
+    if old_status == "cancelado":
+        return -unidades
+    return 0
+
+
+def apply_stock_deltas(db: Session, shop_id: int, deltas: dict[int, int]):
+    """Soma `deltas` (product_id -> unidades) ao estoque num único UPDATE ... CASE (sem commit)."""
+    deltas = {product_id: n for product_id, n in deltas.items() if n}
+    if not deltas:
+        return
+    db.execute(
+        update(Product)
+        .where(Product.id.in_(list(deltas)), Product.barbershop_id == shop_id)
+        .values(stock_quantity=func.coalesce(Product.stock_quantity, 0) + case(deltas, value=Product.id))
+        .execution_options(synchronize_session=False)
+    )
+
+
+def backfill_product_sales(conn, table) -> int:
+    """Liga as vendas antigas ("🛍️ Produto: <nome>") ao produto da loja com esse nome.
+
+    Um SELECT DISTINCT acha os nomes vendidos; cada par (loja, nome) que corresponde a um
+    produto vira um UPDATE num único executemany (pelo índice da loja, sem subquery por linha).
+    """
+    vendidos = conn.execute(
+        select(table.c.barbershop_id, table.c.client_name).distinct()
+        .where(table.c.client_name.like(f"{PRODUCT_SALE_PREFIX}%"), table.c.product_id.is_(None))
+    ).all()
+    if not vendidos:
+        return 0
+    produtos = {
+        (shop_id, f"{PRODUCT_SALE_PREFIX} {nome}"): product_id
+        for product_id, shop_id, nome in conn.execute(select(Product.id, Product.barbershop_id, Product.name))
+    }
+    params = [
+        {"shop": shop_id, "nome": nome, "pid": produtos[(shop_id, nome)]}
+        for shop_id, nome in vendidos if (shop_id, nome) in produtos
+    ]
+    if params:
+        conn.execute(
+            update(table)
+            .where(table.c.barbershop_id == bindparam("shop"), table.c.client_name == bindparam("nome"),
+                   table.c.product_id.is_(None))
+            .values(product_id=bindparam("pid"), quantity=1),
+            params,
+        )
+    return len(params)
+
+
+# ==========================================
+# RELATÓRIO DE ESTOQUE
+# ==========================================
+
+def _sales_by_product(db: Session, shop_id: int, start: datetime, end: datetime) -> dict:
+    """product_id -> (unidades, soma dos quadrados das unidades diárias, faturamento), numa query."""
+    vendas = appointments_between(
+        ["product_id", "quantity", "service_price", "date_time"], start, end,
+        lambda t: t.c.barbershop_id == shop_id,
+        lambda t: t.c.status == "concluido",
+        lambda t: t.c.product_id.isnot(None),
+    ).subquery()
+    unidades = func.coalesce(vendas.c.quantity, 1)
+    por_dia = (
+        select(
+            vendas.c.product_id,
+            func.sum(unidades).label("units"),
+            func.sum(vendas.c.service_price).label("revenue"),
+        )
+        .group_by(vendas.c.product_id, bucket_sql(vendas.c.date_time, "day", db.get_bind().dialect.name))
+        .subquery()
+    )
+    linhas = db.execute(
+        select(
+            por_dia.c.product_id,
+            func.sum(por_dia.c.units),
+            func.sum(por_dia.c.units * por_dia.c.units),
+            func.coalesce(func.sum(por_dia.c.revenue), 0.0),
+        ).group_by(por_dia.c.product_id)
+    ).all()
+    return {pid: (int(u), int(u2), float(r)) for pid, u, u2, r in linhas}
+
+
+def _forecast(stock: int, units: int, units_sq: int, days: int, lead_days: int, cover_days: int) -> dict:
+    media = units / days
+    # Variância das vendas diárias contando os dias sem venda (zeros) da janela
+    desvio = math.sqrt(max(units_sq / days - media * media, 0.0))
+    seguranca = INVENTORY_SERVICE_Z * desvio * math.sqrt(lead_days)
+    ponto_pedido = math.ceil(media * lead_days + seguranca)
+    alvo = ponto_pedido + math.ceil(media * cover_days)
+    dias_restantes = None if media == 0 else round(max(stock, 0) / media, 1)
+    return {
+        "velocity_per_day": round(media, 3),
+        "days_until_stockout": dias_restantes,
+        "stockout_date": (date.today() + timedelta(days=math.floor(dias_restantes))).isoformat()
+        if dias_restantes is not None else None,
+        "reorder_point": ponto_pedido,
+        "needs_reorder": media > 0 and stock <= ponto_pedido,
+        "suggested_reorder": max(alvo - stock, 0) if media > 0 and stock <= ponto_pedido else 0,
+    }
+
+
+def inventory_report(db: Session, shop_id: int, days: int = INVENTORY_WINDOW_DAYS,
+                     lead_days: int = INVENTORY_LEAD_DAYS, cover_days: int = INVENTORY_COVER_DAYS) -> dict:
+    """Velocidade de venda, dias até esgotar, margem e reposição sugerida de todos os produtos da loja."""
+    hoje = date.today()
+    chave = (shop_id, hoje, days, lead_days, cover_days)
+    versao = sync.data_version(db, shop_id, "appointments", "products")
+    agora = time.monotonic()
+    with _lock:
+        cached = _cache.get(chave)
+    if cached is not None and cached[0] == versao and agora - cached[1] < INVENTORY_CACHE_TTL:
+        return cached[2]
+
+    # Janela = os `days` dias completos até hoje (inclusive)
+    fim = datetime.combine(hoje + timedelta(days=1), datetime.min.time())
+    inicio = fim - timedelta(days=days)
+    vendas = _sales_by_product(db, shop_id, inicio, fim)
+    produtos = db.execute(
+        select(Product.id, Product.name, Product.stock_quantity, Product.price, Product.cost_price)
+        .where(Product.barbershop_id == shop_id)
+    ).all()
+
+    itens = []
+    for product_id, nome, estoque, preco, custo in produtos:
+        estoque = estoque or 0
+        unidades, quadrados, faturamento = vendas.get(product_id, (0, 0, 0.0))
+        margem = (preco - custo) if preco is not None and custo is not None else None
+        itens.append({
+            "id": product_id,
+            "name": nome,
+            "stock_quantity": estoque,
+            "price": preco,
+            "cost_price": custo,
+            "units_sold": unidades,
+            "revenue": round(faturamento, 2),
+            "unit_margin": round(margem, 2) if margem is not None else None,
+            "margin_pct": round(100 * margem / preco, 1) if margem is not None and preco else None,
+            "gross_profit": round(faturamento - unidades * custo, 2) if custo is not None else None,
+            "stock_value": round(estoque * custo, 2) if custo is not None else None,
+            **_forecast(estoque, unidades, quadrados, days, lead_days, cover_days),
+        })
+    # Os que esgotam primeiro em cima; sem vendas no fim
+    itens.sort(key=lambda i: (i["days_until_stockout"] is None, i["days_until_stockout"] or 0, i["name"] or ""))
+
+    relatorio = {
+        "days": days,
+        "lead_days": lead_days,
+        "cover_days": cover_days,
+        "generated_at": datetime.now().isoformat(),
+        "products": itens,
+        "totals": {
+            "units_sold": sum(i["units_sold"] for i in itens),
+            "revenue": round(sum(i["revenue"] for i in itens), 2),
+            "gross_profit": round(sum(i["gross_profit"] or 0.0 for i in itens), 2),
+            "stock_value": round(sum(i["stock_value"] or 0.0 for i in itens), 2),
+            "needs_reorder": sum(1 for i in itens if i["needs_reorder"]),
+        },
+    }
+    with _lock:
+        if len(_cache) > _CACHE_MAX_ENTRIES:
+            _cache.clear()
+        _cache[chave] = (versao, agora, relatorio)
+    return relatorio
+
+
+def invalidate(shop_id: int):
+    """Chamado depois do commit de cada venda, reposição ou alteração de produtos da loja.
+
+    Só limpa este worker; nos outros a versão mudou e o relatório é refeito.
+    """
+    with _lock:
+        for key in [k for k in _cache if k[0] == shop_id]:
+            del _cache[key]
@@ -0,0 +1,198 @@
+"""Logs estruturados do backend.
+
+Os pedidos só põem o registo numa fila (QueueHandler); a escrita no stdout é feita por
+uma thread à parte (QueueListener), fora do caminho do pedido. Cada registo sai como uma
+linha JSON com o ID do pedido, a loja e a rota, quando existem:
+
+    {"ts": "...", "level": "ERROR", "logger": "barbearia.agendamentos", "msg": "...",
+     "request_id": "9f1c...", "shop_id": 3, "route": "/appointments", ...}
+
+Configuração (.env):
+
+    LOG_LEVEL=INFO
+    LOG_FORMAT=json          # ou "text" (linhas legíveis, para a consola)
+    SLOW_QUERY_MS=500        # queries mais lentas do que isto vão para o log (0 desliga)
+"""
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import time
+from datetime import datetime, timezone
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+SLOW_QUERY_MS = int(os.getenv("SLOW_QUERY_MS", "500"))
+# Tamanho máximo do SQL guardado no log de queries lentas
+SLOW_QUERY_SQL_MAX = 2000
+
+# Campos padrão do LogRecord (o resto veio por `extra=` e vai para o JSON).
+# O uvicorn manda em `color_message` a mesma mensagem com cores ANSI: fica de fora.
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "taskName", "color_message"}
+
+# Contexto do pedido atual. É um dict mutável de propósito: o get_current_user corre numa
+# thread do pool (com uma CÓPIA do contexto) e mesmo assim consegue acrescentar a loja.
+_request_context: contextvars.ContextVar[dict | None] = contextvars.ContextVar("request_context", default=None)
+
+_listener: logging.handlers.QueueListener | None = None
+
+
+def get_logger(name: str) -> logging.Logger:
+    return logging.getLogger(f"barbearia.{name}")
+
+
+# ==========================================
+# CONTEXTO DO PEDIDO
+# ==========================================
+
+def start_request(request_id: str, scope: dict) -> contextvars.Token:
+    return _request_context.set({"request_id": request_id, "scope": scope})
+
+
+def end_request(token: contextvars.Token):
+    _request_context.reset(token)
+
+
+def bind(**campos):
+    """Acrescenta campos ao contexto do pedido atual (ex.: bind(shop_id=3) depois de ler o token)."""
+    contexto = _request_context.get()
+    if contexto is not None:
+        contexto.update({k: v for k, v in campos.items() if v is not None})
+
+
+def current_context() -> dict:
+    """request_id, shop_id e rota do pedido atual (vazio fora de um pedido)."""
+    contexto = _request_context.get()
+    if contexto is None:
+        return {}
+    scope = contexto["scope"]
+    rota = scope.get("route")
+    params = scope.get("path_params") or {}
+    campos = {
+        "request_id": contexto["request_id"],
+        "route": getattr(rota, "path", None) or scope.get("path"),
+        "shop_id": contexto.get("shop_id") or params.get("barbershop_id") or params.get("shop_id"),
+    }
+    campos.update({k: v for k, v in contexto.items() if k not in ("scope", "request_id", "shop_id")})
+    return {k: v for k, v in campos.items() if v is not None}
+
+
+class _ContextFilter(logging.Filter):
+    """Carimba o contexto no registo AINDA na thread do pedido (antes de ir para a fila)."""
+
+    def filter(self, record):
+        for chave, valor in current_context().items():
+            if not hasattr(record, chave):
+                setattr(record, chave, valor)
+        return True
+
+
+# ==========================================
+# FORMATOS
+# ==========================================
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        dados = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for chave, valor in vars(record).items():
+            if chave not in _RECORD_FIELDS and not chave.startswith("_"):
+                dados[chave] = valor
+        if record.exc_info:
+            dados["exc"] = self.formatException(record.exc_info)
+        return json.dumps(dados, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def format(self, record):
+        linha = super().format(record)
+        extras = {k: v for k, v in vars(record).items() if k not in _RECORD_FIELDS and not k.startswith("_")}
+        if extras:
+            # O traceback (se houver) já está no fim de `linha`; os extras vão na primeira linha
+            primeira, _, resto = linha.partition("\n")
+            linha = primeira + " " + " ".join(f"{k}={v}" for k, v in extras.items()) + (f"\n{resto}" if resto else "")
+        return linha
+
+
+# ==========================================
+# CONFIGURAÇÃO
+# ==========================================
+
+def setup_logging(default_format: str = "json"):
+    """Liga o QueueHandler no logger raiz e arranca a thread que escreve no stdout. Idempotente."""
+    global _listener
+    if _listener is not None:
+        return
+    formato = os.getenv("LOG_FORMAT", default_format).lower()
+
+    fila = queue.SimpleQueue()
+    produtor = logging.handlers.QueueHandler(fila)
+    # A formatação acontece no produtor (o traceback ainda existe ali); o consumidor só escreve
+    produtor.setFormatter(JsonFormatter() if formato == "json" else TextFormatter())
+    produtor.addFilter(_ContextFilter())
+
+    saida = logging.StreamHandler(sys.stdout)
+    saida.setFormatter(logging.Formatter("%(message)s"))
+
+    raiz = logging.getLogger()
+    raiz.addHandler(produtor)
+    raiz.setLevel(LOG_LEVEL)
+
+    _listener = logging.handlers.QueueListener(fila, saida)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """Esvazia a fila e para a thread de escrita (chamado no fim do lifespan e no atexit)."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+# ==========================================
+# QUERIES LENTAS
+# ==========================================
+
+def install_slow_query_log(engine, threshold_ms: int = SLOW_QUERY_MS):
+    """Mede cada query com os eventos do SQLAlchemy e registra as que passam de `threshold_ms`."""
+    if threshold_ms <= 0:
+        return
+    from sqlalchemy import event
+
+    logger = get_logger("sql")
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _inicio(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("_query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _fim(conn, cursor, statement, parameters, context, executemany):
+        inicio = conn.info["_query_start"].pop()
+        duracao = (time.perf_counter() - inicio) * 1000
+        if duracao >= threshold_ms:
+            # Sem os parâmetros: podem ter dados de clientes (nomes, telefones)
+            logger.warning("Query lenta", extra={
+                "duration_ms": round(duracao, 1),
+                "statement": statement[:SLOW_QUERY_SQL_MAX],
+                "executemany": executemany,
+                "db": engine.dialect.name,
+            })
+
+    @event.listens_for(engine, "handle_error")
+    def _erro(context):
+        # A query falhou: o after_cursor_execute não corre, então tira a marca da pilha
+        conn = context.connection
+        if conn is not None and conn.info.get("_query_start"):
+            conn.info["_query_start"].pop()
@@ -1,33 +1,94 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Request, status, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy import extract
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 import httpx # Para falar com o N8N
-import datetime
 import os
 import uuid
 import base64
+import csv
+import asyncio
+import time
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 from pydantic import BaseModel
 from fastapi.staticfiles import StaticFiles
+from fastapi.responses import Response, StreamingResponse, JSONResponse, PlainTextResponse
 from datetime import datetime, timedelta
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from sqlalchemy import extract
 
-from database import engine, get_db, Base
-from models import Appointment, Barbershop, Barber, Product, Service
+from anyio import to_thread
+from database import engine, get_db, get_read_db, mark_recent_write, replica_engine, READ_STICKY_SECONDS, STICKY_COOKIE, get_pool_status, warm_pool, warm_up, keepalive_loop, DB_KEEPALIVE_INTERVAL, THREADPOOL_SIZE
+from models import Appointment, Barbershop, Barber, CommissionRule, DayClose, Product, Service, TenantDeletion
 # IMPORTANTE: Importando a fechadura (get_current_user)
 from auth import hash_password, verify_password, create_access_token, get_current_user
+import agenda
+import analytics
+import availability
+import calendars
+import directory
+import inventory
+import payroll
+import sessions
+import sync
+from archive import appointments_between, month_start, next_month
+from exports import iter_export_rows, stream_csv, stream_ndjson, gzip_stream
+from imports import IMPORT_FORMATS, IMPORT_KINDS, detect_format, iter_rows, run_import
+from reminders import REMINDER_SCHEDULER, reminder_loop
+from deletions import DELETION_SCHEDULER, deletion_loop, deletion_to_dict, request_deletion, wake as wake_deletions
+from closes import DAY_CLOSE_SCHEDULER, day_close_loop, get_or_create_close, latest_close, write_close, close_to_dict, render_close_email, send_email, email_configured
+from clients import upsert_client, search_clients, client_history
+from tenants import tenant_overview, shop_public, OVERVIEW_SORTS, OVERVIEW_MAX_PAGE_SIZE
+import logs
+import profiling
 
 load_dotenv()
+logs.setup_logging()
+logger = logs.get_logger("api")
 
-app = FastAPI(title="SaaS Barbearia - Backend Pro")
+UPLOADS_DIR = "uploads"
+# Uma linha de log por pedido (método, status, duração)
+LOG_REQUESTS = os.getenv("LOG_REQUESTS", "true").lower() == "true"
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Arranque rápido: nada de I/O no banco aqui.
+
+    As tabelas são criadas/alteradas pelas migrações (python migrations.py), não pelo servidor.
+    O aquecimento do pool, o keepalive e os agendadores de fechamentos, de lembretes e de
+    remoção de lojas correm em segundo plano, sem travar o arranque.
+    """
+    os.makedirs(UPLOADS_DIR, exist_ok=True)
+    # As rotas síncronas correm neste limitador (40 threads por omissão): alinhado com o pool
+    to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+
+    tarefas = []
+    if os.getenv("DB_WARM_ON_STARTUP", "true").lower() == "true":
+        tarefas.append(asyncio.create_task(warm_up()))
+    if DB_KEEPALIVE_INTERVAL > 0:
+        tarefas.append(asyncio.create_task(keepalive_loop()))
+    if DAY_CLOSE_SCHEDULER:
+        tarefas.append(asyncio.create_task(day_close_loop()))
+    if REMINDER_SCHEDULER:
+        tarefas.append(asyncio.create_task(reminder_loop()))
+    tarefas.append(asyncio.create_task(sessions.session_loop()))
+    if DELETION_SCHEDULER:
+        tarefas.append(asyncio.create_task(deletion_loop(UPLOADS_DIR)))
+
+    yield
+
+    # Daqui para baixo o uvicorn já esperou os pedidos em curso (ver server.py)
+    for tarefa in tarefas:
+        tarefa.cancel()
+    await asyncio.gather(*tarefas, return_exceptions=True)
+    for alvo in [e for e in (engine, replica_engine) if e is not None]:
+        alvo.dispose()
+
+app = FastAPI(title="SaaS Barbearia - Backend Pro", lifespan=lifespan)
 
 # --- 1. CONFIGURAÇÃO DE UPLOADS DE IMAGEM ---
-os.makedirs("uploads", exist_ok=True)
-app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
+# check_dir=False: a pasta é criada no lifespan, não na importação
+app.mount("/uploads", StaticFiles(directory=UPLOADS_DIR, check_dir=False), name="uploads")
 
 class BarberPhotoUpdate(BaseModel):
     photo_base64: str
@@ -61,7 +122,7 @@ def save_base64_image(base64_string: str) -> str:
         filename = f"{uuid.uuid4().hex}.{ext}"
         
         img_data = base64.b64decode(imgstr)
-        with open(f"uploads/{filename}", "wb") as f:
+        with open(f"{UPLOADS_DIR}/{filename}", "wb") as f:
             f.write(img_data)
         
         # IMPORTANTE: Retorna apenas o caminho relativo
@@ -69,11 +130,6 @@ def save_base64_image(base64_string: str) -> str:
     except:
         return ""
 
-# Criar tabelas
-Base.metadata.create_all(bind=engine)
-
-frontend_url = os.getenv("FRONTEND_URL", "http://localhost:3000")
-
 # Lista de sites que têm permissão para aceder ao seu Backend
 frontend_url = os.getenv("FRONTEND_URL", "https://seu-projeto.vercel.app")
 
@@ -91,6 +147,64 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def read_your_writes(request, call_next):
+    """Depois de uma escrita, manda as leituras deste cliente para o banco principal por alguns segundos."""
+    response = await call_next(request)
+    if replica_engine is not None and request.method in ["POST", "PUT", "PATCH", "DELETE"] and response.status_code < 400:
+        mark_recent_write(request)
+        response.set_cookie(STICKY_COOKIE, "1", max_age=READ_STICKY_SECONDS, httponly=True, samesite="lax")
+    return response
+
+@app.middleware("http")
+async def request_context(request, call_next):
+    """Dá um ID a cada pedido (ou reaproveita o X-Request-ID do proxy) e põe ID, rota e loja em todos os logs dele."""
+    request_id = request.headers.get("x-request-id", "")[:64] or uuid.uuid4().hex[:16]
+    if profiling.PROFILE_HEADER in request.headers:
+        return await profile_request(request, call_next, request_id)
+    token = logs.start_request(request_id, request.scope)
+    inicio = time.perf_counter()
+    try:
+        response = await call_next(request)
+        response.headers["X-Request-ID"] = request_id
+        if LOG_REQUESTS:
+            logger.info("Pedido", extra={
+                "method": request.method, "status": response.status_code,
+                "duration_ms": round((time.perf_counter() - inicio) * 1000, 1),
+            })
+        return response
+    except Exception:
+        logger.exception("Erro não tratado", extra={"method": request.method})
+        raise
+    finally:
+        logs.end_request(token)
+
+async def profile_request(request, call_next, request_id: str):
+    """Pedido com X-Profile: só com token de SUPERADMIN (a mesma verificação do get_current_user)."""
+    try:
+        autorizacao = request.headers.get("authorization", "")
+        user = get_current_user(autorizacao.removeprefix("Bearer ").strip())
+    except HTTPException as e:
+        return JSONResponse({"detail": e.detail}, status_code=e.status_code, headers=e.headers)
+    if user.get("role") != "SUPERADMIN":
+        return JSONResponse({"detail": "Perfilamento só para o SuperAdmin"}, status_code=403)
+
+    engines = [e for e in (engine, replica_engine) if e is not None]
+    token = logs.start_request(request_id, request.scope)
+    inicio = time.perf_counter()
+    perfil, token_perfil, amostrador = profiling.start(request.scope, request.method, request.url.path, engines)
+    status_code = None
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+    finally:
+        profiling.finish(perfil, token_perfil, amostrador, request.scope, status_code, inicio, engines)
+        await asyncio.to_thread(profiling.save, perfil)
+        logs.end_request(token)
+    response.headers["X-Request-ID"] = request_id
+    response.headers["X-Profile-ID"] = perfil.id
+    return response
+
 class SuperAdminLogin(BaseModel):
     email: str
     password: str
@@ -109,17 +223,6 @@ def login_superadmin(data: SuperAdminLogin):
         return {"access_token": access_token, "user": {"name": "CEO SaaS", "role": "SUPERADMIN"}}
     raise HTTPException(status_code=401, detail="Credenciais de SuperAdmin inválidas")
 
-from pydantic import BaseModel
-
-# Modelos para as novas rotas de Login
-class ShopLogin(BaseModel):
-    email: str
-    password: str
-
-class PinLogin(BaseModel):
-    shop_id: int
-    pin: str
-
 # ==========================================
 # ROTAS DE AUTENTICAÇÃO (NOVO FLUXO PDV)
 # ==========================================
@@ -144,6 +247,8 @@ def login_pin(data: PinLogin, db: Session = Depends(get_db)):
     
     if not barber:
         raise HTTPException(status_code=401, detail="PIN incorreto. Tente novamente.")
+    if barber.is_active is False:
+        raise HTTPException(status_code=403, detail="Funcionário desativado. Fale com a gerência.")
         
     # Gera o Token JWT para ESTE barbeiro específico
     token_data = {"sub": str(barber.id), "role": barber.role, "shop_id": barber.barbershop_id}
@@ -160,6 +265,83 @@ def login_pin(data: PinLogin, db: Session = Depends(get_db)):
         }
     }
 
+@app.post("/auth/logout")
+def logout(db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
+    """Revoga o token usado neste pedido (os outros dispositivos continuam com sessão)."""
+    if not sessions.revoke_token(db, current_user, revoked_by=current_user.get("sub")):
+        raise HTTPException(status_code=400, detail="Sessão antiga: faça login de novo para poder sair")
+    db.commit()
+    return {"message": "Sessão terminada"}
+
+@app.post("/admin/barbers/{barber_id}/revoke-sessions")
+def revoke_barber_sessions(barber_id: int, db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
+    """Termina todas as sessões de um funcionário (ex.: PIN vazado). Ele entra de novo com o PIN."""
+    if current_user.get("role") not in ["OWNER", "GERENTE", "CEO", "SUPERADMIN"]:
+        raise HTTPException(status_code=403, detail="Sem permissão")
+    barber = db.query(Barber).filter(Barber.id == barber_id).first()
+    if not barber:
+        raise HTTPException(status_code=404, detail="Barbeiro não encontrado")
+    if current_user.get("role") != "SUPERADMIN" and current_user.get("shop_id") != barber.barbershop_id:
+        raise HTTPException(status_code=403, detail="Acesso negado a esta barbearia")
+    sessions.revoke_barber(db, barber_id, revoked_by=current_user.get("sub"))
+    db.commit()
+    return {"message": "Sessões do funcionário terminadas"}
+
+@app.post("/admin/{barbershop_id}/revoke-sessions")
+def revoke_shop_sessions(barbershop_id: int, db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
+    """Termina todas as sessões da loja, incluindo a de quem pediu."""
+    if current_user.get("role") not in ["OWNER", "CEO", "SUPERADMIN"]:
+        raise HTTPException(status_code=403, detail="Sem permissão")
+    if current_user.get("role") != "SUPERADMIN" and current_user.get("shop_id") != barbershop_id:
+        raise HTTPException(status_code=403, detail="Acesso negado a esta barbearia")
+    sessions.revoke_shop(db, barbershop_id, revoked_by=current_user.get("sub"))
+    db.commit()
+    return {"message": "Todas as sessões da barbearia foram terminadas"}
+
+# ==========================================
+# CALENDÁRIO DO BARBEIRO (.ICS POR LINK SECRETO)
+# ==========================================
+
+def _calendar_barber(db: Session, barber_id: int, current_user: dict) -> Barber:
+    """O próprio barbeiro ou a gestão da loja dele."""
+    barber = db.query(Barber).filter(Barber.id == barber_id).first()
+    if not barber:
+        raise HTTPException(status_code=404, detail="Barbeiro não encontrado")
+    is_self = str(current_user.get("sub")) == str(barber.id)
+    is_manager = current_user.get("role") in ["OWNER", "GERENTE", "CEO"] and current_user.get("shop_id") == barber.barbershop_id
+    if current_user.get("role") != "SUPERADMIN" and not is_self and not is_manager:
+        raise HTTPException(status_code=403, detail="Sem permissão para este calendário")
+    return barber
+
+@app.post("/admin/barbers/{barber_id}/calendar-feed")
+def enable_calendar_feed(barber_id: int, request: Request, rotate: bool = False, db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
+    """Link do calendário do barbeiro (cria na primeira vez). Com ?rotate=true troca o segredo e o link antigo deixa de funcionar."""
+    barber = _calendar_barber(db, barber_id, current_user)
+    token = barber.calendar_token
+    if rotate or not token:
+        token = barber.calendar_token = calendars.new_token()
+        db.commit()
+    url = str(request.url_for("barber_calendar", token=token))
+    return {"calendar_token": token, "url": url, "webcal_url": "webcal://" + url.split("://", 1)[1]}
+
+@app.delete("/admin/barbers/{barber_id}/calendar-feed")
+def disable_calendar_feed(barber_id: int, db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
+    barber = _calendar_barber(db, barber_id, current_user)
+    barber.calendar_token = None
+    db.commit()
+    return {"message": "Link do calendário desligado"}
+
+@app.get("/calendar/{token}.ics", name="barber_calendar")
+def barber_calendar(token: str, request: Request, db: Session = Depends(get_read_db)):
+    """Público (o token é o segredo). Uma query por consulta; 304 se a app já tem esta versão."""
+    feed = calendars.check_feed(db, token)
+    if feed is None:
+        raise HTTPException(status_code=404, detail="Calendário não encontrado")
+    headers = calendars.feed_headers(feed)
+    if calendars.not_modified(feed, request.headers.get("if-none-match"), request.headers.get("if-modified-since")):
+        return Response(status_code=304, headers=headers)
+    return Response(calendars.render_feed(db, feed), media_type="text/calendar; charset=utf-8", headers=headers)
+
 # ==========================================
 # 2. ROTAS DO SUPERADMIN (TRANCADAS 🔒)
 # ==========================================
@@ -168,7 +350,51 @@ def login_pin(data: PinLogin, db: Session = Depends(get_db)):
 def list_all_barbershops(db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
     if current_user.get("role") != "SUPERADMIN":
         raise HTTPException(status_code=403, detail="Acesso negado!")
-    return db.query(Barbershop).all()
+    return [shop_public(shop) for shop in db.query(Barbershop).order_by(Barbershop.id).all()]
+
+@app.get("/superadmin/barbershops/overview")
+def barbershops_overview(
+    page: int = 1,
+    page_size: int = 50,
+    search: str | None = None,
+    sort: str = "name",
+    db: Session = Depends(get_read_db),
+    current_user: dict = Depends(get_current_user),
+):
+    """Lojas paginadas com equipe, agendamentos e faturamento dos últimos 30 dias e última atividade."""
+    if current_user.get("role") != "SUPERADMIN":
+        raise HTTPException(status_code=403, detail="Acesso negado!")
+    if page < 1 or not 1 <= page_size <= OVERVIEW_MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"Página inválida (page >= 1, page_size entre 1 e {OVERVIEW_MAX_PAGE_SIZE}).")
+    if sort not in OVERVIEW_SORTS:
+        raise HTTPException(status_code=400, detail=f"Ordenação inválida. Use: {', '.join(OVERVIEW_SORTS)}")
+    return tenant_overview(db, page, page_size, search, sort)
+
+@app.get("/superadmin/profiles")
+def list_profiles(current_user: dict = Depends(get_current_user)):
+    """Perfis de pedidos gravados (cabeçalho X-Profile), do mais recente para o mais antigo."""
+    if current_user.get("role") != "SUPERADMIN":
+        raise HTTPException(status_code=403, detail="Acesso negado!")
+    return profiling.recent()
+
+@app.get("/superadmin/profiles/{profile_id}")
+def get_profile(profile_id: str, current_user: dict = Depends(get_current_user)):
+    if current_user.get("role") != "SUPERADMIN":
+        raise HTTPException(status_code=403, detail="Acesso negado!")
+    perfil = profiling.load(profile_id)
+    if not perfil:
+        raise HTTPException(status_code=404, detail="Perfil não encontrado")
+    return perfil
+
+@app.get("/superadmin/profiles/{profile_id}/folded")
+def get_profile_folded(profile_id: str, current_user: dict = Depends(get_current_user)):
+    """Pilhas no formato "dobrado" (flamegraph.pl, speedscope, inferno)."""
+    if current_user.get("role") != "SUPERADMIN":
+        raise HTTPException(status_code=403, detail="Acesso negado!")
+    perfil = profiling.load(profile_id)
+    if not perfil:
+        raise HTTPException(status_code=404, detail="Perfil não encontrado")
+    return PlainTextResponse(perfil["folded"])
 
 @app.post("/superadmin/barbershops")
 async def create_barbershop(data: dict, db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
@@ -191,6 +417,7 @@ async def create_barbershop(data: dict, db: Session = Depends(get_db), current_u
 
         new_ceo = Barber(name=data.get("owner_name", "Gerente"), role="OWNER", pin=data.get("initial_pin", "1234"), barbershop_id=new_shop.id)
         db.add(new_ceo)
+        directory.refresh_shop(db, new_shop.id)
         db.commit()
         db.refresh(new_shop)
 
@@ -199,20 +426,22 @@ async def create_barbershop(data: dict, db: Session = Depends(get_db), current_u
             async with httpx.AsyncClient() as client:
                 try:
                     await client.post(webhook_url, json={"event": "new_barbershop", "shop_name": new_shop.name, "email": new_shop.owner_email})
-                except Exception: pass
-        return new_shop
+                except Exception:
+                    logger.warning("Erro ao avisar o N8N da nova barbearia", exc_info=True, extra={"shop_id": new_shop.id})
+        return shop_public(new_shop)
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.put("/superadmin/barbershops/{shop_id}")
-def update_shop_super(shop_id: int, data: dict, db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
+def update_shop_basic_super(shop_id: int, data: dict, db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
     if current_user.get("role") != "SUPERADMIN": raise HTTPException(status_code=403, detail="Acesso negado!")
     shop = db.query(Barbershop).filter(Barbershop.id == shop_id).first()
     if not shop: raise HTTPException(status_code=404, detail="Barbearia não encontrada")
 
     shop.name = data.get("name", shop.name)
     shop.slug = data.get("slug", shop.slug)
+    directory.refresh_shop(db, shop_id)
     db.commit()
     return {"message": "Dados atualizados com sucesso!"}
 
@@ -236,11 +465,13 @@ def update_shop_super(shop_id: int, data: dict, db: Session = Depends(get_db), c
     if nova_senha and len(str(nova_senha).strip()) > 0:
         shop.password_hash = hash_password(str(nova_senha))
         
+    directory.refresh_shop(db, shop_id)
     db.commit()
     return {"message": "Dados atualizados com sucesso!"}
 
-@app.delete("/super/barbershops/{shop_id}")
+@app.delete("/super/barbershops/{shop_id}", status_code=status.HTTP_202_ACCEPTED)
 def delete_shop_super(shop_id: int, db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
+    """Tranca a loja e agenda a remoção em segundo plano (ver deletions.py). Acompanhe pelo job_id."""
     if current_user.get("role") != "SUPERADMIN": 
         raise HTTPException(status_code=403, detail="Acesso negado!")
     
@@ -248,14 +479,26 @@ def delete_shop_super(shop_id: int, db: Session = Depends(get_db), current_user:
     if not shop: 
         raise HTTPException(status_code=404, detail="Barbearia não encontrada")
     
-    # Limpeza de segurança: remove dependências antes de apagar a loja
-    db.query(Barber).filter(Barber.barbershop_id == shop_id).delete()
-    db.query(Service).filter(Service.barbershop_id == shop_id).delete()
-    db.query(Appointment).filter(Appointment.barbershop_id == shop_id).delete()
-    
-    db.delete(shop)
+    job = request_deletion(db, shop, requested_by=current_user.get("sub"))
+    sessions.revoke_shop(db, shop_id, revoked_by=current_user.get("sub"))
     db.commit()
-    return {"message": "Barbearia removida permanentemente."}
+    directory.remove_shop(shop_id)
+    wake_deletions()
+    return {
+        "message": "Remoção da barbearia agendada.",
+        "job_id": job.id,
+        "status_url": f"/super/deletions/{job.id}",
+    }
+
+@app.get("/super/deletions/{job_id}")
+def get_deletion_super(job_id: str, db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
+    """Progresso de uma remoção de loja."""
+    if current_user.get("role") != "SUPERADMIN":
+        raise HTTPException(status_code=403, detail="Acesso negado!")
+    job = db.query(TenantDeletion).filter(TenantDeletion.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Remoção não encontrada")
+    return deletion_to_dict(job)
 
 @app.post("/super/barbers")
 def add_barber_super(data: dict, db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
@@ -276,6 +519,9 @@ def update_barber_super(barber_id: int, data: dict, db: Session = Depends(get_db
     barber = db.query(Barber).filter(Barber.id == barber_id).first()
     if not barber: raise HTTPException(status_code=404, detail="Não encontrado")
     
+    # PIN ou cargo novo: as sessões abertas (com o cargo antigo no token) deixam de valer
+    if data.get("pin", barber.pin) != barber.pin or data.get("role", barber.role) != barber.role:
+        sessions.revoke_barber(db, barber_id, revoked_by=current_user.get("sub"))
     barber.role = data.get("role", barber.role)
     barber.name = data.get("name", barber.name)
     barber.pin = data.get("pin", barber.pin)
@@ -288,6 +534,7 @@ def delete_barber_super(barber_id: int, db: Session = Depends(get_db), current_u
     barber = db.query(Barber).filter(Barber.id == barber_id).first()
     if barber:
         db.delete(barber)
+        sessions.revoke_barber(db, barber_id, revoked_by=current_user.get("sub"))
         db.commit()
     return {"message": "Deletado"}
 
@@ -337,6 +584,9 @@ def toggle_barber_status(barber_id: int, db: Session = Depends(get_db), current_
     
     # Inverte o status atual (Se está True, vira False e vice-versa)
     barber.is_active = not getattr(barber, 'is_active', True)
+    if not barber.is_active:
+        # Desativado: as sessões abertas caem já, não daqui a 7 dias
+        sessions.revoke_barber(db, barber_id, revoked_by=current_user.get("sub"))
     db.commit()
     
     return {"message": "Status atualizado", "is_active": barber.is_active}
@@ -363,6 +613,7 @@ def add_service(data: dict, db: Session = Depends(get_db), current_user: dict =
     if current_user.get("role") not in ["OWNER", "GERENTE"]: raise HTTPException(status_code=403, detail="Sem permissão")
     new_service = Service(name=data.get("name"), price=float(data.get("price")), duration=int(data.get("duration")), barbershop_id=data.get("barbershop_id"))
     db.add(new_service)
+    directory.refresh_shop(db, new_service.barbershop_id)
     db.commit()
     return new_service
 
@@ -379,9 +630,26 @@ def registrar_venda_balcao(data: dict, db: Session = Depends(get_db), current_us
     # Se for serviço, a venda pertence a quem a registou. Se for produto, vai para a loja (None).
     barber_id = user_id if tipo == "servico" else None
     
+    # Produto do estoque: baixa as unidades e liga a venda ao produto (relatório de estoque)
+    if tipo == "produto" and data.get("product_id"):
+        product = db.query(Product).filter(Product.id == int(data["product_id"]), Product.barbershop_id == shop_id).first()
+        if not product:
+            raise HTTPException(status_code=404, detail="Produto não encontrado")
+        quantidade = int(data.get("quantidade", 1))
+        if quantidade <= 0:
+            raise HTTPException(status_code=400, detail="Quantidade inválida")
+        valor = data.get("valor")
+        if not inventory.sell_product(db, product, quantidade, price=float(valor) if valor is not None else None, sold_by=user_id):
+            raise HTTPException(status_code=400, detail="Estoque esgotado")
+        restante = product.stock_quantity  # lido antes do commit (depois dele o objeto expira)
+        db.commit()
+        inventory.invalidate(shop_id)
+        return {"message": "Venda registrada com sucesso!", "new_qty": restante}
+
     # 4. Um toque visual para o seu Dashboard Financeiro ficar organizado
-    prefixo = "✂️ Corte Avulso:" if tipo == "servico" else "🛍️ Produto:"
+    prefixo = "✂️ Corte Avulso:" if tipo == "servico" else inventory.PRODUCT_SALE_PREFIX
     
+    agora = datetime.now()
     nova_venda = Appointment(
         barbershop_id=shop_id,
         barber_id=barber_id, # <--- Agora o ID entra aqui se for serviço!
@@ -389,7 +657,9 @@ def registrar_venda_balcao(data: dict, db: Session = Depends(get_db), current_us
         client_phone="000000000",
         service_id=None,
         service_price=float(data.get("valor", 0)),
-        date_time=datetime.now(),
+        date_time=agora,
+        duration=0, # Venda de balcão não ocupa a agenda
+        end_time=agora,
         status="concluido" 
     )
     
@@ -397,9 +667,9 @@ def registrar_venda_balcao(data: dict, db: Session = Depends(get_db), current_us
         db.add(nova_venda)
         db.commit()
         return {"message": "Venda registrada com sucesso!"}
-    except Exception as e:
+    except Exception:
         db.rollback()
-        print(f"Erro ao salvar venda: {e}")
+        logger.exception("Erro ao salvar venda")
         raise HTTPException(status_code=500, detail="Erro interno ao salvar no banco")
 
 # ==========================================
@@ -413,18 +683,30 @@ def list_products(barbershop_id: int, db: Session = Depends(get_db), current_use
 @app.post("/admin/{barbershop_id}/products")
 def add_product(barbershop_id: int, data: dict, db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
     if current_user.get("role") not in ["OWNER", "GERENTE"]: raise HTTPException(status_code=403, detail="Sem permissão")
-    new_item = Product(name=data.get("name"), price=data.get("price"), stock_quantity=data.get("stock_quantity", 0), barbershop_id=barbershop_id)
+    new_item = Product(name=data.get("name"), price=data.get("price"), cost_price=data.get("cost_price"),
+                       stock_quantity=data.get("stock_quantity", 0), barbershop_id=barbershop_id)
     db.add(new_item)
     db.commit()
+    inventory.invalidate(barbershop_id)
     return new_item
 
 @app.patch("/admin/products/{product_id}/sell")
-def quick_sell_product(product_id: int, db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
+def quick_sell_product(product_id: int, quantity: int = 1, db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
+    """Ajuste do estoque ("-1 no estoque" da página de inventário): só baixa as unidades.
+
+    Não regista venda nem entra no caixa; vendas passam por /admin/venda-balcao.
+    """
     product = db.query(Product).filter(Product.id == product_id).first()
-    if not product or product.stock_quantity <= 0: raise HTTPException(status_code=400, detail="Estoque esgotado")
-    product.stock_quantity -= 1
+    if not product: raise HTTPException(status_code=400, detail="Estoque esgotado")
+    if current_user.get("role") != "SUPERADMIN" and current_user.get("shop_id") != product.barbershop_id:
+        raise HTTPException(status_code=403, detail="Acesso negado a esta barbearia")
+    if quantity <= 0: raise HTTPException(status_code=400, detail="Quantidade inválida")
+    restante = inventory.take_stock(db, product, quantity)
+    if restante is None: raise HTTPException(status_code=400, detail="Estoque esgotado")
+    shop_id = product.barbershop_id  # lido antes do commit
     db.commit()
-    return {"message": "Venda realizada", "new_qty": product.stock_quantity}
+    inventory.invalidate(shop_id)
+    return {"message": "Venda realizada", "new_qty": restante}
 
 @app.delete("/admin/products/{product_id}")
 def delete_product(product_id: int, db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
@@ -438,6 +720,7 @@ def delete_product(product_id: int, db: Session = Depends(get_db), current_user:
     
     db.delete(item)
     db.commit()
+    inventory.invalidate(item.barbershop_id)
     return {"message": "Produto removido com sucesso!"}
 
 # ==========================================
@@ -460,15 +743,45 @@ def restock_product(product_id: int, data: dict, db: Session = Depends(get_db),
         
     # Soma a nova quantidade ao estoque atual
     item.stock_quantity += quantidade
+    # Custo da nova compra (opcional): é o que entra na margem do relatório de estoque
+    if data.get("cost_price") is not None:
+        item.cost_price = float(data["cost_price"])
     db.commit()
+    inventory.invalidate(item.barbershop_id)
     
     return {"message": "Estoque atualizado com sucesso!", "new_quantity": item.stock_quantity}
 
+@app.get("/admin/{barbershop_id}/inventory")
+def get_inventory_report(
+    barbershop_id: int,
+    days: int = inventory.INVENTORY_WINDOW_DAYS,
+    lead_days: int = inventory.INVENTORY_LEAD_DAYS,
+    cover_days: int = inventory.INVENTORY_COVER_DAYS,
+    # No primário: um relatório lido da réplica atrasada ficaria em cache com a versão nova
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user),
+):
+    """Velocidade de venda, dias até esgotar, margem e reposição sugerida de todos os produtos."""
+    if current_user.get("role") not in ["OWNER", "GERENTE", "CEO", "SUPERADMIN"]:
+        raise HTTPException(status_code=403, detail="Sem permissão")
+    if current_user.get("role") != "SUPERADMIN" and current_user.get("shop_id") != barbershop_id:
+        raise HTTPException(status_code=403, detail="Acesso negado a esta barbearia")
+    if not 1 <= days <= inventory.INVENTORY_MAX_WINDOW_DAYS or lead_days < 0 or cover_days < 0:
+        raise HTTPException(status_code=400, detail=f"Use days entre 1 e {inventory.INVENTORY_MAX_WINDOW_DAYS} e prazos não negativos")
+    return inventory.inventory_report(db, barbershop_id, days, lead_days, cover_days)
+
 # ==========================================
 # 5. ROTAS DE AGENDAMENTOS E CLIENTES
 # ==========================================
+@app.get("/api/public/barbershops")
+def search_public_barbershops(q: str, page: int = 1, page_size: int = 20, db: Session = Depends(get_read_db)):
+    """Rota PÚBLICA do diretório: busca lojas por nome, endereço ou serviço (início das palavras)."""
+    if page < 1 or not 1 <= page_size <= directory.DIRECTORY_MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"Página inválida (page >= 1, page_size entre 1 e {directory.DIRECTORY_MAX_PAGE_SIZE}).")
+    return directory.search_shops(db, q, page, page_size)
+
 @app.get("/api/public/barbershops/{slug}")
-def get_public_barbershop(slug: str, db: Session = Depends(get_db)):
+def get_public_barbershop(slug: str, db: Session = Depends(get_read_db)):
     """Rota PÚBLICA para a página do cliente carregar a loja, portfólio, equipe e serviços"""
     shop = db.query(Barbershop).filter(Barbershop.slug == slug).first()
     if not shop:
@@ -497,6 +810,7 @@ async def create_appointment(data: dict, db: Session = Depends(get_db)):
         appo_date = datetime.fromisoformat(data.get("date_time"))
         service_id = data.get("service_id")
         shop_id = data.get("barbershop_id")
+        logs.bind(shop_id=shop_id)
         
         # Busca o serviço e a barbearia para ter dados reais no banco e no Whats
         service = db.query(Service).filter(Service.id == service_id).first()
@@ -504,8 +818,15 @@ async def create_appointment(data: dict, db: Session = Depends(get_db)):
         
         price = service.price if service else 0.0
         shop_name = shop.name if shop else "Barbearia"
+        duracao = availability.service_duration(service)
+        fim = appo_date + timedelta(minutes=duracao)
+
+        # O horário ainda está livre? (um único range no índice do barbeiro)
+        if data.get("barber_id") and availability.find_overlap(db, data.get("barber_id"), appo_date, fim):
+            raise HTTPException(status_code=409, detail="Horário indisponível para este barbeiro")
 
-        # 2. Salva no Banco de Dados
+        # 2. Salva no Banco de Dados (e liga ao cadastro do cliente pelo telefone)
+        client_id = upsert_client(db, shop_id, data.get("client_name"), data.get("client_phone"), appo_date)
         new_appo = Appointment(
             client_name=data.get("client_name"), 
             client_phone=data.get("client_phone"), 
@@ -513,11 +834,18 @@ async def create_appointment(data: dict, db: Session = Depends(get_db)):
             barbershop_id=shop_id,
             barber_id=data.get("barber_id"),
             service_id=service_id,
-            service_price=price 
+            service_price=price,
+            duration=duracao,
+            end_time=fim,
+            client_id=client_id
         )
         db.add(new_appo)
         db.commit()
 
+        # Atualiza o mapa de ocupação em cache deste barbeiro/dia
+        if shop_id and new_appo.barber_id:
+            availability.mark_busy(int(shop_id), int(new_appo.barber_id), appo_date, duracao)
+
         # 3. Disparo para o N8N (Bloco corrigido)
         try:
             n8n_webhook_url = os.getenv("N8N_WHATSAPP_WEBHOOK")
@@ -536,43 +864,22 @@ async def create_appointment(data: dict, db: Session = Depends(get_db)):
                     # Usamos .post mas sem esperar a resposta travar o fluxo
                     await client.post(n8n_webhook_url, json=payload_n8n)
                     
-        except Exception as e:
+        except Exception:
             # Se o N8N falhar, apenas logamos o erro. O agendamento já foi salvo!
-            print(f"Erro ao avisar o N8N: {e}")
+            logger.warning("Erro ao avisar o N8N", exc_info=True, extra={"appointment_id": new_appo.id})
 
         return {"message": "Agendado com sucesso!", "id": new_appo.id}
 
-    except Exception as e:
+    except HTTPException:
+        db.rollback()
+        raise
+    except Exception:
         db.rollback()
-        print(f"Erro geral no agendamento: {e}")
+        logger.exception("Erro geral no agendamento")
         raise HTTPException(status_code=400, detail="Erro ao processar agendamento")
 
-@app.post("/admin/venda-balcao")
-def registrar_venda_balcao(data: dict, db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
-    """Venda avulsa direto do dashboard do barbeiro"""
-    item = data.get("item")
-    valor = data.get("valor")
-    
-    barber_id = current_user.get("sub")
-    barber = db.query(Barber).filter(Barber.id == barber_id).first()
-    if not barber: raise HTTPException(status_code=404, detail="Barbeiro não encontrado")
-        
-    nova_venda = Appointment(
-        client_name=f"Balcão: {item}", 
-        client_phone="00000000000",
-        date_time=datetime.datetime.now(),
-        barber_id=barber.id,
-        barbershop_id=barber.barbershop_id,
-        service_price=float(valor),
-        status="concluido" # A venda de balcão já entra como concluída/paga!
-    )
-    
-    db.add(nova_venda)
-    db.commit()
-    return {"message": "Venda registada!"}
-
 @app.get("/admin/{barbershop_id}/appointments")
-def get_agenda(barbershop_id: int, db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
+def get_agenda(barbershop_id: int, db: Session = Depends(get_read_db), current_user: dict = Depends(get_current_user)):
     user_id = int(current_user.get("sub"))
     user_role = current_user.get("role")
 
@@ -588,6 +895,44 @@ def get_agenda(barbershop_id: int, db: Session = Depends(get_db), current_user:
 
     return query.order_by(Appointment.date_time.asc()).all()
 
+@app.get("/admin/{barbershop_id}/sync")
+def sync_shop(barbershop_id: int, since: int | None = None, db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
+    """Agenda, produtos, serviços e equipa alterados desde `since` (o `version` da resposta anterior); sem `since`, tudo."""
+    if current_user.get("role") != "SUPERADMIN" and current_user.get("shop_id") != barbershop_id:
+        raise HTTPException(status_code=403, detail="Não autorizado")
+    # Banco principal, não a réplica: um atraso da réplica maior que a sobreposição perderia alterações
+    role = current_user.get("role")
+    return JSONResponse(sync.changes(
+        db, barbershop_id, since,
+        barber_id=int(current_user.get("sub")) if role == "BARBER" else None,
+        include_pins=role in ["OWNER", "GERENTE", "CEO", "SUPERADMIN"],
+    ))
+
+@app.get("/admin/{barbershop_id}/clients")
+def find_clients(barbershop_id: int, q: str, limit: int = 20, db: Session = Depends(get_read_db), current_user: dict = Depends(get_current_user)):
+    """Busca clientes da loja por telefone (início do número) ou por nome (início de qualquer palavra)."""
+    if current_user.get("role") != "SUPERADMIN" and current_user.get("shop_id") != barbershop_id:
+        raise HTTPException(status_code=403, detail="Não autorizado")
+    if len(q.strip()) < 2:
+        raise HTTPException(status_code=400, detail="Digite pelo menos 2 caracteres para buscar")
+    return search_clients(db, barbershop_id, q, limit)
+
+@app.get("/admin/{barbershop_id}/clients/{client_id}/history")
+def get_client_history(
+    barbershop_id: int,
+    client_id: int,
+    page: int = 1,
+    page_size: int = 20,
+    db: Session = Depends(get_read_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Histórico de agendamentos de um cliente, paginado, do mais recente para o mais antigo."""
+    if current_user.get("role") != "SUPERADMIN" and current_user.get("shop_id") != barbershop_id:
+        raise HTTPException(status_code=403, detail="Não autorizado")
+    if page < 1 or not 1 <= page_size <= 100:
+        raise HTTPException(status_code=400, detail="Página inválida (page >= 1, page_size entre 1 e 100).")
+    return client_history(db, barbershop_id, client_id, page, page_size)
+
 @app.patch("/admin/appointments/{appointment_id}/status")
 def update_appointment_status(appointment_id: int, data: dict, db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
     appo = db.query(Appointment).filter(Appointment.id == appointment_id).first()
@@ -595,20 +940,54 @@ def update_appointment_status(appointment_id: int, data: dict, db: Session = Dep
     
     new_status = data.get("status")
     if new_status in ["concluido", "cancelado"]:
+        # Venda de produto cancelada: as unidades voltam ao estoque (e saem de novo se for reativada)
+        delta = inventory.sale_stock_delta(appo.product_id, appo.quantity, appo.status, new_status)
+        inventory.apply_stock_deltas(db, appo.barbershop_id, {appo.product_id: delta})
         appo.status = new_status
         db.commit()
+        if new_status == "cancelado" and appo.barber_id and appo.date_time:
+            availability.invalidate(appo.barbershop_id, appo.barber_id, appo.date_time.date())
+        if appo.date_time and appo.date_time.date() < datetime.today().date():
+            analytics.invalidate(appo.barbershop_id)
+        if appo.product_id is not None:
+            inventory.invalidate(appo.barbershop_id)
         return {"message": f"Agendamento {new_status}"}
     raise HTTPException(status_code=400, detail="Status inválido")
 
+@app.post("/admin/{barbershop_id}/appointments/bulk")
+def bulk_appointments(barbershop_id: int, data: dict, db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
+    """Conclui, cancela e remarca vários agendamentos numa transação; devolve o resultado de cada ID (ver agenda.py)."""
+    if current_user.get("role") != "SUPERADMIN" and current_user.get("shop_id") != barbershop_id:
+        raise HTTPException(status_code=403, detail="Acesso negado a esta barbearia")
+    # Barbeiro só mexe na própria agenda; a gestão, na da loja toda
+    barber_id = int(current_user.get("sub")) if current_user.get("role") == "BARBER" else None
+    try:
+        resultado = agenda.bulk_update(db, barbershop_id, data, barber_id=barber_id)
+    except agenda.BulkError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    db.commit()
+
+    hoje = datetime.today().date()
+    alterados = resultado.pop("changed")
+    for _, barber, antes, depois, _ in alterados:
+        if barber is not None:
+            for quando in [d for d in (antes, depois) if d is not None]:
+                availability.invalidate(barbershop_id, barber, quando.date())
+    if any(antes is not None and antes.date() < hoje for _, _, antes, _, _ in alterados):
+        analytics.invalidate(barbershop_id)
+    if any(product_id is not None for *_, product_id in alterados):
+        inventory.invalidate(barbershop_id)
+    return resultado
+
 @app.get("/barbershops/{slug}/available-times")
-def get_available_times(slug: str, barber_id: int, service_id: int, date: str, db: Session = Depends(get_db)):
+def get_available_times(slug: str, barber_id: int, service_id: int, date: str, db: Session = Depends(get_read_db)):
     shop = db.query(Barbershop).filter(Barbershop.slug == slug).first()
     if not shop:
         raise HTTPException(status_code=404, detail="Barbearia não encontrada")
 
     # 1. Pega a duração real do serviço
     service = db.query(Service).filter(Service.id == service_id).first()
-    duracao_servico = service.duration if service else 30
+    duracao_servico = availability.service_duration(service)
 
     abertura = datetime.strptime(f"{date} {shop.open_time or '09:00'}", "%Y-%m-%d %H:%M")
     fechamento = datetime.strptime(f"{date} {shop.close_time or '19:00'}", "%Y-%m-%d %H:%M")
@@ -616,21 +995,20 @@ def get_available_times(slug: str, barber_id: int, service_id: int, date: str, d
     almoco_fim = datetime.strptime(f"{date} {shop.interval_end or '13:00'}", "%Y-%m-%d %H:%M")
 
     # Busca os agendamentos e ORDENA por hora (Crucial para a lógica inteligente)
-    agendamentos = db.query(Appointment).filter(
+    # Intervalo do dia em date_time (usa o índice e, no Postgres, só a partição do mês)
+    inicio_dia = abertura.replace(hour=0, minute=0)
+    # O fim de cada agendamento está gravado na própria linha (nada de JOIN com services)
+    agendamentos = db.query(Appointment.date_time, Appointment.end_time).filter(
         Appointment.barbershop_id == shop.id,
         Appointment.barber_id == barber_id,
-        extract('year', Appointment.date_time) == abertura.year,
-        extract('month', Appointment.date_time) == abertura.month,
-        extract('day', Appointment.date_time) == abertura.day,
+        Appointment.date_time >= inicio_dia,
+        Appointment.date_time < inicio_dia + timedelta(days=1),
+        Appointment.status != "cancelado",
     ).order_by(Appointment.date_time).all()
 
     horarios_ocupados = []
-    for app in agendamentos:
-        app_service = db.query(Service).filter(Service.id == app.service_id).first()
-        app_dur = app_service.duration if app_service else 30
-        inicio_ocup = app.date_time
-        fim_ocup = inicio_ocup + timedelta(minutes=app_dur)
-        horarios_ocupados.append((inicio_ocup, fim_ocup))
+    for inicio_ocup, fim_ocup in agendamentos:
+        horarios_ocupados.append((inicio_ocup, fim_ocup or inicio_ocup + timedelta(minutes=availability.DEFAULT_DURATION)))
 
     horarios_disponiveis = []
     atual = abertura
@@ -672,33 +1050,57 @@ def get_available_times(slug: str, barber_id: int, service_id: int, date: str, d
 
     return horarios_disponiveis
 
+@app.get("/barbershops/{slug}/next-available")
+def get_next_available(slug: str, service_id: int, days: int = 7, limit: int = 5, step: int = 15, db: Session = Depends(get_read_db)):
+    """Primeiros horários livres para o serviço com QUALQUER barbeiro ativo, nos próximos `days` dias."""
+    shop = db.query(Barbershop).filter(Barbershop.slug == slug).first()
+    if not shop:
+        raise HTTPException(status_code=404, detail="Barbearia não encontrada")
+
+    service = db.query(Service).filter(Service.id == service_id, Service.barbershop_id == shop.id).first()
+    if not service:
+        raise HTTPException(status_code=404, detail="Serviço não encontrado")
+    duracao_servico = availability.service_duration(service)
+
+    days = min(max(days, 1), 60)
+    limit = min(max(limit, 1), 50)
+    if step % availability.SLOT_MINUTES != 0:
+        raise HTTPException(status_code=400, detail=f"O passo deve ser múltiplo de {availability.SLOT_MINUTES} minutos")
+    return availability.earliest_slots(db, shop, duracao_servico, days, limit, step)
+
 # ==========================================
 # 6. ROTAS FINANCEIRAS E DASHBOARD (TRANCADAS 🔒)
 # ==========================================
 
 @app.get("/admin/{barbershop_id}/financeiro")
-def get_financial_dashboard(barbershop_id: int, db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
+def get_financial_dashboard(barbershop_id: int, mes: str | None = None, db: Session = Depends(get_read_db), current_user: dict = Depends(get_current_user)):
+    """Faturamento do mês atual, ou de um mês passado com ?mes=AAAA-MM (inclui o histórico arquivado)."""
     user_id = int(current_user.get("sub"))
     user_role = current_user.get("role")
     hoje = datetime.today().date()
 
-    # 1. Busca todos os agendamentos concluídos DESTE MÊS nesta barbearia
-    query = db.query(Appointment).filter(
-        Appointment.barbershop_id == barbershop_id, 
-        Appointment.status == "concluido",
-        extract('year', Appointment.date_time) == hoje.year,
-        extract('month', Appointment.date_time) == hoje.month
-    )
+    try:
+        inicio = datetime.strptime(mes, "%Y-%m") if mes else month_start(datetime.now())
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Mês inválido (use AAAA-MM)")
+    fim = next_month(inicio)
+
+    # 1. Busca todos os agendamentos concluídos DO MÊS nesta barbearia
+    filtros = [
+        lambda t: t.c.barbershop_id == barbershop_id,
+        lambda t: t.c.status == "concluido",
+    ]
 
     # 2. Se for BARBEIRO, filtra SÓ as vendas e cortes dele
     if user_role == "BARBER":
-        query = query.filter(Appointment.barber_id == user_id)
+        filtros.append(lambda t: t.c.barber_id == user_id)
 
-    concluidos = query.all()
+    concluidos = db.execute(appointments_between(["barber_id", "service_price"], inicio, fim, *filtros)).all()
 
     # 3. Calcula os ganhos usando os PREÇOS REAIS do banco
-    faturamento_total = sum(c.service_price for c in concluidos)
-    dias_passados = hoje.day
+    faturamento_total = sum(c.service_price or 0.0 for c in concluidos)
+    # Mês atual: dias até hoje. Mês passado: todos os dias do mês.
+    dias_passados = hoje.day if inicio.date() <= hoje < fim.date() else (fim - inicio).days
     media_diaria = faturamento_total / dias_passados if dias_passados > 0 else 0
 
     # 4. Se for Gestor/CEO, constrói a lista detalhada
@@ -708,13 +1110,13 @@ def get_financial_dashboard(barbershop_id: int, db: Session = Depends(get_db), c
         
         # --- CÁLCULO PARA CADA BARBEIRO ---
         for b in barbeiros:
-            total_barbeiro = sum(c.service_price for c in concluidos if c.barber_id == b.id)
+            total_barbeiro = sum(c.service_price or 0.0 for c in concluidos if c.barber_id == b.id)
             if total_barbeiro > 0:
                 barbeiros_stats.append({"name": b.name, "total": total_barbeiro})
         
         # --- CÁLCULO EXCLUSIVO PARA VENDAS DE BALCÃO (LOJA) ---
         # Somamos tudo o que está concluído mas NÃO tem barbeiro associado
-        total_balcao = sum(c.service_price for c in concluidos if c.barber_id is None)
+        total_balcao = sum(c.service_price or 0.0 for c in concluidos if c.barber_id is None)
         
         if total_balcao > 0:
             barbeiros_stats.append({"name": "🛍️ Vendas de Balcão", "total": total_balcao})
@@ -729,13 +1131,202 @@ def get_financial_dashboard(barbershop_id: int, db: Session = Depends(get_db), c
         "barbeiros": barbeiros_stats
     }
 
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from sqlalchemy import extract
-from datetime import datetime
-import os
-from fastapi import Depends, HTTPException
+# ==========================================
+# COMISSÕES E FOLHA DE PAGAMENTO
+# ==========================================
+
+PAYROLL_MANAGERS = ["OWNER", "GERENTE", "CEO", "SUPERADMIN"]
+
+def _check_payroll_access(current_user: dict, barbershop_id: int, roles: list[str] = PAYROLL_MANAGERS):
+    if current_user.get("role") not in roles:
+        raise HTTPException(status_code=403, detail="Apenas gerentes podem gerir comissões")
+    if current_user.get("role") != "SUPERADMIN" and current_user.get("shop_id") != barbershop_id:
+        raise HTTPException(status_code=403, detail="Acesso negado a esta barbearia")
+
+def _payroll_dates(start: str, end: str):
+    try:
+        inicio = datetime.strptime(start, "%Y-%m-%d").date()
+        fim = datetime.strptime(end, "%Y-%m-%d").date()
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Datas inválidas (use AAAA-MM-DD)")
+    if fim < inicio or (fim - inicio).days >= payroll.PAYROLL_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"Período inválido (máximo de {payroll.PAYROLL_MAX_DAYS} dias)")
+    return inicio, fim
+
+@app.get("/admin/{barbershop_id}/commission-rules")
+def list_commission_rules(barbershop_id: int, db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
+    _check_payroll_access(current_user, barbershop_id)
+    return [payroll.rule_to_dict(r) for r in payroll.list_rules(db, barbershop_id)]
+
+@app.put("/admin/{barbershop_id}/commission-rules")
+def save_commission_rule(barbershop_id: int, data: dict, db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
+    """Cria ou substitui uma regra: {kind, barber_id?, service_id?, product_id?, percent?, fixed_amount?}."""
+    _check_payroll_access(current_user, barbershop_id)
+    try:
+        regra = payroll.save_rule(db, barbershop_id, data)
+    except payroll.RuleError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    db.commit()
+    return payroll.rule_to_dict(regra)
+
+@app.delete("/admin/{barbershop_id}/commission-rules/{rule_id}")
+def delete_commission_rule(barbershop_id: int, rule_id: int, db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
+    _check_payroll_access(current_user, barbershop_id)
+    apagadas = db.query(CommissionRule).filter(
+        CommissionRule.id == rule_id, CommissionRule.barbershop_id == barbershop_id
+    ).delete(synchronize_session=False)
+    if not apagadas:
+        raise HTTPException(status_code=404, detail="Regra não encontrada")
+    db.commit()
+    return {"message": "Regra removida"}
+
+@app.get("/admin/{barbershop_id}/payroll")
+def get_payroll(barbershop_id: int, start: str, end: str, db: Session = Depends(get_read_db), current_user: dict = Depends(get_current_user)):
+    """Comissões de cada barbeiro no período (foto, se o período já foi fechado). O barbeiro só vê a sua linha."""
+    _check_payroll_access(current_user, barbershop_id, PAYROLL_MANAGERS + ["BARBER"])
+    inicio, fim = _payroll_dates(start, end)
+    folha = payroll.get_payroll(db, barbershop_id, inicio, fim)
+    if current_user.get("role") == "BARBER":
+        folha["barbers"] = [l for l in folha["barbers"] if str(l["barber_id"]) == str(current_user.get("sub"))]
+        folha.pop("rules", None)
+    return folha
+
+@app.post("/admin/{barbershop_id}/payroll/close")
+def close_payroll(barbershop_id: int, data: dict, db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
+    """Fecha a folha de um período já terminado: {start, end}. Depois disso ela é sempre lida da foto."""
+    _check_payroll_access(current_user, barbershop_id)
+    inicio, fim = _payroll_dates(data.get("start"), data.get("end"))
+    if fim >= datetime.today().date():
+        raise HTTPException(status_code=400, detail="O período ainda não terminou")
+    if payroll.overlapping_period(db, barbershop_id, inicio, fim):
+        raise HTTPException(status_code=409, detail="Já existe uma folha fechada nesse período")
+    periodo = payroll.close_period(db, barbershop_id, inicio, fim, closed_by=current_user.get("sub"))
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Já existe uma folha fechada nesse período")
+    return payroll.period_to_dict(periodo)
+
+@app.get("/admin/{barbershop_id}/payroll/periods")
+def list_payroll_periods(barbershop_id: int, db: Session = Depends(get_read_db), current_user: dict = Depends(get_current_user)):
+    _check_payroll_access(current_user, barbershop_id)
+    return payroll.list_periods(db, barbershop_id)
+
+@app.get("/admin/{barbershop_id}/analytics/revenue")
+def get_revenue_analytics(
+    barbershop_id: int,
+    start: str,
+    end: str,
+    bucket: str = "day",
+    group_by: str = "none",
+    # No primário: um balde lido da réplica atrasada ficaria em cache com a versão nova
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Faturamento por dia/semana/mês, agrupado por barbeiro, serviço ou tipo de venda (formato colunar)."""
+    if current_user.get("role") not in ["OWNER", "GERENTE", "CEO", "SUPERADMIN"]:
+        raise HTTPException(status_code=403, detail="Apenas gerentes podem ver as análises")
+    if current_user.get("role") != "SUPERADMIN" and current_user.get("shop_id") != barbershop_id:
+        raise HTTPException(status_code=403, detail="Não autorizado")
+    if bucket not in analytics.BUCKETS:
+        raise HTTPException(status_code=400, detail=f"Balde inválido (use {', '.join(analytics.BUCKETS)})")
+    if group_by not in analytics.GROUPS:
+        raise HTTPException(status_code=400, detail=f"Agrupamento inválido (use {', '.join(analytics.GROUPS)})")
+
+    try:
+        inicio = datetime.strptime(start, "%Y-%m-%d").date()
+        fim = datetime.strptime(end, "%Y-%m-%d").date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Datas inválidas (use AAAA-MM-DD)")
+    if fim < inicio or (fim - inicio).days > 3 * 366:
+        raise HTTPException(status_code=400, detail="Período inválido (máximo de 3 anos)")
+
+    return analytics.revenue_series(db, barbershop_id, inicio, fim, bucket, group_by)
+
+@app.get("/admin/{barbershop_id}/export")
+def export_transactions(
+    barbershop_id: int,
+    start: str,
+    end: str,
+    format: str = "csv",
+    gzip: bool = False,
+    after_id: int = 0,
+    current_user: dict = Depends(get_current_user)
+):
+    """Exporta o histórico completo (serviços, vendas de balcão e produtos) em CSV ou NDJSON.
+
+    Para retomar uma exportação interrompida, envie em `after_id` o ID da última linha recebida.
+    """
+    if current_user.get("role") not in ["OWNER", "GERENTE", "CEO", "SUPERADMIN"]:
+        raise HTTPException(status_code=403, detail="Apenas gerentes podem exportar o histórico")
+    if current_user.get("role") != "SUPERADMIN" and current_user.get("shop_id") != barbershop_id:
+        raise HTTPException(status_code=403, detail="Não autorizado")
+    if format not in ["csv", "ndjson"]:
+        raise HTTPException(status_code=400, detail="Formato inválido (use csv ou ndjson)")
+
+    try:
+        inicio = datetime.strptime(start, "%Y-%m-%d")
+        # A data final é inclusiva: vai até à meia-noite do dia seguinte
+        fim = datetime.strptime(end, "%Y-%m-%d") + timedelta(days=1)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Datas inválidas (use AAAA-MM-DD)")
+
+    rows = iter_export_rows(barbershop_id, inicio, fim, after_id)
+    if format == "csv":
+        body = stream_csv(rows)
+        media_type = "text/csv; charset=utf-8"
+    else:
+        body = stream_ndjson(rows)
+        media_type = "application/x-ndjson"
+
+    filename = f"historico_{barbershop_id}_{start}_{end}.{format}"
+    if gzip:
+        body = gzip_stream(body)
+        media_type = "application/gzip"
+        filename += ".gz"
+
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
+@app.post("/admin/{barbershop_id}/import/{kind}")
+def bulk_import(
+    barbershop_id: int,
+    kind: str,
+    file: UploadFile = File(...),
+    format: str | None = None,
+    dry_run: bool = False,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Importação em massa (services, products, team ou appointments) de um CSV/NDJSON, opcionalmente gzip.
+
+    As linhas inválidas voltam no relatório e não impedem as outras. Com `dry_run=true` só valida.
+    """
+    if current_user.get("role") not in ["OWNER", "GERENTE", "CEO", "SUPERADMIN"]:
+        raise HTTPException(status_code=403, detail="Apenas gerentes podem importar dados")
+    if current_user.get("role") != "SUPERADMIN" and current_user.get("shop_id") != barbershop_id:
+        raise HTTPException(status_code=403, detail="Não autorizado")
+    if kind not in IMPORT_KINDS:
+        raise HTTPException(status_code=400, detail=f"Tipo inválido. Use: {', '.join(IMPORT_KINDS)}")
+    formato = format or detect_format(file.filename)
+    if formato not in IMPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="Formato inválido (use csv ou ndjson)")
+    if not db.get(Barbershop, barbershop_id):
+        raise HTTPException(status_code=404, detail="Barbearia não encontrada")
+
+    try:
+        relatorio = run_import(db, barbershop_id, kind, iter_rows(file.file, formato), dry_run)
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="O arquivo deve estar em UTF-8")
+    except csv.Error as e:
+        raise HTTPException(status_code=400, detail=f"CSV inválido: {e}")
+    logger.info("Importação concluída", extra={k: v for k, v in relatorio.items() if k != "error_details"})
+    return relatorio
 
 @app.post("/admin/{barbershop_id}/close-register")
 async def close_register(barbershop_id: int, data: dict, db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
@@ -746,124 +1337,164 @@ async def close_register(barbershop_id: int, data: dict, db: Session = Depends(g
     role = current_user.get("role")
     user_id = current_user.get("sub")
 
-    # 1. Credenciais de E-mail (do ficheiro .env)
-    remetente = os.getenv("EMAIL_SENDER")
-    senha = os.getenv("EMAIL_PASSWORD")
+    if role != "SUPERADMIN" and current_user.get("shop_id") != barbershop_id:
+        raise HTTPException(status_code=403, detail="Não autorizado")
 
-    if not remetente or not senha:
+    # 1. Credenciais de E-mail (do ficheiro .env)
+    if not email_configured():
         raise HTTPException(status_code=500, detail="E-mail do sistema não configurado no servidor.")
     if not target_email:
         raise HTTPException(status_code=400, detail="E-mail de destino não fornecido.")
 
     # 2. Lógica Financeira Inteligente (Diário ou Mensal)
     hoje = datetime.now()
-    
-    # Filtro base: barbearia e status concluído
-    base_query = db.query(Appointment).filter(
-        Appointment.barbershop_id == barbershop_id,
-        Appointment.status == "concluido",
-        extract('year', Appointment.date_time) == hoje.year,
-        extract('month', Appointment.date_time) == hoje.month
-    )
 
-    # Se for diário, adicionamos o filtro do dia. Se for mensal, o filtro acima (ano/mês) já resolve.
     if tipo_fechamento == "diario":
-        appointments_query = base_query.filter(extract('day', Appointment.date_time) == hoje.day)
+        # Reaproveita a foto do dia (do agendador ou de um fechamento anterior) se nada mudou
+        fechamento = close_to_dict(get_or_create_close(db, barbershop_id, hoje.date(), source="manual"))
         periodo_texto = f"do Dia {hoje.strftime('%d/%m/%Y')}"
+        if role == "BARBER":
+            meu = next((b for b in fechamento["per_barber"] if str(b["barber_id"]) == str(user_id)), None)
+            total_faturado = meu["revenue"] if meu else 0.0
+            qtd_cortes = meu["count"] if meu else 0
+            tipo_relatorio = f"Ganhos Pessoais - {periodo_texto}"
+        else:
+            total_faturado = fechamento["total_revenue"]
+            qtd_cortes = fechamento["count"]
+            tipo_relatorio = f"Fechamento da Loja - {periodo_texto}"
     else:
-        appointments_query = base_query
+        inicio = month_start(hoje)
+        appointments_query = db.query(Appointment.barber_id, Appointment.service_price).filter(
+            Appointment.barbershop_id == barbershop_id,
+            Appointment.status == "concluido",
+            Appointment.date_time >= inicio,
+            Appointment.date_time < next_month(inicio),
+        )
         periodo_texto = f"do Mês de {hoje.strftime('%m/%Y')}"
-    
-    # Se for barbeiro, pega só os cortes dele. Se for Gestão, pega todos.
-    if role == "BARBER":
-        appointments = [a for a in appointments_query.all() if str(a.barber_id) == str(user_id)]
-        tipo_relatorio = f"Ganhos Pessoais - {periodo_texto}"
-    else:
-        appointments = appointments_query.all()
-        tipo_relatorio = f"Fechamento da Loja - {periodo_texto}"
 
-    total_faturado = sum(a.service_price or 0.0 for a in appointments)
-    qtd_cortes = len(appointments)
+        # Se for barbeiro, pega só os cortes dele. Se for Gestão, pega todos.
+        if role == "BARBER":
+            appointments = appointments_query.filter(Appointment.barber_id == int(user_id)).all()
+            tipo_relatorio = f"Ganhos Pessoais - {periodo_texto}"
+        else:
+            appointments = appointments_query.all()
+            tipo_relatorio = f"Fechamento da Loja - {periodo_texto}"
 
-    # 3. Montar o E-mail em HTML
-    assunto = tipo_relatorio
-    
-    html = f"""
-    <html>
-        <body style="font-family: Arial, sans-serif; color: #333; line-height: 1.6;">
-            <div style="max-width: 600px; margin: 0 auto; border: 1px solid #e4e4e7; border-radius: 16px; overflow: hidden;">
-                <div style="background-color: #18181b; padding: 24px; text-align: center;">
-                    <h2 style="color: #f59e0b; margin: 0; text-transform: uppercase;">Relatório Financeiro</h2>
-                    <p style="color: #a1a1aa; margin: 5px 0 0 0;">{tipo_relatorio}</p>
-                </div>
-                <div style="padding: 32px; background-color: #fafafa;">
-                    <div style="background-color: #ffffff; padding: 20px; border-radius: 12px; border: 1px solid #e4e4e7; text-align: center; margin-bottom: 24px;">
-                        <p style="font-size: 14px; color: #71717a; text-transform: uppercase; font-weight: bold; margin: 0;">Faturamento {tipo_fechamento}</p>
-                        <h1 style="color: #10b981; font-size: 36px; margin: 8px 0;">R$ {total_faturado:.2f}</h1>
-                        <p style="margin: 0; color: #52525b; font-size: 14px;">Total de Serviços Concluídos: <strong>{qtd_cortes}</strong></p>
-                    </div>
-                    
-                    <h4 style="color: #3f3f46; margin-bottom: 8px;">Observações da Equipa:</h4>
-                    <div style="background-color: #f4f4f5; padding: 12px; border-radius: 8px; margin-bottom: 16px;">
-                        <p style="margin: 0; font-size: 14px;">{observations}</p>
-                    </div>
-                </div>
-            </div>
-        </body>
-    </html>
-    """
+        total_faturado = sum(a.service_price or 0.0 for a in appointments)
+        qtd_cortes = len(appointments)
 
-    msg = MIMEMultipart()
-    msg["From"] = remetente
-    msg["To"] = target_email
-    msg["Subject"] = assunto
-    msg.attach(MIMEText(html, "html"))
+    # 3. Montar o E-mail em HTML
+    html = render_close_email(tipo_relatorio, tipo_fechamento, total_faturado, qtd_cortes, observations)
 
-    # 4. Envio direto pelo Python
+    # 4. Envio numa thread, para não travar o servidor enquanto fala com o SMTP
     try:
-        server = smtplib.SMTP("smtp.gmail.com", 587)
-        server.starttls()
-        server.login(remetente, senha)
-        server.sendmail(remetente, target_email, msg.as_string())
-        server.quit()
-    except Exception as e:
-        print("Erro ao enviar email de fechamento:", e)
+        await asyncio.to_thread(send_email, target_email, tipo_relatorio, html)
+    except Exception:
+        logger.exception("Erro ao enviar email de fechamento")
         raise HTTPException(status_code=500, detail="O fechamento foi salvo, mas houve uma falha técnica ao enviar o e-mail.")
 
     return {"message": f"Relatório {tipo_fechamento} enviado com sucesso!", "total": total_faturado}
 
+@app.get("/admin/{barbershop_id}/closes")
+def list_day_closes(
+    barbershop_id: int,
+    start: str,
+    end: str,
+    db: Session = Depends(get_read_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Fechamentos diários já gravados no período (a última versão de cada dia)."""
+    if current_user.get("role") not in ["OWNER", "GERENTE", "CEO", "SUPERADMIN"]:
+        raise HTTPException(status_code=403, detail="Apenas gerentes podem ver os fechamentos")
+    if current_user.get("role") != "SUPERADMIN" and current_user.get("shop_id") != barbershop_id:
+        raise HTTPException(status_code=403, detail="Não autorizado")
+    try:
+        inicio = datetime.strptime(start, "%Y-%m-%d").date()
+        fim = datetime.strptime(end, "%Y-%m-%d").date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Datas inválidas (use AAAA-MM-DD)")
+
+    fechamentos = (
+        db.query(DayClose)
+        .filter(DayClose.barbershop_id == barbershop_id, DayClose.day >= inicio, DayClose.day <= fim)
+        .order_by(DayClose.day, DayClose.version)
+        .all()
+    )
+    ultimos = {f.day: f for f in fechamentos}  # ordenado por versão: fica a última de cada dia
+    return [close_to_dict(f) for f in ultimos.values()]
+
+@app.get("/admin/{barbershop_id}/closes/{day}")
+def get_day_close(
+    barbershop_id: int,
+    day: str,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Fechamento de um dia. Dias passados sem foto (ex.: servidor fora do ar no fecho) são gravados na primeira leitura."""
+    if current_user.get("role") not in ["OWNER", "GERENTE", "CEO", "SUPERADMIN"]:
+        raise HTTPException(status_code=403, detail="Apenas gerentes podem ver os fechamentos")
+    if current_user.get("role") != "SUPERADMIN" and current_user.get("shop_id") != barbershop_id:
+        raise HTTPException(status_code=403, detail="Não autorizado")
+    try:
+        dia = datetime.strptime(day, "%Y-%m-%d").date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Data inválida (use AAAA-MM-DD)")
+    if dia >= datetime.now().date():
+        raise HTTPException(status_code=400, detail="O dia ainda não terminou. Use o fechamento de caixa.")
+
+    fechamento = latest_close(db, barbershop_id, dia) or write_close(db, barbershop_id, dia, "auto")
+    return close_to_dict(fechamento)
+
 # ==========================================
 # ROTAS DE PERFIL (IMAGENS E DESCRIÇÃO)
 # ==========================================
 @app.get("/admin/barbershops/{shop_id}/team-earnings")
-def get_team_earnings(shop_id: int, db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
+def get_team_earnings(shop_id: int, db: Session = Depends(get_read_db), current_user: dict = Depends(get_current_user)):
     """Retorna a equipa com o cálculo de quanto cada um faturou no mês atual"""
     if current_user.get("role") not in ["OWNER", "GERENTE"]:
         raise HTTPException(status_code=403, detail="Apenas gerentes podem ver o faturamento da equipa")
         
-    hoje = datetime.today().date()
+    inicio_mes = month_start(datetime.now())
     barbers = db.query(Barber).filter(Barber.barbershop_id == shop_id).all()
-    
+
+    # Os cortes deste mês somados por barbeiro numa única query agrupada
+    ganhos = dict(
+        db.query(Appointment.barber_id, func.coalesce(func.sum(Appointment.service_price), 0.0))
+        .filter(
+            Appointment.barber_id.in_([b.id for b in barbers]),
+            Appointment.date_time >= inicio_mes,
+            Appointment.date_time < next_month(inicio_mes)
+        )
+        .group_by(Appointment.barber_id)
+        .all()
+    ) if barbers else {}
+
     resultados = []
     for b in barbers:
-        # Filtra os cortes apenas deste mês e deste barbeiro
-        cortes_mes = db.query(Appointment).filter(
-            Appointment.barber_id == b.id,
-            extract('year', Appointment.date_time) == hoje.year,
-            extract('month', Appointment.date_time) == hoje.month
-        ).all()
-        
-        total_mes = sum(c.service_price for c in cortes_mes)
         resultados.append({
             "id": b.id,
             "name": b.name,
             "role": b.role,
             "profile_image_url": b.profile_image_url,
-            "ganho_mensal": total_mes
+            "ganho_mensal": ganhos.get(b.id, 0.0)
         })
         
     return resultados
 
+@app.get("/admin/barbershops/{barbershop_id}/profile")
+def get_barbershop_profile(barbershop_id: int, db: Session = Depends(get_db)):
+    """Retorna os dados atuais para o formulário no Frontend"""
+    shop = db.query(Barbershop).filter(Barbershop.id == barbershop_id).first()
+    if not shop:
+        raise HTTPException(status_code=404, detail="Não encontrado")
+
+    return {
+        "description": shop.description,
+        "address": shop.address,
+        "logo_url": shop.logo_url,
+        "portfolio_images": shop.portfolio_images.split(";") if shop.portfolio_images else []
+    }
+
 @app.put("/admin/barbershops/{shop_id}/profile")
 def update_barbershop_profile(
     shop_id: int, 
@@ -903,40 +1534,11 @@ def update_barbershop_profile(
         
         shop.portfolio_images = ",".join(final_images)
 
+    # O endereço entra na busca do diretório público
+    directory.refresh_shop(db, shop_id)
     db.commit()
     return {"message": "Perfil atualizado com sucesso!"}
 
-    db.commit()
-    return {"message": "Perfil limpo e guardado!"}
-
-@app.get("/admin/barbershops/{barbershop_id}/profile")
-def get_profile(barbershop_id: int, db: Session = Depends(get_db)):
-    """Retorna os dados atuais para o formulário no Frontend"""
-    shop = db.query(Barbershop).filter(Barbershop.id == barbershop_id).first()
-    if not shop:
-        raise HTTPException(status_code=404, detail="Não encontrado")
-    
-    return {
-        "description": shop.description,
-        "address": shop.address,
-        "logo_url": shop.logo_url,
-        "portfolio_images": shop.portfolio_images.split(";") if shop.portfolio_images else []
-    }
-
-@app.get("/admin/barbershops/{barbershop_id}/profile")
-def get_profile(barbershop_id: int, db: Session = Depends(get_db)):
-    """Retorna os dados atuais para o formulário no Frontend"""
-    shop = db.query(Barbershop).filter(Barbershop.id == barbershop_id).first()
-    if not shop:
-        raise HTTPException(status_code=404, detail="Não encontrado")
-    
-    return {
-        "description": shop.description,
-        "address": shop.address,
-        "logo_url": shop.logo_url,
-        "portfolio_images": shop.portfolio_images.split(";") if shop.portfolio_images else []
-    }
-
 @app.put("/admin/barbers/{barber_id}/profile")
 def update_barber_profile(barber_id: int, data: dict, db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
     """Atualiza a foto de perfil do barbeiro"""
@@ -962,28 +1564,10 @@ def update_barber_profile(barber_id: int, data: dict, db: Session = Depends(get_
 
 # ROTA PÚBLICA: Lista serviços pelo ID da barbearia
 @app.get("/barbershops/{shop_id}/services")
-def list_services_by_id(shop_id: int, db: Session = Depends(get_db)):
+def list_services_by_id(shop_id: int, db: Session = Depends(get_read_db)):
     services = db.query(Service).filter(Service.barbershop_id == shop_id).all()
     return services
 
-# ROTA PRIVADA: Criar novo serviço
-@app.post("/admin/services")
-async def create_service(data: dict, db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
-    # Apenas Gestores/CEOs podem criar serviços
-    if current_user.get("role") == "BARBER":
-        raise HTTPException(status_code=403, detail="Acesso negado")
-
-    new_service = Service(
-        name=data.get("name"),
-        price=data.get("price"),
-        duration=data.get("duration"),
-        barbershop_id=data.get("barbershop_id")
-    )
-    db.add(new_service)
-    db.commit()
-    db.refresh(new_service)
-    return new_service
-
 # ROTA PRIVADA: Editar serviço existente
 @app.put("/admin/services/{service_id}")
 async def update_service(service_id: int, data: dict, db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
@@ -996,9 +1580,16 @@ async def update_service(service_id: int, data: dict, db: Session = Depends(get_
 
     service.name = data.get("name", service.name)
     service.price = data.get("price", service.price)
+    duracao_anterior = service.duration
     service.duration = data.get("duration", service.duration)
+    if service.duration != duracao_anterior:
+        # Os agendamentos futuros deste serviço passam a ocupar a nova duração
+        availability.resize_service_appointments(db, service.id, availability.service_duration(service), datetime.now())
+    directory.refresh_shop(db, service.barbershop_id)
     
     db.commit()
+    # A duração mudou? Os mapas de ocupação da loja têm de ser refeitos
+    availability.invalidate(service.barbershop_id)
     return {"message": "Serviço atualizado com sucesso"}
 
 # ROTA PRIVADA: Eliminar serviço
@@ -1011,33 +1602,17 @@ async def delete_service(service_id: int, db: Session = Depends(get_db), current
     if not service:
         raise HTTPException(status_code=404, detail="Serviço não encontrado")
 
+    shop_id = service.barbershop_id
     db.delete(service)
+    directory.refresh_shop(db, shop_id)
     db.commit()
+    availability.invalidate(shop_id)
     return {"message": "Serviço removido"}
 
 # ==========================================
 # GESTÃO DA AGENDA
 # ==========================================
 
-@app.get("/admin/{barbershop_id}/appointments")
-def get_agenda(barbershop_id: int, db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
-    user_id = int(current_user.get("sub"))
-    user_role = current_user.get("role")
-
-    # 1. Filtro base: Apenas agendamentos que ainda NÃO foram concluídos ou cancelados
-    query = db.query(Appointment).filter(
-        Appointment.barbershop_id == barbershop_id,
-        Appointment.status == "scheduled" 
-    )
-
-    # 2. Se for BARBEIRO, ele só vê os agendamentos DELE
-    if user_role == "BARBER":
-        query = query.filter(Appointment.barber_id == user_id)
-    
-    # Se for CEO/GERENTE/OWNER, a query continua com todos da barbearia
-    
-    return query.order_by(Appointment.date_time.asc()).all()
-
 @app.put("/admin/appointments/{appo_id}/conclude")
 def conclude_appointment(appo_id: int, db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
     shop_id = current_user.get("shop_id")
@@ -1054,107 +1629,21 @@ def conclude_appointment(appo_id: int, db: Session = Depends(get_db), current_us
     if appo.status == "concluido":
         return {"message": "Este atendimento já estava concluído."}
     
+    # Venda de produto cancelada que volta a valer: as unidades saem de novo do estoque
+    delta = inventory.sale_stock_delta(appo.product_id, appo.quantity, appo.status, "concluido")
+    inventory.apply_stock_deltas(db, shop_id, {appo.product_id: delta})
     appo.status = "concluido"
     db.commit()
+    # Concluído com atraso? Os baldes de períodos passados em cache deixam de valer
+    if appo.date_time and appo.date_time.date() < datetime.today().date():
+        analytics.invalidate(shop_id)
+    if appo.product_id is not None:
+        inventory.invalidate(shop_id)
     
     return {"message": "Atendimento concluído com sucesso!"}
 
-# ==========================================
-# FECHAMENTO DE CAIXA (NOVO)
-# ==========================================
-@app.post("/admin/{barbershop_id}/close-register")
-async def close_register(barbershop_id: int, data: dict, db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
-    target_email = data.get("email")
-    observations = data.get("observations", "Nenhuma")
-    incidentes = data.get("incidentes", "Nenhum")
-    role = current_user.get("role")
-    user_id = current_user.get("sub")
-
-    # 1. Credenciais de E-mail (do ficheiro .env)
-    remetente = os.getenv("EMAIL_SENDER")
-    senha = os.getenv("EMAIL_PASSWORD")
-
-    if not remetente or not senha:
-        raise HTTPException(status_code=500, detail="E-mail do sistema não configurado no servidor.")
-    if not target_email:
-        raise HTTPException(status_code=400, detail="E-mail de destino não fornecido.")
-
-    # 2. Lógica Financeira Correta (Apenas os cortes concluídos de HOJE)
-    hoje = datetime.now()
-    
-    appointments_query = db.query(Appointment).filter(
-        Appointment.barbershop_id == barbershop_id,
-        Appointment.status == "concluido", # Conta apenas os que pagaram
-        extract('year', Appointment.date_time) == hoje.year,
-        extract('month', Appointment.date_time) == hoje.month,
-        extract('day', Appointment.date_time) == hoje.day
-    )
-    
-    # Se for barbeiro, pega só os cortes dele. Se for Gestão, pega todos.
-    if role == "BARBER":
-        appointments = [a for a in appointments_query.all() if str(a.barber_id) == str(user_id)]
-        tipo_relatorio = "Faturamento Pessoal (Barbeiro)"
-    else:
-        appointments = appointments_query.all()
-        tipo_relatorio = "Faturamento Global (Loja)"
-
-    total_faturado = sum(a.service_price or 0.0 for a in appointments)
-    qtd_cortes = len(appointments)
-
-    # 3. Montar o E-mail em HTML
-    assunto = f"Fechamento de Caixa - {hoje.strftime('%d/%m/%Y')} - {tipo_relatorio}"
-    
-    html = f"""
-    <html>
-        <body style="font-family: Arial, sans-serif; color: #333; line-height: 1.6;">
-            <div style="max-width: 600px; margin: 0 auto; border: 1px solid #e4e4e7; border-radius: 16px; overflow: hidden;">
-                <div style="background-color: #18181b; padding: 24px; text-align: center;">
-                    <h2 style="color: #f59e0b; margin: 0; text-transform: uppercase;">Relatório de Fechamento</h2>
-                    <p style="color: #a1a1aa; margin: 5px 0 0 0;">{tipo_relatorio}</p>
-                </div>
-                <div style="padding: 32px; background-color: #fafafa;">
-                    <div style="background-color: #ffffff; padding: 20px; border-radius: 12px; border: 1px solid #e4e4e7; text-align: center; margin-bottom: 24px;">
-                        <p style="font-size: 14px; color: #71717a; text-transform: uppercase; font-weight: bold; margin: 0;">Faturamento do Dia</p>
-                        <h1 style="color: #10b981; font-size: 36px; margin: 8px 0;">R$ {total_faturado:.2f}</h1>
-                        <p style="margin: 0; color: #52525b; font-size: 14px;">Total de Serviços: <strong>{qtd_cortes}</strong></p>
-                    </div>
-                    
-                    <h4 style="color: #3f3f46; margin-bottom: 8px;">Observações da Equipa:</h4>
-                    <div style="background-color: #f4f4f5; padding: 12px; border-radius: 8px; margin-bottom: 16px;">
-                        <p style="margin: 0; font-size: 14px;">{observations}</p>
-                    </div>
-
-                    <h4 style="color: #ef4444; margin-bottom: 8px;">Incidentes Registados:</h4>
-                    <div style="background-color: #fef2f2; padding: 12px; border-radius: 8px; border: 1px solid #fca5a5;">
-                        <p style="margin: 0; font-size: 14px; color: #991b1b;">{incidentes}</p>
-                    </div>
-                </div>
-            </div>
-        </body>
-    </html>
-    """
-
-    msg = MIMEMultipart()
-    msg["From"] = remetente
-    msg["To"] = target_email
-    msg["Subject"] = assunto
-    msg.attach(MIMEText(html, "html"))
-
-    # 4. Envio direto pelo Python
-    try:
-        server = smtplib.SMTP("smtp.gmail.com", 587)
-        server.starttls()
-        server.login(remetente, senha)
-        server.sendmail(remetente, target_email, msg.as_string())
-        server.quit()
-    except Exception as e:
-        print("Erro ao enviar email de fechamento:", e)
-        raise HTTPException(status_code=500, detail="O fechamento foi salvo, mas houve uma falha técnica ao enviar o e-mail.")
-
-    return {"message": "Fechamento concluído e enviado para o e-mail!", "total": total_faturado}
-
 @app.get("/barbershops/by-slug/{slug}")
-def get_shop_by_slug(slug: str, db: Session = Depends(get_db)):
+def get_shop_by_slug(slug: str, db: Session = Depends(get_read_db)):
     # Busca a barbearia pelo slug
     shop = db.query(Barbershop).filter(Barbershop.slug == slug).first()
     if not shop:
@@ -1173,10 +1662,24 @@ def get_shop_by_slug(slug: str, db: Session = Depends(get_db)):
         "description": shop.description,
         "address": shop.address,
         "services": shop.services,
-        "barbers": shop.barbers,
         "barbers": active_barbers
     }
 
+# ==========================================
+# SAÚDE DO SERVIDOR (PRONTIDÃO)
+# ==========================================
+
+@app.get("/health/ready")
+async def readiness(check_db: bool = False):
+    """Estado do pool de conexões. Com ?check_db=true faz também um SELECT 1 e mede a latência."""
+    status_pool = get_pool_status()
+    if check_db:
+        try:
+            status_pool["db_ping_ms"] = await asyncio.to_thread(warm_pool, 1)
+        except Exception as e:
+            raise HTTPException(status_code=503, detail=f"Banco indisponível: {e}")
+    return {"ready": True, "pool": status_pool}
+
 # ==========================================
 # LISTAR MEMBROS DE UMA BARBEARIA (SUPERADMIN)
 # ==========================================
@@ -1193,5 +1696,5 @@ def get_barbers_for_super(shop_id: int, db: Session = Depends(get_db), current_u
     return barbers
 
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    import server
+    server.run()
\ No newline at end of file
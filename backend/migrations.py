@@ -0,0 +1,313 @@
+"""Migrações versionadas do banco de dados.
+
+O servidor NÃO cria nem altera tabelas ao arrancar. Antes de subir uma nova versão,
+corra as migrações pendentes com:
+
+    python migrations.py           # aplica o que faltar
+    python migrations.py status    # mostra a versão atual
+
+Para criar uma migração nova, escreva uma função que recebe a conexão e adicione-a
+no fim da lista MIGRATIONS com o próximo número. Nunca altere uma migração já publicada.
+
+Uma migração não pode ler dos modelos o que outra migração acrescenta depois: as tabelas
+que mudaram desde que foram criadas têm aqui a definição congelada (ESQUEMAS CONGELADOS),
+e cada migração cria só os índices que introduziu, pelo nome.
+"""
+import sys
+from datetime import datetime
+
+from sqlalchemy import Boolean, Column, DateTime, Float, ForeignKey, Index, Integer, MetaData, String, Table, Text, inspect, text
+
+from database import engine
+from logs import get_logger, setup_logging
+from models import (Appointment, AppointmentArchive, Barbershop, Barber, Client, CommissionRule, DayClose, PayrollPeriod,
+                    Product, Service, SyncTombstone, TenantDeletion, TokenRevocation)
+from archive import partition_appointments
+from clients import backfill_clients, create_trigram_index
+from directory import backfill_search_text, create_search_index
+from availability import backfill_end_times
+from inventory import backfill_product_sales
+
+logger = get_logger("migrations")
+
+
+# ==========================================
+# AJUDANTES PARA ESCREVER MIGRAÇÕES
+# ==========================================
+
+def create_table(conn, table):
+    """Cria a tabela se ainda não existir (bancos criados com o antigo create_all já a têm)."""
+    table.create(bind=conn, checkfirst=True)
+
+
+def add_column(conn, table, column) -> bool:
+    """Adiciona a coluna do modelo à tabela se ela ainda não existir. Devolve True se criou."""
+    existentes = {c["name"] for c in inspect(conn).get_columns(table.name)}
+    if column.name in existentes:
+        return False
+    tipo = column.type.compile(dialect=conn.dialect)
+    conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {tipo}'))
+    return True
+
+
+def create_index(conn, index):
+    """Cria o índice se ainda não existir."""
+    existentes = {i["name"] for i in inspect(conn).get_indexes(index.table.name)}
+    if index.name not in existentes:
+        index.create(bind=conn)
+
+
+def create_indexes(conn, model, *names):
+    """Cria os índices do modelo com estes nomes (só os da migração, não os que vieram depois)."""
+    indices = {index.name: index for index in model.__table__.indexes}
+    for name in names:
+        create_index(conn, indices[name])
+
+
+# ==========================================
+# ESQUEMAS CONGELADOS
+# ==========================================
+
+_frozen = MetaData()
+
+# Migração 001: o esquema do create_all antigo, tal como estava no models.py
+BASELINE_TABLES = [
+    Table(
+        "barbershops", _frozen,
+        Column("id", Integer, primary_key=True, index=True),
+        Column("name", String),
+        Column("slug", String, unique=True, index=True),
+        Column("owner_email", String, unique=True, nullable=True),
+        Column("password_hash", String, nullable=True),
+        Column("description", String, nullable=True),
+        Column("address", String, nullable=True),
+        Column("logo_url", String, nullable=True),
+        Column("portfolio_images", String, nullable=True),
+        Column("open_time", String),
+        Column("close_time", String),
+        Column("interval_start", String),
+        Column("interval_end", String),
+    ),
+    Table(
+        "barbers", _frozen,
+        Column("id", Integer, primary_key=True, index=True),
+        Column("name", String),
+        Column("role", String),
+        Column("pin", String, unique=True),
+        Column("email", String, nullable=True),
+        Column("barbershop_id", Integer, ForeignKey("barbershops.id")),
+        Column("profile_image_url", String, nullable=True),
+        Column("is_active", Boolean),
+    ),
+    Table(
+        "services", _frozen,
+        Column("id", Integer, primary_key=True, index=True),
+        Column("name", String),
+        Column("price", Float),
+        Column("duration", Integer),
+        Column("barbershop_id", Integer, ForeignKey("barbershops.id")),
+    ),
+    Table(
+        "products", _frozen,
+        Column("id", Integer, primary_key=True, index=True),
+        Column("name", String),
+        Column("description", Text, nullable=True),
+        Column("stock_quantity", Integer),
+        Column("price", Float),
+        Column("cost_price", Float, nullable=True),
+        Column("barbershop_id", Integer, ForeignKey("barbershops.id")),
+    ),
+    Table(
+        "appointments", _frozen,
+        Column("id", Integer, primary_key=True, index=True),
+        Column("client_name", String),
+        Column("client_phone", String),
+        Column("date_time", DateTime),
+        Column("service_id", Integer, ForeignKey("services.id")),
+        Column("barber_id", Integer, ForeignKey("barbers.id")),
+        Column("barbershop_id", Integer, ForeignKey("barbershops.id")),
+        Column("status", String),
+        Column("service_price", Float),
+    ),
+]
+
+# Migração 002: o arquivo com as colunas que appointments tinha nessa altura (as seguintes
+# entram nas duas tabelas pelas mesmas migrações)
+ARCHIVE_TABLE_V2 = Table(
+    "appointments_archive", _frozen,
+    Column("id", Integer, primary_key=True, index=True, autoincrement=False),
+    Column("client_name", String),
+    Column("client_phone", String),
+    Column("date_time", DateTime),
+    Column("service_id", Integer, ForeignKey("services.id")),
+    Column("barber_id", Integer, ForeignKey("barbers.id")),
+    Column("barbershop_id", Integer, ForeignKey("barbershops.id")),
+    Column("status", String),
+    Column("service_price", Float),
+    Index("ix_appointments_archive_shop_date", "barbershop_id", "date_time"),
+)
+
+
+# ==========================================
+# MIGRAÇÕES (POR ORDEM)
+# ==========================================
+
+def m001_baseline(conn):
+    """Esquema inicial (o que o create_all fazia ao importar o main.py)."""
+    for table in BASELINE_TABLES:
+        create_table(conn, table)
+
+
+def m002_appointments_partitioning(conn):
+    """Particiona appointments por mês (Postgres), cria os índices por período e a tabela de arquivo."""
+    partition_appointments(conn)
+    # ix_appointments_id de novo: no Postgres a tabela particionada não herda os índices da antiga
+    create_indexes(conn, Appointment, "ix_appointments_id", "ix_appointments_shop_date",
+                   "ix_appointments_barber_date", "ix_appointments_shop_status_date")
+    create_table(conn, ARCHIVE_TABLE_V2)
+
+
+def m003_day_closes(conn):
+    """Fotos diárias do fechamento de caixa."""
+    create_table(conn, DayClose.__table__)
+
+
+def m004_clients(conn):
+    """Diretório de clientes: tabela, ligação appointments.client_id e preenchimento pelo histórico."""
+    create_table(conn, Client.__table__)
+    for model in [Appointment, AppointmentArchive]:
+        add_column(conn, model.__table__, model.__table__.c.client_id)
+    create_indexes(conn, Appointment, "ix_appointments_client_date")
+    create_indexes(conn, AppointmentArchive, "ix_appointments_archive_client_date")
+    create_trigram_index(conn)
+    backfill_clients(conn)
+
+
+def m005_directory_search(conn):
+    """Texto pesquisável das lojas para o diretório público (+ índice GIN de full-text no Postgres)."""
+    add_column(conn, Barbershop.__table__, Barbershop.__table__.c.search_text)
+    create_search_index(conn)
+    backfill_search_text(conn)
+
+
+def m006_appointment_reminders(conn):
+    """Marca de lembrete enviado por agendamento e índice (status, date_time) para a janela do agendador."""
+    for model in [Appointment, AppointmentArchive]:
+        add_column(conn, model.__table__, model.__table__.c.reminder_sent_at)
+    create_indexes(conn, Appointment, "ix_appointments_status_date")
+
+
+def m007_appointment_end_time(conn):
+    """Duração e fim gravados em cada agendamento (antes vinham do JOIN com services a cada leitura)."""
+    for model in [Appointment, AppointmentArchive]:
+        for coluna in ["duration", "end_time"]:
+            add_column(conn, model.__table__, model.__table__.c[coluna])
+        backfill_end_times(conn, model.__table__)
+
+
+def m008_tenant_deletions(conn):
+    """Jobs de remoção de lojas em segundo plano."""
+    create_table(conn, TenantDeletion.__table__)
+
+
+def m009_product_sales(conn):
+    """Vendas de produto ligadas ao produto (product_id/quantity); o histórico é ligado pelo nome."""
+    for model in [Appointment, AppointmentArchive]:
+        for coluna in ["product_id", "quantity"]:
+            add_column(conn, model.__table__, model.__table__.c[coluna])
+        backfill_product_sales(conn, model.__table__)
+
+
+def m010_payroll(conn):
+    """Regras de comissão, folhas fechadas e o vendedor de cada venda de produto."""
+    create_table(conn, CommissionRule.__table__)
+    create_table(conn, PayrollPeriod.__table__)
+    for model in [Appointment, AppointmentArchive]:
+        add_column(conn, model.__table__, model.__table__.c.seller_id)
+
+
+def m011_token_revocations(conn):
+    """Revogação de tokens (logout e "terminar todas as sessões")."""
+    create_table(conn, TokenRevocation.__table__)
+
+
+def m012_calendar_feeds(conn):
+    """Link secreto do calendário de cada barbeiro e a data da última alteração dos agendamentos."""
+    add_column(conn, Barber.__table__, Barber.__table__.c.calendar_token)
+    create_indexes(conn, Barber, "ix_barbers_calendar_token")
+    for model in [Appointment, AppointmentArchive]:
+        add_column(conn, model.__table__, model.__table__.c.updated_at)
+
+
+def m013_sync(conn):
+    """Sincronização incremental: updated_at em produtos/serviços/barbeiros, índices por loja e a tabela de apagados."""
+    for model in [Product, Service, Barber]:
+        add_column(conn, model.__table__, model.__table__.c.updated_at)
+    create_indexes(conn, Appointment, "ix_appointments_shop_updated")
+    create_indexes(conn, Product, "ix_products_shop_updated")
+    create_indexes(conn, Service, "ix_services_shop_updated")
+    create_indexes(conn, Barber, "ix_barbers_shop_updated")
+    create_table(conn, SyncTombstone.__table__)
+
+
+MIGRATIONS = [
+    (1, "baseline", m001_baseline),
+    (2, "appointments_partitioning", m002_appointments_partitioning),
+    (3, "day_closes", m003_day_closes),
+    (4, "clients", m004_clients),
+    (5, "directory_search", m005_directory_search),
+    (6, "appointment_reminders", m006_appointment_reminders),
+    (7, "appointment_end_time", m007_appointment_end_time),
+    (8, "tenant_deletions", m008_tenant_deletions),
+    (9, "product_sales", m009_product_sales),
+    (10, "payroll", m010_payroll),
+    (11, "token_revocations", m011_token_revocations),
+    (12, "calendar_feeds", m012_calendar_feeds),
+    (13, "sync", m013_sync),
+]
+
+
+# ==========================================
+# EXECUTOR
+# ==========================================
+
+def _ensure_version_table(conn):
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version INTEGER PRIMARY KEY, name VARCHAR NOT NULL, applied_at VARCHAR NOT NULL)"
+    ))
+
+
+def current_version(bind=engine) -> int:
+    with bind.begin() as conn:
+        _ensure_version_table(conn)
+        return conn.execute(text("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")).scalar()
+
+
+def upgrade(bind=engine) -> list[int]:
+    """Aplica as migrações pendentes, cada uma na sua própria transação."""
+    aplicadas = []
+    atual = current_version(bind)
+    for version, name, func in MIGRATIONS:
+        if version <= atual:
+            continue
+        with bind.begin() as conn:
+            func(conn)
+            conn.execute(
+                text("INSERT INTO schema_migrations (version, name, applied_at) VALUES (:v, :n, :t)"),
+                {"v": version, "n": name, "t": datetime.utcnow().isoformat()}
+            )
+        aplicadas.append(version)
+        logger.info(f"Migração {version:03d} ({name}) aplicada.")
+    return aplicadas
+
+
+if __name__ == "__main__":
+    setup_logging(default_format="text")
+    if len(sys.argv) > 1 and sys.argv[1] == "status":
+        atual = current_version()
+        ultima = MIGRATIONS[-1][0]
+        logger.info(f"Versão do banco: {atual} (mais recente disponível: {ultima})")
+    else:
+        if not upgrade():
+            logger.info("Banco já está atualizado.")
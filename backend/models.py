@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, ForeignKey, Text, DateTime
+from sqlalchemy import Column, Integer, String, Float, Boolean, ForeignKey, Text, Date, DateTime, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from database import Base
 import datetime
@@ -21,6 +21,9 @@ class Barbershop(Base):
     close_time = Column(String, default="19:00")
     interval_start = Column(String, default="12:00")
     interval_end = Column(String, default="13:00")
+
+    # Texto da busca do diretório público (nome, endereço, serviços), mantido por directory.py
+    search_text = Column(Text, nullable=True)
     
     # Relações
     barbers = relationship("Barber", back_populates="barbershop")
@@ -29,7 +32,10 @@ class Barbershop(Base):
 
 class Barber(Base):
     __tablename__ = "barbers"
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (
+        Index("ix_barbers_shop_updated", "barbershop_id", "updated_at"),
+        {'extend_existing': True},
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String)
@@ -40,25 +46,36 @@ class Barber(Base):
     profile_image_url = Column(String, nullable=True)
 
     is_active = Column(Boolean, default=True)
+    # Segredo do link do calendário (.ics) do barbeiro; NULL = link desligado
+    calendar_token = Column(String, unique=True, index=True, nullable=True)
+    # Última alteração, para a sincronização incremental dos tablets (ver sync.py)
+    updated_at = Column(DateTime, nullable=True, default=datetime.datetime.now, onupdate=datetime.datetime.now)
     
     barbershop_id = Column(Integer, ForeignKey("barbershops.id"))
     barbershop = relationship("Barbershop", back_populates="barbers")
 
 class Service(Base):
     __tablename__ = "services"
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (
+        Index("ix_services_shop_updated", "barbershop_id", "updated_at"),
+        {'extend_existing': True},
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String)
     price = Column(Float)
     duration = Column(Integer) # em minutos
     barbershop_id = Column(Integer, ForeignKey("barbershops.id"))
+    updated_at = Column(DateTime, nullable=True, default=datetime.datetime.now, onupdate=datetime.datetime.now)
 
     barbershop = relationship("Barbershop", back_populates="services")
 
 class Product(Base):
     __tablename__ = "products"
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (
+        Index("ix_products_shop_updated", "barbershop_id", "updated_at"),
+        {'extend_existing': True},
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String)
@@ -67,13 +84,31 @@ class Product(Base):
     price = Column(Float)
     cost_price = Column(Float, nullable=True) # Para cálculo de lucro futuro
     barbershop_id = Column(Integer, ForeignKey("barbershops.id"))
+    updated_at = Column(DateTime, nullable=True, default=datetime.datetime.now, onupdate=datetime.datetime.now)
     
     barbershop = relationship("Barbershop", back_populates="products")
 
-class Appointment(Base):
-    __tablename__ = "appointments"
-    __table_args__ = {'extend_existing': True}
+class Client(Base):
+    """Cliente de uma loja, identificado pelo telefone normalizado (E.164, ex.: +5511999990000)."""
+    __tablename__ = "clients"
+    __table_args__ = (
+        UniqueConstraint("barbershop_id", "phone", name="uq_clients_shop_phone"),
+        # varchar_pattern_ops: no Postgres o LIKE 'prefixo%' usa o índice em qualquer collation
+        Index("ix_clients_shop_phone_prefix", "barbershop_id", "phone", postgresql_ops={"phone": "varchar_pattern_ops"}),
+        Index("ix_clients_shop_name", "barbershop_id", "name_search", postgresql_ops={"name_search": "varchar_pattern_ops"}),
+        {'extend_existing': True},
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    barbershop_id = Column(Integer, ForeignKey("barbershops.id"), nullable=False)
+    phone = Column(String, nullable=False)
+    name = Column(String)
+    name_search = Column(String)  # nome em minúsculas e sem acentos, só para a busca
+    created_at = Column(DateTime, default=datetime.datetime.now)
+    last_booking_at = Column(DateTime, nullable=True)
 
+class AppointmentColumns:
+    """Colunas partilhadas entre a tabela quente (appointments) e o histórico arquivado."""
     id = Column(Integer, primary_key=True, index=True)
     client_name = Column(String)
     client_phone = Column(String)
@@ -81,8 +116,176 @@ class Appointment(Base):
     service_id = Column(Integer, ForeignKey("services.id"))
     barber_id = Column(Integer, ForeignKey("barbers.id"))
     barbershop_id = Column(Integer, ForeignKey("barbershops.id"))
-    status = Column(String, default="scheduled") # scheduled, completed, cancelled
+    status = Column(String, default="scheduled") # scheduled, concluido, cancelado
     service_price = Column(Float, default=0.0)
+    # Sem FOREIGN KEY de propósito: bancos antigos ganham a coluna por ALTER TABLE (migração 004)
+    client_id = Column(Integer, nullable=True)  # clients.id
+    # Gravados na marcação (duração do serviço na altura; vendas de balcão = 0), para as
+    # buscas de sobreposição não dependerem do JOIN com services
+    duration = Column(Integer, nullable=True)  # minutos
+    end_time = Column(DateTime, nullable=True)
+    # Quando o lembrete do WhatsApp foi reservado/enviado (ver reminders.py); NULL = por enviar
+    reminder_sent_at = Column(DateTime, nullable=True)
+    # Venda de produto (🛍️): qual produto e quantas unidades. Sem FOREIGN KEY, como o client_id:
+    # apagar o produto não apaga o histórico de vendas
+    product_id = Column(Integer, nullable=True)  # products.id
+    quantity = Column(Integer, nullable=True)  # NULL = 1 unidade
+    # Quem vendeu o produto (para a comissão); a venda em si continua a ser da loja (barber_id NULL)
+    seller_id = Column(Integer, nullable=True)  # barbers.id
+    # Última alteração (o onupdate vale também para os update() do Core); é daqui que sai o
+    # ETag/Last-Modified do calendário do barbeiro (ver calendars.py) e a sincronização (sync.py)
+    updated_at = Column(DateTime, nullable=True, default=datetime.datetime.now, onupdate=datetime.datetime.now)
+
+class Appointment(AppointmentColumns, Base):
+    __tablename__ = "appointments"
+    # No Postgres a tabela é particionada por mês em date_time (ver migrations.py)
+    __table_args__ = (
+        Index("ix_appointments_shop_date", "barbershop_id", "date_time"),
+        Index("ix_appointments_barber_date", "barber_id", "date_time"),
+        Index("ix_appointments_shop_status_date", "barbershop_id", "status", "date_time"),
+        Index("ix_appointments_client_date", "client_id", "date_time"),
+        Index("ix_appointments_status_date", "status", "date_time"),
+        Index("ix_appointments_shop_updated", "barbershop_id", "updated_at"),
+        {'extend_existing': True},
+    )
+
     barbershop = relationship("Barbershop")
     barber = relationship("Barber")
-    service = relationship("Service")
\ No newline at end of file
+    service = relationship("Service")
+
+class AppointmentArchive(AppointmentColumns, Base):
+    """Atendimentos concluídos/cancelados antigos, movidos pelo job de arquivo (archive.py)."""
+    __tablename__ = "appointments_archive"
+    __table_args__ = (
+        Index("ix_appointments_archive_shop_date", "barbershop_id", "date_time"),
+        Index("ix_appointments_archive_client_date", "client_id", "date_time"),
+        {'extend_existing': True},
+    )
+
+    # O ID é o mesmo que o atendimento tinha na tabela quente
+    id = Column(Integer, primary_key=True, index=True, autoincrement=False)
+
+class DayClose(Base):
+    """Fechamento de caixa de um dia (foto imutável). Se o dia mudar depois, grava-se uma nova versão."""
+    __tablename__ = "day_closes"
+    __table_args__ = (
+        UniqueConstraint("barbershop_id", "day", "version", name="uq_day_closes_shop_day_version"),
+        {'extend_existing': True},
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    barbershop_id = Column(Integer, ForeignKey("barbershops.id"), nullable=False)
+    day = Column(Date, nullable=False)
+    version = Column(Integer, nullable=False, default=1)
+    source = Column(String, default="auto")  # auto (agendador) ou manual (botão de fechar caixa)
+    closed_at = Column(DateTime, default=datetime.datetime.now)
+
+    total_revenue = Column(Float, default=0.0)
+    services_count = Column(Integer, default=0)
+    services_total = Column(Float, default=0.0)
+    counter_sales_count = Column(Integer, default=0)
+    counter_sales_total = Column(Float, default=0.0)
+    products_count = Column(Integer, default=0)
+    products_total = Column(Float, default=0.0)
+    per_barber = Column(Text)  # JSON: [{barber_id, name, revenue, count}]
+    # Resumo dos atendimentos concluídos do dia; se mudar, a foto está desatualizada
+    fingerprint = Column(String)
+
+    # Fila de e-mail: preenchido quando há envio pendente
+    email_to = Column(String, nullable=True)
+    emailed_at = Column(DateTime, nullable=True)
+
+class TenantDeletion(Base):
+    """Job de remoção de uma loja (ver deletions.py): apaga em lotes e guarda o progresso para retomar."""
+    __tablename__ = "tenant_deletions"
+    __table_args__ = (
+        Index("ix_tenant_deletions_status", "status", "locked_until"),
+        {'extend_existing': True},
+    )
+
+    id = Column(String, primary_key=True)  # uuid4 hex
+    # Sem FOREIGN KEY: a loja deixa de existir no último passo e o job fica como registo
+    barbershop_id = Column(Integer, nullable=False)
+    shop_name = Column(String)
+    requested_by = Column(String)
+    status = Column(String, default="pending")  # pending, running, failed, done
+    step = Column(String)  # tabela (ou "files"/"shop") em que o job vai
+    totals = Column(Text)  # JSON: {tabela: linhas no início}
+    deleted = Column(Text)  # JSON: {tabela: linhas já apagadas}
+    files = Column(Text)  # JSON: arquivos de uploads/ da loja (lidos ao pedir a remoção)
+    files_deleted = Column(Integer, default=0)
+    attempts = Column(Integer, default=0)
+    error = Column(Text, nullable=True)
+    # Quem está a correr o job e até quando (um worker que morre perde a vez quando isto passa)
+    worker = Column(String, nullable=True)
+    locked_until = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.datetime.now)
+    updated_at = Column(DateTime, default=datetime.datetime.now)
+    finished_at = Column(DateTime, nullable=True)
+
+class CommissionRule(Base):
+    """Regra de comissão (ver payroll.py). A mais específica ganha: barbeiro+item, barbeiro, item, loja."""
+    __tablename__ = "commission_rules"
+    __table_args__ = (
+        Index("ix_commission_rules_shop_kind", "barbershop_id", "kind"),
+        {'extend_existing': True},
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    barbershop_id = Column(Integer, ForeignKey("barbershops.id"), nullable=False)
+    kind = Column(String, nullable=False)  # servico, produto, venda_balcao (como o analytics.kind_sql)
+    barber_id = Column(Integer, ForeignKey("barbers.id"), nullable=True)  # NULL = regra da loja
+    service_id = Column(Integer, ForeignKey("services.id"), nullable=True)  # só em kind=servico
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=True)  # só em kind=produto
+    percent = Column(Float, nullable=True)  # % do valor cobrado
+    fixed_amount = Column(Float, nullable=True)  # R$ por corte / por unidade vendida
+    updated_at = Column(DateTime, default=datetime.datetime.now)
+
+class PayrollPeriod(Base):
+    """Folha de um período fechado: foto das comissões, lida tal como foi gravada."""
+    __tablename__ = "payroll_periods"
+    __table_args__ = (
+        UniqueConstraint("barbershop_id", "start_date", name="uq_payroll_periods_shop_start"),
+        {'extend_existing': True},
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    barbershop_id = Column(Integer, ForeignKey("barbershops.id"), nullable=False)
+    start_date = Column(Date, nullable=False)
+    end_date = Column(Date, nullable=False)  # inclusivo
+    closed_at = Column(DateTime, default=datetime.datetime.now)
+    closed_by = Column(String)
+    total_revenue = Column(Float, default=0.0)
+    total_commission = Column(Float, default=0.0)
+    per_barber = Column(Text)  # JSON: linhas da folha (ver payroll.compute_payroll)
+    rules = Column(Text)  # JSON: regras em vigor no fecho
+
+class TokenRevocation(Base):
+    """Token(s) revogados (ver sessions.py): um jti, ou tudo de um barbeiro/loja emitido até revoked_at."""
+    __tablename__ = "token_revocations"
+    __table_args__ = (
+        Index("ix_token_revocations_revoked_at", "revoked_at"),
+        Index("ix_token_revocations_expires_at", "expires_at"),
+        {'extend_existing': True},
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, nullable=False)  # jti, barber, shop
+    value = Column(String, nullable=False)  # o jti, o id do barbeiro ou o id da loja
+    revoked_at = Column(DateTime, nullable=False)  # UTC, como o iat/exp dos tokens
+    expires_at = Column(DateTime, nullable=False)  # depois disto nenhum token afetado ainda vale
+    revoked_by = Column(String, nullable=True)
+
+class SyncTombstone(Base):
+    """Registo apagado (produto, serviço, barbeiro, agendamento), para os tablets o tirarem também (ver sync.py)."""
+    __tablename__ = "sync_tombstones"
+    __table_args__ = (
+        Index("ix_sync_tombstones_shop_deleted", "barbershop_id", "deleted_at"),
+        {'extend_existing': True},
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    barbershop_id = Column(Integer, nullable=False)
+    entity = Column(String, nullable=False)  # appointments, products, services, barbers
+    entity_id = Column(Integer, nullable=False)
+    deleted_at = Column(DateTime, nullable=False, default=datetime.datetime.now)
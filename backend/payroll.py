@@ -0,0 +1,301 @@
+"""Comissões e folha de pagamento dos barbeiros.
+
+Regras (`commission_rules`), por tipo de venda (os mesmos do analytics.kind_sql):
+
+    servico       % do valor e/ou R$ fixo por corte; pode ser de um serviço específico
+    produto       % do valor e/ou R$ fixo por unidade; pode ser de um produto específico
+    venda_balcao  % e/ou R$ fixo por "corte avulso" lançado no balcão
+
+Cada regra vale para a loja toda (barber_id NULL) ou só para um barbeiro. Para cada
+venda ganha a regra mais específica: barbeiro+item > barbeiro > loja+item > loja.
+
+A folha de um período sai de UMA query: os atendimentos concluídos (com o arquivo, se
+o período for antigo) são somados por barbeiro, tipo e item; cada grupo recebe a regra
+certa por LEFT JOINs com as regras, e o GROUP BY (barbeiro, tipo) devolve faturamento e
+comissão. Um período fechado vira uma foto em `payroll_periods`; reabri-lo é ler essa
+foto, não recalcular.
+"""
+import json
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import and_, case, func, or_, select
+from sqlalchemy.orm import Session, aliased
+
+from analytics import kind_sql
+from archive import appointments_between
+from models import Barber, CommissionRule, PayrollPeriod, Product, Service
+
+COMMISSION_KINDS = ["servico", "produto", "venda_balcao"]
+PAYROLL_MAX_DAYS = 366
+
+# Tipo de venda -> prefixo das colunas na linha de cada barbeiro
+_KIND_FIELDS = {"servico": "services", "produto": "products", "venda_balcao": "counter_sales"}
+
+
+class RuleError(ValueError):
+    """Regra de comissão inválida (a mensagem vai para o utilizador)."""
+
+
+# ==========================================
+# REGRAS
+# ==========================================
+
+def rule_to_dict(regra: CommissionRule) -> dict:
+    return {
+        "id": regra.id,
+        "kind": regra.kind,
+        "barber_id": regra.barber_id,
+        "service_id": regra.service_id,
+        "product_id": regra.product_id,
+        "percent": regra.percent,
+        "fixed_amount": regra.fixed_amount,
+        "updated_at": regra.updated_at.isoformat() if regra.updated_at else None,
+    }
+
+
+def list_rules(db: Session, shop_id: int) -> list[CommissionRule]:
+    return (
+        db.query(CommissionRule)
+        .filter(CommissionRule.barbershop_id == shop_id)
+        .order_by(CommissionRule.kind, CommissionRule.barber_id, CommissionRule.service_id, CommissionRule.product_id)
+        .all()
+    )
+
+
+def _optional_id(data: dict, campo: str) -> int | None:
+    valor = data.get(campo)
+    if valor in (None, ""):
+        return None
+    try:
+        return int(valor)
+    except (TypeError, ValueError):
+        raise RuleError(f"'{campo}' inválido")
+
+
+def _optional_amount(data: dict, campo: str, maximo: float | None = None) -> float | None:
+    valor = data.get(campo)
+    if valor in (None, ""):
+        return None
+    try:
+        valor = float(valor)
+    except (TypeError, ValueError):
+        raise RuleError(f"'{campo}' inválido")
+    if valor < 0 or (maximo is not None and valor > maximo):
+        raise RuleError(f"'{campo}' fora do intervalo permitido")
+    return valor
+
+
+def save_rule(db: Session, shop_id: int, data: dict) -> CommissionRule:
+    """Cria ou substitui a regra com a mesma chave (tipo, barbeiro, serviço, produto). Sem commit."""
+    kind = data.get("kind")
+    if kind not in COMMISSION_KINDS:
+        raise RuleError(f"'kind' inválido. Use: {', '.join(COMMISSION_KINDS)}")
+    barber_id = _optional_id(data, "barber_id")
+    service_id = _optional_id(data, "service_id")
+    product_id = _optional_id(data, "product_id")
+    percent = _optional_amount(data, "percent", maximo=100)
+    fixed_amount = _optional_amount(data, "fixed_amount")
+    if percent is None and fixed_amount is None:
+        raise RuleError("Informe 'percent' e/ou 'fixed_amount'")
+    if service_id is not None and kind != "servico":
+        raise RuleError("'service_id' só vale em regras de serviço")
+    if product_id is not None and kind != "produto":
+        raise RuleError("'product_id' só vale em regras de produto")
+
+    # Tudo o que a regra aponta tem de ser desta loja
+    for model, item_id, nome in [(Barber, barber_id, "Barbeiro"), (Service, service_id, "Serviço"), (Product, product_id, "Produto")]:
+        if item_id is not None and not db.query(model.id).filter(model.id == item_id, model.barbershop_id == shop_id).first():
+            raise RuleError(f"{nome} não encontrado nesta barbearia")
+
+    regra = db.query(CommissionRule).filter(
+        CommissionRule.barbershop_id == shop_id,
+        CommissionRule.kind == kind,
+        CommissionRule.barber_id.is_(None) if barber_id is None else CommissionRule.barber_id == barber_id,
+        CommissionRule.service_id.is_(None) if service_id is None else CommissionRule.service_id == service_id,
+        CommissionRule.product_id.is_(None) if product_id is None else CommissionRule.product_id == product_id,
+    ).first()
+    if regra is None:
+        regra = CommissionRule(barbershop_id=shop_id, kind=kind, barber_id=barber_id,
+                               service_id=service_id, product_id=product_id)
+        db.add(regra)
+    regra.percent = percent
+    regra.fixed_amount = fixed_amount
+    regra.updated_at = datetime.now()
+    return regra
+
+
+# ==========================================
+# CÁLCULO DA FOLHA
+# ==========================================
+
+def _period_range(start: date, end: date) -> tuple[datetime, datetime]:
+    return datetime.combine(start, datetime.min.time()), datetime.combine(end + timedelta(days=1), datetime.min.time())
+
+
+def _commission_rows(db: Session, shop_id: int, start: date, end: date):
+    """(barbeiro, tipo, vendas, unidades, faturamento, comissão) por barbeiro e tipo, numa query."""
+    inicio, fim = _period_range(start, end)
+    linhas = appointments_between(
+        ["barber_id", "seller_id", "service_id", "product_id", "client_name", "service_price", "quantity"], inicio, fim,
+        lambda t: t.c.barbershop_id == shop_id,
+        lambda t: t.c.status == "concluido",
+    ).subquery()
+    tipo = kind_sql(linhas)
+    # Produto: a venda é da loja, a comissão de quem vendeu
+    barbeiro = func.coalesce(linhas.c.barber_id, linhas.c.seller_id)
+    # A comissão é linear no valor e nas unidades: agrega-se primeiro por (barbeiro, tipo, item)
+    # e as regras só são procuradas para esses grupos, não para cada atendimento
+    vendas = (
+        select(
+            barbeiro.label("barber_id"),
+            tipo.label("kind"),
+            linhas.c.service_id,
+            linhas.c.product_id,
+            func.count().label("sales"),
+            func.sum(case((tipo == "produto", func.coalesce(linhas.c.quantity, 1)), else_=1)).label("units"),
+            func.coalesce(func.sum(linhas.c.service_price), 0.0).label("price"),
+        )
+        .group_by(barbeiro, tipo, linhas.c.service_id, linhas.c.product_id)
+        .subquery()
+    )
+
+    def _regra(do_barbeiro: bool, do_item: bool):
+        r = aliased(CommissionRule)
+        item = (
+            or_(and_(r.service_id.isnot(None), r.service_id == vendas.c.service_id),
+                and_(r.product_id.isnot(None), r.product_id == vendas.c.product_id))
+            if do_item else and_(r.service_id.is_(None), r.product_id.is_(None))
+        )
+        barbeiro = r.barber_id == vendas.c.barber_id if do_barbeiro else r.barber_id.is_(None)
+        return r, and_(r.barbershop_id == shop_id, r.kind == vendas.c.kind, barbeiro, item)
+
+    # Da mais específica para a mais geral; a primeira que existir decide os dois valores
+    niveis = [_regra(True, True), _regra(True, False), _regra(False, True), _regra(False, False)]
+    percent = case(*[(r.id.isnot(None), func.coalesce(r.percent, 0.0)) for r, _ in niveis], else_=0.0)
+    fixo = case(*[(r.id.isnot(None), func.coalesce(r.fixed_amount, 0.0)) for r, _ in niveis], else_=0.0)
+    comissao = vendas.c.price * percent / 100.0 + fixo * vendas.c.units
+
+    consulta = select(
+        vendas.c.barber_id, vendas.c.kind, func.sum(vendas.c.sales), func.sum(vendas.c.units),
+        func.sum(vendas.c.price), func.sum(comissao),
+    ).select_from(vendas)
+    for r, condicao in niveis:
+        consulta = consulta.outerjoin(r, condicao)
+    return db.execute(consulta.group_by(vendas.c.barber_id, vendas.c.kind)).all()
+
+
+def _empty_line(barber_id: int, nome: str | None) -> dict:
+    linha = {"barber_id": barber_id, "name": nome}
+    for prefixo in _KIND_FIELDS.values():
+        linha.update({f"{prefixo}_count": 0, f"{prefixo}_units": 0,
+                      f"{prefixo}_revenue": 0.0, f"{prefixo}_commission": 0.0})
+    linha.update({"total_revenue": 0.0, "total_commission": 0.0})
+    return linha
+
+
+def compute_payroll(db: Session, shop_id: int, start: date, end: date) -> dict:
+    """Folha do período [start, end] (datas inclusivas), calculada agora."""
+    barbeiros = db.execute(
+        select(Barber.id, Barber.name, Barber.is_active).where(Barber.barbershop_id == shop_id)
+    ).all()
+    por_barbeiro = {b.id: _empty_line(b.id, b.name) for b in barbeiros if b.is_active is not False}
+    nomes = {b.id: b.name for b in barbeiros}
+
+    sem_barbeiro = 0.0
+    for barber_id, kind, qtd, unidades, faturamento, comissao in _commission_rows(db, shop_id, start, end):
+        if barber_id is None:
+            sem_barbeiro += float(faturamento or 0.0)  # vendas da loja sem vendedor: não geram comissão
+            continue
+        linha = por_barbeiro.setdefault(barber_id, _empty_line(barber_id, nomes.get(barber_id)))
+        prefixo = _KIND_FIELDS[kind]
+        linha[f"{prefixo}_count"] += int(qtd)
+        linha[f"{prefixo}_units"] += int(unidades or 0)
+        linha[f"{prefixo}_revenue"] += float(faturamento or 0.0)
+        linha[f"{prefixo}_commission"] += float(comissao or 0.0)
+        linha["total_revenue"] += float(faturamento or 0.0)
+        linha["total_commission"] += float(comissao or 0.0)
+
+    linhas = sorted(por_barbeiro.values(), key=lambda l: (-l["total_commission"], l["name"] or ""))
+    for linha in linhas:
+        for chave, valor in linha.items():
+            if isinstance(valor, float):
+                linha[chave] = round(valor, 2)
+    return {
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "source": "live",
+        "period_id": None,
+        "closed_at": None,
+        "barbers": linhas,
+        "unassigned_revenue": round(sem_barbeiro, 2),
+        "total_revenue": round(sum(l["total_revenue"] for l in linhas) + sem_barbeiro, 2),
+        "total_commission": round(sum(l["total_commission"] for l in linhas), 2),
+    }
+
+
+# ==========================================
+# PERÍODOS FECHADOS
+# ==========================================
+
+def overlapping_period(db: Session, shop_id: int, start: date, end: date) -> PayrollPeriod | None:
+    return db.query(PayrollPeriod).filter(
+        PayrollPeriod.barbershop_id == shop_id,
+        PayrollPeriod.start_date <= end,
+        PayrollPeriod.end_date >= start,
+    ).first()
+
+
+def close_period(db: Session, shop_id: int, start: date, end: date, closed_by: str | None = None) -> PayrollPeriod:
+    """Calcula a folha e grava a foto (sem commit). As regras em vigor ficam junto, para auditoria."""
+    folha = compute_payroll(db, shop_id, start, end)
+    periodo = PayrollPeriod(
+        barbershop_id=shop_id,
+        start_date=start,
+        end_date=end,
+        closed_at=datetime.now(),
+        closed_by=closed_by,
+        total_revenue=folha["total_revenue"],
+        total_commission=folha["total_commission"],
+        per_barber=json.dumps({"barbers": folha["barbers"], "unassigned_revenue": folha["unassigned_revenue"]},
+                              ensure_ascii=False),
+        rules=json.dumps([rule_to_dict(r) for r in list_rules(db, shop_id)], ensure_ascii=False),
+    )
+    db.add(periodo)
+    return periodo
+
+
+def period_to_dict(periodo: PayrollPeriod, with_lines: bool = True) -> dict:
+    dados = {
+        "start": periodo.start_date.isoformat(),
+        "end": periodo.end_date.isoformat(),
+        "source": "snapshot",
+        "period_id": periodo.id,
+        "closed_at": periodo.closed_at.isoformat() if periodo.closed_at else None,
+        "closed_by": periodo.closed_by,
+        "total_revenue": periodo.total_revenue,
+        "total_commission": periodo.total_commission,
+    }
+    if with_lines:
+        foto = json.loads(periodo.per_barber or "{}")
+        dados["barbers"] = foto.get("barbers", [])
+        dados["unassigned_revenue"] = foto.get("unassigned_revenue", 0.0)
+        dados["rules"] = json.loads(periodo.rules or "[]")
+    return dados
+
+
+def get_payroll(db: Session, shop_id: int, start: date, end: date) -> dict:
+    """A foto, se o período foi fechado exatamente assim; senão o cálculo ao vivo."""
+    periodo = db.query(PayrollPeriod).filter(
+        PayrollPeriod.barbershop_id == shop_id, PayrollPeriod.start_date == start, PayrollPeriod.end_date == end,
+    ).first()
+    return period_to_dict(periodo) if periodo else compute_payroll(db, shop_id, start, end)
+
+
+def list_periods(db: Session, shop_id: int) -> list[dict]:
+    periodos = (
+        db.query(PayrollPeriod)
+        .filter(PayrollPeriod.barbershop_id == shop_id)
+        .order_by(PayrollPeriod.start_date.desc())
+        .all()
+    )
+    return [period_to_dict(p, with_lines=False) for p in periodos]
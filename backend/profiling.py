@@ -0,0 +1,239 @@
+"""Perfil de um pedido sob demanda, para o SuperAdmin investigar lentidão em produção.
+
+Um pedido com o cabeçalho `X-Profile: 1` E um token de SUPERADMIN corre sob um
+amostrador de pilhas (a cada PROFILE_SAMPLE_MS) e com todas as queries SQL dele
+cronometradas. A resposta segue normal, com o cabeçalho `X-Profile-ID`; o perfil fica
+gravado em PROFILE_DIR e é lido em:
+
+    GET /superadmin/profiles/{id}          # JSON: duração, queries e pilhas
+    GET /superadmin/profiles/{id}/folded   # pilhas "dobradas" (flamegraph.pl, speedscope)
+
+Sem o cabeçalho não há custo nenhum: o amostrador e os eventos do SQLAlchemy só existem
+enquanto há um perfil a correr.
+"""
+import contextvars
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+
+from sqlalchemy import event
+
+from logs import get_logger
+
+PROFILE_HEADER = "x-profile"
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_SAMPLE_MS = float(os.getenv("PROFILE_SAMPLE_MS", "1"))
+PROFILE_MAX_QUERIES = 2000
+PROFILE_LIST_MAX = 50
+
+_PROFILE_ID = re.compile(r"^[0-9a-f]{32}$")
+
+logger = get_logger("profiling")
+
+# Perfil do pedido atual (só existe dentro de um pedido perfilado). As threads do pool que
+# correm as rotas síncronas recebem uma cópia do contexto, então as queries delas entram.
+_current: contextvars.ContextVar["Profile | None"] = contextvars.ContextVar("profile", default=None)
+
+
+class Profile:
+    def __init__(self, method: str, path: str):
+        self.id = uuid.uuid4().hex
+        self.method = method
+        self.path = path
+        self.route = None
+        self.started_at = datetime.now()
+        self.duration_ms = None
+        self.status = None
+        self.queries: list[dict] = []
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        # Thread que está a correr o pedido (só esta é amostrada). Começa na do event loop
+        # (rotas async); as queries do pedido trazem a do threadpool (rotas síncronas).
+        self.thread_id = threading.get_ident()
+
+    def to_dict(self) -> dict:
+        sql_ms = sum(q["duration_ms"] for q in self.queries)
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "route": self.route,
+            "started_at": self.started_at.isoformat(),
+            "status": self.status,
+            "duration_ms": self.duration_ms,
+            "sample_interval_ms": PROFILE_SAMPLE_MS,
+            "samples": self.samples,
+            "sql_count": len(self.queries),
+            "sql_ms": round(sql_ms, 2),
+            "queries": self.queries,
+            "folded": folded(self.stacks),
+        }
+
+
+def folded(stacks: Counter) -> str:
+    """Formato "dobrado" do flamegraph: `raiz;filho;neto N` por linha."""
+    return "\n".join(f"{pilha} {n}" for pilha, n in stacks.most_common())
+
+
+# ==========================================
+# SQL
+# ==========================================
+
+_sql_lock = threading.Lock()
+_sql_users = 0
+
+
+def _before(conn, cursor, statement, parameters, context, executemany):
+    perfil = _current.get()
+    if perfil is not None:
+        # Corre na thread do pedido perfilado (o contexto só existe nela)
+        perfil.thread_id = threading.get_ident()
+        conn.info.setdefault("_profile_start", []).append(time.perf_counter())
+
+
+def _after(conn, cursor, statement, parameters, context, executemany):
+    perfil = _current.get()
+    if perfil is None or not conn.info.get("_profile_start"):
+        return
+    duracao = (time.perf_counter() - conn.info["_profile_start"].pop()) * 1000
+    if len(perfil.queries) < PROFILE_MAX_QUERIES:
+        perfil.queries.append({"statement": statement, "duration_ms": round(duracao, 3), "executemany": executemany})
+
+
+def _attach_sql(engines):
+    global _sql_users
+    with _sql_lock:
+        if _sql_users == 0:
+            for engine in engines:
+                event.listen(engine, "before_cursor_execute", _before)
+                event.listen(engine, "after_cursor_execute", _after)
+        _sql_users += 1
+
+
+def _detach_sql(engines):
+    global _sql_users
+    with _sql_lock:
+        _sql_users -= 1
+        if _sql_users == 0:
+            for engine in engines:
+                event.remove(engine, "before_cursor_execute", _before)
+                event.remove(engine, "after_cursor_execute", _after)
+
+
+# ==========================================
+# AMOSTRADOR DE PILHAS
+# ==========================================
+
+def _label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class Sampler(threading.Thread):
+    """A cada intervalo lê a pilha da thread do pedido perfilado (Profile.thread_id), se ela
+    estiver DENTRO da rota. Os pedidos de outros utilizadores à mesma rota, noutras threads do
+    pool, não entram.
+
+    A rota é reconhecida pelo código da função (scope["route"].endpoint), conhecido assim que
+    o roteamento acontece; as pilhas são cortadas para começar nela. Numa rota síncrona a
+    thread do pool só é conhecida na primeira query do pedido: o que corre antes dela não é
+    amostrado.
+    """
+
+    def __init__(self, profile: Profile, scope: dict):
+        super().__init__(daemon=True, name=f"profiler-{profile.id[:8]}")
+        self.profile = profile
+        self.scope = scope
+        self.intervalo = PROFILE_SAMPLE_MS / 1000
+        self.parar = threading.Event()
+
+    def _endpoint_code(self):
+        rota = self.scope.get("route")
+        endpoint = getattr(rota, "endpoint", None)
+        return getattr(endpoint, "__code__", None)
+
+    def run(self):
+        alvo = None
+        while not self.parar.wait(self.intervalo):
+            alvo = alvo or self._endpoint_code()
+            if alvo is None:
+                continue
+            frame = sys._current_frames().get(self.profile.thread_id)
+            pilha = []
+            while frame is not None:
+                pilha.append(frame.f_code)
+                if frame.f_code is alvo:
+                    break
+                frame = frame.f_back
+            if frame is None:
+                continue  # a thread do pedido não está (ainda) dentro da rota perfilada
+            self.profile.stacks[";".join(_label(c) for c in reversed(pilha))] += 1
+            self.profile.samples += 1
+
+    def stop(self):
+        self.parar.set()
+        self.join()
+
+
+# ==========================================
+# CICLO DO PEDIDO E ARMAZENAMENTO
+# ==========================================
+
+def start(scope: dict, method: str, path: str, engines) -> tuple[Profile, contextvars.Token, Sampler]:
+    perfil = Profile(method, path)
+    token = _current.set(perfil)
+    _attach_sql(engines)
+    amostrador = Sampler(perfil, scope)
+    amostrador.start()
+    return perfil, token, amostrador
+
+
+def finish(perfil: Profile, token: contextvars.Token, amostrador: Sampler, scope: dict, status: int | None,
+           inicio: float, engines):
+    amostrador.stop()
+    _detach_sql(engines)
+    _current.reset(token)
+    perfil.duration_ms = round((time.perf_counter() - inicio) * 1000, 2)
+    perfil.status = status
+    perfil.route = getattr(scope.get("route"), "path", None)
+
+
+def save(perfil: Profile):
+    """Grava o perfil em PROFILE_DIR (bloqueante: chame numa thread)."""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    with open(os.path.join(PROFILE_DIR, f"{perfil.id}.json"), "w", encoding="utf-8") as f:
+        json.dump(perfil.to_dict(), f, ensure_ascii=False)
+    logger.info("Perfil gravado", extra={"profile_id": perfil.id, "duration_ms": perfil.duration_ms,
+                                         "sql_count": len(perfil.queries)})
+
+
+def load(profile_id: str) -> dict | None:
+    if not _PROFILE_ID.match(profile_id):
+        return None
+    try:
+        with open(os.path.join(PROFILE_DIR, f"{profile_id}.json"), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def recent(limit: int = PROFILE_LIST_MAX) -> list[dict]:
+    """Resumo dos perfis mais recentes (sem as queries e as pilhas)."""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    arquivos = sorted(
+        (e for e in os.scandir(PROFILE_DIR) if e.name.endswith(".json")),
+        key=lambda e: e.stat().st_mtime, reverse=True,
+    )[:limit]
+    resumo = []
+    for arquivo in arquivos:
+        dados = load(arquivo.name.removesuffix(".json"))
+        if dados:
+            resumo.append({k: dados[k] for k in ("id", "method", "path", "route", "started_at", "status",
+                                                 "duration_ms", "sql_count", "sql_ms")})
+    return resumo
@@ -0,0 +1,161 @@
+"""Lembretes de agendamento pelo WhatsApp (webhook do N8N).
+
+O agendador acorda a cada REMINDER_CHECK_INTERVAL segundos e "reserva" os agendamentos
+`scheduled` que começam na janela de lembrete com um único UPDATE ... RETURNING por lote
+(range no índice (status, date_time)), marcando `reminder_sent_at`. Só quem reservou envia:
+nada sai duas vezes, mesmo com vários workers ou depois de um restart. Cada lote segue
+num único POST para o N8N; se o POST falhar, o lote é devolvido e volta na próxima volta.
+
+Uma volta manual (ex.: cron em vez do agendador dentro do servidor):
+
+    python reminders.py
+"""
+import asyncio
+import os
+from datetime import datetime, timedelta
+
+import httpx
+from sqlalchemy import select, update
+
+from database import SessionLocal
+from logs import get_logger, setup_logging
+from models import Appointment, Barber, Barbershop, Service
+
+# Liga/desliga o agendador dentro do servidor (sem N8N_WHATSAPP_WEBHOOK ele não faz nada)
+REMINDER_SCHEDULER = os.getenv("REMINDER_SCHEDULER", "true").lower() == "true"
+REMINDER_CHECK_INTERVAL = int(os.getenv("REMINDER_CHECK_INTERVAL", "60"))
+# Lembra os agendamentos que começam daqui a no máximo REMINDER_LEAD_MINUTES...
+REMINDER_LEAD_MINUTES = int(os.getenv("REMINDER_LEAD_MINUTES", "180"))
+# ...e não os que já estão em cima da hora
+REMINDER_MIN_AHEAD_MINUTES = int(os.getenv("REMINDER_MIN_AHEAD_MINUTES", "15"))
+# Lembretes por POST ao N8N
+REMINDER_BATCH_SIZE = int(os.getenv("REMINDER_BATCH_SIZE", "200"))
+REMINDER_HTTP_TIMEOUT = float(os.getenv("REMINDER_HTTP_TIMEOUT", "10"))
+
+reminder_state = {"last_run_at": None, "last_sent": 0, "last_error": None}
+logger = get_logger("reminders")
+
+
+def webhook_url() -> str | None:
+    return os.getenv("N8N_WHATSAPP_WEBHOOK")
+
+
+def reminder_window(now: datetime) -> tuple[datetime, datetime]:
+    return now + timedelta(minutes=REMINDER_MIN_AHEAD_MINUTES), now + timedelta(minutes=REMINDER_LEAD_MINUTES)
+
+
+# ==========================================
+# RESERVA E LIBERAÇÃO
+# ==========================================
+
+def claim_batch(db, now: datetime, batch_size: int = REMINDER_BATCH_SIZE) -> list[int]:
+    """Marca até `batch_size` agendamentos da janela como enviados e devolve os IDs que ESTE worker marcou.
+
+    O `reminder_sent_at IS NULL` repetido no UPDATE faz com que dois workers nunca fiquem
+    com o mesmo agendamento: o segundo UPDATE já não encontra a linha por enviar.
+    """
+    inicio, fim = reminder_window(now)
+    pendentes = (
+        Appointment.status == "scheduled",
+        Appointment.date_time >= inicio,
+        Appointment.date_time < fim,
+        Appointment.reminder_sent_at.is_(None),
+    )
+    candidatos = select(Appointment.id).where(*pendentes).order_by(Appointment.date_time).limit(batch_size)
+    ids = db.execute(
+        update(Appointment)
+        .where(Appointment.id.in_(candidatos.scalar_subquery()), *pendentes)
+        .values(reminder_sent_at=now)
+        .returning(Appointment.id)
+        .execution_options(synchronize_session=False)
+    ).scalars().all()
+    db.commit()
+    return ids
+
+
+def release_batch(db, ids: list[int]):
+    """Devolve um lote cujo envio falhou (volta na próxima volta, se ainda estiver na janela)."""
+    db.execute(
+        update(Appointment).where(Appointment.id.in_(ids)).values(reminder_sent_at=None)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+
+
+def reminder_payloads(db, ids: list[int]) -> list[dict]:
+    """Dados de cada lembrete do lote numa única query (nomes da loja, barbeiro e serviço)."""
+    linhas = db.execute(
+        select(
+            Appointment.id, Appointment.client_name, Appointment.client_phone, Appointment.date_time,
+            Barbershop.name.label("barbershop_name"), Barber.name.label("barber_name"), Service.name.label("service_name"),
+        )
+        .outerjoin(Barbershop, Barbershop.id == Appointment.barbershop_id)
+        .outerjoin(Barber, Barber.id == Appointment.barber_id)
+        .outerjoin(Service, Service.id == Appointment.service_id)
+        .where(Appointment.id.in_(ids))
+        .order_by(Appointment.date_time)
+    ).all()
+    return [{
+        "appointment_id": row.id,
+        "client_name": row.client_name,
+        "client_phone": row.client_phone,
+        "date": row.date_time.strftime("%Y-%m-%d"),
+        "time": row.date_time.strftime("%H:%M"),
+        "barbershop_name": row.barbershop_name or "Barbearia",
+        "barber_name": row.barber_name,
+        "service_name": row.service_name,
+    } for row in linhas]
+
+
+# ==========================================
+# AGENDADOR
+# ==========================================
+
+def run_reminders(now: datetime | None = None, http: httpx.Client | None = None) -> int:
+    """Uma volta do agendador: reserva e envia lotes até a janela ficar vazia. Devolve quantos lembretes saíram."""
+    url = webhook_url()
+    if not url:
+        return 0
+    now = now or datetime.now()
+    db = SessionLocal()
+    cliente = http or httpx.Client(timeout=REMINDER_HTTP_TIMEOUT)
+    enviados = 0
+    try:
+        while True:
+            ids = claim_batch(db, now)
+            if not ids:
+                break
+            try:
+                lembretes = reminder_payloads(db, ids)
+                resposta = cliente.post(url, json={"event": "appointment_reminders", "reminders": lembretes})
+                resposta.raise_for_status()
+            except Exception:
+                release_batch(db, ids)
+                logger.warning("Envio de lote de lembretes falhou; lote devolvido", extra={"batch_size": len(ids)})
+                raise
+            enviados += len(ids)
+            if len(ids) < REMINDER_BATCH_SIZE:
+                break
+        return enviados
+    finally:
+        reminder_state["last_sent"] = enviados
+        if http is None:
+            cliente.close()
+        db.close()
+
+
+async def reminder_loop(interval: int = REMINDER_CHECK_INTERVAL):
+    """Tarefa de fundo: a cada `interval` segundos envia os lembretes que entraram na janela."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(run_reminders)
+            reminder_state["last_run_at"] = datetime.now().isoformat()
+        except Exception as e:
+            reminder_state["last_error"] = str(e)
+            logger.exception("Volta do agendador de lembretes falhou")
+
+
+if __name__ == "__main__":
+    setup_logging(default_format="text")
+    logger.info(f"{run_reminders()} lembretes enviados.")
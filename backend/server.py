@@ -0,0 +1,102 @@
+"""Arranque do servidor em produção: python server.py (ou python main.py).
+
+    python server.py                      # workers pelo número de CPUs, porta $PORT
+    python server.py --workers 1 --port 9000
+
+O que decide aqui:
+
+    workers       WEB_CONCURRENCY, ou um por CPU disponível para o processo (as rotas
+                  síncronas já correm num threadpool em cada worker); SQLite fica com 1.
+                  Com DB_MAX_CONNECTIONS, nunca mais workers do que as conexões do banco
+                  aguentam (cada worker abre até DB_POOL_SIZE + DB_MAX_OVERFLOW).
+    event loop    uvloop e httptools quando estão instalados; senão asyncio e h11.
+    desligar      no SIGTERM o uvicorn deixa de aceitar ligações e espera até
+                  GRACEFUL_TIMEOUT segundos pelos pedidos em curso; só depois corre o fim
+                  do lifespan (tarefas de fundo canceladas, pools fechados).
+
+O threadpool das rotas síncronas é ajustado no lifespan (THREADPOOL_SIZE em database.py),
+por isso vale também para quem arranca com `uvicorn main:app`.
+"""
+import argparse
+import os
+from importlib.util import find_spec
+
+import uvicorn
+
+from database import DB_MAX_OVERFLOW, DB_POOL_SIZE, THREADPOOL_SIZE, engine
+from logs import get_logger, setup_logging
+
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", "8000"))
+# Segundos à espera dos pedidos em curso depois do SIGTERM
+GRACEFUL_TIMEOUT = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+# Ligações keep-alive paradas fecham ao fim disto (acima do timeout do proxy à frente)
+KEEPALIVE_TIMEOUT = int(os.getenv("KEEPALIVE_TIMEOUT", "75"))
+# Conexões que o banco aceita no total (ex.: max_connections do Postgres); vazio = sem teto
+DB_MAX_CONNECTIONS = int(os.getenv("DB_MAX_CONNECTIONS", "0"))
+
+logger = get_logger("server")
+
+
+def cpu_count() -> int:
+    """CPUs que este processo pode usar (respeita o affinity do container, quando existe)."""
+    if hasattr(os, "sched_getaffinity"):
+        return max(len(os.sched_getaffinity(0)), 1)
+    return os.cpu_count() or 1
+
+
+def worker_count() -> int:
+    if os.getenv("WEB_CONCURRENCY"):
+        return max(int(os.environ["WEB_CONCURRENCY"]), 1)
+    # O SQLite de desenvolvimento não gosta de vários processos a escrever ao mesmo tempo
+    if engine.dialect.name == "sqlite":
+        return 1
+    workers = cpu_count()
+    if DB_MAX_CONNECTIONS:
+        workers = min(workers, DB_MAX_CONNECTIONS // (DB_POOL_SIZE + DB_MAX_OVERFLOW))
+    return max(workers, 1)
+
+
+def event_loop() -> tuple[str, str]:
+    """(loop, http): as implementações rápidas só se estiverem instaladas."""
+    loop = "uvloop" if find_spec("uvloop") else "asyncio"
+    http = "httptools" if find_spec("httptools") else "h11"
+    return loop, http
+
+
+def run(host: str = HOST, port: int = PORT, workers: int | None = None):
+    workers = workers or worker_count()
+    loop, http = event_loop()
+    logger.info(
+        f"A arrancar em {host}:{port} com {workers} worker(s), loop={loop}, http={http}, "
+        f"threadpool={THREADPOOL_SIZE}, pool do banco={DB_POOL_SIZE}+{DB_MAX_OVERFLOW}"
+    )
+    uvicorn.run(
+        # Com vários workers o uvicorn precisa do caminho da app (cada processo importa a sua)
+        "main:app",
+        host=host,
+        port=port,
+        workers=workers,
+        loop=loop,
+        http=http,
+        timeout_graceful_shutdown=GRACEFUL_TIMEOUT,
+        timeout_keep_alive=KEEPALIVE_TIMEOUT,
+        # Atrás do proxy do Render/Heroku: IP real do cliente (sticky reads, limites, logs)
+        proxy_headers=True,
+        forwarded_allow_ips=os.getenv("FORWARDED_ALLOW_IPS", "*"),
+        # O middleware já escreve uma linha por pedido (LOG_REQUESTS)
+        access_log=False,
+        # Os logs vão pelo nosso QueueHandler (logs.py), não pela configuração do uvicorn
+        log_config=None,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor de produção (uvicorn)")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    setup_logging()
+    run(args.host, args.port, args.workers)
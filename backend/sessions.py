@@ -0,0 +1,188 @@
+"""Sessões: revogação de tokens sem ir ao banco em cada pedido.
+
+Cada token leva um `jti` (ID único) e um `iat` (quando foi emitido, com os microssegundos:
+um login no mesmo segundo de um "terminar sessões" não pode cair nele). As revogações
+ficam em `token_revocations` e há três tipos:
+
+    jti     um token só (logout)
+    barber  todos os tokens de um barbeiro emitidos até ao momento da revogação
+    shop    todos os tokens de uma loja emitidos até ao momento da revogação
+
+O get_current_user consulta só a memória: um set com os jti revogados (16 bytes cada) e
+dois dicts {barbeiro/loja: momento da revogação}. A carga inicial lê as revogações ainda
+válidas; depois a tarefa de fundo (session_loop) só lê as novas, a cada
+SESSION_REFRESH_SECONDS, e apaga as que já expiraram. Uma revogação feita neste worker
+vale assim que a transação dela faz commit; nos outros, até SESSION_REFRESH_SECONDS depois.
+"""
+import asyncio
+import os
+import threading
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, event, insert, select
+from sqlalchemy.orm import Session
+
+from database import engine
+from logs import get_logger
+from models import TokenRevocation
+
+# Quanto tempo vale um token (as revogações em bloco só precisam de durar isto)
+SESSION_LIFETIME = timedelta(days=7)
+SESSION_REFRESH_SECONDS = int(os.getenv("SESSION_REFRESH_SECONDS", "5"))
+# Cada leitura incremental relê este tanto para trás: apanha inserts que fizeram commit
+# fora de ordem e relógios de workers um pouco desencontrados
+SESSION_REFRESH_OVERLAP = timedelta(seconds=60)
+SESSION_PURGE_INTERVAL = timedelta(hours=1)
+
+REVOCATION_KINDS = ["jti", "barber", "shop"]
+
+logger = get_logger("sessions")
+revocations = TokenRevocation.__table__
+
+_lock = threading.Lock()
+_state = {"loaded": False, "watermark": None, "last_purge": None}
+_jtis: set[bytes] = set()
+# sub do barbeiro / shop_id -> epoch (segundos, com fração) da revogação mais recente
+_barbers: dict[str, float] = {}
+_shops: dict[str, float] = {}
+
+
+def new_jti() -> str:
+    return uuid.uuid4().hex
+
+
+def issued_at(dt: datetime) -> float:
+    """Epoch UTC com os microssegundos (o `iat` dos tokens; um JWT aceita NumericDate com fração)."""
+    return dt.replace(tzinfo=timezone.utc).timestamp()
+
+
+def _jti_key(jti: str) -> bytes:
+    try:
+        return bytes.fromhex(jti)
+    except (TypeError, ValueError):
+        return str(jti).encode()
+
+
+# ==========================================
+# CONSULTA (CAMINHO DE CADA PEDIDO)
+# ==========================================
+
+def is_revoked(payload: dict) -> bool:
+    """O token foi revogado? Só memória; a primeira chamada do processo faz a carga inicial."""
+    if not _state["loaded"]:
+        refresh()
+    jti = payload.get("jti")
+    if jti and _jti_key(jti) in _jtis:
+        return True
+    # Tokens antigos (sem iat) caem em qualquer revogação em bloco
+    emitido = payload.get("iat") or 0
+    sub = payload.get("sub")
+    if sub is not None and str(sub) in _barbers and emitido <= _barbers[str(sub)]:
+        return True
+    shop_id = payload.get("shop_id")
+    return shop_id is not None and str(shop_id) in _shops and emitido <= _shops[str(shop_id)]
+
+
+def _apply(kind: str, value: str, revoked_at: datetime):
+    if kind == "jti":
+        _jtis.add(_jti_key(value))
+    else:
+        alvo = _barbers if kind == "barber" else _shops
+        alvo[value] = max(alvo.get(value, 0), issued_at(revoked_at))
+
+
+def refresh(now: datetime | None = None) -> int:
+    """Lê as revogações novas (ou todas as válidas, na primeira vez). Devolve quantas leu."""
+    now = now or datetime.utcnow()
+    with _lock:
+        consulta = select(revocations.c.kind, revocations.c.value, revocations.c.revoked_at)
+        if _state["loaded"]:
+            consulta = consulta.where(revocations.c.revoked_at >= _state["watermark"] - SESSION_REFRESH_OVERLAP)
+        else:
+            consulta = consulta.where(revocations.c.expires_at > now)
+        with engine.connect() as conn:
+            linhas = conn.execute(consulta).all()
+        for kind, value, revoked_at in linhas:
+            _apply(kind, value, revoked_at)
+        _state.update(loaded=True, watermark=now)
+    return len(linhas)
+
+
+def purge_expired(now: datetime | None = None) -> int:
+    """Apaga do banco (e da memória) as revogações de tokens que já expiraram de qualquer forma."""
+    now = now or datetime.utcnow()
+    with engine.begin() as conn:
+        apagadas = conn.execute(delete(revocations).where(revocations.c.expires_at <= now)).rowcount
+    limite = issued_at(now - SESSION_LIFETIME)
+    with _lock:
+        for alvo in (_barbers, _shops):
+            for chave in [k for k, v in alvo.items() if v < limite]:
+                del alvo[chave]
+        _state["last_purge"] = now
+    # Os jti expirados saem da memória no próximo arranque (o set não guarda a validade)
+    return apagadas
+
+
+# ==========================================
+# REVOGAÇÃO
+# ==========================================
+
+def revoke(db, kind: str, value, revoked_by: str | None = None, expires_at: datetime | None = None):
+    """Grava a revogação (sem commit). Neste worker ela vale a partir do commit da sessão."""
+    agora = datetime.utcnow()
+    db.execute(insert(revocations).values(
+        kind=kind, value=str(value), revoked_at=agora, revoked_by=revoked_by,
+        expires_at=expires_at or agora + SESSION_LIFETIME,
+    ))
+    db.info.setdefault("_revocations", []).append((kind, str(value), agora))
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_committed(session):
+    """As revogações da transação entram na memória só depois do commit."""
+    pendentes = session.info.pop("_revocations", None)
+    if pendentes:
+        with _lock:
+            for kind, value, revoked_at in pendentes:
+                _apply(kind, value, revoked_at)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rolled_back(session):
+    # Commit falhou (ou rollback): a revogação não existe no banco, não pode existir na memória
+    session.info.pop("_revocations", None)
+
+
+def revoke_token(db, payload: dict, revoked_by: str | None = None) -> bool:
+    """Logout: revoga o token do próprio pedido até ele expirar. False se o token não tem jti."""
+    if not payload.get("jti"):
+        return False
+    expira = datetime.utcfromtimestamp(payload["exp"]) if payload.get("exp") else None
+    revoke(db, "jti", payload["jti"], revoked_by, expira)
+    return True
+
+
+def revoke_barber(db, barber_id: int, revoked_by: str | None = None):
+    revoke(db, "barber", barber_id, revoked_by)
+
+
+def revoke_shop(db, shop_id: int, revoked_by: str | None = None):
+    revoke(db, "shop", shop_id, revoked_by)
+
+
+# ==========================================
+# TAREFA DE FUNDO
+# ==========================================
+
+async def session_loop(interval: int = SESSION_REFRESH_SECONDS):
+    """Mantém a memória em dia com as revogações feitas nos outros workers."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(refresh)
+            ultima = _state["last_purge"]
+            if ultima is None or datetime.utcnow() - ultima >= SESSION_PURGE_INTERVAL:
+                await asyncio.to_thread(purge_expired)
+        except Exception:
+            logger.exception("Atualização das revogações de sessão falhou")
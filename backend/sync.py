@@ -0,0 +1,142 @@
+"""Sincronização incremental para os tablets da loja (caixa, agenda, equipa).
+
+    GET /admin/<loja>/sync                   # primeira vez: tudo
+    GET /admin/<loja>/sync?since=<version>   # depois: só o que mudou desde então
+
+A resposta traz um `version` novo, que o tablet guarda e manda no pedido seguinte:
+
+    {"version": 1760870000000, "full": false,
+     "appointments": {"columns": ["id", "barber_id", ...], "rows": [[812, 3, ...], ...]},
+     "products": {...}, "services": {...}, "barbers": {...},
+     "deleted": {"products": [17], "services": [], ...}}
+
+As linhas vão como listas (os nomes das colunas uma vez só) e o tablet faz upsert por ID.
+Com "full": true o tablet troca tudo o que tem pelo que veio (primeira vez, ou `since` mais
+antigo do que os apagados que ainda guardamos).
+
+A versão é o updated_at (em ms) de cada linha, mantido pelo default/onupdate das colunas
+(ORM e update() do Core). Como a hora vem de cada worker e as transações fazem commit fora
+de ordem, cada leitura volta SYNC_OVERLAP para trás: o tablet pode receber de novo uma linha
+que já tinha (o upsert resolve), mas não perde nenhuma.
+
+Os apagados (db.delete de um produto, serviço, barbeiro ou agendamento) ficam em
+sync_tombstones durante SYNC_TOMBSTONE_DAYS, gravados na mesma transação do delete.
+"""
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import delete, event, func, select
+from sqlalchemy.orm import Session
+
+from models import Appointment, Barber, Product, Service, SyncTombstone
+
+# Quanto cada leitura volta para trás (commits fora de ordem, relógios dos workers)
+SYNC_OVERLAP = timedelta(seconds=30)
+# Agendamentos sincronizados: da semana passada em diante (o resto é histórico, não é caixa)
+SYNC_PAST_DAYS = 7
+# Quanto tempo os apagados ficam guardados; um `since` mais antigo recebe tudo de novo
+SYNC_TOMBSTONE_DAYS = 30
+
+SYNC_ENTITIES = {
+    "appointments": (Appointment, ["id", "barber_id", "service_id", "client_id", "client_name", "client_phone",
+                                   "date_time", "end_time", "duration", "status", "service_price",
+                                   "product_id", "quantity", "seller_id", "updated_at"]),
+    "products": (Product, ["id", "name", "description", "price", "cost_price", "stock_quantity", "updated_at"]),
+    "services": (Service, ["id", "name", "price", "duration", "updated_at"]),
+    "barbers": (Barber, ["id", "name", "role", "email", "profile_image_url", "is_active", "updated_at"]),
+}
+_ENTITY_BY_MODEL = {model: nome for nome, (model, _) in SYNC_ENTITIES.items()}
+
+tombstones = SyncTombstone.__table__
+
+
+def to_version(dt: datetime) -> int:
+    return int(dt.timestamp() * 1000)
+
+
+def from_version(version: int) -> datetime:
+    return datetime.fromtimestamp(version / 1000)
+
+
+def _value(v):
+    return v.isoformat() if isinstance(v, (datetime, date)) else v
+
+
+# ==========================================
+# LEITURA
+# ==========================================
+
+def changes(db: Session, shop_id: int, since: int | None = None, barber_id: int | None = None,
+            include_pins: bool = False, now: datetime | None = None) -> dict:
+    """O que mudou na loja desde `since` (None = tudo). `barber_id` limita a agenda a um barbeiro."""
+    # A versão nova é a hora ANTES das leituras: o que mudar durante elas vem no próximo pedido
+    now = now or datetime.now()
+    full = not since or since < 0 or from_version(since) < now - timedelta(days=SYNC_TOMBSTONE_DAYS)
+    desde = None if full else from_version(since) - SYNC_OVERLAP
+    inicio_agenda = datetime.combine(now.date() - timedelta(days=SYNC_PAST_DAYS), datetime.min.time())
+
+    resposta = {"version": to_version(now), "full": full}
+    for nome, (model, colunas) in SYNC_ENTITIES.items():
+        if model is Barber and include_pins:
+            colunas = colunas + ["pin"]
+        tabela = model.__table__
+        consulta = select(*[tabela.c[c] for c in colunas]).where(tabela.c.barbershop_id == shop_id)
+        if desde is not None:
+            consulta = consulta.where(tabela.c.updated_at >= desde)
+        if model is Appointment:
+            # O filtro por data deixa o Postgres ler só as partições recentes
+            consulta = consulta.where(tabela.c.date_time >= inicio_agenda)
+            if barber_id is not None:
+                consulta = consulta.where(tabela.c.barber_id == barber_id)
+        linhas = db.execute(consulta.order_by(tabela.c.id)).all()
+        resposta[nome] = {"columns": colunas, "rows": [[_value(v) for v in linha] for linha in linhas]}
+
+    resposta["deleted"] = {nome: [] for nome in SYNC_ENTITIES}
+    if desde is not None:
+        for entity, entity_id in db.execute(
+            select(tombstones.c.entity, tombstones.c.entity_id)
+            .where(tombstones.c.barbershop_id == shop_id, tombstones.c.deleted_at >= desde)
+        ):
+            resposta["deleted"].setdefault(entity, []).append(entity_id)
+    return resposta
+
+
+def data_version(db: Session, shop_id: int, *entities: str) -> tuple:
+    """Versão barata dos dados da loja: o updated_at mais recente de cada entidade e o último apagado.
+
+    Uma query (MAX nos índices (barbershop_id, updated_at) e (barbershop_id, deleted_at)) que muda
+    a cada escrita, feita por qualquer worker. Os caches por processo (analytics.py, inventory.py)
+    guardam-na junto com o valor e recalculam quando ela muda.
+    """
+    colunas = [
+        select(func.max(SYNC_ENTITIES[nome][0].updated_at))
+        .where(SYNC_ENTITIES[nome][0].barbershop_id == shop_id).scalar_subquery()
+        for nome in entities
+    ]
+    colunas.append(
+        select(func.max(tombstones.c.deleted_at))
+        .where(tombstones.c.barbershop_id == shop_id, tombstones.c.entity.in_(entities)).scalar_subquery()
+    )
+    return tuple(db.execute(select(*colunas)).one())
+
+
+# ==========================================
+# APAGADOS (TOMBSTONES)
+# ==========================================
+
+@event.listens_for(Session, "before_flush")
+def _record_deletions(session, flush_context, instances):
+    """Cada db.delete() de um modelo sincronizado deixa um tombstone na mesma transação."""
+    apagados = [obj for obj in session.deleted if type(obj) in _ENTITY_BY_MODEL and obj.barbershop_id is not None]
+    if not apagados:
+        return
+    agora = datetime.now()
+    conn = session.connection()
+    conn.execute(tombstones.insert(), [
+        {"barbershop_id": obj.barbershop_id, "entity": _ENTITY_BY_MODEL[type(obj)], "entity_id": obj.id, "deleted_at": agora}
+        for obj in apagados
+    ])
+    # Limpeza dos antigos da loja (apagar é raro; não precisa de tarefa de fundo)
+    conn.execute(delete(tombstones).where(
+        tombstones.c.barbershop_id.in_({obj.barbershop_id for obj in apagados}),
+        tombstones.c.deleted_at < agora - timedelta(days=SYNC_TOMBSTONE_DAYS),
+    ))
@@ -0,0 +1,115 @@
+"""Visão geral das barbearias (tenants) para o painel do SuperAdmin."""
+from datetime import datetime, timedelta
+
+from sqlalchemy import case, func, or_, select, union_all
+from sqlalchemy.orm import Session
+
+from models import Appointment, AppointmentArchive, Barber, Barbershop
+
+OVERVIEW_WINDOW_DAYS = 30
+OVERVIEW_MAX_PAGE_SIZE = 200
+
+# Campos da loja que podem sair na API (nunca o password_hash)
+SHOP_PUBLIC_FIELDS = ["id", "name", "slug", "owner_email", "description", "address", "logo_url",
+                      "open_time", "close_time", "interval_start", "interval_end"]
+
+OVERVIEW_SORTS = {
+    "name": lambda c: (c["name"].asc(), c["id"].asc()),
+    "revenue": lambda c: (c["revenue_30d"].desc(), c["id"].asc()),
+    "appointments": lambda c: (c["appointments_30d"].desc(), c["id"].asc()),
+    "barbers": lambda c: (c["barbers"].desc(), c["id"].asc()),
+    # Lojas sem atividade nenhuma vão para o fim
+    "last_activity": lambda c: (c["last_activity"].desc().nulls_last(), c["id"].asc()),
+}
+
+
+def shop_public(shop: Barbershop) -> dict:
+    return {campo: getattr(shop, campo) for campo in SHOP_PUBLIC_FIELDS}
+
+
+def tenant_overview(db: Session, page: int = 1, page_size: int = 50, search: str | None = None,
+                    sort: str = "name", now: datetime | None = None) -> dict:
+    """Uma página de lojas com os totais dos últimos 30 dias, tudo num único SELECT.
+
+    Os agendamentos entram agregados por loja (GROUP BY numa janela de 30 dias, que o índice
+    por data e as partições mensais mantêm barata); a última atividade é o maior de dois MAX
+    por loja, um na tabela quente e outro no arquivo (uma loja só com histórico arquivado
+    também teve atividade), que os índices (barbershop_id, date_time) resolvem sem varrer
+    o histórico.
+    """
+    now = now or datetime.now()
+    desde = now - timedelta(days=OVERVIEW_WINDOW_DAYS)
+    ap = Appointment.__table__
+
+    recentes = (
+        select(
+            ap.c.barbershop_id,
+            func.count().filter(ap.c.status != "cancelado").label("appointments"),
+            func.sum(case((ap.c.status == "concluido", ap.c.service_price), else_=0.0)).label("revenue"),
+        )
+        .where(ap.c.date_time >= desde, ap.c.date_time <= now)
+        .group_by(ap.c.barbershop_id)
+        .subquery()
+    )
+    equipe = (
+        select(Barber.barbershop_id, func.count().label("barbers"))
+        .where(Barber.is_active.isnot(False))
+        .group_by(Barber.barbershop_id)
+        .subquery()
+    )
+    maximos = union_all(*[
+        select(func.max(tabela.c.date_time).label("date_time"))
+        .where(tabela.c.barbershop_id == Barbershop.id, tabela.c.date_time <= now)
+        .correlate(Barbershop)
+        for tabela in (ap, AppointmentArchive.__table__)
+    ]).subquery()
+    ultima_atividade = select(func.max(maximos.c.date_time)).correlate(Barbershop).scalar_subquery()
+
+    colunas = {
+        "id": Barbershop.id,
+        "name": Barbershop.name,
+        "slug": Barbershop.slug,
+        "owner_email": Barbershop.owner_email,
+        "barbers": func.coalesce(equipe.c.barbers, 0),
+        "appointments_30d": func.coalesce(recentes.c.appointments, 0),
+        "revenue_30d": func.coalesce(recentes.c.revenue, 0.0),
+        "last_activity": ultima_atividade,
+    }
+    rotulos = {nome: expr.label(nome) for nome, expr in colunas.items()}
+
+    filtros = []
+    if search:
+        termo = f"%{search.strip()}%"
+        filtros.append(or_(Barbershop.name.ilike(termo), Barbershop.slug.ilike(termo),
+                           Barbershop.owner_email.ilike(termo)))
+
+    stmt = (
+        select(*rotulos.values(), func.count().over().label("total"))
+        .outerjoin(recentes, recentes.c.barbershop_id == Barbershop.id)
+        .outerjoin(equipe, equipe.c.barbershop_id == Barbershop.id)
+        .where(*filtros)
+    )
+    stmt = stmt.order_by(*OVERVIEW_SORTS[sort](rotulos)).limit(page_size).offset((page - 1) * page_size)
+    linhas = db.execute(stmt).mappings().all()
+
+    if linhas:
+        total = linhas[0]["total"]
+    else:
+        # Página depois do fim: o total vem de uma contagem simples
+        total = db.execute(select(func.count()).select_from(Barbershop).where(*filtros)).scalar()
+
+    items = []
+    for row in linhas:
+        item = {nome: row[nome] for nome in colunas}
+        item["revenue_30d"] = float(item["revenue_30d"] or 0.0)
+        item["last_activity"] = item["last_activity"].isoformat() if item["last_activity"] else None
+        items.append(item)
+
+    return {
+        "items": items,
+        "page": page,
+        "page_size": page_size,
+        "total": total,
+        "pages": -(-total // page_size) if total else 0,
+        "window_days": OVERVIEW_WINDOW_DAYS,
+    }
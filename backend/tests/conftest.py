@@ -0,0 +1,182 @@
+"""Fixtures dos testes do backend (python -m pytest -q, a partir da pasta backend/).
+
+Os testes correm contra um SQLite temporário, com o schema das migrações. O banco e o
+resto da configuração vêm das variáveis de ambiente, por isso são definidos aqui, antes
+de qualquer teste importar a app.
+
+    app            a app FastAPI (sem lifespan: nenhuma tarefa de fundo corre)
+    client         TestClient da app
+    seeded_shop    uma loja grande (dezenas de barbeiros, centenas de atendimentos), para um
+                   N+1 aparecer como falha e não só como lentidão; devolve o contexto
+                   (IDs, datas e tokens) que os testes usam
+    query_counter  conta, pelos eventos do engine do SQLAlchemy, os comandos SQL de um bloco
+"""
+import os
+import tempfile
+import warnings
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+
+TEST_DIR = tempfile.mkdtemp(prefix="barbearia_tests_")
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{TEST_DIR}/test.db",
+    "DB_KEEPALIVE_INTERVAL": "0",
+    "LOG_LEVEL": os.getenv("LOG_LEVEL", "WARNING"),
+    "PROFILE_DIR": os.path.join(TEST_DIR, "profiles"),
+    "SUPERADMIN_EMAIL": "ceo@saas", "SUPERADMIN_PASSWORD": "super",
+    "EMAIL_SENDER": "relatorios@saas", "EMAIL_PASSWORD": "x",
+})
+for var in ["N8N_WEBHOOK_URL", "N8N_WHATSAPP_WEBHOOK", "DATABASE_REPLICA_URL"]:
+    os.environ.pop(var, None)
+
+# Tamanho da loja semeada (os orçamentos de queries valem para este tamanho ou maior)
+SEED_BARBERS = 25
+SEED_SERVICES = 10
+SEED_APPOINTMENTS_PER_BARBER_TODAY = 8
+SEED_APPOINTMENTS_PER_BARBER_MONTH = 40
+SEED_PRODUCTS = 15
+
+
+@pytest.fixture(scope="session")
+def app():
+    warnings.filterwarnings("ignore")
+    cwd = os.getcwd()
+    os.chdir(TEST_DIR)  # uploads/ dos testes ficam na pasta temporária
+    import main
+    import migrations
+
+    migrations.upgrade()
+    # O SMTP é externo: aqui só interessa o SQL do fechamento
+    main.send_email = lambda *a, **k: None
+    yield main.app
+    os.chdir(cwd)
+
+
+@pytest.fixture(scope="session")
+def client(app):
+    from fastapi.testclient import TestClient
+
+    return TestClient(app)
+
+
+def auth_headers(token: str) -> dict:
+    return {"Authorization": f"Bearer {token}"}
+
+
+# ==========================================
+# CONTADOR DE QUERIES
+# ==========================================
+
+class QueryCounter:
+    """Conta os comandos SQL executados dentro de `with contador:`."""
+
+    def __init__(self):
+        self.count = 0
+        self.statements: list[str] = []
+        self._active = False
+
+    def __enter__(self):
+        self.count = 0
+        self.statements = []
+        self._active = True
+        return self
+
+    def __exit__(self, *exc):
+        self._active = False
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if self._active:
+            self.count += 1
+            self.statements.append(statement)
+
+    def report(self) -> str:
+        return "\n".join(f"  {i}. {' '.join(s.split())[:200]}" for i, s in enumerate(self.statements, 1))
+
+
+@pytest.fixture
+def query_counter(app):
+    from database import engine
+
+    contador = QueryCounter()
+    event.listen(engine, "before_cursor_execute", contador._on_execute)
+    yield contador
+    event.remove(engine, "before_cursor_execute", contador._on_execute)
+
+
+# ==========================================
+# LOJA SEMEADA
+# ==========================================
+
+@pytest.fixture(scope="session")
+def seeded_shop(app) -> dict:
+    from sqlalchemy import insert
+    from auth import create_access_token, hash_password
+    from availability import backfill_end_times
+    from clients import backfill_clients
+    from database import engine
+    from models import Appointment, Barber, Barbershop, Product, Service
+
+    agora = datetime.now()
+    hoje = agora.replace(hour=0, minute=0, second=0, microsecond=0)
+    with engine.begin() as conn:
+        shop_id = conn.execute(insert(Barbershop).values(
+            name="Loja Grande", slug="loja-grande", owner_email="dono@loja", password_hash=hash_password("senha"),
+        )).inserted_primary_key[0]
+        other_shop_id = conn.execute(insert(Barbershop).values(name="Outra", slug="outra", owner_email="outra@loja")).inserted_primary_key[0]
+
+        barbeiros = [conn.execute(insert(Barber).values(
+            name=f"Barbeiro {i}", role="OWNER" if i == 0 else "BARBER", pin=str(1000 + i), barbershop_id=shop_id,
+        )).inserted_primary_key[0] for i in range(SEED_BARBERS)]
+        spare_barber_id = conn.execute(insert(Barber).values(name="Sobra", pin="9999", barbershop_id=shop_id)).inserted_primary_key[0]
+
+        servicos = [conn.execute(insert(Service).values(
+            name=f"Serviço {i}", price=20 + i, duration=15 + 5 * (i % 4), barbershop_id=shop_id,
+        )).inserted_primary_key[0] for i in range(SEED_SERVICES)]
+        spare_service_id = conn.execute(insert(Service).values(name="Sobra", price=1, duration=5, barbershop_id=shop_id)).inserted_primary_key[0]
+
+        produtos = [conn.execute(insert(Product).values(
+            name=f"Produto {i}", price=10 + i, stock_quantity=50, barbershop_id=shop_id,
+        )).inserted_primary_key[0] for i in range(SEED_PRODUCTS)]
+
+        linhas = []
+        for n, barber_id in enumerate(barbeiros):
+            for i in range(SEED_APPOINTMENTS_PER_BARBER_TODAY):
+                linhas.append({"date_time": hoje + timedelta(hours=9, minutes=45 * i), "barber_id": barber_id,
+                               "service_id": servicos[(n + i) % SEED_SERVICES], "status": "scheduled",
+                               "client_phone": f"(11) 9{i % 5:04d}-{n:04d}"})
+            for i in range(SEED_APPOINTMENTS_PER_BARBER_MONTH):
+                linhas.append({"date_time": hoje - timedelta(days=1 + i % 20, hours=-10 - i % 8), "barber_id": barber_id,
+                               "service_id": servicos[i % SEED_SERVICES], "status": "concluido",
+                               "client_phone": f"(11) 9{i % 5:04d}-{n:04d}"})
+        conn.execute(insert(Appointment), [
+            {**linha, "client_name": "Cliente", "barbershop_id": shop_id, "service_price": 30.0}
+            for linha in linhas
+        ])
+        backfill_clients(conn)
+        backfill_end_times(conn, Appointment.__table__)
+        client_id = conn.exec_driver_sql("SELECT MIN(id) FROM clients").scalar()
+        ids = [r[0] for r in conn.exec_driver_sql(
+            "SELECT id FROM appointments WHERE status = 'scheduled' ORDER BY id LIMIT 14"
+        )]
+
+    owner_id = barbeiros[0]
+    return {
+        "shop_id": shop_id, "other_shop_id": other_shop_id, "slug": "loja-grande",
+        "owner_id": owner_id, "barber_id": barbeiros[1], "spare_barber_id": spare_barber_id,
+        "service_id": servicos[0], "spare_service_id": spare_service_id,
+        "product_id": produtos[0], "spare_product_id": produtos[-1],
+        "scheduled_id": ids[0], "conclude_id": ids[1], "client_id": client_id,
+        # Lote: 10 para concluir, 1 para cancelar (+ um ID que não existe), 1 para remarcar
+        "bulk_ids": ids[2:12], "bulk_cancel_id": ids[12], "bulk_move_id": ids[13],
+        "today": hoje.date().isoformat(), "yesterday": (hoje - timedelta(days=1)).date().isoformat(),
+        "tomorrow": (hoje + timedelta(days=1)).date().isoformat(),
+        "sync_since": int((agora - timedelta(minutes=5)).timestamp() * 1000), "month_start": hoje.replace(day=1).date().isoformat(),
+        "tokens": {
+            "owner": create_access_token({"sub": str(owner_id), "role": "OWNER", "shop_id": shop_id}),
+            "super": create_access_token({"sub": "ceo", "role": "SUPERADMIN"}),
+            # Token descartável: o logout revoga-o
+            "logout": create_access_token({"sub": str(owner_id), "role": "OWNER", "shop_id": shop_id}),
+        },
+    }
@@ -0,0 +1,155 @@
+"""Séries de faturamento (analytics.py): o GROUP BY no banco e o cache por balde batem com uma soma ingénua."""
+import random
+from datetime import date, datetime, timedelta
+
+import pytest
+from sqlalchemy import insert, update
+
+PERIOD_DAYS = 75
+
+
+@pytest.fixture(scope="module")
+def revenue_shop(app):
+    """Loja com 75 dias de atendimentos concluídos (e alguns cancelados), mais as linhas para a soma ingénua."""
+    from database import engine
+    from models import Appointment, Barber, Barbershop, Service
+
+    aleatorio = random.Random(7)
+    hoje = date.today()
+    with engine.begin() as conn:
+        shop_id = conn.execute(insert(Barbershop).values(name="Analises", slug="analises")).inserted_primary_key[0]
+        barbeiros = [conn.execute(insert(Barber).values(name=f"A{i}", pin=f"6{i:03d}", barbershop_id=shop_id)).inserted_primary_key[0]
+                     for i in range(3)]
+        servicos = [(conn.execute(insert(Service).values(name=f"S{i}", price=20 + 5 * i, duration=30, barbershop_id=shop_id)).inserted_primary_key[0], 20.0 + 5 * i)
+                    for i in range(3)]
+        linhas = []
+        for d in range(PERIOD_DAYS + 1):
+            dia = datetime.combine(hoje - timedelta(days=d), datetime.min.time())
+            for _ in range(aleatorio.randint(0, 6)):
+                quando = dia + timedelta(minutes=aleatorio.randint(540, 1140))
+                sorteio = aleatorio.random()
+                if sorteio < 0.1:
+                    linha = {"client_name": "🛍️ Produto: Gel", "barber_id": None, "service_id": None, "service_price": 35.0}
+                elif sorteio < 0.2:
+                    linha = {"client_name": "Balcão", "barber_id": None, "service_id": None, "service_price": 12.5}
+                else:
+                    sid, preco = aleatorio.choice(servicos)
+                    linha = {"client_name": "Cliente", "barber_id": aleatorio.choice(barbeiros), "service_id": sid, "service_price": preco}
+                status = "cancelado" if aleatorio.random() < 0.1 else "concluido"
+                linhas.append({**linha, "date_time": quando, "status": status, "barbershop_id": shop_id})
+        conn.execute(insert(Appointment), linhas)
+    return {"shop_id": shop_id, "rows": [l for l in linhas if l["status"] == "concluido"]}
+
+
+def _naive(rows, start: date, end: date, bucket: str, group_by: str) -> dict:
+    """{(balde, chave): (faturamento, quantidade)} somando linha a linha em Python."""
+    from analytics import bucket_start
+    from exports import classify_kind
+
+    somas = {}
+    for row in rows:
+        dia = row["date_time"].date()
+        if not start <= dia <= end:
+            continue
+        chave = {
+            "none": "total",
+            "barber": row["barber_id"],
+            "service": row["service_id"],
+            "kind": classify_kind(row["client_name"], row["service_id"]),
+        }[group_by]
+        total, qtd = somas.get((bucket_start(dia, bucket), chave), (0.0, 0))
+        somas[(bucket_start(dia, bucket), chave)] = (total + row["service_price"], qtd + 1)
+    return somas
+
+
+def _flatten(serie: dict) -> dict:
+    return {
+        (date.fromisoformat(balde), s["key"]): (s["revenue"][i], s["count"][i])
+        for s in serie["series"] for i, balde in enumerate(serie["buckets"]) if s["count"][i]
+    }
+
+
+@pytest.mark.parametrize("bucket", ["day", "week", "month"])
+@pytest.mark.parametrize("group_by", ["none", "barber", "service", "kind"])
+def test_series_match_a_naive_sum_before_and_after_the_cache(revenue_shop, bucket, group_by):
+    import analytics
+    from database import SessionLocal
+
+    fim = date.today()
+    # Começa a meio de uma semana/mês: os baldes das pontas são recortados ao período
+    inicio = fim - timedelta(days=PERIOD_DAYS - 3)
+    esperado = _naive(revenue_shop["rows"], inicio, fim, bucket, group_by)
+
+    db = SessionLocal()
+    try:
+        analytics.invalidate(revenue_shop["shop_id"])
+        frio = analytics.revenue_series(db, revenue_shop["shop_id"], inicio, fim, bucket, group_by)
+        assert _flatten(frio) == pytest.approx(esperado)
+        assert frio["totals"]["count"] == sum(qtd for _, qtd in esperado.values())
+
+        assert any(k[0] == revenue_shop["shop_id"] for k in analytics._cache)
+        assert analytics.revenue_series(db, revenue_shop["shop_id"], inicio, fim, bucket, group_by) == frio
+    finally:
+        db.close()
+
+
+def _closed_month_window() -> tuple[date, date, datetime]:
+    """(início, fim, hora num mês inteiro e já encerrado): o balde desse mês fica em cache."""
+    fim = date.today()
+    inicio = (fim.replace(day=1) - timedelta(days=1)).replace(day=1)
+    inicio = (inicio - timedelta(days=1)).replace(day=1)
+    return inicio, fim, datetime.combine(inicio + timedelta(days=1), datetime.min.time()) + timedelta(hours=12)
+
+
+def test_write_from_another_worker_reaches_cached_buckets(revenue_shop):
+    """Sem invalidate() (a escrita foi noutro worker): a versão dos agendamentos muda e o balde é refeito."""
+    import analytics
+    from database import SessionLocal, engine
+    from models import Appointment
+
+    inicio, fim, atrasado = _closed_month_window()
+    shop_id = revenue_shop["shop_id"]
+    db = SessionLocal()
+    try:
+        antes = analytics.revenue_series(db, shop_id, inicio, fim, "month", "none")["totals"]
+        assert (shop_id, "month", "none", inicio) in analytics._cache
+
+        # Concluído com atraso num mês já encerrado (em cache)
+        with engine.begin() as conn:
+            novo_id = conn.execute(insert(Appointment).values(
+                client_name="Atrasado", date_time=atrasado, status="concluido", service_price=100.0, barbershop_id=shop_id,
+            )).inserted_primary_key[0]
+        depois = analytics.revenue_series(db, shop_id, inicio, fim, "month", "none")["totals"]
+        assert depois == {"revenue": antes["revenue"] + 100.0, "count": antes["count"] + 1}
+
+        # ...e cancelado logo depois (o onupdate do updated_at vale para o update() do Core)
+        with engine.begin() as conn:
+            conn.execute(update(Appointment).where(Appointment.id == novo_id).values(status="cancelado"))
+        assert analytics.revenue_series(db, shop_id, inicio, fim, "month", "none")["totals"] == antes
+    finally:
+        db.close()
+
+
+def test_ttl_bounds_writes_the_version_misses(revenue_shop, monkeypatch):
+    """Um commit fora de ordem (updated_at mais antigo do que a versão) só aparece quando o TTL vence."""
+    import analytics
+    from database import SessionLocal, engine
+    from models import Appointment
+
+    inicio, fim, atrasado = _closed_month_window()
+    shop_id = revenue_shop["shop_id"]
+    db = SessionLocal()
+    try:
+        antes = analytics.revenue_series(db, shop_id, inicio, fim, "month", "none")["totals"]
+        with engine.begin() as conn:
+            conn.execute(insert(Appointment).values(
+                client_name="Fora de ordem", date_time=atrasado, status="concluido", service_price=7.0,
+                barbershop_id=shop_id, updated_at=datetime(2000, 1, 1),
+            ))
+        assert analytics.revenue_series(db, shop_id, inicio, fim, "month", "none")["totals"] == antes
+
+        monkeypatch.setattr(analytics, "ANALYTICS_CACHE_TTL", 0)
+        depois = analytics.revenue_series(db, shop_id, inicio, fim, "month", "none")["totals"]
+        assert depois == {"revenue": antes["revenue"] + 7.0, "count": antes["count"] + 1}
+    finally:
+        db.close()
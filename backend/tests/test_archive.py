@@ -0,0 +1,87 @@
+"""Arquivo do histórico antigo (archive.py): o job move as linhas e as rotas continuam a vê-las."""
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import func, insert, select
+
+from conftest import auth_headers
+
+
+@pytest.fixture(scope="module")
+def archived_shop(app):
+    """Loja com histórico de há mais de um ano, já passado pelo job de arquivo."""
+    import archive
+    from auth import create_access_token
+    from database import engine
+    from models import Appointment, Barber, Barbershop
+
+    antigo = archive.month_start(datetime.now() - timedelta(days=archive.ARCHIVE_HORIZON_DAYS + 35)) + timedelta(days=2, hours=10)
+    with engine.begin() as conn:
+        shop_id = conn.execute(insert(Barbershop).values(name="Arquivo", slug="arquivo")).inserted_primary_key[0]
+        owner_id = conn.execute(insert(Barber).values(
+            name="Dono", role="OWNER", pin="7000", barbershop_id=shop_id,
+        )).inserted_primary_key[0]
+        linhas = [("concluido", 30.0), ("concluido", 45.0), ("cancelado", 30.0), ("scheduled", 30.0)]
+        ids = [conn.execute(insert(Appointment).values(
+            client_name=f"Antigo {i}", date_time=antigo + timedelta(hours=i), status=status, service_price=preco,
+            barber_id=owner_id, barbershop_id=shop_id,
+        )).inserted_primary_key[0] for i, (status, preco) in enumerate(linhas)]
+        recente_id = conn.execute(insert(Appointment).values(
+            client_name="Recente", date_time=datetime.now() - timedelta(days=1), status="concluido",
+            service_price=20.0, barber_id=owner_id, barbershop_id=shop_id,
+        )).inserted_primary_key[0]
+
+    movidos = archive.archive_old_appointments()
+    token = create_access_token({"sub": str(owner_id), "role": "OWNER", "shop_id": shop_id})
+    return {"shop_id": shop_id, "ids": ids, "recent_id": recente_id, "moved": movidos,
+            "month": antigo.strftime("%Y-%m"), "day": antigo.date().isoformat(), "headers": auth_headers(token)}
+
+
+def _ids(tabela, shop_id):
+    from database import engine
+
+    with engine.connect() as conn:
+        return set(conn.execute(select(tabela.c.id).where(tabela.c.barbershop_id == shop_id)).scalars())
+
+
+def test_only_old_finished_appointments_are_moved(archived_shop):
+    from models import Appointment, AppointmentArchive
+
+    concluido, concluido_2, cancelado, agendado = archived_shop["ids"]
+    assert archived_shop["moved"] == 3
+    assert _ids(AppointmentArchive.__table__, archived_shop["shop_id"]) == {concluido, concluido_2, cancelado}
+    # O que ainda está agendado fica na tabela quente, mesmo antigo; o recente também
+    assert _ids(Appointment.__table__, archived_shop["shop_id"]) == {agendado, archived_shop["recent_id"]}
+
+
+def test_second_run_moves_nothing(archived_shop):
+    import archive
+    from database import engine
+    from models import AppointmentArchive
+
+    assert archive.archive_old_appointments() == 0
+    with engine.connect() as conn:
+        total = conn.execute(select(func.count()).select_from(AppointmentArchive.__table__)
+                             .where(AppointmentArchive.barbershop_id == archived_shop["shop_id"])).scalar()
+    assert total == 3
+
+
+def test_financeiro_of_an_archived_month_reads_the_archive(client, archived_shop):
+    resposta = client.get(f"/admin/{archived_shop['shop_id']}/financeiro", params={"mes": archived_shop["month"]},
+                          headers=archived_shop["headers"])
+    assert resposta.status_code == 200, resposta.text
+    assert resposta.json()["faturamento_total"] == 75.0
+    assert resposta.json()["total_cortes"] == 2
+
+    atual = client.get(f"/admin/{archived_shop['shop_id']}/financeiro", headers=archived_shop["headers"]).json()
+    if datetime.now().day > 1:  # no dia 1 o atendimento de ontem é do mês passado
+        assert atual["faturamento_total"] == 20.0
+
+
+def test_export_of_an_archived_period_includes_the_archive(client, archived_shop):
+    resposta = client.get(f"/admin/{archived_shop['shop_id']}/export", headers=archived_shop["headers"],
+                          params={"start": archived_shop["day"], "end": archived_shop["day"], "format": "ndjson"})
+    assert resposta.status_code == 200, resposta.text
+    exportados = [json.loads(linha)["id"] for linha in resposta.text.splitlines() if linha]
+    assert exportados == sorted(archived_shop["ids"])
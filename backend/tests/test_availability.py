@@ -0,0 +1,24 @@
+"""Busca dos primeiros horários livres (GET /barbershops/{slug}/next-available)."""
+
+
+def test_next_available_returns_slots_for_a_service_of_the_shop(client, seeded_shop):
+    resposta = client.get(f"/barbershops/{seeded_shop['slug']}/next-available",
+                          params={"service_id": seeded_shop["service_id"], "days": 7, "limit": 3})
+    assert resposta.status_code == 200
+    assert 0 < len(resposta.json()) <= 3
+
+
+def test_next_available_rejects_unknown_or_foreign_service(client, seeded_shop):
+    from models import Service
+    from database import SessionLocal
+
+    with SessionLocal() as db:
+        de_outra_loja = Service(name="Corte", price=30, duration=30, barbershop_id=seeded_shop["other_shop_id"])
+        db.add(de_outra_loja)
+        db.commit()
+        outro_id = de_outra_loja.id
+
+    for service_id in (outro_id, 999_999):
+        resposta = client.get(f"/barbershops/{seeded_shop['slug']}/next-available", params={"service_id": service_id})
+        assert resposta.status_code == 404
+        assert resposta.json()["detail"] == "Serviço não encontrado"
@@ -0,0 +1,65 @@
+"""Agendador do fechamento automático (closes.py): quais lojas já passaram da hora de fecho."""
+from datetime import datetime, time
+
+import pytest
+from sqlalchemy import insert
+
+
+@pytest.mark.parametrize("valor, hora", [
+    ("19:00", time(19, 0)),
+    ("9:00", time(9, 0)),
+    (" 09:30 ", time(9, 30)),
+    ("24:00", time.max),
+    (None, time(19, 0)),
+    ("", time(19, 0)),
+    ("fechado", time(19, 0)),
+])
+def test_close_hour(valor, hora):
+    from closes import close_hour
+
+    assert close_hour(valor) == hora
+
+
+@pytest.fixture(scope="module")
+def closing_shops(app):
+    from database import engine
+    from models import Barbershop
+
+    with engine.begin() as conn:
+        return {
+            valor: conn.execute(insert(Barbershop).values(name=f"Fecho {valor}", close_time=valor)).inserted_primary_key[0]
+            for valor in ["9:00", "19:30", None]
+        }
+
+
+def _due(closing_shops, hora: str) -> set:
+    from closes import due_shops
+    from database import SessionLocal
+
+    agora = datetime.combine(datetime.today(), time.fromisoformat(hora))
+    db = SessionLocal()
+    try:
+        devidas = {loja.id for loja in due_shops(db, agora)}
+    finally:
+        db.close()
+    return {valor for valor, shop_id in closing_shops.items() if shop_id in devidas}
+
+
+def test_due_shops_compares_hours_not_text(closing_shops):
+    # Como texto, "9:00" <= "10:00" é falso: a loja das 9h nunca fecharia
+    assert _due(closing_shops, "08:59") == set()
+    assert _due(closing_shops, "10:00") == {"9:00"}
+    assert _due(closing_shops, "19:00") == {"9:00", None}
+    assert _due(closing_shops, "19:45") == {"9:00", "19:30", None}
+
+
+def test_shop_already_closed_today_is_not_due(closing_shops):
+    from closes import write_close
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        write_close(db, closing_shops["9:00"], datetime.today().date(), "auto")
+    finally:
+        db.close()
+    assert _due(closing_shops, "19:45") == {"19:30", None}
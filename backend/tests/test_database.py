@@ -0,0 +1,77 @@
+"""Aquecimento e keepalive do pool (database.py)."""
+from datetime import datetime
+
+import pytest
+
+
+@pytest.mark.parametrize("janela, hora, dentro", [
+    ("07:00-22:00", "06:59", False),
+    ("07:00-22:00", "07:00", True),
+    ("07:00-22:00", "21:59", True),
+    ("07:00-22:00", "22:00", False),
+    # Sem zero à esquerda: "7:00" não pode ser comparado como texto com "10:00"
+    ("7:00-22:00", "10:00", True),
+    ("7:00-9:30", "10:00", False),
+    # Passa da meia-noite
+    ("18:00-02:00", "23:30", True),
+    ("18:00-02:00", "01:59", True),
+    ("18:00-02:00", "02:00", False),
+    ("18:00-02:00", "12:00", False),
+    ("00:00-24:00", "23:59", True),
+])
+def test_keepalive_window(janela, hora, dentro):
+    from database import within_keepalive_hours
+
+    agora = datetime(2026, 10, 19, *map(int, hora.split(":")))
+    assert within_keepalive_hours(agora, janela) is dentro
+
+
+def test_warm_pool_leaves_connections_ready(app):
+    from database import engine, warm_pool
+
+    engine.dispose()
+    assert warm_pool(2) >= 0
+    # As duas ficam no pool, prontas para os primeiros pedidos
+    assert engine.pool.checkedin() >= 2
+
+
+def _run_keepalive(monkeypatch, voltas: int, dentro: bool, warm) -> dict:
+    """Corre `voltas` voltas do keepalive_loop sem esperar de verdade; devolve o pool_state."""
+    import asyncio
+    import database
+
+    chamadas = {"sleep": 0}
+
+    async def sleep(_):
+        chamadas["sleep"] += 1
+        if chamadas["sleep"] > voltas:
+            raise asyncio.CancelledError
+
+    monkeypatch.setattr(database.asyncio, "sleep", sleep)
+    monkeypatch.setattr(database, "within_keepalive_hours", lambda: dentro)
+    monkeypatch.setattr(database, "warm_pool", warm)
+    monkeypatch.setattr(database, "pool_state", dict(database.pool_state, last_keepalive_at=None, last_error=None))
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(database.keepalive_loop(240))
+    return database.pool_state
+
+
+def test_keepalive_touches_the_pool_inside_the_window(monkeypatch):
+    toques = []
+    estado = _run_keepalive(monkeypatch, 3, True, lambda: toques.append(1) or 1.5)
+    assert len(toques) == 3
+    assert estado["last_keepalive_ms"] == 1.5 and estado["last_keepalive_at"] is not None
+
+
+def test_keepalive_sleeps_outside_the_window(monkeypatch):
+    toques = []
+    estado = _run_keepalive(monkeypatch, 3, False, lambda: toques.append(1) or 1.5)
+    assert toques == [] and estado["last_keepalive_at"] is None
+
+
+def test_keepalive_survives_a_failed_ping(monkeypatch):
+    def falha():
+        raise OSError("compute suspenso")
+
+    estado = _run_keepalive(monkeypatch, 2, True, falha)
+    assert estado["last_error"] == "compute suspenso"
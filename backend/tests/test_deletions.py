@@ -0,0 +1,35 @@
+"""Remoção de lojas (deletions.py): o pedido tira a loja do ar antes de o job correr."""
+import pytest
+
+from conftest import auth_headers
+
+
+@pytest.fixture
+def doomed_shop(client, seeded_shop):
+    resposta = client.post("/superadmin/barbershops", headers=auth_headers(seeded_shop["tokens"]["super"]), json={
+        "name": "Quintaflor Barbearia", "slug": "quintaflor", "owner_email": "dono@quintaflor",
+        "password": "senha", "initial_pin": "8123",
+    })
+    assert resposta.status_code == 200, resposta.text
+    return resposta.json()["id"]
+
+
+def _listed(client) -> list[str]:
+    return [i["slug"] for i in client.get("/api/public/barbershops", params={"q": "quintaflor"}).json()["items"]]
+
+
+def test_deletion_request_takes_the_shop_out_of_the_directory(client, seeded_shop, doomed_shop):
+    import directory
+
+    assert _listed(client) == ["quintaflor"]
+    assert client.get("/api/public/barbershops/quintaflor").status_code == 200
+
+    resposta = client.delete(f"/super/barbershops/{doomed_shop}", headers=auth_headers(seeded_shop["tokens"]["super"]))
+    assert resposta.status_code == 202, resposta.text
+
+    assert _listed(client) == []
+    assert client.get("/api/public/barbershops/quintaflor").status_code == 404
+    # Um índice refeito a partir do banco (outro worker, ou depois do TTL) também não a traz de volta
+    with directory._lock:
+        directory._index = None
+    assert _listed(client) == []
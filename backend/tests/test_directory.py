@@ -0,0 +1,76 @@
+"""Busca do diretório público (directory.py): prefixos de nome, endereço e serviço, sem acentos."""
+import pytest
+
+from conftest import auth_headers
+
+LOJAS = [
+    # (nome, slug, endereço, serviços)
+    ("Zebrafina Barbearia", "zebrafina-barbearia", "Rua das Quixabeiras, Centro", ["Pigmentação", "Corte"]),
+    ("Zebrafina Studio", "zebrafina-studio", "Avenida Boa Viagem", ["Corte"]),
+    # Sem slug não tem página pública: fica fora do diretório
+    ("Zebrafina Escondida", None, "Rua das Quixabeiras", ["Pigmentação"]),
+]
+
+
+@pytest.fixture(scope="module")
+def directory_shops(app):
+    import directory
+    from database import SessionLocal
+    from models import Barbershop, Service
+
+    db = SessionLocal()
+    try:
+        ids = {}
+        for nome, slug, endereco, servicos in LOJAS:
+            shop = Barbershop(name=nome, slug=slug, address=endereco)
+            db.add(shop)
+            db.flush()
+            db.add_all([Service(name=s, price=30, duration=30, barbershop_id=shop.id) for s in servicos])
+            directory.refresh_shop(db, shop.id)
+            ids[nome] = shop.id
+        db.commit()
+    finally:
+        db.close()
+    return ids
+
+
+def _search(client, q, **params):
+    resposta = client.get("/api/public/barbershops", params={"q": q, **params})
+    assert resposta.status_code == 200, resposta.text
+    return resposta.json()
+
+
+@pytest.mark.parametrize("busca, esperado", [
+    ("zebraf", ["Zebrafina Barbearia", "Zebrafina Studio"]),
+    ("Zebrafina quixab", ["Zebrafina Barbearia"]),      # endereço
+    ("zebrafina pigment", ["Zebrafina Barbearia"]),     # serviço
+    ("ZEBRAFÍNA PIGMENTAÇÃO", ["Zebrafina Barbearia"]),  # maiúsculas e acentos
+    ("zebrafina viagem", ["Zebrafina Studio"]),
+    ("zebrafina barbearia studio", []),                 # todas as palavras têm de aparecer
+    ("afina", []),                                      # só o início das palavras
+])
+def test_search_matches_word_prefixes(client, directory_shops, busca, esperado):
+    resultado = _search(client, busca)
+    assert [i["name"] for i in resultado["items"]] == esperado
+    assert resultado["total"] == len(esperado)
+
+
+def test_short_tokens_are_ignored(client, directory_shops):
+    assert _search(client, "z")["total"] == 0
+    assert _search(client, "z zebrafina s")["total"] == 2
+
+
+def test_pagination(client, directory_shops):
+    segunda = _search(client, "zebrafina", page=2, page_size=1)
+    assert [i["name"] for i in segunda["items"]] == ["Zebrafina Studio"]
+    assert (segunda["total"], segunda["pages"]) == (2, 2)
+    assert client.get("/api/public/barbershops", params={"q": "zebrafina", "page_size": 0}).status_code == 400
+
+
+def test_new_service_is_searchable_right_away(client, seeded_shop, directory_shops):
+    assert _search(client, "zebrafina platinad")["total"] == 0
+    resposta = client.post("/admin/services", headers=auth_headers(seeded_shop["tokens"]["owner"]), json={
+        "name": "Platinado", "price": 80, "duration": 60, "barbershop_id": directory_shops["Zebrafina Studio"],
+    })
+    assert resposta.status_code == 200, resposta.text
+    assert [i["name"] for i in _search(client, "zebrafina platinad")["items"]] == ["Zebrafina Studio"]
@@ -0,0 +1,114 @@
+"""Importação em massa (imports.py) pela rota POST /admin/{id}/import/{kind}."""
+import gzip
+import json
+
+import pytest
+from sqlalchemy import func, insert, select
+
+from conftest import auth_headers
+
+HISTORICO = """date_time,kind,status,client_name,client_phone,barber_name,service_name,price,product_name,quantity
+2025-03-01T10:00,servico,concluido,Ana,(11) 91234-5678,JOÃO SILVA,corte,,,
+01/03/2025 11:30,,concluido,Ana Souza,11912345678,joao silva,Corte,35,,
+2025-03-02T09:00,produto,concluido,🛍️ Produto: Pomada x2,,,,,,
+2025-03-02T09:30,produto,concluido,,,,,,Pomada,3
+2025-03-02T10:00,venda_balcao,concluido,Pezinho,,,,10,,
+ontem,servico,concluido,Bruno,(11) 95555-0000,João Silva,Corte,,,
+2025-03-03T10:00,servico,concluido,Bruno,(11) 95555-0000,Pedro,Corte,,,
+2025-03-03T11:00,servico,pendente,Bruno,(11) 95555-0000,João Silva,Corte,,,
+2025-03-03T12:00,venda_balcao,concluido,Sem preço,,,,,,
+"""
+
+
+@pytest.fixture(scope="module")
+def import_shop(app):
+    from auth import create_access_token
+    from database import engine
+    from models import Barber, Barbershop, Product, Service
+
+    with engine.begin() as conn:
+        shop_id = conn.execute(insert(Barbershop).values(name="Importa", slug="importa")).inserted_primary_key[0]
+        owner_id = conn.execute(insert(Barber).values(name="João Silva", role="OWNER", pin="4100", barbershop_id=shop_id)).inserted_primary_key[0]
+        service_id = conn.execute(insert(Service).values(name="Corte", price=30, duration=30, barbershop_id=shop_id)).inserted_primary_key[0]
+        product_id = conn.execute(insert(Product).values(name="Pomada", price=25, stock_quantity=10, barbershop_id=shop_id)).inserted_primary_key[0]
+    token = create_access_token({"sub": str(owner_id), "role": "OWNER", "shop_id": shop_id})
+    return {"shop_id": shop_id, "owner_id": owner_id, "service_id": service_id, "product_id": product_id,
+            "headers": auth_headers(token)}
+
+
+def _import(client, shop, kind, conteudo: bytes, filename="historico.csv", **params):
+    return client.post(f"/admin/{shop['shop_id']}/import/{kind}", params=params, headers=shop["headers"],
+                       files={"file": (filename, conteudo, "application/octet-stream")})
+
+
+def _count(model, shop_id) -> int:
+    from database import engine
+
+    with engine.connect() as conn:
+        return conn.execute(select(func.count()).select_from(model).where(model.barbershop_id == shop_id)).scalar()
+
+
+# Linhas do CSV com erro (o cabeçalho é a linha 1)
+EXPECTED_ERRORS = [7, 8, 9, 10]
+
+
+def test_dry_run_validates_without_writing(client, import_shop):
+    from models import Appointment, Client
+
+    resposta = _import(client, import_shop, "appointments", HISTORICO.encode(), dry_run=True)
+    assert resposta.status_code == 200, resposta.text
+    relatorio = resposta.json()
+    assert (relatorio["rows"], relatorio["imported"], relatorio["errors"]) == (9, 5, 4)
+    assert [e["row"] for e in relatorio["error_details"]] == EXPECTED_ERRORS
+    assert _count(Appointment, import_shop["shop_id"]) == 0
+    assert _count(Client, import_shop["shop_id"]) == 0
+
+
+def test_import_writes_valid_rows_and_reports_the_rest(client, import_shop):
+    from database import engine
+    from models import Appointment, Client
+
+    relatorio = _import(client, import_shop, "appointments", HISTORICO.encode()).json()
+    assert (relatorio["imported"], relatorio["errors"]) == (5, 4)
+    erros = {e["row"]: e["error"] for e in relatorio["error_details"]}
+    assert "date_time" in erros[7] and "Pedro" in erros[8] and "status" in erros[9] and "price" in erros[10]
+
+    with engine.connect() as conn:
+        linhas = conn.execute(
+            select(Appointment.client_name, Appointment.barber_id, Appointment.service_id, Appointment.service_price,
+                   Appointment.product_id, Appointment.quantity, Appointment.client_id, Appointment.duration)
+            .where(Appointment.barbershop_id == import_shop["shop_id"]).order_by(Appointment.date_time)
+        ).all()
+        clientes = conn.execute(select(Client.phone, Client.last_booking_at)
+                                .where(Client.barbershop_id == import_shop["shop_id"])).all()
+
+    corte, corte_2, pomada_x2, pomada_x3, balcao = linhas
+    assert (corte.barber_id, corte.service_id, corte.service_price, corte.duration) == (import_shop["owner_id"], import_shop["service_id"], 30.0, 30)
+    assert corte_2.service_price == 35.0
+    # O mesmo telefone em formatos diferentes é o mesmo cliente
+    assert corte.client_id is not None and corte.client_id == corte_2.client_id
+    assert len(clientes) == 1 and clientes[0].last_booking_at.isoformat() == "2025-03-01T11:30:00"
+
+    assert (pomada_x2.product_id, pomada_x2.quantity, pomada_x2.service_price, pomada_x2.barber_id) == (import_shop["product_id"], 2, 50.0, None)
+    assert (pomada_x3.product_id, pomada_x3.quantity, pomada_x3.service_price) == (import_shop["product_id"], 3, 75.0)
+    assert pomada_x3.client_name == "🛍️ Produto: Pomada x3"
+    assert balcao.client_name.startswith("✂️ Corte Avulso:") and balcao.product_id is None
+
+
+def test_services_from_gzipped_ndjson(client, import_shop):
+    linhas = [{"name": "Platinado", "price": "80,00", "duration": 90}, {"name": "Sem duração", "price": 10}, "não é objeto"]
+    conteudo = gzip.compress("\n".join(json.dumps(l) for l in linhas).encode())
+    relatorio = _import(client, import_shop, "services", conteudo, filename="servicos.ndjson.gz").json()
+    assert (relatorio["imported"], relatorio["errors"]) == (1, 2)
+
+    servicos = client.get(f"/barbershops/{import_shop['shop_id']}/services").json()
+    assert {s["name"]: s["price"] for s in servicos}["Platinado"] == 80.0
+    # O serviço importado entra na busca do diretório
+    busca = client.get("/api/public/barbershops", params={"q": "importa platinado"}).json()
+    assert [i["slug"] for i in busca["items"]] == ["importa"]
+
+
+def test_only_managers_of_the_shop_can_import(client, seeded_shop, import_shop):
+    resposta = client.post(f"/admin/{import_shop['shop_id']}/import/services", headers=auth_headers(seeded_shop["tokens"]["owner"]),
+                           files={"file": ("servicos.csv", b"name,price,duration\nX,1,10\n", "text/csv")})
+    assert resposta.status_code == 403
@@ -0,0 +1,119 @@
+"""Estoque (inventory.py): o relatório em cache acompanha as vendas e o cancelamento devolve as unidades."""
+from datetime import datetime
+
+import pytest
+from sqlalchemy import insert, select
+
+from conftest import auth_headers
+
+
+@pytest.fixture
+def stock_shop(app):
+    """Loja com um produto (10 unidades) e dono; um ID novo por teste."""
+    from auth import create_access_token
+    from database import engine
+    from models import Barber, Barbershop, Product
+
+    with engine.begin() as conn:
+        shop_id = conn.execute(insert(Barbershop).values(name="Estoque")).inserted_primary_key[0]
+        owner_id = conn.execute(insert(Barber).values(
+            name="Dono", role="OWNER", pin=f"3{shop_id:05d}", barbershop_id=shop_id,
+        )).inserted_primary_key[0]
+        product_id = conn.execute(insert(Product).values(
+            name="Gel", price=20, cost_price=8, stock_quantity=10, barbershop_id=shop_id,
+        )).inserted_primary_key[0]
+    token = create_access_token({"sub": str(owner_id), "role": "OWNER", "shop_id": shop_id})
+    return {"shop_id": shop_id, "product_id": product_id, "headers": auth_headers(token)}
+
+
+def _report(client, shop) -> dict:
+    resposta = client.get(f"/admin/{shop['shop_id']}/inventory", headers=shop["headers"])
+    assert resposta.status_code == 200, resposta.text
+    return resposta.json()["products"][0]
+
+
+def _stock(product_id) -> int:
+    from database import engine
+    from models import Product
+
+    with engine.connect() as conn:
+        return conn.execute(select(Product.stock_quantity).where(Product.id == product_id)).scalar()
+
+
+def _sell(client, shop, quantidade) -> int:
+    from database import engine
+    from models import Appointment
+
+    resposta = client.post("/admin/venda-balcao", headers=shop["headers"],
+                           json={"tipo": "produto", "product_id": shop["product_id"], "quantidade": quantidade})
+    assert resposta.status_code == 200, resposta.text
+    with engine.connect() as conn:
+        return conn.execute(select(Appointment.id).where(Appointment.product_id == shop["product_id"])
+                            .order_by(Appointment.id.desc())).scalars().first()
+
+
+def test_report_follows_a_sale_made_by_another_worker(client, stock_shop):
+    from database import engine
+    from models import Appointment, Product
+
+    assert (_report(client, stock_shop)["units_sold"], _report(client, stock_shop)["stock_quantity"]) == (0, 10)
+    # Escrita direta no banco: nenhum invalidate() corre neste processo
+    with engine.begin() as conn:
+        conn.execute(insert(Appointment).values(
+            barbershop_id=stock_shop["shop_id"], client_name="🛍️ Produto: Gel x3", date_time=datetime.now(),
+            status="concluido", service_price=60.0, product_id=stock_shop["product_id"], quantity=3,
+        ))
+        conn.execute(Product.__table__.update().where(Product.id == stock_shop["product_id"]).values(stock_quantity=7))
+    item = _report(client, stock_shop)
+    assert (item["units_sold"], item["stock_quantity"]) == (3, 7)
+
+
+def test_cancelling_a_sale_restocks_and_reactivating_takes_it_back(client, stock_shop):
+    venda_id = _sell(client, stock_shop, 2)
+    assert _stock(stock_shop["product_id"]) == 8
+    assert _report(client, stock_shop)["units_sold"] == 2
+
+    resposta = client.patch(f"/admin/appointments/{venda_id}/status", json={"status": "cancelado"}, headers=stock_shop["headers"])
+    assert resposta.status_code == 200, resposta.text
+    assert _stock(stock_shop["product_id"]) == 10
+    assert (_report(client, stock_shop)["units_sold"], _report(client, stock_shop)["stock_quantity"]) == (0, 10)
+
+    # Cancelar de novo não devolve outra vez
+    client.patch(f"/admin/appointments/{venda_id}/status", json={"status": "cancelado"}, headers=stock_shop["headers"])
+    assert _stock(stock_shop["product_id"]) == 10
+
+    assert client.put(f"/admin/appointments/{venda_id}/conclude", headers=stock_shop["headers"]).status_code == 200
+    assert _stock(stock_shop["product_id"]) == 8
+    assert _report(client, stock_shop)["units_sold"] == 2
+
+
+def test_quick_sell_only_adjusts_the_stock(client, stock_shop):
+    from database import engine
+    from models import Appointment
+
+    resposta = client.patch(f"/admin/products/{stock_shop['product_id']}/sell", headers=stock_shop["headers"])
+    assert resposta.status_code == 200, resposta.text
+    assert resposta.json()["new_qty"] == 9 and _stock(stock_shop["product_id"]) == 9
+    # Nenhuma venda registada: o caixa e o financeiro não mudam
+    with engine.connect() as conn:
+        assert conn.execute(select(Appointment.id).where(Appointment.barbershop_id == stock_shop["shop_id"])).first() is None
+    item = _report(client, stock_shop)
+    assert (item["stock_quantity"], item["units_sold"]) == (9, 0)
+
+    assert client.patch(f"/admin/products/{stock_shop['product_id']}/sell", params={"quantity": 10},
+                        headers=stock_shop["headers"]).status_code == 400
+
+
+def test_bulk_cancel_restocks_product_sales(client, stock_shop):
+    primeira, segunda = _sell(client, stock_shop, 2), _sell(client, stock_shop, 3)
+    assert _stock(stock_shop["product_id"]) == 5
+
+    resposta = client.post(f"/admin/{stock_shop['shop_id']}/appointments/bulk", headers=stock_shop["headers"],
+                           json={"cancel": [primeira, segunda]})
+    assert resposta.status_code == 200, resposta.text
+    assert resposta.json()["summary"] == {"ok": 2}
+    assert _stock(stock_shop["product_id"]) == 10
+    assert _report(client, stock_shop)["units_sold"] == 0
+
+    client.post(f"/admin/{stock_shop['shop_id']}/appointments/bulk", headers=stock_shop["headers"], json={"conclude": [segunda]})
+    assert _stock(stock_shop["product_id"]) == 7
@@ -0,0 +1,181 @@
+"""Orçamento de queries SQL por rota.
+
+Chama TODAS as rotas do main.py pelo TestClient, contra a loja grande semeada
+(conftest.seeded_shop), e conta com o query_counter quantos comandos SQL cada pedido
+executa. Cada linha da tabela BUDGETS é um teste: uma rota que passa do máximo falha
+sozinha, com a lista das queries. Uma rota nova sem orçamento também falha.
+
+Como a loja tem dezenas de barbeiros e centenas de atendimentos, um N+1 (uma query por
+barbeiro/atendimento dentro de um laço) estoura o orçamento em vez de só ficar lento.
+"""
+import pytest
+
+from conftest import SEED_APPOINTMENTS_PER_BARBER_MONTH, SEED_APPOINTMENTS_PER_BARBER_TODAY, SEED_BARBERS, auth_headers
+
+# (método, rota como está no main.py, token usado, URL com {placeholders} do contexto, corpo JSON, máximo de queries)
+# Os corpos podem usar os mesmos {placeholders} nos valores de texto.
+# A ordem importa (os testes correm pela ordem da tabela): as rotas que apagam coisas ficam
+# no fim e usam registos próprios; algumas leem IDs devolvidos por uma rota anterior.
+BUDGETS = [
+    ("POST", "/auth/login-super", None, "/auth/login-super", {"email": "ceo@saas", "password": "super"}, 0),
+    ("POST", "/auth/verify-shop", None, "/auth/verify-shop", {"email": "dono@loja", "password": "senha"}, 1),
+    ("POST", "/auth/login-pin", None, "/auth/login-pin", {"shop_id": "{shop_id}", "pin": "1000"}, 1),
+
+    ("GET", "/superadmin/barbershops", "super", "/superadmin/barbershops", None, 1),
+    ("GET", "/superadmin/barbershops/overview", "super", "/superadmin/barbershops/overview?sort=revenue", None, 1),
+    ("GET", "/superadmin/profiles", "super", "/superadmin/profiles", None, 0),
+    ("GET", "/superadmin/profiles/{profile_id}", "super", "/superadmin/profiles/{profile_id}", None, 0),
+    ("GET", "/superadmin/profiles/{profile_id}/folded", "super", "/superadmin/profiles/{profile_id}/folded", None, 0),
+    ("POST", "/superadmin/barbershops", "super", "/superadmin/barbershops",
+     {"name": "Nova", "slug": "nova", "owner_email": "nova@loja", "password": "x"}, 7),
+    ("PUT", "/superadmin/barbershops/{shop_id}", "super", "/superadmin/barbershops/{other_shop_id}", {"name": "Outra"}, 3),
+    ("PUT", "/super/barbershops/{shop_id}", "super", "/super/barbershops/{other_shop_id}", {"name": "Outra 2"}, 4),
+    ("POST", "/super/barbers", "super", "/super/barbers",
+     {"name": "Extra", "role": "BARBER", "pin": "7777", "barbershop_id": "{other_shop_id}"}, 2),
+    ("PUT", "/super/barbers/{barber_id}", "super", "/super/barbers/{spare_barber_id}", {"name": "Sobra"}, 2),
+    ("GET", "/super/barbershops/{shop_id}/barbers", "super", "/super/barbershops/{shop_id}/barbers", None, 1),
+
+    ("PUT", "/admin/barbers/{barber_id}/photo", "owner", "/admin/barbers/{barber_id}/photo", {"photo_base64": "/uploads/x.png"}, 2),
+    ("PUT", "/admin/barbers/{barber_id}/toggle", "owner", "/admin/barbers/{spare_barber_id}/toggle", None, 4),
+    ("POST", "/admin/{barbershop_id}/barbers", "owner", "/admin/{shop_id}/barbers", {"name": "Novo", "pin": "8888"}, 3),
+    ("GET", "/admin/barbershops/{barbershop_id}/team-stats", "owner", "/admin/barbershops/{shop_id}/team-stats", None, 1),
+    ("POST", "/admin/services", "owner", "/admin/services",
+     {"name": "Barba", "price": 20, "duration": 20, "barbershop_id": "{shop_id}"}, 4),
+    ("POST", "/admin/venda-balcao", "owner", "/admin/venda-balcao", {"tipo": "produto", "item": "Gel", "valor": 30}, 1),
+    ("POST", "/admin/venda-balcao", "owner", "/admin/venda-balcao", {"tipo": "produto", "product_id": "{product_id}"}, 3),
+
+    ("GET", "/admin/{barbershop_id}/products", "owner", "/admin/{shop_id}/products", None, 1),
+    ("POST", "/admin/{barbershop_id}/products", "owner", "/admin/{shop_id}/products", {"name": "Pomada", "price": 25}, 2),
+    ("PATCH", "/admin/products/{product_id}/sell", "owner", "/admin/products/{product_id}/sell", None, 2),
+    ("PATCH", "/admin/products/{product_id}/restock", "owner", "/admin/products/{product_id}/restock", {"quantity": 5}, 3),
+    ("GET", "/admin/{barbershop_id}/inventory", "owner", "/admin/{shop_id}/inventory", None, 3),
+    ("PUT", "/admin/{barbershop_id}/commission-rules", "owner", "/admin/{shop_id}/commission-rules",
+     {"kind": "servico", "percent": 40}, 3),
+    ("PUT", "/admin/{barbershop_id}/commission-rules", "owner", "/admin/{shop_id}/commission-rules",
+     {"kind": "servico", "barber_id": "{barber_id}", "service_id": "{service_id}", "fixed_amount": 5}, 5),
+    ("GET", "/admin/{barbershop_id}/commission-rules", "owner", "/admin/{shop_id}/commission-rules", None, 1),
+    ("GET", "/admin/{barbershop_id}/payroll", "owner", "/admin/{shop_id}/payroll?start={month_start}&end={today}", None, 3),
+    ("POST", "/admin/{barbershop_id}/payroll/close", "owner", "/admin/{shop_id}/payroll/close",
+     {"start": "{month_start}", "end": "{yesterday}"}, 6),
+    ("GET", "/admin/{barbershop_id}/payroll/periods", "owner", "/admin/{shop_id}/payroll/periods", None, 1),
+
+    ("GET", "/api/public/barbershops", None, "/api/public/barbershops?q=loja gra", None, 1),
+    ("GET", "/api/public/barbershops/{slug}", None, "/api/public/barbershops/{slug}", None, 3),
+    ("POST", "/appointments", None, "/appointments",
+     {"client_name": "Ana", "client_phone": "11999990000", "date_time": "{tomorrow}T10:00",
+      "barbershop_id": "{shop_id}", "barber_id": "{barber_id}", "service_id": "{service_id}"}, 9),
+    ("GET", "/admin/{barbershop_id}/appointments", "owner", "/admin/{shop_id}/appointments", None, 1),
+    ("GET", "/admin/{barbershop_id}/sync", "owner", "/admin/{shop_id}/sync", None, 4),
+    ("GET", "/admin/{barbershop_id}/sync", "owner", "/admin/{shop_id}/sync?since={sync_since}", None, 5),
+    ("GET", "/admin/{barbershop_id}/clients", "owner", "/admin/{shop_id}/clients?q=11999", None, 1),
+    ("GET", "/admin/{barbershop_id}/clients/{client_id}/history", "owner", "/admin/{shop_id}/clients/{client_id}/history", None, 2),
+    ("PATCH", "/admin/appointments/{appointment_id}/status", "owner", "/admin/appointments/{scheduled_id}/status",
+     {"status": "cancelado"}, 3),
+    ("POST", "/admin/{barbershop_id}/appointments/bulk", "owner", "/admin/{shop_id}/appointments/bulk",
+     {"conclude": "{bulk_ids}", "cancel": ["{bulk_cancel_id}", 999999],
+      "reschedule": [{"id": "{bulk_move_id}", "date_time": "{tomorrow}T21:00"}]}, 5),
+    ("GET", "/barbershops/{slug}/available-times", None,
+     "/barbershops/{slug}/available-times?barber_id={barber_id}&service_id={service_id}&date={today}", None, 3),
+    ("GET", "/barbershops/{slug}/next-available", None, "/barbershops/{slug}/next-available?service_id={service_id}&days=14", None, 4),
+
+    ("GET", "/admin/{barbershop_id}/financeiro", "owner", "/admin/{shop_id}/financeiro", None, 2),
+    ("GET", "/admin/{barbershop_id}/analytics/revenue", "owner",
+     "/admin/{shop_id}/analytics/revenue?start={month_start}&end={today}&group_by=barber", None, 4),
+    ("GET", "/admin/{barbershop_id}/export", "owner", "/admin/{shop_id}/export?start={month_start}&end={today}", None, 1),
+    # Corpo em bytes = upload multipart no campo "file"
+    ("POST", "/admin/{barbershop_id}/import/{kind}", "owner", "/admin/{shop_id}/import/products",
+     b"name,price,stock_quantity\nCera,25,3\nTonico,\"30,50\",5\n", 2),
+    ("POST", "/admin/{barbershop_id}/close-register", "owner", "/admin/{shop_id}/close-register", {"email": "dono@loja"}, 8),
+    ("GET", "/admin/{barbershop_id}/closes", "owner", "/admin/{shop_id}/closes?start={month_start}&end={today}", None, 1),
+    ("GET", "/admin/{barbershop_id}/closes/{day}", "owner", "/admin/{shop_id}/closes/{yesterday}", None, 8),
+    ("GET", "/admin/barbershops/{shop_id}/team-earnings", "owner", "/admin/barbershops/{shop_id}/team-earnings", None, 2),
+
+    ("GET", "/admin/barbershops/{barbershop_id}/profile", "owner", "/admin/barbershops/{shop_id}/profile", None, 1),
+    ("PUT", "/admin/barbershops/{shop_id}/profile", "owner", "/admin/barbershops/{shop_id}/profile",
+     {"description": "Desde 1990", "open_time": "09:00", "close_time": "19:00", "interval_start": "12:00", "interval_end": "13:00"}, 3),
+    ("PUT", "/admin/barbers/{barber_id}/profile", "owner", "/admin/barbers/{barber_id}/profile", {}, 2),
+    ("GET", "/barbershops/{shop_id}/services", None, "/barbershops/{shop_id}/services", None, 1),
+    ("PUT", "/admin/services/{service_id}", "owner", "/admin/services/{service_id}", {"price": 45}, 5),
+    ("PUT", "/admin/appointments/{appo_id}/conclude", "owner", "/admin/appointments/{conclude_id}/conclude", None, 3),
+    ("GET", "/barbershops/by-slug/{slug}", None, "/barbershops/by-slug/{slug}", None, 3),
+    ("GET", "/health/ready", None, "/health/ready", None, 0),
+
+    # Rotas que apagam: cada uma com o seu registo descartável (+2: tombstone da sincronização e limpeza dos antigos)
+    ("DELETE", "/admin/products/{product_id}", "owner", "/admin/products/{spare_product_id}", None, 4),
+    ("DELETE", "/admin/services/{service_id}", "owner", "/admin/services/{spare_service_id}", None, 7),
+    ("POST", "/admin/barbers/{barber_id}/revoke-sessions", "owner", "/admin/barbers/{spare_barber_id}/revoke-sessions", None, 2),
+    ("POST", "/admin/{barbershop_id}/revoke-sessions", "super", "/admin/{other_shop_id}/revoke-sessions", None, 1),
+    ("POST", "/auth/logout", "logout", "/auth/logout", None, 1),
+    ("POST", "/admin/barbers/{barber_id}/calendar-feed", "owner", "/admin/barbers/{barber_id}/calendar-feed", None, 2),
+    # O calendar_token vem da resposta acima; a segunda consulta sai do cache do .ics
+    ("GET", "/calendar/{token}.ics", None, "/calendar/{calendar_token}.ics", None, 2),
+    ("GET", "/calendar/{token}.ics", None, "/calendar/{calendar_token}.ics", None, 1),
+    ("DELETE", "/admin/barbers/{barber_id}/calendar-feed", "owner", "/admin/barbers/{barber_id}/calendar-feed", None, 2),
+    ("DELETE", "/admin/{barbershop_id}/commission-rules/{rule_id}", "owner", "/admin/{shop_id}/commission-rules/1", None, 1),
+    ("DELETE", "/super/barbers/{barber_id}", "super", "/super/barbers/{spare_barber_id}", None, 5),
+    ("DELETE", "/super/barbershops/{shop_id}", "super", "/super/barbershops/{other_shop_id}", None, 8),
+    # O job_id vem da resposta do DELETE acima
+    ("GET", "/super/deletions/{job_id}", "super", "/super/deletions/{job_id}", None, 1),
+]
+
+
+def _fill(value, ctx: dict):
+    """Troca os {placeholders} do contexto; um valor que é só um placeholder numérico vira int (ou lista)."""
+    if isinstance(value, dict):
+        return {k: _fill(v, ctx) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_fill(v, ctx) for v in value]
+    if isinstance(value, str):
+        if value.startswith("{") and value.endswith("}") and isinstance(ctx.get(value[1:-1]), list):
+            return ctx[value[1:-1]]
+        texto = value.format(**ctx)
+        if value.startswith("{") and value.endswith("}") and texto.isdigit():
+            return int(texto)
+        return texto
+    return value
+
+
+@pytest.fixture(scope="module")
+def budget_ctx(client, seeded_shop) -> dict:
+    ctx = {k: v for k, v in seeded_shop.items() if k != "tokens"}
+    # Um pedido perfilado (X-Profile), para as rotas de perfis terem o que ler
+    perfilado = client.get("/superadmin/barbershops/overview",
+                           headers={**auth_headers(seeded_shop["tokens"]["super"]), "X-Profile": "1"})
+    ctx["profile_id"] = perfilado.headers.get("X-Profile-ID", "sem-perfil")
+    return ctx
+
+
+def test_every_route_has_a_budget(app):
+    from fastapi.routing import APIRoute
+
+    rotas = {(m, r.path) for r in app.routes if isinstance(r, APIRoute) for m in r.methods}
+    com_orcamento = {(m, path) for m, path, *_ in BUDGETS}
+    assert sorted(rotas - com_orcamento) == [], "rotas sem orçamento"
+    assert sorted(com_orcamento - rotas) == [], "orçamento de rota que não existe"
+
+
+@pytest.mark.parametrize(
+    "metodo, rota, token, url, corpo, maximo", BUDGETS,
+    ids=[f"{metodo} {url}" for metodo, _, _, url, *_ in BUDGETS],
+)
+def test_query_budget(client, seeded_shop, budget_ctx, query_counter, metodo, rota, token, url, corpo, maximo):
+    try:
+        url, corpo = _fill(url, budget_ctx), _fill(corpo, budget_ctx)
+    except KeyError as e:
+        pytest.skip(f"depende do ID {e} devolvido por uma rota anterior da tabela")
+    headers = auth_headers(seeded_shop["tokens"][token]) if token else {}
+
+    with query_counter:
+        if isinstance(corpo, bytes):
+            resposta = client.request(metodo, url, files={"file": ("import.csv", corpo)}, headers=headers)
+        else:
+            resposta = client.request(metodo, url, json=corpo, headers=headers)
+
+    if resposta.headers.get("content-type") == "application/json" and isinstance(resposta.json(), dict):
+        budget_ctx.update({k: v for k, v in resposta.json().items() if k in ("job_id", "calendar_token")})
+    assert resposta.status_code < 400, f"HTTP {resposta.status_code} {resposta.text[:200]}"
+    assert query_counter.count <= maximo, (
+        f"{metodo} {rota}: {query_counter.count} queries (máximo {maximo}) com {SEED_BARBERS} barbeiros e "
+        f"{SEED_BARBERS * (SEED_APPOINTMENTS_PER_BARBER_TODAY + SEED_APPOINTMENTS_PER_BARBER_MONTH)} atendimentos:\n"
+        + query_counter.report()
+    )
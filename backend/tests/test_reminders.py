@@ -0,0 +1,106 @@
+"""Lembretes pelo WhatsApp (reminders.py) contra um webhook simulado: cada lembrete sai uma única vez."""
+import json
+from datetime import datetime, timedelta
+
+import httpx
+import pytest
+from sqlalchemy import insert, select
+
+# Cada teste usa um dia próprio, bem no futuro: a agenda da loja semeada fica fora da janela
+FUTURE_DAYS = 800
+
+
+@pytest.fixture
+def webhook(monkeypatch):
+    """Cliente HTTP com um N8N simulado; `status` muda a resposta, `posts` guarda o que chegou."""
+    monkeypatch.setenv("N8N_WHATSAPP_WEBHOOK", "http://n8n.invalid/webhook")
+    estado = {"status": 200, "posts": []}
+
+    def responder(request):
+        estado["posts"].append(json.loads(request.content))
+        return httpx.Response(estado["status"])
+
+    with httpx.Client(transport=httpx.MockTransport(responder)) as http:
+        estado["http"] = http
+        yield estado
+
+
+def _seed(app, dia: int, linhas: list[tuple[int, str]]) -> tuple[datetime, dict]:
+    """Agendamentos a `minutos` de um "agora" no futuro. Devolve (agora, {minutos: id})."""
+    from database import engine
+    from models import Appointment, Barber, Barbershop, Service
+
+    agora = datetime.now().replace(hour=8, minute=0, second=0, microsecond=0) + timedelta(days=FUTURE_DAYS + dia)
+    with engine.begin() as conn:
+        shop_id = conn.execute(insert(Barbershop).values(name=f"Lembretes {dia}", slug=f"lembretes-{dia}")).inserted_primary_key[0]
+        barber_id = conn.execute(insert(Barber).values(name="Rui", pin=f"50{dia:02d}", barbershop_id=shop_id)).inserted_primary_key[0]
+        service_id = conn.execute(insert(Service).values(name="Corte", price=30, duration=30, barbershop_id=shop_id)).inserted_primary_key[0]
+        ids = {minutos: conn.execute(insert(Appointment).values(
+            client_name=f"Cliente {minutos}", client_phone="(11) 90000-0000", date_time=agora + timedelta(minutes=minutos),
+            status=status, barber_id=barber_id, service_id=service_id, barbershop_id=shop_id,
+        )).inserted_primary_key[0] for minutos, status in linhas}
+    return agora, ids
+
+
+def _sent_ids(webhook) -> list[int]:
+    return [r["appointment_id"] for post in webhook["posts"] for r in post["reminders"]]
+
+
+def test_reminders_go_out_once_and_only_inside_the_window(app, webhook):
+    import reminders
+
+    agora, ids = _seed(app, 0, [
+        (10, "scheduled"),   # em cima da hora
+        (30, "scheduled"),
+        (120, "scheduled"),
+        (90, "cancelado"),
+        (240, "scheduled"),  # depois da janela
+    ])
+    assert reminders.run_reminders(agora, webhook["http"]) == 2
+    assert _sent_ids(webhook) == [ids[30], ids[120]]
+    lembrete = webhook["posts"][0]["reminders"][0]
+    assert lembrete["barbershop_name"] == "Lembretes 0"
+    assert (lembrete["barber_name"], lembrete["service_name"]) == ("Rui", "Corte")
+    assert lembrete["time"] == (agora + timedelta(minutes=30)).strftime("%H:%M")
+
+    assert reminders.run_reminders(agora, webhook["http"]) == 0
+    # Duas horas depois, o das 240 minutos entra na janela (e só ele)
+    assert reminders.run_reminders(agora + timedelta(hours=2), webhook["http"]) == 1
+    assert _sent_ids(webhook)[-1] == ids[240]
+
+
+def test_large_window_is_sent_in_batches(app, webhook):
+    import reminders
+
+    agora, ids = _seed(app, 1, [(20 + i / 2, "scheduled") for i in range(reminders.REMINDER_BATCH_SIZE + 30)])
+    assert reminders.run_reminders(agora, webhook["http"]) == len(ids)
+    assert [len(post["reminders"]) for post in webhook["posts"]] == [reminders.REMINDER_BATCH_SIZE, 30]
+    assert sorted(_sent_ids(webhook)) == sorted(ids.values())
+
+
+def test_failed_post_releases_the_batch(app, webhook):
+    import reminders
+    from database import engine
+    from models import Appointment
+
+    agora, ids = _seed(app, 2, [(60, "scheduled")])
+    webhook["status"] = 500
+    with pytest.raises(httpx.HTTPStatusError):
+        reminders.run_reminders(agora, webhook["http"])
+    with engine.connect() as conn:
+        assert conn.execute(select(Appointment.reminder_sent_at).where(Appointment.id == ids[60])).scalar() is None
+
+    webhook["status"] = 200
+    assert reminders.run_reminders(agora, webhook["http"]) == 1
+
+
+def test_without_webhook_nothing_is_claimed(app, monkeypatch):
+    import reminders
+    from database import engine
+    from models import Appointment
+
+    monkeypatch.delenv("N8N_WHATSAPP_WEBHOOK", raising=False)
+    agora, ids = _seed(app, 3, [(60, "scheduled")])
+    assert reminders.run_reminders(agora) == 0
+    with engine.connect() as conn:
+        assert conn.execute(select(Appointment.reminder_sent_at).where(Appointment.id == ids[60])).scalar() is None
@@ -0,0 +1,33 @@
+"""Arranque a frio: `import main` num processo novo, como cada worker paga antes do primeiro pedido.
+
+O banco aponta para uma porta onde não há nada (benchmarks/startup.py): se a importação
+abrir uma conexão, o processo filho quebra e o teste falha.
+
+O tempo de arranque depende da máquina, por isso o orçamento só é verificado quando pedido:
+
+    STARTUP_BUDGET_MS=1500 python -m pytest -q tests/test_startup.py
+"""
+import os
+import statistics
+from collections import Counter
+
+import pytest
+
+from benchmarks.startup import measure_once
+
+STARTUP_BUDGET_MS = os.getenv("STARTUP_BUDGET_MS")
+STARTUP_RUNS = 3
+
+
+def test_import_does_no_database_io_and_registers_each_route_once():
+    amostra = measure_once()
+    repetidas = [rota for rota, n in Counter(map(tuple, amostra["routes"])).items() if n > 1]
+    assert repetidas == []
+
+
+@pytest.mark.skipif(STARTUP_BUDGET_MS is None, reason="benchmark opcional: defina STARTUP_BUDGET_MS")
+def test_cold_start_within_budget():
+    orcamento = float(STARTUP_BUDGET_MS)
+    measure_once()  # aquece o cache de bytecode (.pyc) antes de medir
+    mediana = statistics.median(measure_once()["ms"] for _ in range(STARTUP_RUNS))
+    assert mediana <= orcamento, f"import main levou {mediana:.0f} ms (orçamento {orcamento:.0f} ms)"
@@ -0,0 +1,72 @@
+"""Visão geral das lojas do SuperAdmin (tenants.py)."""
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import insert
+
+from conftest import auth_headers
+
+
+@pytest.fixture(scope="module")
+def tenant_shops(app, seeded_shop):
+    """Três lojas "Tenant": só com histórico arquivado, com atividade recente e sem atividade."""
+    from database import engine
+    from models import Appointment, AppointmentArchive, Barbershop
+
+    agora = datetime.now()
+    with engine.begin() as conn:
+        ids = {
+            nome: conn.execute(insert(Barbershop).values(
+                name=f"Tenant {nome}", slug=f"tenant-{nome}", owner_email=f"{nome}@tenant",
+            )).inserted_primary_key[0]
+            for nome in ["arquivada", "ativa", "parada"]
+        }
+        # O ID vem da tabela quente, de onde a linha foi movida
+        conn.execute(insert(AppointmentArchive).values(
+            id=10**6, barbershop_id=ids["arquivada"], client_name="Antigo", status="concluido",
+            service_price=40.0, date_time=agora - timedelta(days=500),
+        ))
+        conn.execute(insert(Appointment), [
+            {"barbershop_id": ids["ativa"], "client_name": "Recente", "status": "concluido",
+             "service_price": 25.0, "date_time": agora - timedelta(days=d)}
+            for d in (1, 2)
+        ])
+    return ids
+
+
+def _overview(client, seeded_shop, **params):
+    resposta = client.get("/superadmin/barbershops/overview", params=params,
+                          headers=auth_headers(seeded_shop["tokens"]["super"]))
+    assert resposta.status_code == 200, resposta.text
+    return resposta.json()
+
+
+def test_last_activity_includes_the_archive(client, seeded_shop, tenant_shops):
+    items = {i["slug"]: i for i in _overview(client, seeded_shop, search="tenant-")["items"]}
+
+    assert items["tenant-arquivada"]["last_activity"] is not None
+    assert items["tenant-arquivada"]["appointments_30d"] == 0
+    assert items["tenant-ativa"]["last_activity"] > items["tenant-arquivada"]["last_activity"]
+    assert items["tenant-ativa"]["appointments_30d"] == 2
+    assert items["tenant-ativa"]["revenue_30d"] == 50.0
+    assert items["tenant-parada"]["last_activity"] is None
+
+
+def test_sort_by_last_activity_puts_inactive_shops_last(client, seeded_shop, tenant_shops):
+    items = _overview(client, seeded_shop, search="tenant-", sort="last_activity")["items"]
+    assert [i["slug"] for i in items] == ["tenant-ativa", "tenant-arquivada", "tenant-parada"]
+
+
+def test_pagination_reports_the_filtered_total(client, seeded_shop, tenant_shops):
+    pagina = _overview(client, seeded_shop, search="tenant-", page=2, page_size=2)
+    assert [i["slug"] for i in pagina["items"]] == ["tenant-parada"]
+    assert (pagina["total"], pagina["pages"]) == (3, 2)
+
+    depois_do_fim = _overview(client, seeded_shop, search="tenant-", page=5, page_size=2)
+    assert depois_do_fim["items"] == [] and depois_do_fim["total"] == 3
+
+
+def test_invalid_sort_is_rejected(client, seeded_shop):
+    resposta = client.get("/superadmin/barbershops/overview", params={"sort": "password_hash"},
+                          headers=auth_headers(seeded_shop["tokens"]["super"]))
+    assert resposta.status_code == 400